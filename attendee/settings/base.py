@@ -202,3 +202,17 @@ STORAGES = {
 }
 AWS_S3_SIGNATURE_VERSION = "s3v4"
 AWS_RECORDING_STORAGE_BUCKET_NAME = os.getenv("AWS_RECORDING_STORAGE_BUCKET_NAME")
+AWS_UTTERANCE_AUDIO_STORAGE_BUCKET_NAME = os.getenv("AWS_UTTERANCE_AUDIO_STORAGE_BUCKET_NAME", AWS_RECORDING_STORAGE_BUCKET_NAME)
+
+# Where per-participant utterance audio is kept until it is transcribed. One of database, s3 or local.
+# The local backend only works when the bot and the celery worker share a filesystem.
+UTTERANCE_AUDIO_STORAGE_BACKEND = os.getenv("UTTERANCE_AUDIO_STORAGE_BACKEND", "database")
+UTTERANCE_AUDIO_LOCAL_PATH = os.getenv("UTTERANCE_AUDIO_LOCAL_PATH", "/tmp/utterance_audio")
+# One of flac or none. Only applies to the object storage backends.
+UTTERANCE_AUDIO_COMPRESSION = os.getenv("UTTERANCE_AUDIO_COMPRESSION", "flac")
+# 0 means utterance audio is deleted as soon as it has been transcribed
+UTTERANCE_AUDIO_RETENTION_DAYS = int(os.getenv("UTTERANCE_AUDIO_RETENTION_DAYS", "0"))
+# Cut silence out of raw PCM utterance audio and downsample it before it's sent to be transcribed. Word timestamps are mapped
+# back to the original audio afterwards.
+UTTERANCE_TRANSCRIPTION_AUDIO_COMPACTION = os.getenv("UTTERANCE_TRANSCRIPTION_AUDIO_COMPACTION", "true") == "true"
+UTTERANCE_TRANSCRIPTION_SAMPLE_RATE = int(os.getenv("UTTERANCE_TRANSCRIPTION_SAMPLE_RATE", "16000"))
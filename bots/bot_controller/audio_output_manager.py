@@ -1,9 +1,14 @@
-import threading
-import time
+import itertools
 
 from bots.utils import mp3_to_pcm
 
-from .text_to_speech import generate_audio_from_text
+from .paced_audio_output import PacedAudioOutput
+from .text_to_speech import generate_audio_segments_from_text
+
+
+def decode_mp3_segments(mp3_data, sample_rate):
+    # A generator, so the decoding happens on the playback thread and an error fails the request from there
+    yield mp3_to_pcm(mp3_data, sample_rate=sample_rate)
 
 
 class AudioOutputManager:
@@ -12,80 +17,65 @@ class AudioOutputManager:
     def __init__(
         self,
         currently_playing_audio_media_request_finished_callback,
+        currently_playing_audio_media_request_failed_callback,
         play_raw_audio_callback,
     ):
         self.currently_playing_audio_media_request = None
-        self.currently_playing_audio_media_request_started_at = None
-        self.currently_playing_audio_media_request_duration_ms = None
         self.currently_playing_audio_media_request_finished_callback = currently_playing_audio_media_request_finished_callback
+        self.currently_playing_audio_media_request_failed_callback = currently_playing_audio_media_request_failed_callback
         self.play_raw_audio_callback = play_raw_audio_callback
-        self.currently_playing_audio_media_request_raw_audio_pcm_bytes = None
-        self.audio_thread = None
-        self.stop_audio_thread = False
-
-    def _play_audio_chunks(self, audio_data, chunk_size):
-        for i in range(0, len(audio_data), chunk_size):
-            if self.stop_audio_thread:
-                break
-            chunk = audio_data[i : i + chunk_size]
-            self.play_raw_audio_callback(bytes=chunk, sample_rate=self.SAMPLE_RATE)
-            time.sleep(0.9)  # the chunk size is a second's worth of audio so we'll sleep for almost that much
+        self.paced_audio_output = None
 
-    def _stop_audio_thread(self):
-        """Stop the currently running audio thread if it exists."""
-        self.stop_audio_thread = True
-        if self.audio_thread and self.audio_thread.is_alive():
-            self.audio_thread.join()
-        self.stop_audio_thread = False
+    def _stop_paced_audio_output(self):
+        """Stop the current audio playback if there is one."""
+        if self.paced_audio_output:
+            self.paced_audio_output.cancel()
+            self.paced_audio_output = None
 
     def start_playing_audio_media_request(self, audio_media_request):
         # Stop any existing audio playback
-        self._stop_audio_thread()
+        self._stop_paced_audio_output()
 
         if audio_media_request.media_blob:
-            # Handle raw audio blob case
-            self.currently_playing_audio_media_request_raw_audio_pcm_bytes = mp3_to_pcm(audio_media_request.media_blob.blob, sample_rate=self.SAMPLE_RATE)
-            self.currently_playing_audio_media_request_duration_ms = audio_media_request.media_blob.duration_ms
+            # Handle raw audio blob case, decoded on the playback thread so a large file doesn't hold up the main loop
+            segments = decode_mp3_segments(audio_media_request.media_blob.blob, self.SAMPLE_RATE)
         else:
-            # Handle text-to-speech case
-            audio_blob, duration_ms = generate_audio_from_text(
+            # Handle text-to-speech case. Sentences after the first are synthesized while the first one plays.
+            segments = generate_audio_segments_from_text(
                 text=audio_media_request.text_to_speak,
                 settings=audio_media_request.text_to_speech_settings,
                 sample_rate=self.SAMPLE_RATE,
                 bot=audio_media_request.bot,
             )
-            self.currently_playing_audio_media_request_raw_audio_pcm_bytes = audio_blob
-            self.currently_playing_audio_media_request_duration_ms = duration_ms
+            # Synthesize the first sentence now, so that a text-to-speech error fails the request
+            segments = itertools.chain([next(segments)], segments)
 
         self.currently_playing_audio_media_request = audio_media_request
-        self.currently_playing_audio_media_request_started_at = time.time()
 
-        bytes_per_sample = 2
-        # Start audio playback in a new thread
-        self.audio_thread = threading.Thread(
-            target=self._play_audio_chunks,
-            args=(
-                self.currently_playing_audio_media_request_raw_audio_pcm_bytes,
-                self.SAMPLE_RATE * bytes_per_sample,
-            ),
+        # Start audio playback in new threads
+        self.paced_audio_output = PacedAudioOutput(
+            sample_rate=self.SAMPLE_RATE,
+            segments=segments,
+            play_raw_audio_callback=self.play_raw_audio_callback,
         )
-        self.audio_thread.start()
+        self.paced_audio_output.start()
 
     def currently_playing_audio_media_request_is_finished(self):
-        if not self.currently_playing_audio_media_request or not self.currently_playing_audio_media_request_started_at:
+        if not self.currently_playing_audio_media_request or not self.paced_audio_output:
             return False
-        elapsed_ms = (time.time() - self.currently_playing_audio_media_request_started_at) * 1000
-        if elapsed_ms > self.currently_playing_audio_media_request_duration_ms:
-            return True
-        return False
+        return self.paced_audio_output.finished.is_set()
 
     def clear_currently_playing_audio_media_request(self):
-        self._stop_audio_thread()
+        self._stop_paced_audio_output()
         self.currently_playing_audio_media_request = None
-        self.currently_playing_audio_media_request_started_at = None
 
     def monitor_currently_playing_audio_media_request(self):
         if self.currently_playing_audio_media_request_is_finished():
             temp_currently_playing_audio_media_request = self.currently_playing_audio_media_request
+            error = self.paced_audio_output.error
             self.clear_currently_playing_audio_media_request()
-            self.currently_playing_audio_media_request_finished_callback(temp_currently_playing_audio_media_request)
+            if error:
+                # The audio couldn't be decoded, a later sentence couldn't be synthesized or the audio couldn't be sent
+                self.currently_playing_audio_media_request_failed_callback(temp_currently_playing_audio_media_request)
+            else:
+                self.currently_playing_audio_media_request_finished_callback(temp_currently_playing_audio_media_request)
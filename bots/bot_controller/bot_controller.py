@@ -2,15 +2,20 @@ import json
 import logging
 import os
 import signal
+import time
 import traceback
 
 import gi
 import redis
+from django.conf import settings
 from django.core.files.base import ContentFile
-from django.utils import timezone
+from django.db import connection
 
 from bots.bot_adapter import BotAdapter
+from bots.bot_metrics import BotMetricsServer, bot_metrics, install_orm_timing
 from bots.models import (
+    AUDIO_ONLY_RECORDING_FORMATS,
+    RECORDING_RESOLUTION_FRAME_SIZES,
     Bot,
     BotDebugScreenshot,
     BotEventManager,
@@ -26,20 +31,28 @@ from bots.models import (
     Recording,
     RecordingFormats,
     RecordingManager,
+    RecordingResolutions,
     RecordingStates,
+    TranscriptionTypes,
     Utterance,
 )
 from bots.utils import meeting_type_from_url
+from bots.utterance_audio_compaction import compact_speech
+from bots.utterance_audio_storage import get_utterance_audio_store
 
 from .audio_output_manager import AudioOutputManager
 from .automatic_leave_configuration import AutomaticLeaveConfiguration
 from .closed_caption_manager import ClosedCaptionManager
+from .closed_caption_utterance_writer import ClosedCaptionUtteranceWriter
 from .file_uploader import FileUploader
 from .gstreamer_pipeline import GstreamerPipeline
 from .individual_audio_input_manager import IndividualAudioInputManager
 from .media_recorder_receiver import MediaRecorderReceiver
+from .ordered_task_executor import OrderedTaskExecutor
 from .pipeline_configuration import PipelineConfiguration
 from .rtmp_client import RTMPClient
+from .streaming_transcription_manager import StreamingTranscriptionManager, deepgram_streaming_url
+from .streaming_uploader import StreamingUploader
 
 gi.require_version("GLib", "2.0")
 from gi.repository import GLib
@@ -48,6 +61,23 @@ logger = logging.getLogger(__name__)
 
 
 class BotController:
+    MAIN_LOOP_TIMEOUT_INTERVAL_MS = 100
+    TASK_EXECUTOR_NUM_WORKERS = 4
+    # How long cleanup waits for flushed utterances to be saved before completing the recording anyway
+    FLUSH_UTTERANCES_TIMEOUT_SECONDS = 60
+
+    # Tasks with the same key run in order
+    TASK_KEY_UTTERANCES = "utterances"
+    TASK_KEY_HEARTBEAT = "heartbeat"
+    TASK_KEY_DEBUG_ARTIFACTS = "debug_artifacts"
+
+    # The size of the video each platform sends us: what we subscribe to in Zoom and what the browser renders in Meet and Teams
+    SOURCE_VIDEO_FRAME_SIZES = {
+        MeetingTypes.ZOOM: (640, 360),
+        MeetingTypes.GOOGLE_MEET: (1280, 720),
+        MeetingTypes.TEAMS: (1280, 720),
+    }
+
     def get_google_meet_bot_adapter(self):
         from bots.google_meet_bot_adapter import GoogleMeetBotAdapter
 
@@ -64,6 +94,9 @@ class BotController:
             recording_view=self.bot_in_db.recording_view(),
             google_meet_closed_captions_language=self.bot_in_db.google_meet_closed_captions_language(),
             should_create_debug_recording=self.bot_in_db.create_debug_recording(),
+            video_frame_size=self.get_video_frame_size(),
+            video_frame_rate=self.bot_in_db.recording_frame_rate(),
+            record_video=self.pipeline_configuration.record_video or self.pipeline_configuration.rtmp_stream_video,
         )
 
     def get_teams_bot_adapter(self):
@@ -81,6 +114,10 @@ class BotController:
             add_encoded_mp4_chunk_callback=None,
             recording_view=self.bot_in_db.recording_view(),
             should_create_debug_recording=self.bot_in_db.create_debug_recording(),
+            repeat_video_frame_callback=self.gstreamer_pipeline.on_repeat_video_frame,
+            video_frame_size=self.get_video_frame_size(),
+            video_frame_rate=self.bot_in_db.recording_frame_rate(),
+            record_video=self.pipeline_configuration.record_video or self.pipeline_configuration.rtmp_stream_video,
         )
 
     def get_zoom_bot_adapter(self):
@@ -100,7 +137,7 @@ class BotController:
             use_video=self.pipeline_configuration.record_video or self.pipeline_configuration.rtmp_stream_video,
             display_name=self.bot_in_db.name,
             send_message_callback=self.on_message_from_adapter,
-            add_audio_chunk_callback=self.individual_audio_input_manager.add_chunk,
+            add_audio_chunk_callback=self.streaming_transcription_manager.add_chunk if self.streaming_transcription_manager else self.individual_audio_input_manager.add_chunk,
             zoom_client_id=zoom_oauth_credentials["client_id"],
             zoom_client_secret=zoom_oauth_credentials["client_secret"],
             meeting_url=self.bot_in_db.meeting_url,
@@ -108,6 +145,9 @@ class BotController:
             wants_any_video_frames_callback=self.gstreamer_pipeline.wants_any_video_frames,
             add_mixed_audio_chunk_callback=self.gstreamer_pipeline.on_mixed_audio_raw_data_received_callback,
             automatic_leave_configuration=self.automatic_leave_configuration,
+            repeat_video_frame_callback=self.gstreamer_pipeline.on_repeat_video_frame,
+            video_frame_size=self.get_video_frame_size(),
+            video_subscription_frame_size=self.get_video_frame_size() if self.bot_in_db.recording_resolution_is_set() else None,
         )
 
     def get_meeting_type(self):
@@ -125,15 +165,6 @@ class BotController:
         elif meeting_type == MeetingTypes.TEAMS:
             return GstreamerPipeline.AUDIO_FORMAT_FLOAT
 
-    def get_num_audio_sources(self):
-        meeting_type = self.get_meeting_type()
-        if meeting_type == MeetingTypes.ZOOM:
-            return 1
-        elif meeting_type == MeetingTypes.GOOGLE_MEET:
-            return 3
-        elif meeting_type == MeetingTypes.TEAMS:
-            return 1
-
     def get_bot_adapter(self):
         meeting_type = self.get_meeting_type()
         if meeting_type == MeetingTypes.ZOOM:
@@ -158,6 +189,32 @@ class BotController:
         recording.first_buffer_timestamp_ms = self.get_first_buffer_timestamp_ms()
         recording.save()
 
+    def recording_file_failed(self):
+        recording = Recording.objects.get(bot=self.bot_in_db, is_default_recording=True)
+        # Otherwise the bot's terminal event would mark it complete without a file
+        if recording.state == RecordingStates.IN_PROGRESS:
+            RecordingManager.set_recording_failed(recording)
+
+    def complete_streaming_upload(self):
+        # Everything but the last part was uploaded during the meeting
+        logger.info("Telling streaming uploader to upload the final part and complete the upload...")
+        try:
+            self.streaming_uploader.complete_upload()
+        except Exception as e:
+            # The upload was aborted, so there's no recording file to point at
+            logger.error(f"Streaming uploader failed to upload recording: {e}")
+            self.recording_file_failed()
+            return
+        logger.info("Streaming uploader finished uploading recording")
+        self.recording_file_saved(self.streaming_uploader.key)
+
+    def get_video_frame_size(self):
+        resolution = self.bot_in_db.recording_resolution()
+        if resolution == RecordingResolutions.SOURCE:
+            # The muxers can't change resolution partway through a recording, so this has to be decided before any video arrives
+            return self.SOURCE_VIDEO_FRAME_SIZES[self.get_meeting_type()]
+        return RECORDING_RESOLUTION_FRAME_SIZES[resolution]
+
     def get_recording_filename(self):
         recording = Recording.objects.get(bot=self.bot_in_db, is_default_recording=True)
         return f"{recording.object_id}.{self.bot_in_db.recording_format()}"
@@ -172,7 +229,18 @@ class BotController:
         )
         self.cleanup()
 
+    def on_new_flv_sample_from_gstreamer_pipeline(self, data):
+        # The stream teed off the recording's encoders, when the bot is recording and streaming at the same time
+        write_succeeded = self.rtmp_client.write_data(data)
+        if not write_succeeded:
+            GLib.idle_add(lambda: self.on_rtmp_connection_failed())
+
     def on_new_sample_from_gstreamer_pipeline(self, data):
+        if self.streaming_uploader:
+            # Queued here and uploaded as multipart parts by the uploader's thread
+            self.streaming_uploader.upload_part(data)
+            return
+
         # For now, we'll assume that if rtmp streaming is enabled, we don't need to upload to s3
         if self.rtmp_client:
             write_succeeded = self.rtmp_client.write_data(data)
@@ -191,8 +259,6 @@ class BotController:
         import threading
 
         def terminate_worker():
-            import time
-
             time.sleep(20)
             if normal_quitting_process_worked:
                 logger.info("Normal quitting process worked, not force terminating worker")
@@ -220,10 +286,21 @@ class BotController:
         if self.main_loop and self.main_loop.is_running():
             self.main_loop.quit()
 
+        if self.closed_caption_utterance_writer:
+            logger.info("Telling closed caption utterance writer to cleanup...")
+            self.closed_caption_utterance_writer.stop()
+
+        if self.task_executor:
+            logger.info("Telling task executor to finish pending tasks...")
+            self.task_executor.shutdown(timeout=10)
+
         if self.media_recorder_receiver:
             logger.info("Telling media recorder receiver to cleanup...")
             self.media_recorder_receiver.cleanup()
 
+        if self.streaming_uploader:
+            self.complete_streaming_upload()
+
         if self.get_recording_file_location():
             logger.info("Telling file uploader to upload recording file...")
             file_uploader = FileUploader(
@@ -240,8 +317,19 @@ class BotController:
         if self.bot_in_db.create_debug_recording():
             self.save_debug_recording()
 
+        if self.metrics_server:
+            self.metrics_server.stop()
+
         if self.bot_in_db.state == BotStates.POST_PROCESSING:
-            BotEventManager.create_event(bot=self.bot_in_db, event_type=BotEventTypes.POST_PROCESSING_COMPLETED)
+            BotEventManager.create_event(
+                bot=self.bot_in_db,
+                event_type=BotEventTypes.POST_PROCESSING_COMPLETED,
+                event_metadata={
+                    "metrics": bot_metrics.summary(),
+                    # So it's clear when and why parts of the recording are lower quality
+                    "encoder_quality_changes": self.gstreamer_pipeline.encoder_quality_changes() if self.gstreamer_pipeline else [],
+                },
+            )
 
         normal_quitting_process_worked = True
 
@@ -252,28 +340,62 @@ class BotController:
 
         self.automatic_leave_configuration = AutomaticLeaveConfiguration()
 
-        if self.bot_in_db.rtmp_destination_url():
+        if self.bot_in_db.rtmp_destination_url() and self.bot_in_db.rtmp_save_recording():
+            self.pipeline_configuration = PipelineConfiguration.rtmp_streaming_and_recorder_bot()
+        elif self.bot_in_db.rtmp_destination_url():
             self.pipeline_configuration = PipelineConfiguration.rtmp_streaming_bot()
+        elif self.bot_in_db.recording_format() in AUDIO_ONLY_RECORDING_FORMATS:
+            self.pipeline_configuration = PipelineConfiguration.audio_recorder_bot()
         else:
             self.pipeline_configuration = PipelineConfiguration.recorder_bot()
 
+    def should_stream_recording_upload(self):
+        # Upload the recording to S3 in parts while the meeting is going on, instead of writing a file and uploading it at the end.
+        if not self.pipeline_configuration.record_video and not self.pipeline_configuration.record_audio:
+            return False
+        return os.getenv("RECORDING_UPLOAD_MODE") == "streaming"
+
+    def should_use_rtmp2sink(self):
+        # Stream from an rtmp2sink inside the gstreamer pipeline, instead of piping FLV to an ffmpeg process.
+        # It saves a process and a copy, but a broken connection is fatal instead of being reconnected.
+        return os.getenv("RTMP_EGRESS_MODE") == "rtmp2sink"
+
+    def is_rtmp_streaming_only(self):
+        # When the bot is also recording, the recording is the pipeline's main output and the stream is a second one
+        if not self.pipeline_configuration.rtmp_stream_audio and not self.pipeline_configuration.rtmp_stream_video:
+            return False
+        return not self.pipeline_configuration.record_video and not self.pipeline_configuration.record_audio
+
     def get_gstreamer_sink_type(self):
-        if self.pipeline_configuration.rtmp_stream_audio or self.pipeline_configuration.rtmp_stream_video:
+        if self.is_rtmp_streaming_only() and self.should_use_rtmp2sink():
+            return GstreamerPipeline.SINK_TYPE_RTMP
+        if self.is_rtmp_streaming_only():
+            return GstreamerPipeline.SINK_TYPE_APPSINK
+        if self.should_stream_recording_upload():
             return GstreamerPipeline.SINK_TYPE_APPSINK
         else:
             return GstreamerPipeline.SINK_TYPE_FILE
 
     def get_gstreamer_output_format(self):
-        if self.pipeline_configuration.rtmp_stream_audio or self.pipeline_configuration.rtmp_stream_video:
+        if self.is_rtmp_streaming_only():
             return GstreamerPipeline.OUTPUT_FORMAT_FLV
 
-        if self.bot_in_db.recording_format() == RecordingFormats.WEBM:
+        recording_format = self.bot_in_db.recording_format()
+        if recording_format == RecordingFormats.WEBM:
             return GstreamerPipeline.OUTPUT_FORMAT_WEBM
+        elif recording_format == RecordingFormats.M4A:
+            return GstreamerPipeline.OUTPUT_FORMAT_M4A
+        elif recording_format == RecordingFormats.MP3:
+            return GstreamerPipeline.OUTPUT_FORMAT_MP3
+        elif recording_format == RecordingFormats.OPUS:
+            return GstreamerPipeline.OUTPUT_FORMAT_OPUS
         else:
             return GstreamerPipeline.OUTPUT_FORMAT_MP4
 
     def get_recording_file_location(self):
-        if self.pipeline_configuration.rtmp_stream_audio or self.pipeline_configuration.rtmp_stream_video:
+        if self.is_rtmp_streaming_only():
+            return None
+        elif self.should_stream_recording_upload():
             return None
         else:
             return os.path.join("/tmp", self.get_recording_filename())
@@ -289,6 +411,39 @@ class BotController:
         elif meeting_type == MeetingTypes.TEAMS:
             return True
 
+    def should_use_streaming_transcription(self):
+        # Streaming transcription needs per-participant audio, which only the zoom adapter provides
+        if self.get_meeting_type() != MeetingTypes.ZOOM:
+            return False
+        default_recording = Recording.objects.filter(bot=self.bot_in_db, is_default_recording=True).first()
+        return default_recording is not None and default_recording.transcription_type == TranscriptionTypes.REALTIME
+
+    def create_streaming_transcription_manager(self):
+        deepgram_credentials_record = self.bot_in_db.project.credentials.filter(credential_type=Credentials.CredentialTypes.DEEPGRAM).first()
+        if not deepgram_credentials_record:
+            raise Exception("Deepgram credentials record not found")
+
+        deepgram_credentials = deepgram_credentials_record.get_credentials()
+        if not deepgram_credentials:
+            raise Exception("Deepgram credentials not found")
+
+        # nova-3 does not have multilingual support yet, so we need to use nova-2 if we're transcribing with a non-default language
+        if self.bot_in_db.deepgram_language() != "en" and self.bot_in_db.deepgram_language():
+            deepgram_model = "nova-2"
+        else:
+            deepgram_model = "nova-3"
+
+        return StreamingTranscriptionManager(
+            url=deepgram_streaming_url(
+                model=deepgram_model,
+                language=self.bot_in_db.deepgram_language(),
+                sample_rate=self.individual_audio_input_manager.sample_rate,
+            ),
+            api_key=deepgram_credentials["api_key"],
+            save_result_callback=self.on_streaming_transcription_result,
+            get_participant_callback=self.get_participant,
+        )
+
     def should_create_media_recorder_receiver(self):
         return not self.should_create_gstreamer_pipeline()
 
@@ -303,34 +458,64 @@ class BotController:
         channel = f"bot_{self.bot_in_db.id}"
         pubsub.subscribe(channel)
 
+        # Metrics for this bot process, served for scraping if a port is configured and summarised at shutdown
+        install_orm_timing(connection)
+        self.metrics_server = None
+        if os.getenv("BOT_METRICS_PORT"):
+            self.metrics_server = BotMetricsServer(metrics=bot_metrics, host=os.getenv("BOT_METRICS_HOST", "0.0.0.0"), port=int(os.getenv("BOT_METRICS_PORT")))
+            self.metrics_server.start()
+
+        # Blocking side effects (utterance saves, heartbeats, debug uploads) run here so they don't stall the main loop
+        self.task_executor = OrderedTaskExecutor(num_workers=self.TASK_EXECUTOR_NUM_WORKERS)
+
         # Initialize core objects
         # Only used for adapters that can provide per-participant audio
         self.individual_audio_input_manager = IndividualAudioInputManager(
-            save_utterance_callback=self.save_individual_audio_utterance,
+            save_utterance_callback=self.on_individual_audio_utterance,
             get_participant_callback=self.get_participant,
         )
 
+        # Used instead of the individual audio input manager when the recording is transcribed in realtime
+        self.streaming_transcription_manager = None
+        if self.should_use_streaming_transcription():
+            self.streaming_transcription_manager = self.create_streaming_transcription_manager()
+
         # Only used for adapters that can provide closed captions
+        self.closed_caption_utterance_writer = ClosedCaptionUtteranceWriter(
+            bot=self.bot_in_db,
+            get_recording_in_progress_callback=self.get_recording_in_progress,
+        )
         self.closed_caption_manager = ClosedCaptionManager(
             save_utterance_callback=self.save_closed_caption_utterance,
             get_participant_callback=self.get_participant,
         )
 
         self.rtmp_client = None
-        if self.pipeline_configuration.rtmp_stream_audio or self.pipeline_configuration.rtmp_stream_video:
+        if (self.pipeline_configuration.rtmp_stream_audio or self.pipeline_configuration.rtmp_stream_video) and not self.should_use_rtmp2sink():
             self.rtmp_client = RTMPClient(rtmp_url=self.bot_in_db.rtmp_destination_url())
             self.rtmp_client.start()
 
+        self.streaming_uploader = None
+        if self.should_stream_recording_upload():
+            self.streaming_uploader = StreamingUploader(
+                os.environ.get("AWS_RECORDING_STORAGE_BUCKET_NAME"),
+                self.get_recording_filename(),
+            )
+            self.streaming_uploader.start_upload()
+
         self.gstreamer_pipeline = None
         if self.should_create_gstreamer_pipeline():
             self.gstreamer_pipeline = GstreamerPipeline(
                 on_new_sample_callback=self.on_new_sample_from_gstreamer_pipeline,
-                video_frame_size=(1920, 1080),
+                video_frame_size=self.get_video_frame_size(),
+                video_frame_rate=self.bot_in_db.recording_frame_rate(),
                 audio_format=self.get_audio_format(),
                 output_format=self.get_gstreamer_output_format(),
-                num_audio_sources=self.get_num_audio_sources(),
                 sink_type=self.get_gstreamer_sink_type(),
                 file_location=self.get_recording_file_location(),
+                on_new_flv_sample_callback=self.on_new_flv_sample_from_gstreamer_pipeline if self.rtmp_client and not self.is_rtmp_streaming_only() else None,
+                rtmp_location=self.bot_in_db.rtmp_destination_url() if self.should_use_rtmp2sink() else None,
+                on_rtmp_sink_error_callback=self.on_rtmp_connection_failed,
             )
             self.gstreamer_pipeline.setup()
 
@@ -338,12 +523,14 @@ class BotController:
         if self.should_create_media_recorder_receiver():
             self.media_recorder_receiver = MediaRecorderReceiver(
                 file_location=self.get_recording_file_location(),
+                write_chunk_callback=self.streaming_uploader.upload_part if self.streaming_uploader else None,
             )
 
         self.adapter = self.get_bot_adapter()
 
         self.audio_output_manager = AudioOutputManager(
             currently_playing_audio_media_request_finished_callback=self.currently_playing_audio_media_request_finished,
+            currently_playing_audio_media_request_failed_callback=self.currently_playing_audio_media_request_failed,
             play_raw_audio_callback=self.adapter.send_raw_audio,
         )
 
@@ -369,7 +556,11 @@ class BotController:
 
         # Add timeout just for audio processing
         self.first_timeout_call = True
-        GLib.timeout_add(100, self.on_main_loop_timeout)
+        self.last_heartbeat_submitted_at = None
+        self.last_main_loop_timeout_at = None
+        self.max_main_loop_lag_ms = 0
+        self.last_main_loop_stats_logged_at = time.monotonic()
+        GLib.timeout_add(self.MAIN_LOOP_TIMEOUT_INTERVAL_MS, self.on_main_loop_timeout)
 
         # Add signal handlers so that when we get a SIGTERM or SIGINT, we can clean up the bot
         GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGTERM, self.handle_glib_shutdown)
@@ -404,6 +595,11 @@ class BotController:
         BotMediaRequestManager.set_media_request_finished(audio_media_request)
         self.take_action_based_on_audio_media_requests_in_db()
 
+    def currently_playing_audio_media_request_failed(self, audio_media_request):
+        logger.info("currently_playing_audio_media_request_failed called")
+        BotMediaRequestManager.set_media_request_failed_to_play(audio_media_request)
+        self.take_action_based_on_audio_media_requests_in_db()
+
     def take_action_based_on_audio_media_requests_in_db(self):
         media_type = BotMediaRequestMediaTypes.AUDIO
         oldest_enqueued_media_request = self.bot_in_db.media_requests.filter(state=BotMediaRequestStates.ENQUEUED, media_type=media_type).order_by("created_at").first()
@@ -482,8 +678,29 @@ class BotController:
                 logger.info(f"Unknown command: {command}")
 
     def set_bot_heartbeat(self):
-        if self.bot_in_db.last_heartbeat_timestamp is None or self.bot_in_db.last_heartbeat_timestamp <= int(timezone.now().timestamp()) - 60:
-            self.bot_in_db.set_heartbeat()
+        if self.last_heartbeat_submitted_at is None or time.monotonic() - self.last_heartbeat_submitted_at >= 60:
+            self.last_heartbeat_submitted_at = time.monotonic()
+            # Only the latest heartbeat matters, so one isn't queued behind another when the database is slow
+            self.task_executor.submit_coalesced(self.TASK_KEY_HEARTBEAT, self.write_bot_heartbeat)
+
+    def write_bot_heartbeat(self):
+        # Runs on the task executor, so it uses its own bot instance instead of modifying the main loop's copy
+        Bot.objects.get(id=self.bot_in_db.id).set_heartbeat()
+
+    def record_main_loop_lag(self):
+        now = time.monotonic()
+        if self.last_main_loop_timeout_at is not None:
+            # How much later than scheduled this tick ran, which is how long something else held up the main loop
+            lag_ms = (now - self.last_main_loop_timeout_at) * 1000 - self.MAIN_LOOP_TIMEOUT_INTERVAL_MS
+            self.max_main_loop_lag_ms = max(self.max_main_loop_lag_ms, lag_ms)
+            bot_metrics.observe("main_loop_lag_ms", max(lag_ms, 0))
+        bot_metrics.set_gauge("task_executor_queue_depth", self.task_executor.queue_depth())
+        self.last_main_loop_timeout_at = now
+
+        if now - self.last_main_loop_stats_logged_at >= 60:
+            logger.info(f"Main loop max lag over the last minute: {self.max_main_loop_lag_ms:.0f}ms. Task executor queue depth: {self.task_executor.queue_depth()} (max {self.task_executor.max_pending_task_count}), by key: {self.task_executor.queue_depth_by_key()}")
+            self.max_main_loop_lag_ms = 0
+            self.last_main_loop_stats_logged_at = now
 
     def on_main_loop_timeout(self):
         try:
@@ -493,12 +710,18 @@ class BotController:
                 self.take_action_based_on_bot_in_db()
                 self.first_timeout_call = False
 
+            self.record_main_loop_lag()
+
             # Set heartbeat
             self.set_bot_heartbeat()
 
             # Process audio chunks
             self.individual_audio_input_manager.process_chunks()
 
+            # Process streaming transcription results
+            if self.streaming_transcription_manager:
+                self.streaming_transcription_manager.process_results()
+
             # Process captions
             self.closed_caption_manager.process_captions()
 
@@ -525,32 +748,14 @@ class BotController:
         return recordings_in_progress.first()
 
     def save_closed_caption_utterance(self, message):
-        participant, _ = Participant.objects.get_or_create(
-            bot=self.bot_in_db,
-            uuid=message["participant_uuid"],
-            defaults={
-                "user_uuid": message["participant_user_uuid"],
-                "full_name": message["participant_full_name"],
-            },
-        )
+        # Written to the database in batches by a background thread
+        self.closed_caption_utterance_writer.enqueue(message)
 
-        # Create new utterance record
-        recording_in_progress = self.get_recording_in_progress()
-        source_uuid = f"{recording_in_progress.object_id}-{message['source_uuid_suffix']}"
-        utterance, _ = Utterance.objects.update_or_create(
-            recording=recording_in_progress,
-            source_uuid=source_uuid,
-            defaults={
-                "source": Utterance.Sources.CLOSED_CAPTION_FROM_PLATFORM,
-                "participant": participant,
-                "transcription": {"transcript": message["text"]},
-                "timestamp_ms": message["timestamp_ms"],
-                "duration_ms": message["duration_ms"],
-                "sample_rate": None,
-            },
-        )
+    def on_individual_audio_utterance(self, message):
+        self.task_executor.submit(self.TASK_KEY_UTTERANCES, self.save_individual_audio_utterance, message)
 
-        RecordingManager.set_recording_transcription_in_progress(recording_in_progress)
+    def on_streaming_transcription_result(self, message):
+        self.task_executor.submit(self.TASK_KEY_UTTERANCES, self.save_streaming_transcription_result, message)
 
     def save_individual_audio_utterance(self, message):
         from bots.tasks.process_utterance_task import process_utterance
@@ -569,21 +774,79 @@ class BotController:
 
         # Create new utterance record
         recording_in_progress = self.get_recording_in_progress()
+
+        # If an utterance audio store is configured, the audio goes there and the row only holds its key
+        # audio_data is a memoryview over the utterance's buffer, which is passed on without copying it
+        audio_blob = message["audio_data"]
+        audio_format = Utterance.AudioFormat.PCM
+        audio_storage_key = None
+        sample_rate = message["sample_rate"]
+        audio_time_map = None
+        utterance_audio_store = get_utterance_audio_store()
+        if utterance_audio_store:
+            audio_data = message["audio_data"]
+            if settings.UTTERANCE_TRANSCRIPTION_AUDIO_COMPACTION:
+                # Compacted before the store compresses it, the transcription task can't compact compressed audio
+                audio_data, sample_rate, audio_time_map = compact_speech(audio_data, sample_rate, settings.UTTERANCE_TRANSCRIPTION_SAMPLE_RATE)
+            audio_storage_key, audio_format = utterance_audio_store.save(
+                f"{recording_in_progress.object_id}/{participant.uuid}-{message['timestamp_ms']}",
+                audio_data,
+                sample_rate,
+            )
+            audio_blob = b""
+
         utterance = Utterance.objects.create(
             source=Utterance.Sources.PER_PARTICIPANT_AUDIO,
             recording=recording_in_progress,
             participant=participant,
-            audio_blob=message["audio_data"],
-            audio_format=Utterance.AudioFormat.PCM,
+            audio_blob=audio_blob,
+            audio_format=audio_format,
+            audio_storage_key=audio_storage_key,
             timestamp_ms=message["timestamp_ms"],
             duration_ms=len(message["audio_data"]) / 64,
-            sample_rate=message["sample_rate"],
+            sample_rate=sample_rate,
+            audio_time_map=audio_time_map,
         )
 
         # Process the utterance immediately
         process_utterance.delay(utterance.id)
         return
 
+    def save_streaming_transcription_result(self, message):
+        participant, _ = Participant.objects.get_or_create(
+            bot=self.bot_in_db,
+            uuid=message["participant_uuid"],
+            defaults={
+                "user_uuid": message["participant_user_uuid"],
+                "full_name": message["participant_full_name"],
+            },
+        )
+
+        recording_in_progress = self.get_recording_in_progress()
+        source_uuid = f"{recording_in_progress.object_id}-{message['participant_uuid']}-{message['segment_key']}"
+
+        # An empty final result means the interim results for this segment were spurious
+        if message["discard"]:
+            Utterance.objects.filter(recording=recording_in_progress, source_uuid=source_uuid).delete()
+            return
+
+        # Interim results are upserted and then overwritten by the final result for the same segment
+        Utterance.objects.update_or_create(
+            recording=recording_in_progress,
+            source_uuid=source_uuid,
+            defaults={
+                "source": Utterance.Sources.PER_PARTICIPANT_AUDIO,
+                "participant": participant,
+                "audio_format": Utterance.AudioFormat.PCM,
+                "transcription": message["transcription"],
+                "timestamp_ms": message["timestamp_ms"],
+                "duration_ms": message["duration_ms"],
+                "sample_rate": self.individual_audio_input_manager.sample_rate,
+            },
+        )
+
+        RecordingManager.set_recording_transcription_in_progress(recording_in_progress)
+
     def on_message_from_adapter(self, message):
         GLib.idle_add(lambda: self.take_action_based_on_message_from_adapter(message))
 
@@ -591,9 +854,17 @@ class BotController:
         if self.individual_audio_input_manager:
             logger.info("Flushing utterances...")
             self.individual_audio_input_manager.flush_utterances()
+        if self.streaming_transcription_manager:
+            logger.info("Flushing streaming transcription results...")
+            self.streaming_transcription_manager.flush_results()
         if self.closed_caption_manager:
             logger.info("Flushing captions...")
             self.closed_caption_manager.flush_captions()
+            self.closed_caption_utterance_writer.flush()
+        # The flushed utterances are saved on the task executor, wait for them to land before the recording is completed
+        logger.info("Waiting for utterances to be saved...")
+        if not self.task_executor.wait_until_idle(timeout=self.FLUSH_UTTERANCES_TIMEOUT_SECONDS):
+            logger.info(f"Gave up waiting for utterances to be saved after {self.FLUSH_UTTERANCES_TIMEOUT_SECONDS}s, {self.task_executor.queue_depth()} tasks still pending")
 
     def save_debug_recording(self):
         # Only save if the file exists
@@ -611,6 +882,32 @@ class BotController:
                 debug_screenshot.file.save(f"debug_screen_recording_{debug_screenshot.object_id}.mp4", f, save=True)
             logger.info(f"Saved debug recording with ID {debug_screenshot.object_id}")
 
+    def save_debug_artifacts(self, bot_event, screenshot_path, mhtml_file_path):
+        if screenshot_path:
+            # Create debug screenshot
+            debug_screenshot = BotDebugScreenshot.objects.create(bot_event=bot_event)
+
+            # Read the file content from the path
+            with open(screenshot_path, "rb") as f:
+                screenshot_content = f.read()
+                debug_screenshot.file.save(
+                    f"debug_screenshot_{debug_screenshot.object_id}.png",
+                    ContentFile(screenshot_content),
+                    save=True,
+                )
+
+        if mhtml_file_path:
+            # Create debug screenshot
+            mhtml_debug_screenshot = BotDebugScreenshot.objects.create(bot_event=bot_event)
+
+            with open(mhtml_file_path, "rb") as f:
+                mhtml_content = f.read()
+                mhtml_debug_screenshot.file.save(
+                    f"debug_screenshot_{mhtml_debug_screenshot.object_id}.mhtml",
+                    ContentFile(mhtml_content),
+                    save=True,
+                )
+
     def take_action_based_on_message_from_adapter(self, message):
         if message.get("message") == BotAdapter.Messages.REQUEST_TO_JOIN_DENIED:
             logger.info("Received message that request to join was denied")
@@ -642,30 +939,14 @@ class BotController:
                 },
             )
 
-            if screenshot_available:
-                # Create debug screenshot
-                debug_screenshot = BotDebugScreenshot.objects.create(bot_event=new_bot_event)
-
-                # Read the file content from the path
-                with open(message.get("screenshot_path"), "rb") as f:
-                    screenshot_content = f.read()
-                    debug_screenshot.file.save(
-                        f"debug_screenshot_{debug_screenshot.object_id}.png",
-                        ContentFile(screenshot_content),
-                        save=True,
-                    )
-
-            if mhtml_file_available:
-                # Create debug screenshot
-                mhtml_debug_screenshot = BotDebugScreenshot.objects.create(bot_event=new_bot_event)
-
-                with open(message.get("mhtml_file_path"), "rb") as f:
-                    mhtml_content = f.read()
-                    mhtml_debug_screenshot.file.save(
-                        f"debug_screenshot_{mhtml_debug_screenshot.object_id}.mhtml",
-                        ContentFile(mhtml_content),
-                        save=True,
-                    )
+            if screenshot_available or mhtml_file_available:
+                self.task_executor.submit(
+                    self.TASK_KEY_DEBUG_ARTIFACTS,
+                    self.save_debug_artifacts,
+                    new_bot_event,
+                    message.get("screenshot_path"),
+                    message.get("mhtml_file_path"),
+                )
 
             self.cleanup()
             return
@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+
+from django.db import connection
+
+from bots.bot_metrics import SIZE_BUCKETS, bot_metrics
+from bots.models import Participant, RecordingManager, Utterance
+
+logger = logging.getLogger(__name__)
+
+
+class ClosedCaptionUtteranceWriter:
+    """
+    Write-behind persistence for closed caption utterances. Captions are queued from the main loop and a background
+    thread upserts everything that's pending in a single bulk query, so busy meetings don't stall the main loop on the database.
+    Participants and the in-progress recording are looked up once and cached. When stopping, the last flush is retried and
+    if it still fails the captions are written one at a time, so one bad caption can't take the rest down with it.
+    """
+
+    FLUSH_INTERVAL_SECONDS = 1
+    FINAL_FLUSH_ATTEMPTS = 3
+    FINAL_FLUSH_RETRY_DELAY_SECONDS = 1
+
+    def __init__(self, *, bot, get_recording_in_progress_callback):
+        self.bot = bot
+        self.get_recording_in_progress_callback = get_recording_in_progress_callback
+
+        # Keyed by source_uuid_suffix so that only the latest version of each caption is written
+        self.pending_messages = {}
+        self.pending_messages_lock = threading.Lock()
+        # Held while writing, so a flush from the main loop and the background thread never write at the same time
+        self.write_lock = threading.Lock()
+
+        self.recording = None
+        self.participants_by_uuid = {}
+        self.recording_transcription_marked_in_progress = False
+
+        self.stop_event = threading.Event()
+        self.writer_thread = threading.Thread(target=self.writer_worker, daemon=True)
+        self.writer_thread.start()
+
+    def enqueue(self, message):
+        with self.pending_messages_lock:
+            self.pending_messages[message["source_uuid_suffix"]] = message
+
+    def flush(self):
+        self.write_pending_messages()
+
+    def stop(self):
+        self.stop_event.set()
+        self.writer_thread.join(timeout=10)
+        for attempt in range(self.FINAL_FLUSH_ATTEMPTS):
+            if attempt > 0:
+                time.sleep(self.FINAL_FLUSH_RETRY_DELAY_SECONDS)
+            if self.write_pending_messages():
+                return
+        self.write_pending_messages_individually()
+
+    def writer_worker(self):
+        try:
+            while not self.stop_event.wait(self.FLUSH_INTERVAL_SECONDS):
+                self.write_pending_messages()
+        finally:
+            # This thread has its own database connection, which needs to be closed explicitly
+            connection.close()
+
+    def get_participant(self, message):
+        participant = self.participants_by_uuid.get(message["participant_uuid"])
+        if participant is None:
+            participant, _ = Participant.objects.get_or_create(
+                bot=self.bot,
+                uuid=message["participant_uuid"],
+                defaults={
+                    "user_uuid": message["participant_user_uuid"],
+                    "full_name": message["participant_full_name"],
+                },
+            )
+            self.participants_by_uuid[message["participant_uuid"]] = participant
+        return participant
+
+    def take_pending_messages(self):
+        with self.pending_messages_lock:
+            messages = self.pending_messages
+            self.pending_messages = {}
+        return messages
+
+    def write_messages(self, messages):
+        if self.recording is None:
+            self.recording = self.get_recording_in_progress_callback()
+
+        utterances = [
+            Utterance(
+                recording=self.recording,
+                source_uuid=f"{self.recording.object_id}-{message['source_uuid_suffix']}",
+                source=Utterance.Sources.CLOSED_CAPTION_FROM_PLATFORM,
+                participant=self.get_participant(message),
+                transcription={"transcript": message["text"]},
+                timestamp_ms=message["timestamp_ms"],
+                duration_ms=message["duration_ms"],
+                sample_rate=None,
+            )
+            for message in messages
+        ]
+
+        Utterance.objects.bulk_create(
+            utterances,
+            update_conflicts=True,
+            unique_fields=["source_uuid"],
+            update_fields=["source", "participant", "transcription", "timestamp_ms", "duration_ms", "sample_rate", "updated_at"],
+        )
+
+        if not self.recording_transcription_marked_in_progress:
+            RecordingManager.set_recording_transcription_in_progress(self.recording)
+            self.recording_transcription_marked_in_progress = True
+
+        bot_metrics.observe("utterance_flush_size", len(utterances), buckets=SIZE_BUCKETS, source="closed_caption")
+        logger.info(f"Wrote {len(utterances)} closed caption utterances")
+
+    def write_pending_messages(self):
+        """Returns whether everything that was pending got written"""
+        with self.write_lock:
+            messages = self.take_pending_messages()
+            if not messages:
+                return True
+
+            try:
+                self.write_messages(list(messages.values()))
+                return True
+            except Exception as e:
+                logger.info(f"Error writing closed caption utterances, will retry: {e}")
+                # Put the messages back unless a newer version of the caption has arrived in the meantime
+                with self.pending_messages_lock:
+                    self.pending_messages = {**messages, **self.pending_messages}
+                return False
+
+    def write_pending_messages_individually(self):
+        """Last resort when stopping, captions that still can't be written are dropped"""
+        with self.write_lock:
+            for source_uuid_suffix, message in self.take_pending_messages().items():
+                try:
+                    self.write_messages([message])
+                except Exception as e:
+                    logger.error(f"Dropping closed caption {source_uuid_suffix} from participant {message['participant_uuid']}: {e}")
+                    bot_metrics.increment("closed_captions_dropped_total")
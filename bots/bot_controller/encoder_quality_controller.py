@@ -0,0 +1,119 @@
+import logging
+import os
+import resource
+
+logger = logging.getLogger(__name__)
+
+
+def cgroup_cpu_limit_cores():
+    """The container's CPU limit in cores, or None if it doesn't have one"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        return None
+
+
+def cpu_seconds_used():
+    """CPU time used by the whole container if it's in a cgroup, otherwise by this process. The browser counts against the same limit as the bot."""
+    try:
+        with open("/sys/fs/cgroup/cpu.stat") as f:
+            for line in f:
+                key, value = line.split()
+                if key == "usage_usec":
+                    return int(value) / 1_000_000
+    except (OSError, ValueError):
+        pass
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def default_cpu_budget_cores():
+    if os.getenv("ENCODER_CPU_BUDGET_CORES"):
+        return float(os.getenv("ENCODER_CPU_BUDGET_CORES"))
+    # Leave some headroom, so the audio and the meeting client don't starve when the encoder is busy
+    return 0.85 * (cgroup_cpu_limit_cores() or os.cpu_count() or 1)
+
+
+class EncoderQualityController:
+    """
+    Decides how much work the video encoder should do, from how much CPU is being used and whether the video queues in front of
+    the encoder are backing up. It steps down one level at a time when it's over the CPU budget or the queues are filling up,
+    and steps back up once usage has stayed well under the budget for a while, so a busy machine makes the recording
+    lower quality instead of making it stutter.
+
+    The resolution and the encoder preset stay the same. The muxers can't change resolution partway through a recording,
+    and the encoder already runs at its fastest preset. The frame rate is lowered by dropping frames between videorate and the
+    encoder, instead of changing the negotiated frame rate, which would restart the encoder and send the muxers new caps.
+    """
+
+    # (fraction of the starting bitrate, encode one in this many frames)
+    LEVELS = ((1.0, 1), (0.75, 1), (0.5, 2), (0.35, 3))
+    # A video queue this full means the encoder isn't keeping up
+    HIGH_QUEUE_FILL = 0.5
+    # Usage has to drop below this fraction of the budget before stepping back up
+    RECOVERY_CPU_FRACTION = 0.6
+    # Samples in a row that have to be under the recovery threshold before stepping back up, so the quality doesn't flap
+    SAMPLES_BEFORE_RECOVERY = 6
+
+    def __init__(self, *, cpu_budget_cores):
+        self.cpu_budget_cores = cpu_budget_cores
+        self.level = 0
+        self.samples_under_recovery_threshold = 0
+        # Every change, for the bot's events
+        self.changes = []
+
+    @property
+    def bitrate_fraction(self):
+        return self.LEVELS[self.level][0]
+
+    @property
+    def frame_rate_divisor(self):
+        return self.LEVELS[self.level][1]
+
+    def should_encode_frame(self, frame_index):
+        return frame_index % self.frame_rate_divisor == 0
+
+    def update(self, *, cpu_cores_used, max_queue_fill, new_queue_drops, recording_time_ms):
+        """Takes a sample of how the pipeline is doing. Returns True if the level changed."""
+        reason = None
+        if new_queue_drops > 0:
+            reason = "video_queue_dropped_buffers"
+        elif max_queue_fill > self.HIGH_QUEUE_FILL:
+            reason = "video_queue_filling"
+        elif cpu_cores_used > self.cpu_budget_cores:
+            reason = "over_cpu_budget"
+
+        if reason:
+            self.samples_under_recovery_threshold = 0
+            if self.level == len(self.LEVELS) - 1:
+                return False
+            return self.change_level(self.level + 1, reason, cpu_cores_used, recording_time_ms)
+
+        if cpu_cores_used < self.cpu_budget_cores * self.RECOVERY_CPU_FRACTION:
+            self.samples_under_recovery_threshold += 1
+        else:
+            self.samples_under_recovery_threshold = 0
+
+        if self.level == 0 or self.samples_under_recovery_threshold < self.SAMPLES_BEFORE_RECOVERY:
+            return False
+        self.samples_under_recovery_threshold = 0
+        return self.change_level(self.level - 1, "under_cpu_budget", cpu_cores_used, recording_time_ms)
+
+    def change_level(self, level, reason, cpu_cores_used, recording_time_ms):
+        logger.info(f"Changing encoder quality level from {self.level} to {level} because of {reason}, using {cpu_cores_used:.2f} of a {self.cpu_budget_cores:.2f} core budget")
+        self.level = level
+        self.changes.append(
+            {
+                "recording_time_ms": recording_time_ms,
+                "level": level,
+                "bitrate_fraction": self.bitrate_fraction,
+                "frame_rate_divisor": self.frame_rate_divisor,
+                "reason": reason,
+                "cpu_cores_used": round(cpu_cores_used, 2),
+            }
+        )
+        return True
@@ -0,0 +1,206 @@
+import struct
+
+# Bit in the sample flags that marks a sample that can't be decoded on its own
+SAMPLE_IS_NON_SYNC_SAMPLE = 0x10000
+
+
+def mp4_box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def mp4_full_box(box_type, version, flags, payload):
+    return mp4_box(box_type, struct.pack(">I", (version << 24) | flags) + payload)
+
+
+def iterate_boxes(data):
+    """Yields (box_type, payload) for the boxes that make up data"""
+    offset = 0
+    while offset + 8 <= len(data):
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", data, offset + 8)
+            header_size = 16
+        elif size == 0:
+            size = len(data) - offset
+        if size < header_size or offset + size > len(data):
+            return
+        yield box_type, data[offset + header_size : offset + size]
+        offset += size
+
+
+def find_box(data, box_type):
+    for child_type, payload in iterate_boxes(data):
+        if child_type == box_type:
+            return payload
+    return None
+
+
+class FragmentedMp4Index:
+    """
+    Follows a fragmented MP4 as it's written, one chunk at a time, and keeps track of where each fragment starts and
+    what time it starts at. At the end, movie_fragment_random_access_box() returns an mfra box to append to the file,
+    so players can seek in it without the whole file being remuxed to move the moov box to the front.
+
+    Only moov and moof boxes are buffered, the media data is skipped over without being copied.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.pending_header = b""
+        self.current_box_type = None
+        self.current_box_start = 0
+        self.current_box_remaining = 0
+        self.current_box_payload = None
+        self.header_overflow = 0
+
+        self.is_fragmented_mp4 = None
+        self.default_sample_flags_by_track = {}
+        # track_id -> list of (time, moof_offset, traf_number)
+        self.entries_by_track = {}
+        self.num_fragments = 0
+
+    def add_chunk(self, chunk):
+        if self.is_fragmented_mp4 is False:
+            return
+
+        chunk = memoryview(chunk)
+        position = 0
+        while position < len(chunk):
+            if self.current_box_type is None:
+                # Collect enough bytes for the largest box header
+                needed = 16 - len(self.pending_header)
+                self.pending_header += bytes(chunk[position : position + needed])
+                position += min(needed, len(chunk) - position)
+                if not self.start_box():
+                    continue
+                # Any bytes after the header that were pulled into pending_header belong to the box
+                position -= self.header_overflow
+                if self.is_fragmented_mp4 is False:
+                    return
+                continue
+
+            consumed = min(self.current_box_remaining, len(chunk) - position)
+            if self.current_box_payload is not None:
+                self.current_box_payload += chunk[position : position + consumed]
+            position += consumed
+            self.current_box_remaining -= consumed
+            if self.current_box_remaining == 0:
+                self.finish_box()
+
+    def start_box(self):
+        if len(self.pending_header) < 8:
+            return False
+        size, box_type = struct.unpack_from(">I4s", self.pending_header)
+        header_size = 8
+        if size == 1:
+            if len(self.pending_header) < 16:
+                return False
+            (size,) = struct.unpack_from(">Q", self.pending_header, 8)
+            header_size = 16
+
+        self.header_overflow = len(self.pending_header) - header_size
+        self.pending_header = b""
+
+        # A fragmented MP4 starts with an ftyp box, anything else isn't something we know how to index
+        if self.offset == 0 and box_type != b"ftyp":
+            self.is_fragmented_mp4 = False
+            return True
+        if size < header_size:
+            # A size of 0 means the box runs to the end of the file, which only a non-fragmented file would do
+            self.is_fragmented_mp4 = False
+            return True
+
+        self.current_box_type = box_type
+        self.current_box_start = self.offset
+        self.current_box_remaining = size - header_size
+        self.current_box_payload = bytearray() if box_type in (b"moov", b"moof") else None
+        self.offset += size
+        if self.current_box_remaining == 0:
+            self.finish_box()
+        return True
+
+    def finish_box(self):
+        if self.current_box_type == b"moov":
+            self.is_fragmented_mp4 = self.parse_moov(bytes(self.current_box_payload))
+        elif self.current_box_type == b"moof":
+            self.parse_moof(bytes(self.current_box_payload), self.current_box_start)
+        self.current_box_type = None
+        self.current_box_payload = None
+
+    def parse_moov(self, moov):
+        mvex = find_box(moov, b"mvex")
+        if mvex is None:
+            # Not fragmented, the sample tables are in the moov box
+            return False
+        for box_type, trex in iterate_boxes(mvex):
+            if box_type == b"trex" and len(trex) >= 24:
+                track_id, _, _, _, default_sample_flags = struct.unpack_from(">IIIII", trex, 4)
+                self.default_sample_flags_by_track[track_id] = default_sample_flags
+        return True
+
+    def parse_moof(self, moof, moof_offset):
+        self.num_fragments += 1
+        traf_number = 0
+        for box_type, traf in iterate_boxes(moof):
+            if box_type != b"traf":
+                continue
+            traf_number += 1
+
+            tfhd = find_box(traf, b"tfhd")
+            tfdt = find_box(traf, b"tfdt")
+            trun = find_box(traf, b"trun")
+            if tfhd is None or tfdt is None or trun is None:
+                continue
+
+            tfhd_flags, track_id = struct.unpack_from(">II", tfhd)
+            tfhd_flags &= 0xFFFFFF
+            default_sample_flags = self.default_sample_flags_by_track.get(track_id, 0)
+            if tfhd_flags & 0x20:
+                # default_sample_flags comes after the optional base_data_offset, sample_description_index, duration and size
+                flags_offset = 8 + (8 if tfhd_flags & 0x1 else 0) + sum(4 for flag in (0x2, 0x8, 0x10) if tfhd_flags & flag)
+                (default_sample_flags,) = struct.unpack_from(">I", tfhd, flags_offset)
+
+            version = tfdt[0]
+            if version == 1:
+                (decode_time,) = struct.unpack_from(">Q", tfdt, 4)
+            else:
+                (decode_time,) = struct.unpack_from(">I", tfdt, 4)
+
+            if self.first_sample_flags(trun, default_sample_flags) & SAMPLE_IS_NON_SYNC_SAMPLE:
+                # Players can't start decoding from this fragment, so it's not a useful seek point
+                continue
+
+            self.entries_by_track.setdefault(track_id, []).append((decode_time, moof_offset, traf_number))
+
+    def first_sample_flags(self, trun, default_sample_flags):
+        trun_flags, sample_count = struct.unpack_from(">II", trun)
+        trun_flags &= 0xFFFFFF
+        if sample_count == 0:
+            return default_sample_flags
+        offset = 8 + (4 if trun_flags & 0x1 else 0)
+        if trun_flags & 0x4:
+            (first_sample_flags,) = struct.unpack_from(">I", trun, offset)
+            return first_sample_flags
+        if trun_flags & 0x400:
+            # Per sample flags come after the per sample duration and size, if those are present
+            flags_offset = offset + (4 if trun_flags & 0x100 else 0) + (4 if trun_flags & 0x200 else 0)
+            (first_sample_flags,) = struct.unpack_from(">I", trun, flags_offset)
+            return first_sample_flags
+        return default_sample_flags
+
+    def movie_fragment_random_access_box(self):
+        if not self.is_fragmented_mp4 or not self.entries_by_track:
+            return None
+
+        track_fragment_random_access_boxes = b""
+        for track_id, entries in sorted(self.entries_by_track.items()):
+            # Version 1 uses 64 bit times and offsets. The zero means traf, trun and sample numbers are one byte each.
+            payload = struct.pack(">III", track_id, 0, len(entries))
+            for decode_time, moof_offset, traf_number in entries:
+                payload += struct.pack(">QQBBB", decode_time, moof_offset, traf_number, 1, 1)
+            track_fragment_random_access_boxes += mp4_full_box(b"tfra", 1, 0, payload)
+
+        # The mfro box at the very end holds the size of the mfra box, so readers can find it from the end of the file
+        mfra_size = 8 + len(track_fragment_random_access_boxes) + 16
+        return mp4_box(b"mfra", track_fragment_random_access_boxes + mp4_full_box(b"mfro", 0, 0, struct.pack(">I", mfra_size)))
@@ -2,22 +2,62 @@ import gi
 
 gi.require_version("Gst", "1.0")
 import logging
+import threading
 import time
 
 from gi.repository import GLib, Gst
 
+from bots.bot_metrics import bot_metrics
+
+from .encoder_quality_controller import EncoderQualityController, cpu_seconds_used, default_cpu_budget_cores
+from .pipeline_memory_budget import PipelineMemoryBudget, default_pipeline_memory_budget_bytes
+
 logger = logging.getLogger(__name__)
 
 
+class AudioSource:
+    """An appsrc feeding the audio mixer, the bin it's in, its queue and the mixer pad the bin is linked to"""
+
+    def __init__(self, *, appsrc, branch, queue, mixer_pad):
+        self.appsrc = appsrc
+        self.branch = branch
+        self.queue = queue
+        self.mixer_pad = mixer_pad
+        self.last_buffer_time = time.monotonic()
+
+
 class GstreamerPipeline:
     AUDIO_FORMAT_PCM = "audio/x-raw,format=S16LE,channels=1,rate=32000,layout=interleaved"
     AUDIO_FORMAT_FLOAT = "audio/x-raw,format=F32LE,channels=1,rate=48000,layout=interleaved"
     OUTPUT_FORMAT_FLV = "flv"
     OUTPUT_FORMAT_MP4 = "mp4"
     OUTPUT_FORMAT_WEBM = "webm"
+    OUTPUT_FORMAT_M4A = "m4a"
+    OUTPUT_FORMAT_MP3 = "mp3"
+    OUTPUT_FORMAT_OPUS = "opus"
+    # These formats have no video, so the pipeline is built without a video branch
+    AUDIO_ONLY_OUTPUT_FORMATS = (OUTPUT_FORMAT_M4A, OUTPUT_FORMAT_MP3, OUTPUT_FORMAT_OPUS)
 
     SINK_TYPE_APPSINK = "appsink"
     SINK_TYPE_FILE = "filesink"
+    SINK_TYPE_RTMP = "rtmp2sink"
+
+    # Audio from the default source is pushed with this id, its branch is part of the pipeline string and is never released
+    DEFAULT_AUDIO_SOURCE_ID = 0
+    # How long the mixer waits for late audio from any source before mixing without it
+    AUDIO_MIXER_LATENCY_NS = 200_000_000
+    # Other audio sources are released after this long without audio, and added again if they start sending audio
+    AUDIO_SOURCE_IDLE_TIMEOUT_SECONDS = 10
+
+    # The queues in front of the video encoder, which back up when it can't keep up
+    VIDEO_QUEUE_NAMES = ("q1", "q2")
+    ENCODER_QUALITY_CHECK_INTERVAL_SECONDS = 5
+
+    # Up to 5 seconds of encoded media waits for the FLV muxer, after that the oldest is dropped
+    FLV_QUEUE_LIMITS = "max-size-time=5000000000"
+    # Queues whose time limit is set in the pipeline string, every other queue is only limited by the memory budget
+    TIME_LIMITED_QUEUE_NAMES = ("flv_video_queue", "flv_audio_queue")
+    MEMORY_BUDGET_CHECK_INTERVAL_MS = 1000
 
     def __init__(
         self,
@@ -26,23 +66,40 @@ class GstreamerPipeline:
         video_frame_size,
         audio_format,
         output_format,
-        num_audio_sources,
         sink_type,
         file_location=None,
+        video_frame_rate=30,
+        on_new_flv_sample_callback=None,
+        rtmp_location=None,
+        on_rtmp_sink_error_callback=None,
     ):
         self.on_new_sample_callback = on_new_sample_callback
+        # If set, the encoded audio and video are also muxed into FLV and passed to this callback, so a bot can stream
+        # to RTMP and record at the same time with one encode
+        self.on_new_flv_sample_callback = on_new_flv_sample_callback
+        # If set, the FLV output is streamed by an rtmp2sink in the pipeline, instead of being passed to a callback
+        self.rtmp_location = rtmp_location
+        self.on_rtmp_sink_error_callback = on_rtmp_sink_error_callback
         self.video_frame_size = video_frame_size
+        self.video_frame_rate = video_frame_rate
         self.audio_format = audio_format
         self.output_format = output_format
-        self.num_audio_sources = num_audio_sources
+        self.has_video = output_format not in self.AUDIO_ONLY_OUTPUT_FORMATS
         self.sink_type = sink_type
         self.file_location = file_location
 
+        self.tees_flv_output = bool(self.on_new_flv_sample_callback or (self.rtmp_location and self.output_format != self.OUTPUT_FORMAT_FLV))
+        if self.tees_flv_output and (not self.has_video or self.output_format == self.OUTPUT_FORMAT_FLV):
+            raise ValueError(f"Can't add an FLV output to a pipeline with output format {self.output_format}")
+
         self.pipeline = None
         self.appsrc = None
         self.recording_active = False
 
-        self.audio_appsrcs = []
+        # source id -> AudioSource, for every audio source currently linked to the mixer
+        self.audio_sources = {}
+        self.audio_sources_lock = threading.Lock()
+        self.audio_mixer = None
         self.audio_recording_active = False
 
         self.start_time_ns = None  # Will be set on first frame/audio sample
@@ -53,13 +110,25 @@ class GstreamerPipeline:
         self.queue_drops = {}
         self.last_reported_drops = {}
 
-    def on_new_sample_from_appsink(self, sink):
+        # When each frame entered the video encoder, keyed by pts, so we can measure how long encoding took
+        self.video_encoder_input_times = {}
+
+        self.video_encoder = None
+        self.encoder_quality_controller = None
+        # The most recent frame pushed, so it can be pushed again when the adapter has nothing new to show
+        self.last_video_frame = None
+        self.queues = {}
+        self.memory_budget = None
+        self.last_video_frame_time_ns = None
+
+    def on_new_sample_from_appsink(self, sink, callback, output):
         """Handle new samples from the appsink"""
         sample = sink.emit("pull-sample")
         if sample:
             buffer = sample.get_buffer()
             data = buffer.extract_dup(0, buffer.get_size())
-            self.on_new_sample_callback(data)
+            bot_metrics.increment("pipeline_output_bytes_total", len(data), output=output)
+            callback(data)
             return Gst.FlowReturn.OK
         return Gst.FlowReturn.ERROR
 
@@ -68,99 +137,121 @@ class GstreamerPipeline:
         self.start_time_ns = None
 
         # Setup muxer based on output format
+        # An appsink can't seek back to rewrite headers once the data has been passed on, so those muxers have to write a streamable file.
+        # For MP4 that means a fragmented MP4.
+        streamable = self.sink_type == self.SINK_TYPE_APPSINK
         if self.output_format == self.OUTPUT_FORMAT_MP4:
-            muxer_string = "mp4mux name=muxer"
+            muxer_string = "mp4mux name=muxer fragment-duration=1000 streamable=true" if streamable else "mp4mux name=muxer"
         elif self.output_format == self.OUTPUT_FORMAT_FLV:
             muxer_string = "h264parse ! flvmux name=muxer streamable=true"
         elif self.output_format == self.OUTPUT_FORMAT_WEBM:
-            muxer_string = "h264parse ! matroskamux name=muxer"
+            muxer_string = "h264parse ! matroskamux name=muxer streamable=true" if streamable else "h264parse ! matroskamux name=muxer"
+        elif self.output_format == self.OUTPUT_FORMAT_M4A:
+            muxer_string = "mp4mux name=muxer fragment-duration=1000 streamable=true" if streamable else "mp4mux name=muxer"
+        elif self.output_format == self.OUTPUT_FORMAT_MP3:
+            muxer_string = "xingmux name=muxer"
+        elif self.output_format == self.OUTPUT_FORMAT_OPUS:
+            muxer_string = "oggmux name=muxer"
         else:
             raise ValueError(f"Invalid output format: {self.output_format}")
 
+        if self.output_format == self.OUTPUT_FORMAT_MP3:
+            audio_encoder_string = "lamemp3enc target=bitrate bitrate=128 cbr=true"
+        elif self.output_format == self.OUTPUT_FORMAT_OPUS:
+            # Opus doesn't support 32kHz, which is what zoom gives us
+            audio_encoder_string = "audioresample ! opusenc bitrate=64000"
+        else:
+            audio_encoder_string = "voaacenc bitrate=128000"
+
         if self.sink_type == self.SINK_TYPE_APPSINK:
             sink_string = "appsink name=sink emit-signals=true sync=false drop=false "
         elif self.sink_type == self.SINK_TYPE_FILE:
             sink_string = f"filesink location={self.file_location} name=sink sync=false "
+        elif self.sink_type == self.SINK_TYPE_RTMP:
+            sink_string = f'rtmp2sink location="{self.rtmp_location}" name=sink sync=false async-connect=true '
         else:
             raise ValueError(f"Invalid sink type: {self.sink_type}")
 
-        if self.num_audio_sources == 1:
+        if self.rtmp_location:
+            flv_sink_string = f'rtmp2sink location="{self.rtmp_location}" name=flv_sink sync=false async-connect=true '
+        else:
+            flv_sink_string = "appsink name=flv_sink emit-signals=true sync=false drop=false "
+
+        # fmt: off
+        audio_source_string = (
+            # --- DEFAULT AUDIO SOURCE, the mixer gets a pad for each other audio source as it shows up ---
+            "appsrc name=audio_source_1 do-timestamp=false stream-type=0 format=time ! "
+            "queue name=q5 leaky=downstream ! "
+            "mixer. "
+            # --- AUDIO MIXER ---
+            "audiomixer name=mixer ! "
+            "queue name=mixer_q1 leaky=downstream ! "
+            "audioconvert ! "
+            "audiorate ! "
+            "queue name=q6 leaky=downstream ! "
+            f"{audio_encoder_string} ! "
+            "queue name=q7 leaky=downstream ! "
+        )
+        # fmt: on
+
+        if not self.has_video:
+            # The audio branch ends in a queue, so it connects straight to the muxer
+            pipeline_str = f"{audio_source_string}{muxer_string} ! queue name=q4 ! {sink_string}"
+        elif self.tees_flv_output:
+            # The encoded streams are split with tees, so the recording and the FLV stream share one encode.
+            # The FLV branches have their own leaky queues, so if the RTMP endpoint stalls, the FLV output drops
+            # frames instead of holding up the recording.
             # fmt: off
-            audio_source_string = (
-                # --- AUDIO STRING FOR 1 AUDIO SOURCE ---
-                "appsrc name=audio_source_1 do-timestamp=false stream-type=0 format=time ! "
-                "queue name=q5 leaky=downstream max-size-buffers=1000000 max-size-bytes=100000000 max-size-time=0 ! "
-                "audioconvert ! "
-                "audiorate ! "
-                "queue name=q6 leaky=downstream max-size-buffers=1000000 max-size-bytes=100000000 max-size-time=0 ! "
-                "voaacenc bitrate=128000 ! "
-                "queue name=q7 leaky=downstream max-size-buffers=1000000 max-size-bytes=100000000 max-size-time=0 ! "
+            pipeline_str = (
+                "appsrc name=video_source do-timestamp=false stream-type=0 format=time ! "
+                "queue name=q1 ! "
+                "videoconvert ! "
+                "videorate ! "
+                f"video/x-raw,framerate={self.video_frame_rate}/1 ! "
+                "queue name=q2 ! "
+                "x264enc name=video_encoder tune=zerolatency speed-preset=ultrafast ! "
+                "tee name=video_tee "
+                # --- RECORDING ---
+                "video_tee. ! queue name=q3 ! "
+                f"{muxer_string} ! queue name=q4 ! {sink_string} "
+                f"{audio_source_string}"
+                "tee name=audio_tee "
+                "audio_tee. ! queue name=q8 ! muxer. "
+                # --- FLV ---
+                f"video_tee. ! queue name=flv_video_queue leaky=downstream {self.FLV_QUEUE_LIMITS} ! "
+                "h264parse ! flvmux name=flv_muxer streamable=true ! queue name=flv_q4 ! "
+                f"{flv_sink_string}"
+                f"audio_tee. ! queue name=flv_audio_queue leaky=downstream {self.FLV_QUEUE_LIMITS} ! flv_muxer. "
             )
             # fmt: on
-        elif self.num_audio_sources == 3:
-            audio_source_string = (
-                # --- AUDIO BRANCH 1 ---
-                "appsrc name=audio_source_1 do-timestamp=false stream-type=0 format=time ! "
-                "queue name=q5_1 leaky=downstream max-size-buffers=1000000 max-size-bytes=100000000 max-size-time=0 ! "
-                "mixer. "
-                # --- AUDIO BRANCH 2 ---
-                "appsrc name=audio_source_2 do-timestamp=false stream-type=0 format=time ! "
-                "queue name=q5_2 leaky=downstream max-size-buffers=1000000 max-size-bytes=100000000 max-size-time=0 ! "
-                "mixer. "
-                # --- AUDIO BRANCH 3 ---
-                "appsrc name=audio_source_3 do-timestamp=false stream-type=0 format=time ! "
-                "queue name=q5_3 leaky=downstream max-size-buffers=1000000 max-size-bytes=100000000 max-size-time=0 ! "
-                "mixer. "
-                # --- AUDIO MIXER
-                "adder name=mixer ! "
-                "queue name=mixer_q1 leaky=downstream max-size-buffers=1000000 max-size-bytes=100000000 max-size-time=0 ! "
-                "audioconvert ! "
-                "audiorate ! "
-                "queue name=mixer_q2 leaky=downstream max-size-buffers=1000000 max-size-bytes=100000000 max-size-time=0 ! "
-                "voaacenc bitrate=128000 ! "
-                "queue name=mixer_q3 leaky=downstream max-size-buffers=1000000 max-size-bytes=100000000 max-size-time=0 ! "
-            )
         else:
-            raise ValueError(f"Unsupported number of audio sources: {self.num_audio_sources}")
-
-        pipeline_str = (
-            "appsrc name=video_source do-timestamp=false stream-type=0 format=time ! "
-            "queue name=q1 max-size-buffers=1000 max-size-bytes=100000000 max-size-time=0 ! "  # q1 can contain 100mb of video before it drops
-            "videoconvert ! "
-            "videorate ! "
-            "queue name=q2 max-size-buffers=5000 max-size-bytes=500000000 max-size-time=0 ! "  # q2 can contain 100mb of video before it drops
-            "x264enc tune=zerolatency speed-preset=ultrafast ! "
-            "queue name=q3 max-size-buffers=1000 max-size-bytes=100000000 max-size-time=0 ! "
-            f"{muxer_string} ! queue name=q4 ! {sink_string} "
-            f"{audio_source_string} "
-            "muxer. "
-        )
+            pipeline_str = f"appsrc name=video_source do-timestamp=false stream-type=0 format=time ! queue name=q1 ! videoconvert ! videorate ! video/x-raw,framerate={self.video_frame_rate}/1 ! queue name=q2 ! x264enc name=video_encoder tune=zerolatency speed-preset=ultrafast ! queue name=q3 ! {muxer_string} ! queue name=q4 ! {sink_string} {audio_source_string} muxer. "
 
         self.pipeline = Gst.parse_launch(pipeline_str)
 
-        # Get both appsrc elements
-        self.appsrc = self.pipeline.get_by_name("video_source")
-
         # Configure video appsrc
-        video_caps = Gst.Caps.from_string(f"video/x-raw,format=I420,width={self.video_frame_size[0]},height={self.video_frame_size[1]},framerate=30/1")
-        self.appsrc.set_property("caps", video_caps)
-        self.appsrc.set_property("format", Gst.Format.TIME)
-        self.appsrc.set_property("is-live", True)
-        self.appsrc.set_property("do-timestamp", False)
-        self.appsrc.set_property("stream-type", 0)  # GST_APP_STREAM_TYPE_STREAM
-        self.appsrc.set_property("block", True)  # This helps with synchronization
-
-        audio_caps = Gst.Caps.from_string(self.audio_format)  # e.g. "audio/x-raw,rate=48000,channels=2,format=S16LE"
-        self.audio_appsrcs = []
-        for i in range(self.num_audio_sources):
-            audio_appsrc = self.pipeline.get_by_name(f"audio_source_{i + 1}")
-            audio_appsrc.set_property("caps", audio_caps)
-            audio_appsrc.set_property("format", Gst.Format.TIME)
-            audio_appsrc.set_property("is-live", True)
-            audio_appsrc.set_property("do-timestamp", False)
-            audio_appsrc.set_property("stream-type", 0)  # GST_APP_STREAM_TYPE_STREAM
-            audio_appsrc.set_property("block", True)
-            self.audio_appsrcs.append(audio_appsrc)
+        self.appsrc = None
+        if self.has_video:
+            self.appsrc = self.pipeline.get_by_name("video_source")
+            video_caps = Gst.Caps.from_string(f"video/x-raw,format=I420,width={self.video_frame_size[0]},height={self.video_frame_size[1]},framerate={self.video_frame_rate}/1")
+            self.appsrc.set_property("caps", video_caps)
+            self.appsrc.set_property("format", Gst.Format.TIME)
+            self.appsrc.set_property("is-live", True)
+            self.appsrc.set_property("do-timestamp", False)
+            self.appsrc.set_property("stream-type", 0)  # GST_APP_STREAM_TYPE_STREAM
+            self.appsrc.set_property("block", True)  # This helps with synchronization
+
+        # audiomixer lines buffers up by timestamp, and in live mode it mixes whatever has arrived once the latency has passed.
+        # Pads that haven't had any audio yet are ignored, so a new source doesn't hold up the mix.
+        self.audio_mixer = self.pipeline.get_by_name("mixer")
+        self.audio_mixer.set_property("latency", self.AUDIO_MIXER_LATENCY_NS)
+        self.audio_mixer.set_property("ignore-inactive-pads", True)
+
+        default_audio_appsrc = self.pipeline.get_by_name("audio_source_1")
+        self.configure_audio_appsrc(default_audio_appsrc)
+        self.audio_sources = {
+            self.DEFAULT_AUDIO_SOURCE_ID: AudioSource(appsrc=default_audio_appsrc, branch=None, queue=None, mixer_pad=None),
+        }
 
         # Set up bus
         bus = self.pipeline.get_bus()
@@ -170,15 +261,13 @@ class GstreamerPipeline:
         # Connect to the sink element
         if self.sink_type == self.SINK_TYPE_APPSINK:
             sink = self.pipeline.get_by_name("sink")
-            sink.connect("new-sample", self.on_new_sample_from_appsink)
-
-        # Start the pipeline
-        self.pipeline.set_state(Gst.State.PLAYING)
-
-        self.recording_active = True
-        self.audio_recording_active = True
+            sink.connect("new-sample", self.on_new_sample_from_appsink, self.on_new_sample_callback, self.output_format)
+        if self.on_new_flv_sample_callback:
+            flv_sink = self.pipeline.get_by_name("flv_sink")
+            flv_sink.connect("new-sample", self.on_new_sample_from_appsink, self.on_new_flv_sample_callback, self.OUTPUT_FORMAT_FLV)
 
         # Initialize queue monitoring
+        self.queues = {}
         self.queue_drops = {}
         self.last_reported_drops = {}
 
@@ -193,12 +282,199 @@ class GstreamerPipeline:
 
             if isinstance(element, Gst.Element) and element.get_factory().get_name() == "queue":
                 queue_name = element.get_name()
+                self.queues[queue_name] = element
                 self.queue_drops[queue_name] = 0
                 self.last_reported_drops[queue_name] = 0
                 element.connect("overrun", self.on_queue_overrun, queue_name)
 
+        # Size the queues from the memory the pod has, instead of giving each one a fixed size that could add up to more
+        self.memory_budget = PipelineMemoryBudget(total_bytes=default_pipeline_memory_budget_bytes(), queue_names=list(self.queues))
+        for queue_name, queue in self.queues.items():
+            self.apply_queue_memory_limit(queue, self.memory_budget.limit_for_queue(queue_name), time_limited=queue_name in self.TIME_LIMITED_QUEUE_NAMES)
+        logger.info(f"Pipeline memory budget is {self.memory_budget.total_bytes} bytes, queue limits are {self.memory_budget.queue_limits}")
+
+        # Start the pipeline
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+        self.recording_active = True
+        self.audio_recording_active = True
+
+        self.video_encoder_input_times = {}
+        if self.has_video:
+            self.video_encoder = self.pipeline.get_by_name("video_encoder")
+
+            # Lower the bitrate and frame rate when the machine is too busy to encode at full quality
+            self.initial_video_bitrate = self.video_encoder.get_property("bitrate")
+            self.encoder_quality_controller = EncoderQualityController(cpu_budget_cores=default_cpu_budget_cores())
+
+            # Measure video encoder latency, and skip frames at the lower quality levels
+            self.video_encoder.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self.on_video_encoder_input)
+            self.video_encoder.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self.on_video_encoder_output)
+            self.last_cpu_sample_time = time.monotonic()
+            self.last_cpu_seconds_used = cpu_seconds_used()
+            self.last_video_queue_drops = 0
+            GLib.timeout_add_seconds(self.ENCODER_QUALITY_CHECK_INTERVAL_SECONDS, self.adjust_encoder_quality)
+
         # Start statistics monitoring
         GLib.timeout_add_seconds(15, self.monitor_pipeline_stats)
+        GLib.timeout_add_seconds(self.AUDIO_SOURCE_IDLE_TIMEOUT_SECONDS, self.release_idle_audio_sources)
+        GLib.timeout_add(self.MEMORY_BUDGET_CHECK_INTERVAL_MS, self.check_memory_budget)
+
+    def apply_queue_memory_limit(self, queue, max_size_bytes, time_limited=False):
+        queue.set_property("max-size-bytes", max_size_bytes)
+        queue.set_property("max-size-buffers", 0)
+        if not time_limited:
+            queue.set_property("max-size-time", 0)
+
+    def queue_levels(self):
+        """Bytes in each queue right now. The queues of audio sources added while running are added up together."""
+        queue_levels = {queue_name: queue.get_property("current-level-bytes") for queue_name, queue in self.queues.items()}
+        with self.audio_sources_lock:
+            added_audio_source_queues = [audio_source.queue for audio_source in self.audio_sources.values() if audio_source.queue]
+        queue_levels["added_audio_sources"] = sum(queue.get_property("current-level-bytes") for queue in added_audio_source_queues)
+        return queue_levels
+
+    def check_memory_budget(self):
+        if not self.recording_active:
+            return False
+
+        queue_levels = self.queue_levels()
+        for queue_name, level in queue_levels.items():
+            bot_metrics.set_gauge("pipeline_queue_bytes", level, queue=queue_name)
+        if self.memory_budget.update(sum(queue_levels.values())):
+            bot_metrics.set_gauge("pipeline_shedding_video", int(self.memory_budget.shedding_video))
+
+        return True  # Continue timer
+
+    def configure_audio_appsrc(self, audio_appsrc):
+        audio_appsrc.set_property("caps", Gst.Caps.from_string(self.audio_format))  # e.g. "audio/x-raw,rate=48000,channels=2,format=S16LE"
+        audio_appsrc.set_property("format", Gst.Format.TIME)
+        audio_appsrc.set_property("is-live", True)
+        audio_appsrc.set_property("do-timestamp", False)
+        audio_appsrc.set_property("stream-type", 0)  # GST_APP_STREAM_TYPE_STREAM
+        audio_appsrc.set_property("block", True)
+
+    def get_or_add_audio_source(self, source_id):
+        with self.audio_sources_lock:
+            audio_source = self.audio_sources.get(source_id)
+            if audio_source is not None:
+                return audio_source
+
+            # The same branch the default source has in the pipeline string, in a bin with a ghost pad for the queue's output
+            branch = Gst.parse_bin_from_description("appsrc name=audio_source do-timestamp=false stream-type=0 format=time ! queue name=audio_source_queue leaky=downstream", True)
+            audio_appsrc = branch.get_by_name("audio_source")
+            self.configure_audio_appsrc(audio_appsrc)
+            queue = branch.get_by_name("audio_source_queue")
+            self.apply_queue_memory_limit(queue, self.memory_budget.audio_source_queue_limit)
+
+            self.pipeline.add(branch)
+            mixer_pad = self.audio_mixer.request_pad_simple("sink_%u")
+            branch.get_static_pad("src").link(mixer_pad)
+            branch.sync_state_with_parent()
+
+            audio_source = AudioSource(appsrc=audio_appsrc, branch=branch, queue=queue, mixer_pad=mixer_pad)
+            self.audio_sources[source_id] = audio_source
+            logger.info(f"Added audio source {source_id} to the mixer, {len(self.audio_sources)} audio sources")
+            bot_metrics.set_gauge("pipeline_audio_sources", len(self.audio_sources))
+            return audio_source
+
+    def release_idle_audio_sources(self):
+        if not self.audio_recording_active:
+            return False
+
+        now = time.monotonic()
+        with self.audio_sources_lock:
+            idle_source_ids = [source_id for source_id, audio_source in self.audio_sources.items() if source_id != self.DEFAULT_AUDIO_SOURCE_ID and now - audio_source.last_buffer_time > self.AUDIO_SOURCE_IDLE_TIMEOUT_SECONDS]
+            idle_audio_sources = [self.audio_sources.pop(source_id) for source_id in idle_source_ids]
+            bot_metrics.set_gauge("pipeline_audio_sources", len(self.audio_sources))
+
+        for source_id, audio_source in zip(idle_source_ids, idle_audio_sources):
+            logger.info(f"Releasing idle audio source {source_id}")
+            # The branch is removed once the end of stream has made it through the queue, so nothing is pushed to an unlinked pad
+            audio_source.branch.get_static_pad("src").add_probe(Gst.PadProbeType.EVENT_DOWNSTREAM, self.on_released_audio_source_event, audio_source)
+            audio_source.appsrc.emit("end-of-stream")
+
+        return True  # Continue timer
+
+    def on_released_audio_source_event(self, pad, info, audio_source):
+        if info.get_event().type != Gst.EventType.EOS:
+            return Gst.PadProbeReturn.OK
+        # Elements can't change state from their own streaming thread
+        GLib.idle_add(self.remove_audio_source_elements, audio_source)
+        # The other sources are still going, so the mixer shouldn't see an end of stream
+        return Gst.PadProbeReturn.DROP
+
+    def remove_audio_source_elements(self, audio_source):
+        audio_source.branch.get_static_pad("src").unlink(audio_source.mixer_pad)
+        self.audio_mixer.release_request_pad(audio_source.mixer_pad)
+        audio_source.branch.set_state(Gst.State.NULL)
+        self.pipeline.remove(audio_source.branch)
+        return False
+
+    def queue_fill(self, queue):
+        """How full the queue is, as a fraction of whichever of its limits it's closest to"""
+        fills = [queue.get_property(f"current-level-{unit}") / queue.get_property(f"max-size-{unit}") for unit in ("buffers", "bytes", "time") if queue.get_property(f"max-size-{unit}")]
+        return max(fills, default=0)
+
+    def adjust_encoder_quality(self):
+        if not self.recording_active:
+            return False
+
+        now = time.monotonic()
+        current_cpu_seconds_used = cpu_seconds_used()
+        cpu_cores_used = (current_cpu_seconds_used - self.last_cpu_seconds_used) / (now - self.last_cpu_sample_time)
+        self.last_cpu_sample_time = now
+        self.last_cpu_seconds_used = current_cpu_seconds_used
+
+        video_queue_drops = sum(self.queue_drops.get(queue_name, 0) for queue_name in self.VIDEO_QUEUE_NAMES)
+        new_video_queue_drops = video_queue_drops - self.last_video_queue_drops
+        self.last_video_queue_drops = video_queue_drops
+
+        max_queue_fill = max(self.queue_fill(self.pipeline.get_by_name(queue_name)) for queue_name in self.VIDEO_QUEUE_NAMES)
+        bot_metrics.set_gauge("pipeline_cpu_cores_used", round(cpu_cores_used, 3))
+        bot_metrics.set_gauge("pipeline_video_queue_fill", round(max_queue_fill, 3))
+
+        recording_time_ms = (time.time_ns() - self.start_time_ns) // 1_000_000 if self.start_time_ns else 0
+        level_changed = self.encoder_quality_controller.update(
+            cpu_cores_used=cpu_cores_used,
+            max_queue_fill=max_queue_fill,
+            new_queue_drops=new_video_queue_drops,
+            recording_time_ms=recording_time_ms,
+        )
+        if level_changed:
+            # x264enc picks up a new bitrate while it's running, the frame rate is applied in on_video_encoder_input
+            self.video_encoder.set_property("bitrate", int(self.initial_video_bitrate * self.encoder_quality_controller.bitrate_fraction))
+            bot_metrics.set_gauge("encoder_quality_level", self.encoder_quality_controller.level)
+            bot_metrics.increment("encoder_quality_changes_total")
+
+        return True  # Continue timer
+
+    def encoder_quality_changes(self):
+        if not self.encoder_quality_controller:
+            return []
+        return self.encoder_quality_controller.changes
+
+    def on_video_encoder_input(self, pad, info):
+        buffer = info.get_buffer()
+        # At the lower quality levels only some of the frames from videorate are encoded. The muxers go by the timestamps,
+        # so each encoded frame is shown until the next one, and the recording's duration doesn't change.
+        frame_index = (buffer.pts * self.video_frame_rate + 500_000_000) // 1_000_000_000
+        if not self.encoder_quality_controller.should_encode_frame(frame_index):
+            bot_metrics.increment("video_frames_skipped_total")
+            return Gst.PadProbeReturn.DROP
+
+        # Frames the encoder never outputs would otherwise pile up here
+        if len(self.video_encoder_input_times) > 1000:
+            self.video_encoder_input_times.clear()
+        self.video_encoder_input_times[buffer.pts] = time.perf_counter()
+        return Gst.PadProbeReturn.OK
+
+    def on_video_encoder_output(self, pad, info):
+        input_time = self.video_encoder_input_times.pop(info.get_buffer().pts, None)
+        if input_time is not None:
+            bot_metrics.observe("video_encoder_latency_ms", (time.perf_counter() - input_time) * 1000)
+        bot_metrics.increment("video_frames_encoded_total")
+        return Gst.PadProbeReturn.OK
 
     def on_pipeline_message(self, bus, message):
         """Handle pipeline messages"""
@@ -209,6 +485,9 @@ class GstreamerPipeline:
             src = message.src
             src_name = src.name if src else "unknown"
             logger.info(f"GStreamer Error: {err}, Debug: {debug}, src_name: {src_name}")
+
+            if src and src.get_factory() and src.get_factory().get_name() == "rtmp2sink" and self.on_rtmp_sink_error_callback:
+                self.on_rtmp_sink_error_callback()
         elif t == Gst.MessageType.EOS:
             logger.info("GStreamer pipeline reached end of stream")
 
@@ -225,6 +504,12 @@ class GstreamerPipeline:
                     logger.info(f"  {queue_name}: {drops} buffers dropped")
                 self.last_reported_drops[queue_name] = self.queue_drops[queue_name]
 
+            queue_levels = self.queue_levels()
+            logger.info(f"Queue Levels ({sum(queue_levels.values())} of a {self.memory_budget.total_bytes} byte budget, shedding video: {self.memory_budget.shedding_video}):")
+            for queue_name, level in queue_levels.items():
+                if level > 0:
+                    logger.info(f"  {queue_name}: {level} bytes of {self.memory_budget.limit_for_queue(queue_name)}")
+
         except Exception as e:
             logger.info(f"Error getting pipeline stats: {e}")
 
@@ -233,15 +518,16 @@ class GstreamerPipeline:
     def on_queue_overrun(self, queue, queue_name):
         """Callback for when a queue drops buffers"""
         self.queue_drops[queue_name] += 1
+        bot_metrics.increment("pipeline_queue_dropped_buffers_total", queue=queue_name)
         return True
 
-    def on_mixed_audio_raw_data_received_callback(self, data, timestamp=None, audio_appsrc_idx=0):
-        audio_appsrc = self.audio_appsrcs[audio_appsrc_idx]
-
-        if not self.audio_recording_active or not audio_appsrc or not self.recording_active or not self.appsrc:
+    def on_mixed_audio_raw_data_received_callback(self, data, timestamp=None, audio_source_id=DEFAULT_AUDIO_SOURCE_ID):
+        if not self.audio_recording_active or not self.recording_active:
             return
 
         try:
+            audio_source = self.get_or_add_audio_source(audio_source_id)
+            audio_source.last_buffer_time = time.monotonic()
             current_time_ns = timestamp if timestamp else time.time_ns()
             buffer_bytes = data
             buffer = Gst.Buffer.new_wrapped(buffer_bytes)
@@ -253,19 +539,29 @@ class GstreamerPipeline:
             # Calculate timestamp relative to same start time as video
             buffer.pts = current_time_ns - self.start_time_ns
 
-            ret = audio_appsrc.emit("push-buffer", buffer)
+            ret = audio_source.appsrc.emit("push-buffer", buffer)
+            bot_metrics.increment("audio_chunks_received_total")
             if ret != Gst.FlowReturn.OK:
                 logger.info(f"Warning: Failed to push audio buffer to pipeline: {ret}")
         except Exception as e:
             logger.info(f"Error processing audio data: {e}")
 
     def wants_any_video_frames(self):
-        if not self.audio_recording_active or not self.audio_appsrcs[0] or not self.recording_active or not self.appsrc:
+        if not self.has_video:
+            return False
+
+        if not self.audio_recording_active or not self.recording_active or not self.appsrc:
             return False
 
         return True
 
     def on_new_video_frame(self, frame, current_time_ns):
+        # Video is dropped before audio when the queues are using too much memory
+        if self.memory_budget and self.memory_budget.shedding_video:
+            bot_metrics.increment("video_frames_shed_total")
+            return
+
+        self.last_video_frame = frame
         try:
             # Initialize start time if not set
             if self.start_time_ns is None:
@@ -278,17 +574,27 @@ class GstreamerPipeline:
             buffer = Gst.Buffer.new_wrapped(frame)
             buffer.pts = buffer_pts
 
-            # Default to 33ms (30fps)
-            buffer.duration = 33 * 1000 * 1000  # 33ms in nanoseconds
+            buffer.duration = 1_000_000_000 // self.video_frame_rate
 
             # Push buffer to pipeline
             ret = self.appsrc.emit("push-buffer", buffer)
+            bot_metrics.increment("video_frames_received_total")
             if ret != Gst.FlowReturn.OK:
                 logger.info(f"Warning: Failed to push buffer to pipeline: {ret}")
 
         except Exception as e:
             logger.info(f"Error processing video frame: {e}")
 
+    def on_repeat_video_frame(self, current_time_ns):
+        # Nothing to repeat until a real frame has been pushed
+        if self.last_video_frame is None or not self.appsrc:
+            return
+
+        # videorate only fills in frames between buffers it has received, so the previous frame is pushed again with the new
+        # timestamp. It's the same bytes object the adapter sent, so nothing has to be rendered again.
+        bot_metrics.increment("video_frames_repeated_total")
+        self.on_new_video_frame(self.last_video_frame, current_time_ns)
+
     def cleanup(self):
         logger.info("Shutting down GStreamer pipeline...")
 
@@ -302,8 +608,9 @@ class GstreamerPipeline:
 
         if self.appsrc:
             self.appsrc.emit("end-of-stream")
-        for audio_appsrc in self.audio_appsrcs:
-            audio_appsrc.emit("end-of-stream")
+        with self.audio_sources_lock:
+            for audio_source in self.audio_sources.values():
+                audio_source.appsrc.emit("end-of-stream")
 
         msg = bus.timed_pop_filtered(
             5 * 60 * Gst.SECOND,  # 5 minute timeout
@@ -1,110 +1,193 @@
 import logging
-import queue
-from datetime import datetime, timedelta
+import os
+import time
+from collections import deque
 
 import numpy as np
 import webrtcvad
 
+from bots.bot_metrics import bot_metrics
+
+from .utterance_audio_buffer import UtteranceAudioBuffer
+
 logger = logging.getLogger(__name__)
 
 
-def calculate_normalized_rms(audio_bytes):
-    samples = np.frombuffer(audio_bytes, dtype=np.int16)
-    rms = np.sqrt(np.mean(np.square(samples)))
-    # Normalize by max possible value for 16-bit audio (32768)
-    return rms / 32768
+def calculate_normalized_frame_rms(samples, frame_length):
+    """RMS of each frame_length run of int16 samples, normalized to 0-1. samples has to be a whole number of frames."""
+    frames = samples.reshape(-1, frame_length).astype(np.float32)
+    return np.sqrt(np.einsum("ij,ij->i", frames, frames) / frame_length) / 32768
 
 
 class IndividualAudioInputManager:
+    """
+    Splits each speaker's audio into utterances, separated by silence.
+
+    Chunks are queued as they arrive and processed in batches from the main loop. Each speaker's chunks in a batch are joined
+    into one buffer and split into 30ms frames, the longest frame WebRTC VAD accepts. Quiet frames are found for the whole
+    buffer at once, and only the rest are passed to WebRTC VAD. Times are integer nanoseconds on the monotonic clock, and are
+    only converted to wall clock time for the utterance's timestamp.
+
+    An utterance starts with the PRE_ROLL_DURATION_MS of audio before its first speech, so word onsets aren't clipped. It
+    ends on a pause, and the longer it gets the shorter that pause has to be, so long monologues are split at natural pauses
+    and transcribed as they go rather than minutes later. Nothing is held past the maximum utterance length.
+    """
+
+    VAD_FRAME_DURATION_MS = 30
+    # Frames quieter than this are silence, without asking WebRTC VAD
+    SILENCE_RMS_THRESHOLD = 0.01
+    PRE_ROLL_DURATION_MS = 300
+    # The pause that ends an utterance at its maximum length. It scales up to SILENCE_DURATION_LIMIT_NS for a new utterance.
+    MIN_PAUSE_DURATION_NS = 300_000_000
+    DEFAULT_MAX_UTTERANCE_DURATION_MS = 30000
+
     def __init__(self, *, save_utterance_callback, get_participant_callback):
-        self.queue = queue.Queue()
+        # Appends and pops on a deque are thread safe, and much cheaper than a queue.Queue
+        self.queue = deque()
 
         self.save_utterance_callback = save_utterance_callback
         self.get_participant_callback = get_participant_callback
 
         self.utterances = {}
         self.sample_rate = 32000
+        self.vad_frame_length = self.sample_rate * self.VAD_FRAME_DURATION_MS // 1000
+        self.vad_frame_bytes = self.vad_frame_length * 2
+        self.wall_clock_offset_ns = time.time_ns() - time.monotonic_ns()
 
-        self.first_nonsilent_audio_time = {}
+        self.utterance_start_time = {}
         self.last_nonsilent_audio_time = {}
+        # The most recent silent frames for each speaker who isn't speaking, to start their next utterance with
+        self.pre_roll_frames = {}
+        self.pre_roll_frame_count = self.PRE_ROLL_DURATION_MS // self.VAD_FRAME_DURATION_MS
+        # Audio after the last whole VAD frame, and when it arrived, kept for the next batch
+        self.pending_audio = {}
+        self.pending_audio_time = {}
 
         self.UTTERANCE_SIZE_LIMIT = 19200000  # 19.2 MB / 2 bytes per sample / 32,000 samples per second = 300 seconds of continuous audio
-        self.SILENCE_DURATION_LIMIT = 3  # seconds
+        self.SILENCE_DURATION_LIMIT_NS = 3 * 1_000_000_000
+        max_utterance_duration_ms = int(os.getenv("MAX_UTTERANCE_DURATION_MS", self.DEFAULT_MAX_UTTERANCE_DURATION_MS))
+        # In whole VAD frames, since that's how audio is added
+        self.max_utterance_bytes = min(self.UTTERANCE_SIZE_LIMIT, max_utterance_duration_ms * self.sample_rate // 1000 * 2) // self.vad_frame_bytes * self.vad_frame_bytes
         self.vad = webrtcvad.Vad()
 
-    def add_chunk(self, speaker_id, chunk_time, chunk_bytes):
-        self.queue.put((speaker_id, chunk_time, chunk_bytes))
+    def add_chunk(self, speaker_id, chunk_time_ns, chunk_bytes):
+        """chunk_time_ns is when the chunk arrived, from time.monotonic_ns()"""
+        self.queue.append((speaker_id, chunk_time_ns, chunk_bytes))
 
     def process_chunks(self):
-        while not self.queue.empty():
-            speaker_id, chunk_time, chunk_bytes = self.queue.get()
-            self.process_chunk(speaker_id, chunk_time, chunk_bytes)
+        chunks_by_speaker = {}
+        while self.queue:
+            speaker_id, chunk_time_ns, chunk_bytes = self.queue.popleft()
+            chunks_by_speaker.setdefault(speaker_id, []).append((chunk_time_ns, chunk_bytes))
 
-        for speaker_id in list(self.first_nonsilent_audio_time.keys()):
-            self.process_chunk(speaker_id, datetime.utcnow(), None)
+        for speaker_id, chunks in chunks_by_speaker.items():
+            self.process_speaker_chunks(speaker_id, chunks)
+
+        # Speakers that have stopped sending audio still need their utterances flushed
+        current_time_ns = time.monotonic_ns()
+        for speaker_id in list(self.utterance_start_time.keys()):
+            self.process_frame(speaker_id, current_time_ns, None, True)
 
     # When the meeting ends, we need to flush all utterances. Do this by pretending that we received a chunk of silence at the end of the meeting.
     def flush_utterances(self):
-        for speaker_id in list(self.first_nonsilent_audio_time.keys()):
-            self.process_chunk(
-                speaker_id,
-                datetime.utcnow() + timedelta(seconds=self.SILENCE_DURATION_LIMIT + 1),
-                None,
-            )
-
-    def silence_detected(self, chunk_bytes):
-        if calculate_normalized_rms(chunk_bytes) < 0.01:
-            return True
-        return not self.vad.is_speech(chunk_bytes, self.sample_rate)
-
-    def process_chunk(self, speaker_id, chunk_time, chunk_bytes):
-        audio_is_silent = self.silence_detected(chunk_bytes) if chunk_bytes else True
-
-        # Initialize buffer and timing for new speaker
-        if speaker_id not in self.utterances or len(self.utterances[speaker_id]) == 0:
+        for speaker_id in list(self.utterance_start_time.keys()):
+            # Long enough after the last speech to end any utterance
+            end_time_ns = self.last_nonsilent_audio_time[speaker_id] + self.SILENCE_DURATION_LIMIT_NS
+            # Audio that didn't make up a whole VAD frame is still part of the utterance
+            pending_audio = self.pending_audio.pop(speaker_id, b"")
+            self.process_frame(speaker_id, end_time_ns, pending_audio or None, True)
+
+    def process_speaker_chunks(self, speaker_id, chunks):
+        pending_audio = self.pending_audio.get(speaker_id, b"")
+        chunk_times = [self.pending_audio_time[speaker_id]] if pending_audio else []
+        chunk_times.extend(chunk_time_ns for chunk_time_ns, _ in chunks)
+        audio = b"".join([pending_audio, *(chunk_bytes for _, chunk_bytes in chunks)])
+        # Where each chunk starts in the joined buffer, so each frame can be given the time of the chunk it starts in
+        chunk_offsets = np.cumsum([0, len(pending_audio), *(len(chunk_bytes) for _, chunk_bytes in chunks)])[0 if pending_audio else 1 : -1]
+
+        num_frames = len(audio) // self.vad_frame_bytes
+        whole_frames_length = num_frames * self.vad_frame_bytes
+        if whole_frames_length < len(audio):
+            leftover_chunk_index = np.searchsorted(chunk_offsets, whole_frames_length, side="right") - 1
+            self.pending_audio[speaker_id] = audio[whole_frames_length:]
+            self.pending_audio_time[speaker_id] = chunk_times[leftover_chunk_index]
+        else:
+            self.pending_audio.pop(speaker_id, None)
+        if num_frames == 0:
+            return
+
+        with bot_metrics.timer("vad_duration_ms"):
+            samples = np.frombuffer(audio, dtype=np.int16, count=whole_frames_length // 2)
+            frame_is_silent = calculate_normalized_frame_rms(samples, self.vad_frame_length) < self.SILENCE_RMS_THRESHOLD
+            for frame_index in np.flatnonzero(~frame_is_silent):
+                frame_start = frame_index * self.vad_frame_bytes
+                frame_is_silent[frame_index] = not self.vad.is_speech(audio[frame_start : frame_start + self.vad_frame_bytes], self.sample_rate)
+        bot_metrics.increment("vad_frames_total", num_frames)
+
+        frame_chunk_indices = np.searchsorted(chunk_offsets, np.arange(num_frames) * self.vad_frame_bytes, side="right") - 1
+        audio_view = memoryview(audio)
+        for frame_index in range(num_frames):
+            frame_start = frame_index * self.vad_frame_bytes
+            frame_time_ns = chunk_times[frame_chunk_indices[frame_index]]
+            self.process_frame(speaker_id, frame_time_ns, audio_view[frame_start : frame_start + self.vad_frame_bytes], bool(frame_is_silent[frame_index]))
+
+    def pause_duration_limit_ns(self, utterance_bytes):
+        """How long a pause ends an utterance that's utterance_bytes long. Shrinks from SILENCE_DURATION_LIMIT_NS to MIN_PAUSE_DURATION_NS as the utterance approaches its maximum length."""
+        utterance_fraction = min(utterance_bytes / self.max_utterance_bytes, 1)
+        return int(self.SILENCE_DURATION_LIMIT_NS - (self.SILENCE_DURATION_LIMIT_NS - self.MIN_PAUSE_DURATION_NS) * utterance_fraction)
+
+    def process_frame(self, speaker_id, frame_time_ns, frame_bytes, audio_is_silent):
+        # Start a new utterance on the first frame of speech, with the pre-roll before it
+        if speaker_id not in self.utterance_start_time:
             if audio_is_silent:
+                if frame_bytes:
+                    self.pre_roll_frames.setdefault(speaker_id, deque(maxlen=self.pre_roll_frame_count)).append((frame_time_ns, frame_bytes))
                 return
-            self.utterances[speaker_id] = bytearray()
-            self.first_nonsilent_audio_time[speaker_id] = chunk_time
-            self.last_nonsilent_audio_time[speaker_id] = chunk_time
+            if speaker_id not in self.utterances:
+                # Room for a whole utterance, and the audio that didn't fill a VAD frame when it's flushed at the end of the meeting
+                self.utterances[speaker_id] = UtteranceAudioBuffer(self.max_utterance_bytes + self.vad_frame_bytes)
+            pre_roll_frames = self.pre_roll_frames.pop(speaker_id, ())
+            for _, pre_roll_frame in pre_roll_frames:
+                self.utterances[speaker_id].append(pre_roll_frame)
+            self.utterance_start_time[speaker_id] = pre_roll_frames[0][0] if pre_roll_frames else frame_time_ns
+            self.last_nonsilent_audio_time[speaker_id] = frame_time_ns
 
         # Add new audio data to buffer
-        if chunk_bytes:
-            self.utterances[speaker_id].extend(chunk_bytes)
+        if frame_bytes:
+            self.utterances[speaker_id].append(frame_bytes)
 
         should_flush = False
         reason = None
 
-        # Check buffer size
-        if len(self.utterances[speaker_id]) >= self.UTTERANCE_SIZE_LIMIT:
+        # Check utterance length
+        if len(self.utterances[speaker_id]) >= self.max_utterance_bytes:
             should_flush = True
-            reason = "buffer_full"
+            reason = "max_duration"
 
-        # Check for silence
+        # Check for a pause
         if audio_is_silent:
-            silence_duration = (chunk_time - self.last_nonsilent_audio_time[speaker_id]).total_seconds()
-            if silence_duration >= self.SILENCE_DURATION_LIMIT:
+            silence_duration_ns = frame_time_ns - self.last_nonsilent_audio_time[speaker_id]
+            if silence_duration_ns >= self.pause_duration_limit_ns(len(self.utterances[speaker_id])):
                 should_flush = True
                 reason = "silence_limit"
         else:
-            self.last_nonsilent_audio_time[speaker_id] = chunk_time
-
-            logger.debug(f"Speaker {speaker_id} is speaking")
+            self.last_nonsilent_audio_time[speaker_id] = frame_time_ns
 
         # Flush buffer if needed
         if should_flush and len(self.utterances[speaker_id]) > 0:
+            bot_metrics.increment("utterances_flushed_total", reason=reason)
+            audio_data = self.utterances[speaker_id].release()
             participant = self.get_participant_callback(speaker_id)
             if participant:
                 self.save_utterance_callback(
                     {
                         **participant,
-                        "audio_data": bytes(self.utterances[speaker_id]),
-                        "timestamp_ms": int(self.first_nonsilent_audio_time[speaker_id].timestamp() * 1000),
+                        # A memoryview over the utterance's buffer, so the audio isn't copied again
+                        "audio_data": audio_data,
+                        "timestamp_ms": (self.utterance_start_time[speaker_id] + self.wall_clock_offset_ns) // 1_000_000,
                         "flush_reason": reason,
                         "sample_rate": self.sample_rate,
                     }
                 )
-            # Clear the buffer
-            self.utterances[speaker_id] = bytearray()
-            del self.first_nonsilent_audio_time[speaker_id]
+            del self.utterance_start_time[speaker_id]
             del self.last_nonsilent_audio_time[speaker_id]
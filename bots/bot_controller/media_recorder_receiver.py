@@ -2,23 +2,57 @@ import logging
 import os
 import subprocess
 
+from .fragmented_mp4_index import FragmentedMp4Index
+
 logger = logging.getLogger(__name__)
 
 
 class MediaRecorderReceiver:
-    def __init__(self, file_location):
+    """
+    Receives the MP4 that the browser's MediaRecorder produces, one chunk per second, and writes it to a file or passes it
+    to write_chunk_callback (e.g. a StreamingUploader) as it arrives.
+
+    The MediaRecorder output is a fragmented MP4, which is playable as it's written. Instead of remuxing it at the end to move
+    the index to the front, the fragments are indexed as they go by and an mfra box is appended at the end. The ffmpeg
+    remux is only used as a fallback if the recording turns out not to be a fragmented MP4.
+    """
+
+    FILE_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, file_location=None, write_chunk_callback=None):
         self.file_location = file_location
+        self.write_chunk_callback = write_chunk_callback
+        self.file = None
+        self.fragmented_mp4_index = FragmentedMp4Index()
 
     def cleanup(self):
+        movie_fragment_random_access_box = self.fragmented_mp4_index.movie_fragment_random_access_box()
+        if movie_fragment_random_access_box:
+            self.write(movie_fragment_random_access_box)
+            logger.info(f"Appended index of {self.fragmented_mp4_index.num_fragments} fragments to the recording")
+
+        if self.file:
+            self.file.close()
+            self.file = None
+
+        if movie_fragment_random_access_box or self.file_location is None:
+            return
+
         self.make_file_seekable()
 
-    def on_encoded_mp4_chunk(self, chunk):
-        # Check if file exists and open in appropriate mode
-        mode = "ab" if os.path.exists(self.file_location) else "wb"
+    def write(self, data):
+        if self.write_chunk_callback:
+            self.write_chunk_callback(data)
+            return
+
+        if self.file is None:
+            # Kept open for the whole recording, so chunks are appended without reopening the file each time
+            self.file = open(self.file_location, "wb", buffering=self.FILE_BUFFER_SIZE)
+        self.file.write(data)
 
-        # Write or append data to the file
-        with open(self.file_location, mode) as f:
-            f.write(chunk)
+    def on_encoded_mp4_chunk(self, chunk):
+        self.fragmented_mp4_index.add_chunk(chunk)
+        self.write(chunk)
 
     def get_seekable_path(self, path):
         """
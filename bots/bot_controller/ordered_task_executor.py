@@ -0,0 +1,152 @@
+import logging
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+
+from django.db import connection
+
+from bots.bot_metrics import bot_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class OrderedTaskExecutor:
+    """
+    Bounded thread pool for blocking side effects (database writes, uploads, celery calls) that shouldn't run on the main loop.
+
+    Every task is submitted with an ordering key. Tasks with the same key run one at a time in the order they were submitted,
+    tasks with different keys can run in parallel. submit never blocks, since it's called from the main loop. Past
+    max_pending_tasks, tasks are still queued but counted as overflow, while tasks that only matter if they're the latest,
+    like heartbeats, go through submit_coalesced and are dropped instead.
+    """
+
+    def __init__(self, *, num_workers=4, max_pending_tasks=1000):
+        self.max_pending_tasks = max_pending_tasks
+
+        # Keys that have tasks waiting and aren't currently claimed by a worker
+        self.ready_keys = queue.Queue()
+        self.tasks_by_key = {}
+        # Keys whose first task is being run by a worker
+        self.running_keys = set()
+        self.condition = threading.Condition()
+        self.pending_task_count = 0
+        self.max_pending_task_count = 0
+        self.shut_down = False
+
+        self.workers = [threading.Thread(target=self.worker, daemon=True) for _ in range(num_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, key, fn, *args, **kwargs):
+        with self.condition:
+            self.raise_if_shut_down()
+
+            if self.pending_task_count >= self.max_pending_tasks:
+                if self.pending_task_count == self.max_pending_tasks:
+                    logger.info(f"OrderedTaskExecutor has {self.pending_task_count} pending tasks, the workers are falling behind")
+                bot_metrics.increment("task_executor_overflow_total", task=fn.__name__)
+
+            key_is_idle = self.add_task(key, fn, args, kwargs)
+
+        # If a worker already owns this key it will pick up the new task when it's done with the current one
+        if key_is_idle:
+            self.ready_keys.put(key)
+
+    def submit_coalesced(self, key, fn, *args, **kwargs):
+        """
+        Like submit, for tasks where only the latest one matters. Skipped if a task for the key is already waiting to run,
+        or if the executor is over max_pending_tasks. Returns whether the task was queued.
+        """
+        with self.condition:
+            self.raise_if_shut_down()
+
+            waiting_task_count = len(self.tasks_by_key.get(key, ())) - (1 if key in self.running_keys else 0)
+            if waiting_task_count > 0:
+                bot_metrics.increment("task_executor_coalesced_total", task=fn.__name__)
+                return False
+            if self.pending_task_count >= self.max_pending_tasks:
+                bot_metrics.increment("task_executor_dropped_total", task=fn.__name__)
+                return False
+
+            key_is_idle = self.add_task(key, fn, args, kwargs)
+
+        if key_is_idle:
+            self.ready_keys.put(key)
+        return True
+
+    def raise_if_shut_down(self):
+        if self.shut_down:
+            raise RuntimeError("Cannot submit tasks to an executor that has been shut down")
+
+    def add_task(self, key, fn, args, kwargs):
+        """Must be called holding the condition. Returns whether no worker has the key yet."""
+        key_is_idle = key not in self.tasks_by_key
+        self.tasks_by_key.setdefault(key, deque()).append((fn, args, kwargs, time.monotonic()))
+        self.pending_task_count += 1
+        self.max_pending_task_count = max(self.max_pending_task_count, self.pending_task_count)
+        return key_is_idle
+
+    def worker(self):
+        try:
+            while True:
+                key = self.ready_keys.get()
+                if key is None:
+                    return
+
+                with self.condition:
+                    fn, args, kwargs, submitted_at = self.tasks_by_key[key][0]
+                    self.running_keys.add(key)
+
+                queued_seconds = time.monotonic() - submitted_at
+                bot_metrics.observe("task_queue_wait_ms", queued_seconds * 1000, task=fn.__name__)
+                if queued_seconds > 5:
+                    logger.info(f"OrderedTaskExecutor task {fn.__name__} for key {key} waited {queued_seconds:.1f}s in the queue")
+
+                try:
+                    with bot_metrics.timer("task_duration_ms", task=fn.__name__):
+                        fn(*args, **kwargs)
+                except Exception as e:
+                    logger.info(f"Error in OrderedTaskExecutor task {fn.__name__} for key {key}: {e}")
+                    logger.info(traceback.format_exc())
+
+                with self.condition:
+                    self.running_keys.discard(key)
+                    tasks = self.tasks_by_key[key]
+                    tasks.popleft()
+                    has_more_tasks = len(tasks) > 0
+                    if not has_more_tasks:
+                        del self.tasks_by_key[key]
+                    self.pending_task_count -= 1
+                    self.condition.notify_all()
+
+                # Go to the back of the line so one busy key can't starve the others
+                if has_more_tasks:
+                    self.ready_keys.put(key)
+        finally:
+            # Each worker thread has its own database connection, which needs to be closed explicitly
+            connection.close()
+
+    def queue_depth(self):
+        with self.condition:
+            return self.pending_task_count
+
+    def queue_depth_by_key(self):
+        with self.condition:
+            return {key: len(tasks) for key, tasks in self.tasks_by_key.items()}
+
+    def wait_until_idle(self, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.pending_task_count == 0, timeout=timeout)
+
+    def shutdown(self, timeout=None):
+        if not self.wait_until_idle(timeout=timeout):
+            logger.info(f"OrderedTaskExecutor shutting down with {self.queue_depth()} tasks still pending")
+
+        with self.condition:
+            self.shut_down = True
+        for _ in self.workers:
+            self.ready_keys.put(None)
+        for worker in self.workers:
+            worker.join(timeout=5)
@@ -0,0 +1,126 @@
+import logging
+import queue
+import threading
+import time
+
+from bots.bot_metrics import bot_metrics
+
+logger = logging.getLogger(__name__)
+
+END_OF_AUDIO = None
+
+
+class PacedAudioOutput:
+    """
+    Plays raw 16-bit mono PCM audio by sending it in short frames, each one just before it's due to play.
+
+    Audio arrives in segments, like a decoded file or a synthesized sentence. A producer thread splits them into frames and
+    puts them in a bounded jitter buffer, so synthesizing the next sentence doesn't hold up playing this one. A sender
+    thread takes frames out and sends each one LEAD_MS before it's due on the monotonic clock, so a late wakeup doesn't
+    leave a gap. Sending starts as soon as the first frame is buffered. If the buffer runs dry the clock restarts at the
+    next frame, instead of bursting frames to catch up. cancel() stops both threads right away, so no more than LEAD_MS of
+    audio has been sent ahead of what's playing. If getting or sending the audio fails, playback stops and the exception is
+    kept in error, so the caller can tell it apart from finishing.
+    """
+
+    FRAME_DURATION_MS = 20
+    LEAD_MS = 60
+    JITTER_BUFFER_MS = 1000
+
+    def __init__(self, *, sample_rate, segments, play_raw_audio_callback):
+        self.sample_rate = sample_rate
+        self.frame_bytes = sample_rate * self.FRAME_DURATION_MS // 1000 * 2
+        self.segments = segments
+        self.play_raw_audio_callback = play_raw_audio_callback
+
+        self.frames = queue.Queue(maxsize=self.JITTER_BUFFER_MS // self.FRAME_DURATION_MS)
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self.error = None
+        self.created_at_ns = time.monotonic_ns()
+        self.producer_thread = threading.Thread(target=self.produce_frames, daemon=True)
+        self.sender_thread = threading.Thread(target=self.send_frames, daemon=True)
+
+    def start(self):
+        self.producer_thread.start()
+        self.sender_thread.start()
+
+    def cancel(self):
+        """Stops playback immediately. The producer may be waiting on a segment, it stops when it gets it."""
+        self.cancelled.set()
+        if self.sender_thread.is_alive() and self.sender_thread is not threading.current_thread():
+            self.sender_thread.join()
+
+    def frame_duration_ns(self, frame):
+        return len(frame) // 2 * 1_000_000_000 // self.sample_rate
+
+    def put_frame(self, frame):
+        while not self.cancelled.is_set():
+            try:
+                self.frames.put(frame, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce_frames(self):
+        remainder = b""
+        try:
+            for segment in self.segments:
+                if self.cancelled.is_set():
+                    return
+                audio = remainder + segment if remainder else segment
+                whole_frames_length = len(audio) // self.frame_bytes * self.frame_bytes
+                for frame_start in range(0, whole_frames_length, self.frame_bytes):
+                    if not self.put_frame(audio[frame_start : frame_start + self.frame_bytes]):
+                        return
+                remainder = audio[whole_frames_length:]
+            # The end of the audio is sent as a short frame
+            if remainder:
+                self.put_frame(remainder)
+            self.put_frame(END_OF_AUDIO)
+        except Exception as e:
+            logger.info(f"Error getting audio to play: {e}")
+            self.error = e
+            self.cancelled.set()
+
+    def send_frames(self):
+        lead_ns = self.LEAD_MS * 1_000_000
+        clock_start_ns = None
+        # How much audio has been sent since the clock started
+        sent_duration_ns = 0
+        try:
+            while not self.cancelled.is_set():
+                try:
+                    frame = self.frames.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if frame is END_OF_AUDIO:
+                    break
+
+                now_ns = time.monotonic_ns()
+                if clock_start_ns is None:
+                    bot_metrics.observe("audio_output_first_frame_latency_ms", (now_ns - self.created_at_ns) / 1_000_000)
+                    clock_start_ns = now_ns
+                    sent_duration_ns = 0
+                elif clock_start_ns + sent_duration_ns < now_ns:
+                    # The frame should already be playing, so everything sent before it has played out
+                    bot_metrics.increment("audio_output_underruns_total")
+                    clock_start_ns = now_ns
+                    sent_duration_ns = 0
+
+                send_at_ns = clock_start_ns + sent_duration_ns - lead_ns
+                if send_at_ns > now_ns and self.cancelled.wait((send_at_ns - now_ns) / 1_000_000_000):
+                    break
+                self.play_raw_audio_callback(bytes=frame, sample_rate=self.sample_rate)
+                sent_duration_ns += self.frame_duration_ns(frame)
+
+            # Finished once the last frame has played out
+            if clock_start_ns is not None and not self.cancelled.is_set():
+                self.cancelled.wait(max(clock_start_ns + sent_duration_ns - time.monotonic_ns(), 0) / 1_000_000_000)
+        except Exception as e:
+            logger.info(f"Error sending audio: {e}")
+            self.error = e
+            self.cancelled.set()
+        finally:
+            self.finished.set()
@@ -19,8 +19,12 @@ class PipelineConfiguration:
             {
                 # Basic meeting bot configuration
                 frozenset({"record_audio", "record_video", "transcribe_audio"}),
+                # Audio only recording configuration
+                frozenset({"record_audio", "transcribe_audio"}),
                 # RTMP streaming configuration
                 frozenset({"rtmp_stream_audio", "rtmp_stream_video", "transcribe_audio"}),
+                # RTMP streaming and recording from the same encode
+                frozenset({"record_audio", "record_video", "rtmp_stream_audio", "rtmp_stream_video", "transcribe_audio"}),
                 # Voice agent configuration
                 frozenset({"transcribe_audio"}),
             }
@@ -43,6 +47,16 @@ class PipelineConfiguration:
             rtmp_stream_video=False,
         )
 
+    @classmethod
+    def audio_recorder_bot(cls) -> "PipelineConfiguration":
+        return cls(
+            record_video=False,
+            record_audio=True,
+            transcribe_audio=True,
+            rtmp_stream_audio=False,
+            rtmp_stream_video=False,
+        )
+
     @classmethod
     def rtmp_streaming_bot(cls) -> "PipelineConfiguration":
         return cls(
@@ -53,6 +67,16 @@ class PipelineConfiguration:
             rtmp_stream_video=True,
         )
 
+    @classmethod
+    def rtmp_streaming_and_recorder_bot(cls) -> "PipelineConfiguration":
+        return cls(
+            record_video=True,
+            record_audio=True,
+            transcribe_audio=True,
+            rtmp_stream_audio=True,
+            rtmp_stream_video=True,
+        )
+
     @classmethod
     def voice_agent(cls) -> "PipelineConfiguration":
         return cls(
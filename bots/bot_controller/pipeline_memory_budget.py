@@ -0,0 +1,94 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# cgroup v1 reports no limit as a number just under the largest 64 bit integer
+NO_CGROUP_MEMORY_LIMIT_THRESHOLD = 1 << 60
+
+
+def cgroup_memory_limit_bytes():
+    """The container's memory limit, or None if it doesn't have one"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value == "max":
+            return None
+        try:
+            limit = int(value)
+        except ValueError:
+            return None
+        return limit if limit < NO_CGROUP_MEMORY_LIMIT_THRESHOLD else None
+    return None
+
+
+def default_pipeline_memory_budget_bytes():
+    if os.getenv("PIPELINE_MEMORY_BUDGET_BYTES"):
+        return int(os.getenv("PIPELINE_MEMORY_BUDGET_BYTES"))
+    memory_limit_bytes = cgroup_memory_limit_bytes()
+    if memory_limit_bytes is None:
+        return 1_000_000_000
+    # The browser or the Zoom SDK, the encoders and the rest of the bot need most of the memory
+    return memory_limit_bytes // 4
+
+
+class PipelineMemoryBudget:
+    """
+    Splits a memory budget between the queues in a gstreamer pipeline, and decides when to start dropping video because the
+    queues together are holding too much.
+
+    Each queue gets a share of the budget. Shares of queues the pipeline doesn't have are split between the ones it has, so
+    an audio only pipeline gives its audio queues more room. When the queues together go over SHED_VIDEO_FRACTION of the
+    budget, incoming video frames are dropped until they're back under RESUME_VIDEO_FRACTION. Audio is never dropped to make
+    room for video, it's much smaller and losing it is much more noticeable.
+    """
+
+    QUEUE_SHARES = {
+        # Raw video, before and after it's converted
+        "q1": 0.3,
+        "q2": 0.3,
+        # Encoded video
+        "q3": 0.1,
+        "flv_video_queue": 0.05,
+        # Muxed output
+        "q4": 0.1,
+        "flv_q4": 0.05,
+        # Raw and encoded audio
+        "q5": 0.02,
+        "mixer_q1": 0.02,
+        "q6": 0.02,
+        "q7": 0.02,
+        "q8": 0.01,
+        "flv_audio_queue": 0.01,
+    }
+    # Each audio source added while the pipeline is running gets this share, on top of the shares above
+    AUDIO_SOURCE_SHARE = 0.005
+    SHED_VIDEO_FRACTION = 0.8
+    RESUME_VIDEO_FRACTION = 0.6
+
+    def __init__(self, *, total_bytes, queue_names):
+        self.total_bytes = total_bytes
+        total_share = sum(self.QUEUE_SHARES.get(queue_name, 0) for queue_name in queue_names)
+        self.queue_limits = {queue_name: int(total_bytes * self.QUEUE_SHARES.get(queue_name, 0) / total_share) for queue_name in queue_names if total_share}
+        self.audio_source_queue_limit = int(total_bytes * self.AUDIO_SOURCE_SHARE)
+        self.shedding_video = False
+        self.queued_bytes = 0
+
+    def limit_for_queue(self, queue_name):
+        return self.queue_limits.get(queue_name) or self.audio_source_queue_limit
+
+    def update(self, queued_bytes):
+        """Takes how many bytes are in the queues right now. Returns True if video shedding started or stopped."""
+        self.queued_bytes = queued_bytes
+        if not self.shedding_video and queued_bytes > self.total_bytes * self.SHED_VIDEO_FRACTION:
+            logger.info(f"Pipeline queues are holding {queued_bytes} bytes of a {self.total_bytes} byte budget, dropping video until they drain")
+            self.shedding_video = True
+            return True
+        if self.shedding_video and queued_bytes < self.total_bytes * self.RESUME_VIDEO_FRACTION:
+            logger.info(f"Pipeline queues are down to {queued_bytes} bytes of a {self.total_bytes} byte budget, no longer dropping video")
+            self.shedding_video = False
+            return True
+        return False
@@ -1,11 +1,105 @@
 import logging
 import subprocess
+import threading
+import time
+from collections import deque
+
+from bots.bot_metrics import bot_metrics
 
 logger = logging.getLogger(__name__)
 
+FLV_TAG_TYPE_AUDIO = 8
+FLV_TAG_TYPE_VIDEO = 9
+FLV_TAG_TYPE_SCRIPT = 18
+FLV_TAG_HEADER_SIZE = 11
+FLV_PREVIOUS_TAG_SIZE_SIZE = 4
+FLV_VIDEO_FRAME_TYPE_KEYFRAME = 1
+FLV_VIDEO_CODEC_AVC = 7
+FLV_AUDIO_FORMAT_AAC = 10
+
+
+class FlvTag:
+    def __init__(self, data):
+        self.data = data
+        self.tag_type = data[0]
+        self.data_size = int.from_bytes(data[1:4], "big")
+        # 24 bit timestamp followed by an extra byte for the high bits
+        self.timestamp_ms = (data[7] << 24) | (data[4] << 16) | (data[5] << 8) | data[6]
+        self.received_at = time.monotonic()
+
+    @property
+    def is_keyframe(self):
+        return self.tag_type == FLV_TAG_TYPE_VIDEO and self.data_size >= 1 and self.data[FLV_TAG_HEADER_SIZE] >> 4 == FLV_VIDEO_FRAME_TYPE_KEYFRAME
+
+    @property
+    def header_kind(self):
+        """The metadata and codec configuration tags a player needs before it can decode anything, or None for media tags"""
+        if self.tag_type == FLV_TAG_TYPE_SCRIPT:
+            return "metadata"
+        # Past the payload is the PreviousTagSize, which mustn't be mistaken for the codec bytes
+        if self.data_size < 2:
+            return None
+        codec_byte = self.data[FLV_TAG_HEADER_SIZE]
+        is_sequence_header = self.data[FLV_TAG_HEADER_SIZE + 1] == 0
+        if self.tag_type == FLV_TAG_TYPE_VIDEO and codec_byte & 0x0F == FLV_VIDEO_CODEC_AVC and is_sequence_header:
+            return "video_sequence_header"
+        if self.tag_type == FLV_TAG_TYPE_AUDIO and codec_byte >> 4 == FLV_AUDIO_FORMAT_AAC and is_sequence_header:
+            return "audio_sequence_header"
+        return None
+
+
+class FlvTagReader:
+    """Splits an FLV stream into tags. The stream can be passed in chunks that don't line up with tag boundaries."""
+
+    def __init__(self):
+        self.pending = bytearray()
+        self.file_header = None
+
+    def add_chunk(self, chunk):
+        self.pending += chunk
+        if self.file_header is None:
+            if len(self.pending) < 9:
+                return []
+            # The header's size is in the header, and is followed by a PreviousTagSize of 0
+            file_header_size = int.from_bytes(self.pending[5:9], "big") + FLV_PREVIOUS_TAG_SIZE_SIZE
+            if len(self.pending) < file_header_size:
+                return []
+            self.file_header = bytes(self.pending[:file_header_size])
+            del self.pending[:file_header_size]
+
+        tags = []
+        position = 0
+        while len(self.pending) - position >= FLV_TAG_HEADER_SIZE:
+            data_size = int.from_bytes(self.pending[position + 1 : position + 4], "big")
+            tag_size = FLV_TAG_HEADER_SIZE + data_size + FLV_PREVIOUS_TAG_SIZE_SIZE
+            if len(self.pending) - position < tag_size:
+                break
+            tags.append(FlvTag(bytes(self.pending[position : position + tag_size])))
+            position += tag_size
+        del self.pending[:position]
+        return tags
+
 
 class RTMPClient:
-    def __init__(self, rtmp_url):
+    """
+    Streams FLV data to an RTMP endpoint through an ffmpeg process.
+
+    write_data never blocks. It splits the stream into FLV tags and queues them for a writer thread, so a slow RTMP server
+    can't hold up the gstreamer pipeline. The queue is bounded by duration and size. When it's full, whole groups of
+    pictures are dropped from the front, so the stream always resumes on a keyframe. If ffmpeg exits or the connection
+    breaks, it's restarted with exponential backoff and sent the stream's headers again. The client only gives up after
+    max_reconnect_attempts reconnects in a row fail.
+    """
+
+    def __init__(
+        self,
+        rtmp_url,
+        max_buffered_ms=5000,
+        max_buffered_bytes=50_000_000,
+        max_reconnect_attempts=5,
+        reconnect_base_delay_seconds=1,
+        reconnect_max_delay_seconds=30,
+    ):
         """
         Initialize the RTMP client for streaming FLV data to an RTMP endpoint.
 
@@ -13,18 +107,53 @@ class RTMPClient:
             rtmp_url (str): The RTMP endpoint URL
         """
         self.rtmp_url = rtmp_url
+        self.max_buffered_ms = max_buffered_ms
+        self.max_buffered_bytes = max_buffered_bytes
+        self.max_reconnect_attempts = max_reconnect_attempts
+        self.reconnect_base_delay_seconds = reconnect_base_delay_seconds
+        self.reconnect_max_delay_seconds = reconnect_max_delay_seconds
+
         self.ffmpeg_process = None
         self.is_running = False
+        self.failed = False
+
+        self.tag_reader = FlvTagReader()
+        # The latest tag of each header kind, sent again after a reconnect
+        self.header_tags = {}
+        self.queue = deque()
+        self.queued_bytes = 0
+        self.waiting_for_keyframe = False
+        self.queue_condition = threading.Condition()
+        self.stopped = threading.Event()
+        self.writer_thread = None
+
+        self.sent_stream_header = False
+        self.header_tags_sent = set()
+        # Reconnects in a row that didn't lead to a connection that stayed up
+        self.consecutive_reconnect_attempts = 0
+        self.connected_at = None
 
     def start(self):
         """Start the RTMP streaming process"""
         if self.is_running:
             return False
 
+        if not self.start_ffmpeg():
+            return False
+
+        self.is_running = True
+        self.writer_thread = threading.Thread(target=self.run_writer, daemon=True)
+        self.writer_thread.start()
+        return True
+
+    def start_ffmpeg(self):
         # Configure FFmpeg command to copy the FLV stream directly
         ffmpeg_cmd = [
             "ffmpeg",
             "-y",  # Overwrite output if needed
+            "-loglevel",
+            "warning",
+            "-nostats",
             "-f",
             "flv",  # Input format is FLV
             "-i",
@@ -41,58 +170,214 @@ class RTMPClient:
             self.ffmpeg_process = subprocess.Popen(
                 ffmpeg_cmd,
                 stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
                 stderr=subprocess.PIPE,
-                bufsize=10**8,
             )
-            self.is_running = True
-            logger.info(f"FFmpeg RTMP client started with PID {self.ffmpeg_process.pid}")
-            return True
         except Exception as e:
             logger.info(f"Failed to start FFmpeg process: {e}")
+            self.ffmpeg_process = None
             return False
 
+        # Nothing else reads ffmpeg's output, and if the pipe filled up ffmpeg would stop streaming
+        threading.Thread(target=self.log_ffmpeg_output, args=(self.ffmpeg_process,), daemon=True).start()
+        self.sent_stream_header = False
+        self.header_tags_sent = set()
+        self.connected_at = time.monotonic()
+        logger.info(f"FFmpeg RTMP client started with PID {self.ffmpeg_process.pid}")
+        return True
+
+    def log_ffmpeg_output(self, ffmpeg_process):
+        try:
+            for line in ffmpeg_process.stderr:
+                logger.info(f"FFmpeg RTMP client: {line.decode(errors='replace').rstrip()}")
+        except Exception:
+            pass
+
     def write_data(self, flv_data):
         """
-        Write FLV data to the RTMP stream.
+        Queue FLV data to be written to the RTMP stream.
 
         Args:
             flv_data (bytes): FLV formatted data containing audio and video
 
         Returns:
-            bool: True if data was written, False if failed
+            bool: False if the stream has failed and won't be reconnected, True otherwise
         """
-        if not self.is_running or not self.ffmpeg_process:
+        if not self.is_running or self.failed:
             return False
 
-        try:
-            self.ffmpeg_process.stdin.write(flv_data)
-            self.ffmpeg_process.stdin.flush()
+        with self.queue_condition:
+            for tag in self.tag_reader.add_chunk(flv_data):
+                self.queue_tag(tag)
+            self.drop_tags_over_buffer_limit()
+            bot_metrics.set_gauge("rtmp_buffered_bytes", self.queued_bytes)
+            self.queue_condition.notify()
+        return True
+
+    def queue_tag(self, tag):
+        if tag.header_kind:
+            self.header_tags[tag.header_kind] = tag
+        elif self.waiting_for_keyframe:
+            if not tag.is_keyframe:
+                bot_metrics.increment("rtmp_tags_dropped_total")
+                return
+            self.waiting_for_keyframe = False
+        self.queue.append(tag)
+        self.queued_bytes += len(tag.data)
+
+    def buffered_ms(self):
+        # Header tags only show up at the start of the stream, so this doesn't have to look far
+        first_media_tag = next((tag for tag in self.queue if not tag.header_kind), None)
+        if first_media_tag is None or self.queue[-1].header_kind:
+            return 0
+        return self.queue[-1].timestamp_ms - first_media_tag.timestamp_ms
+
+    def drop_tags_over_buffer_limit(self):
+        num_dropped = 0
+        while self.queued_bytes > self.max_buffered_bytes or self.buffered_ms() > self.max_buffered_ms:
+            num_dropped_to_keyframe = self.drop_to_next_keyframe(drop_first_media_tag=True)
+            if num_dropped_to_keyframe == 0:
+                break
+            num_dropped += num_dropped_to_keyframe
+        if num_dropped:
+            logger.info(f"RTMP client is falling behind, dropped {num_dropped} FLV tags to stay within {self.max_buffered_ms}ms and {self.max_buffered_bytes} bytes")
+
+    def drop_to_next_keyframe(self, drop_first_media_tag=False):
+        """Drops media tags from the front of the queue until it starts with a keyframe. Header tags are kept. Returns the number dropped."""
+        kept_tags = deque()
+        num_dropped = 0
+        found_keyframe = False
+        for tag in self.queue:
+            if found_keyframe or tag.header_kind:
+                kept_tags.append(tag)
+            elif tag.is_keyframe and not (drop_first_media_tag and num_dropped == 0):
+                found_keyframe = True
+                kept_tags.append(tag)
+            else:
+                num_dropped += 1
+                self.queued_bytes -= len(tag.data)
+        self.queue = kept_tags
+        if not found_keyframe:
+            # Everything after the last keyframe is gone, so wait for the next one before queueing media again
+            self.waiting_for_keyframe = True
+        bot_metrics.increment("rtmp_tags_dropped_total", num_dropped)
+        return num_dropped
+
+    def next_tag(self):
+        with self.queue_condition:
+            while not self.queue and not self.stopped.is_set():
+                self.queue_condition.wait()
+            if self.stopped.is_set():
+                return None
+            tag = self.queue.popleft()
+            self.queued_bytes -= len(tag.data)
+            return tag
+
+    def run_writer(self):
+        while True:
+            tag = self.next_tag()
+            if tag is None:
+                return
+            if self.write_tag(tag):
+                continue
+            if self.stopped.is_set():
+                return
+            with self.queue_condition:
+                # Retried on the new connection. Header tags are always kept, media only if it starts at a keyframe.
+                self.queue.appendleft(tag)
+                self.queued_bytes += len(tag.data)
+            if not self.reconnect():
+                self.failed = True
+                logger.info(f"RTMP client giving up after {self.max_reconnect_attempts} reconnect attempts")
+                return
+
+    def write_tag(self, tag):
+        if tag.header_kind and tag in self.header_tags_sent:
             return True
+
+        data = tag.data
+        if not self.sent_stream_header:
+            # A new connection needs the FLV header and the codec configuration before any media, always in the order they first arrived
+            self.header_tags_sent = set(self.header_tags.values())
+            data = self.tag_reader.file_header + b"".join(header_tag.data for header_tag in self.header_tags.values()) + (b"" if tag in self.header_tags_sent else data)
+
+        try:
+            # stop() can swap the process out from under this thread
+            ffmpeg_process = self.ffmpeg_process
+            if ffmpeg_process is None or ffmpeg_process.poll() is not None:
+                logger.info(f"FFmpeg RTMP client exited with code {ffmpeg_process.returncode if ffmpeg_process else None}")
+                return False
+            ffmpeg_process.stdin.write(data)
+            ffmpeg_process.stdin.flush()
         except BrokenPipeError:
             logger.info("FFmpeg pipe broken - stream may have failed")
-            self.is_running = False
             return False
         except Exception as e:
             logger.info(f"Error writing data to FFmpeg: {e}")
-            self.is_running = False
             return False
 
-    def stop(self):
-        """Stop the RTMP streaming process"""
-        self.is_running = False
+        self.sent_stream_header = True
+        bot_metrics.increment("rtmp_bytes_written_total", len(data))
+        bot_metrics.observe("rtmp_write_latency_ms", (time.monotonic() - tag.received_at) * 1000)
+        return True
+
+    def reconnect(self):
+        self.stop_ffmpeg()
 
-        if self.ffmpeg_process:
+        # A connection that stayed up for a while resets the backoff
+        if self.connected_at is not None and time.monotonic() - self.connected_at > self.reconnect_max_delay_seconds:
+            self.consecutive_reconnect_attempts = 0
+
+        while self.consecutive_reconnect_attempts < self.max_reconnect_attempts:
+            delay = min(self.reconnect_base_delay_seconds * 2**self.consecutive_reconnect_attempts, self.reconnect_max_delay_seconds)
+            self.consecutive_reconnect_attempts += 1
+            logger.info(f"RTMP client reconnecting in {delay}s (attempt {self.consecutive_reconnect_attempts} of {self.max_reconnect_attempts})")
+            if self.stopped.wait(delay):
+                return False
+            if self.start_ffmpeg():
+                bot_metrics.increment("rtmp_reconnects_total")
+                with self.queue_condition:
+                    # Whatever was queued while disconnected starts again at a keyframe
+                    self.drop_to_next_keyframe()
+                return True
+        return False
+
+    def stop_ffmpeg(self):
+        if not self.ffmpeg_process:
+            return
+
+        ffmpeg_process = self.ffmpeg_process
+        # Stopped before stdin is closed. If the endpoint stalled, the writer thread is blocked writing to stdin and holds
+        # its lock, so closing it first would hang. Once ffmpeg is gone that write fails with a broken pipe.
+        try:
+            ffmpeg_process.terminate()
+            ffmpeg_process.wait(timeout=5.0)
+        except Exception as e:
+            logger.info(f"Error stopping FFmpeg process: {e}")
+            # Force kill if graceful shutdown fails
             try:
-                self.ffmpeg_process.stdin.close()
-                self.ffmpeg_process.terminate()
-                self.ffmpeg_process.wait(timeout=5.0)
-            except Exception as e:
-                logger.info(f"Error stopping FFmpeg process: {e}")
-                # Force kill if graceful shutdown fails
-                try:
-                    self.ffmpeg_process.kill()
-                except Exception:
-                    pass
+                ffmpeg_process.kill()
+                ffmpeg_process.wait(timeout=5.0)
+            except Exception:
+                pass
 
-            self.ffmpeg_process = None
+        try:
+            ffmpeg_process.stdin.close()
+        except Exception:
+            # Whatever was still buffered can't be written to a process that's gone
+            pass
+
+        self.ffmpeg_process = None
+
+    def stop(self):
+        """Stop the RTMP streaming process"""
+        self.is_running = False
+        self.stopped.set()
+        with self.queue_condition:
+            self.queue_condition.notify_all()
+        # Stopping ffmpeg first unblocks a writer thread that's stuck writing to a stalled connection
+        self.stop_ffmpeg()
+        if self.writer_thread:
+            self.writer_thread.join(timeout=5.0)
+        # In case the writer thread was reconnecting
+        self.stop_ffmpeg()
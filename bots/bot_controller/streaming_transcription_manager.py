@@ -0,0 +1,325 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from urllib.parse import urlencode
+
+from websockets.sync.client import connect
+
+from bots.bot_metrics import bot_metrics
+
+logger = logging.getLogger(__name__)
+
+END_OF_AUDIO = None
+
+
+def deepgram_streaming_url(*, model, language, sample_rate, base_url=None):
+    if base_url is None:
+        base_url = os.getenv("DEEPGRAM_STREAMING_URL", "wss://api.deepgram.com/v1/listen")
+
+    params = {
+        "model": model,
+        "encoding": "linear16",
+        "sample_rate": sample_rate,
+        "channels": 1,
+        "smart_format": "true",
+        "interim_results": "true",
+    }
+    if language:
+        params["language"] = language
+
+    return f"{base_url}?{urlencode(params)}"
+
+
+class StreamingTranscriptionConnection:
+    """One websocket connection of a session. Stream times in results are relative to the audio sent on this connection."""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        # When the first chunk sent on this connection arrived
+        self.started_at_ms = None
+        # Segment start times (ms into the stream) that have had an interim result emitted but no final result yet
+        self.segments_with_interim_results = set()
+        self.receiver_thread = None
+
+
+class StreamingTranscriptionSession:
+    """
+    A long-lived streaming transcription session for a single speaker. Audio chunks are queued from the
+    audio callback thread and sent by a dedicated sender thread, transcription results are read by a receiver
+    thread and handed to on_result_callback. Speaks the Deepgram live streaming websocket protocol.
+
+    If the connection fails, the sender reconnects with exponential backoff. Audio keeps being queued in the meantime
+    and is sent once the new connection is up, up to MAX_QUEUED_CHUNKS, after which the oldest audio is dropped.
+    """
+
+    KEEPALIVE_INTERVAL_SECONDS = 5
+    INITIAL_RECONNECT_DELAY_SECONDS = 0.5
+    MAX_RECONNECT_DELAY_SECONDS = 30
+    # About a minute of audio in 10ms chunks
+    MAX_QUEUED_CHUNKS = 6000
+
+    def __init__(self, *, speaker_id, url, api_key, on_result_callback):
+        self.speaker_id = speaker_id
+        self.url = url
+        self.api_key = api_key
+        self.on_result_callback = on_result_callback
+
+        # (arrival time in ms, chunk) pairs, then END_OF_AUDIO once the session is closed
+        self.audio_queue = queue.Queue(maxsize=self.MAX_QUEUED_CHUNKS)
+        self.connection = None
+        self.last_audio_time = None
+        self.closed = False
+        self.close_requested = threading.Event()
+        self.sender_thread = None
+
+    def start(self):
+        self.last_audio_time = time.time()
+
+        self.sender_thread = threading.Thread(target=self._send_worker, daemon=True)
+        self.sender_thread.start()
+        logger.info(f"Started streaming transcription session for speaker {self.speaker_id}")
+
+    def add_chunk(self, chunk_bytes):
+        if self.closed:
+            return
+        self.last_audio_time = time.time()
+        self._queue_item((int(self.last_audio_time * 1000), chunk_bytes))
+
+    def _queue_item(self, item):
+        while True:
+            try:
+                self.audio_queue.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+            # The connection has been down too long to keep everything, drop the oldest audio
+            try:
+                self.audio_queue.get_nowait()
+                bot_metrics.increment("streaming_transcription_chunks_dropped_total")
+            except queue.Empty:
+                pass
+
+    def seconds_since_last_audio(self):
+        return time.time() - self.last_audio_time
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.close_requested.set()
+        # Sentinel value tells the sender thread to finish the stream
+        self._queue_item(END_OF_AUDIO)
+
+    def wait_until_finished(self, timeout):
+        deadline = time.time() + timeout
+        if self.sender_thread:
+            self.sender_thread.join(timeout=timeout)
+        if self.connection and self.connection.receiver_thread:
+            self.connection.receiver_thread.join(timeout=max(0, deadline - time.time()))
+
+    def _connect(self):
+        websocket = connect(self.url, additional_headers={"Authorization": f"Token {self.api_key}"}, compression=None, max_size=None)
+        connection = StreamingTranscriptionConnection(websocket)
+        connection.receiver_thread = threading.Thread(target=self._receive_worker, args=(connection,), daemon=True)
+        connection.receiver_thread.start()
+        return connection
+
+    def _send_worker(self):
+        reconnect_delay = self.INITIAL_RECONNECT_DELAY_SECONDS
+        retried_after_close = False
+        # A chunk that was taken off the queue but couldn't be sent, it's sent first on the next connection
+        unsent_item = None
+        while True:
+            try:
+                self.connection = self._connect()
+                while True:
+                    if unsent_item is None:
+                        try:
+                            unsent_item = self.audio_queue.get(timeout=self.KEEPALIVE_INTERVAL_SECONDS)
+                        except queue.Empty:
+                            self.connection.websocket.send(json.dumps({"type": "KeepAlive"}))
+                            continue
+
+                    if unsent_item is END_OF_AUDIO:
+                        self.connection.websocket.send(json.dumps({"type": "CloseStream"}))
+                        return
+
+                    arrival_time_ms, chunk = unsent_item
+                    if self.connection.started_at_ms is None:
+                        self.connection.started_at_ms = arrival_time_ms
+                    self.connection.websocket.send(chunk)
+                    unsent_item = None
+                    # Only a connection that's taking audio resets the backoff, not one that's closed as soon as it opens
+                    reconnect_delay = self.INITIAL_RECONNECT_DELAY_SECONDS
+            except Exception as e:
+                bot_metrics.increment("streaming_transcription_connection_failures_total")
+                if self.connection:
+                    self.connection.websocket.close()
+
+                if self.close_requested.is_set():
+                    # Try once more to send what's left, then give up on it
+                    if retried_after_close:
+                        logger.info(f"Streaming transcription session for speaker {self.speaker_id} closed without sending all its audio: {e}")
+                        return
+                    retried_after_close = True
+                    continue
+
+                logger.info(f"Streaming transcription connection for speaker {self.speaker_id} failed, reconnecting in {reconnect_delay}s: {e}")
+                self.close_requested.wait(reconnect_delay)
+                reconnect_delay = min(reconnect_delay * 2, self.MAX_RECONNECT_DELAY_SECONDS)
+
+    def _receive_worker(self, connection):
+        try:
+            for message in connection.websocket:
+                self._handle_message(connection, json.loads(message))
+        except Exception as e:
+            logger.info(f"Streaming transcription connection for speaker {self.speaker_id} ended: {e}")
+
+    def _handle_message(self, connection, message):
+        if message.get("type") != "Results":
+            return
+
+        alternatives = message.get("channel", {}).get("alternatives", [])
+        if not alternatives:
+            return
+        alternative = alternatives[0]
+
+        segment_start_seconds = message.get("start", 0.0)
+        segment_start_ms = int(segment_start_seconds * 1000)
+        is_final = message.get("is_final", False)
+        transcript = alternative.get("transcript", "")
+        segment_key = f"{connection.started_at_ms}-{segment_start_ms}"
+
+        if not transcript:
+            # If an interim result was already emitted for this segment, tell the consumer to discard it
+            if is_final and segment_start_ms in connection.segments_with_interim_results:
+                connection.segments_with_interim_results.discard(segment_start_ms)
+                self.on_result_callback(
+                    {
+                        "speaker_id": self.speaker_id,
+                        "segment_key": segment_key,
+                        "discard": True,
+                    }
+                )
+            return
+
+        if is_final:
+            connection.segments_with_interim_results.discard(segment_start_ms)
+        else:
+            connection.segments_with_interim_results.add(segment_start_ms)
+
+        # Word timings are relative to the start of the stream, but utterance words are relative to the start of the utterance
+        words = []
+        for word in alternative.get("words", []):
+            words.append({**word, "start": word["start"] - segment_start_seconds, "end": word["end"] - segment_start_seconds})
+
+        self.on_result_callback(
+            {
+                "speaker_id": self.speaker_id,
+                "segment_key": segment_key,
+                "discard": False,
+                "is_final": is_final,
+                "timestamp_ms": connection.started_at_ms + segment_start_ms,
+                "duration_ms": int(message.get("duration", 0.0) * 1000),
+                "transcription": {**alternative, "words": words},
+            }
+        )
+
+
+class StreamingTranscriptionManager:
+    """
+    Alternative to IndividualAudioInputManager that sends per-speaker audio to a streaming transcription
+    session as it arrives instead of buffering whole utterances. Results are queued by the session threads
+    and saved from the main loop via process_results.
+
+    Final results are saved as soon as they arrive. Interim results are only shown while a segment is in progress and
+    each one replaces the last, so only the latest interim result for each segment is saved, at most every
+    INTERIM_RESULTS_SAVE_INTERVAL_SECONDS.
+    """
+
+    IDLE_SESSION_TIMEOUT_SECONDS = 60
+    FLUSH_TIMEOUT_SECONDS = 10
+    INTERIM_RESULTS_SAVE_INTERVAL_SECONDS = 1
+
+    def __init__(self, *, url, api_key, save_result_callback, get_participant_callback):
+        self.url = url
+        self.api_key = api_key
+        self.save_result_callback = save_result_callback
+        self.get_participant_callback = get_participant_callback
+
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.results_queue = queue.Queue()
+        # The latest unsaved interim result for each segment, keyed by segment key
+        self.pending_interim_results = {}
+        self.interim_results_saved_at = time.monotonic()
+
+    def add_chunk(self, speaker_id, chunk_time, chunk_bytes):
+        self.get_or_create_session(speaker_id).add_chunk(chunk_bytes)
+
+    def get_or_create_session(self, speaker_id):
+        with self.sessions_lock:
+            session = self.sessions.get(speaker_id)
+            if session and not session.closed:
+                return session
+
+            session = StreamingTranscriptionSession(
+                speaker_id=speaker_id,
+                url=self.url,
+                api_key=self.api_key,
+                on_result_callback=self.results_queue.put,
+            )
+            session.start()
+            self.sessions[speaker_id] = session
+            return session
+
+    def save_result(self, result):
+        participant = self.get_participant_callback(result["speaker_id"])
+        if participant:
+            self.save_result_callback({**participant, **result})
+
+    def save_pending_interim_results(self):
+        for result in self.pending_interim_results.values():
+            self.save_result(result)
+        bot_metrics.increment("streaming_transcription_interim_results_saved_total", len(self.pending_interim_results))
+        self.pending_interim_results = {}
+        self.interim_results_saved_at = time.monotonic()
+
+    def process_results(self):
+        while not self.results_queue.empty():
+            result = self.results_queue.get()
+            if result["discard"] or result["is_final"]:
+                # Supersedes any interim result for the segment that hasn't been saved yet
+                self.pending_interim_results.pop(result["segment_key"], None)
+                self.save_result(result)
+            else:
+                if result["segment_key"] in self.pending_interim_results:
+                    bot_metrics.increment("streaming_transcription_interim_results_coalesced_total")
+                self.pending_interim_results[result["segment_key"]] = result
+
+        if time.monotonic() - self.interim_results_saved_at >= self.INTERIM_RESULTS_SAVE_INTERVAL_SECONDS:
+            self.save_pending_interim_results()
+
+        # Close sessions for speakers who have stopped talking so they don't hold open connections
+        with self.sessions_lock:
+            for speaker_id, session in list(self.sessions.items()):
+                if session.closed or session.seconds_since_last_audio() > self.IDLE_SESSION_TIMEOUT_SECONDS:
+                    session.close()
+                    del self.sessions[speaker_id]
+
+    def flush_results(self):
+        with self.sessions_lock:
+            sessions = list(self.sessions.values())
+            self.sessions = {}
+
+        for session in sessions:
+            session.close()
+        for session in sessions:
+            session.wait_until_finished(timeout=self.FLUSH_TIMEOUT_SECONDS)
+
+        self.process_results()
+        # Segments that never got a final result keep their latest interim result
+        self.save_pending_interim_results()
@@ -1,87 +1,215 @@
+import base64
+import hashlib
 import logging
+import os
+import shutil
+import tempfile
 import threading
-from io import BytesIO
+import time
 from queue import Queue
 
 import boto3
 
+from bots.bot_metrics import bot_metrics
+
 logger = logging.getLogger(__name__)
 
 
 class StreamingUploader:
-    def __init__(self, bucket, key, chunk_size=5242880):  # 5MB chunks
+    """
+    Uploads a stream of bytes to S3 as a multipart upload while it's still being written.
+
+    Data is copied once, into a part-sized buffer. Full parts are uploaded by a pool of threads. The queue of parts waiting
+    to be uploaded is bounded, so if S3 can't keep up, upload_part blocks instead of buffering the whole recording in memory.
+    Every part is sent with its MD5 so S3 rejects corrupted parts, and failed parts are retried with exponential backoff.
+    If a part still fails, it and every part after it are spooled to local disk, and uploaded again when the recording ends.
+    """
+
+    def __init__(
+        self,
+        bucket,
+        key,
+        chunk_size=5242880,  # 5MB chunks
+        max_concurrent_uploads=4,
+        max_pending_parts=8,
+        max_attempts=5,
+        retry_base_delay_seconds=0.5,
+    ):
         self.s3_client = boto3.client("s3")
         self.bucket = bucket
         self.key = key
         self.chunk_size = chunk_size
-        self.buffer = BytesIO()
+        self.max_attempts = max_attempts
+        self.retry_base_delay_seconds = retry_base_delay_seconds
         self.upload_id = None
-        self.parts = []
+
+        self.current_part = bytearray()
         self.part_number = 1
 
-        # Add upload queue and worker thread
-        self.upload_queue = Queue()
-        self.upload_thread = threading.Thread(target=self._upload_worker, daemon=True)
-        self.upload_thread.start()
+        self.parts = []
+        self.parts_lock = threading.Lock()
+        self.failed_part_number = None
+        self.failed_part_error = None
+        # Set once a part has failed, after which parts are written here instead of to S3
+        self.spool_directory = None
+        self.spooled_part_paths = {}
+
+        self.bytes_uploaded = 0
+        self.started_at = time.monotonic()
+
+        self.upload_queue = Queue(maxsize=max_pending_parts)
+        self.upload_threads = [threading.Thread(target=self._upload_worker, daemon=True) for _ in range(max_concurrent_uploads)]
+        for upload_thread in self.upload_threads:
+            upload_thread.start()
 
     def _upload_worker(self):
         """Background thread to handle uploads"""
         while True:
+            chunk, part_num = self.upload_queue.get()
             try:
-                chunk, part_num = self.upload_queue.get()
                 if chunk is None:  # Sentinel value to stop the thread
                     break
+                self._upload_part_or_spool(chunk, part_num)
+            finally:
+                self.upload_queue.task_done()
 
+    def _upload_part_or_spool(self, chunk, part_num):
+        # Once S3 has failed, retrying every part during the meeting would only hold up the ones behind it
+        if self.spool_directory is None and self._upload_part_with_retries(chunk, part_num):
+            return
+        try:
+            self._spool_part(chunk, part_num)
+        except Exception as e:
+            logger.error(f"Could not spool part {part_num} to disk: {e}")
+            with self.parts_lock:
+                if self.failed_part_number is None:
+                    self.failed_part_number = part_num
+                    self.failed_part_error = e
+
+    def _spool_part(self, chunk, part_num):
+        with self.parts_lock:
+            if self.spool_directory is None:
+                self.spool_directory = tempfile.mkdtemp(prefix="recording_upload_")
+                logger.error(f"Streaming upload of {self.key} failed at part {part_num}, spooling the rest of the recording to {self.spool_directory} to upload when it ends")
+            path = os.path.join(self.spool_directory, f"{part_num}.part")
+        with open(path, "wb") as spool_file:
+            spool_file.write(chunk)
+        with self.parts_lock:
+            self.spooled_part_paths[part_num] = path
+        bot_metrics.increment("recording_upload_parts_spooled_total")
+
+    def _upload_spooled_parts(self):
+        try:
+            if self.failed_part_number is not None:
+                # A part that couldn't be spooled leaves a hole, so the upload is going to be aborted anyway
+                return
+            for part_num in sorted(self.spooled_part_paths):
+                with open(self.spooled_part_paths[part_num], "rb") as spool_file:
+                    chunk = spool_file.read()
+                if not self._upload_part_with_retries(chunk, part_num):
+                    self.failed_part_number = part_num
+                    return
+            logger.info(f"Uploaded {len(self.spooled_part_paths)} spooled parts of {self.key}")
+        finally:
+            shutil.rmtree(self.spool_directory, ignore_errors=True)
+
+    def _upload_part_with_retries(self, chunk, part_num):
+        """Returns whether the part was uploaded"""
+        content_md5 = base64.b64encode(hashlib.md5(chunk).digest()).decode("ascii")
+
+        for attempt in range(1, self.max_attempts + 1):
+            start = time.monotonic()
+            try:
                 response = self.s3_client.upload_part(
                     Bucket=self.bucket,
                     Key=self.key,
                     PartNumber=part_num,
                     UploadId=self.upload_id,
                     Body=chunk,
+                    ContentMD5=content_md5,
                 )
-
-                self.parts.append({"PartNumber": part_num, "ETag": response["ETag"]})
             except Exception as e:
-                logging.error(f"Upload error: {e}")
-            finally:
-                self.upload_queue.task_done()
+                if attempt == self.max_attempts:
+                    logger.error(f"Upload of part {part_num} failed after {attempt} attempts: {e}")
+                    self.failed_part_error = e
+                    return False
+
+                delay = self.retry_base_delay_seconds * 2 ** (attempt - 1)
+                logger.info(f"Upload of part {part_num} failed on attempt {attempt}, retrying in {delay}s: {e}")
+                bot_metrics.increment("recording_upload_part_retries_total")
+                time.sleep(delay)
+                continue
+
+            bot_metrics.observe("recording_upload_part_duration_ms", (time.monotonic() - start) * 1000)
+            bot_metrics.increment("recording_upload_bytes_total", len(chunk))
+            with self.parts_lock:
+                self.parts.append({"PartNumber": part_num, "ETag": response["ETag"]})
+                self.bytes_uploaded += len(chunk)
+                num_parts_uploaded = len(self.parts)
+            if num_parts_uploaded % 20 == 0:
+                progress = self.progress()
+                logger.info(f"Uploaded {progress['parts_uploaded']} parts, {progress['bytes_uploaded'] / 1e6:.0f} MB at {progress['megabytes_per_second']:.1f} MB/s")
+            return True
+
+    def _queue_current_part(self):
+        # Blocks if max_pending_parts are already waiting, which slows the writer down to the speed of the uploads
+        self.upload_queue.put((self.current_part, self.part_number))
+        self.part_number += 1
+        self.current_part = bytearray()
 
     def upload_part(self, data):
-        self.buffer.write(data)
-
-        # Upload complete chunks
-        while self.buffer.tell() >= self.chunk_size:
-            self.buffer.seek(0)
-            chunk = self.buffer.read(self.chunk_size)
-
-            # Queue the chunk for upload instead of uploading directly
-            self.upload_queue.put((chunk, self.part_number))
-            self.part_number += 1
-
-            # Keep remaining data
-            remaining = self.buffer.read()
-            self.buffer = BytesIO()
-            self.buffer.write(remaining)
+        data = memoryview(data)
+        offset = 0
+        while offset < len(data):
+            # Fill the current part up to the chunk size, anything left over starts the next part
+            space_in_part = self.chunk_size - len(self.current_part)
+            self.current_part += data[offset : offset + space_in_part]
+            offset += space_in_part
+
+            if len(self.current_part) >= self.chunk_size:
+                self._queue_current_part()
+
+    def progress(self):
+        with self.parts_lock:
+            elapsed = time.monotonic() - self.started_at
+            return {
+                "parts_uploaded": len(self.parts),
+                "bytes_uploaded": self.bytes_uploaded,
+                "megabytes_per_second": self.bytes_uploaded / 1e6 / elapsed if elapsed > 0 else 0,
+            }
+
+    def _stop_upload_threads(self):
+        for _ in self.upload_threads:
+            self.upload_queue.put((None, None))
+        for upload_thread in self.upload_threads:
+            upload_thread.join()
 
     def complete_upload(self):
-        # If we never started a multipart upload (len(self.parts) == 0), do a regular upload
-        if len(self.parts) == 0:
-            self.buffer.seek(0)
-            data = self.buffer.getvalue()
-            self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=data)
-            logger.info("len(self.parts) == 0, so did a regular upload")
+        # If no part was ever queued, the data is smaller than a part (S3 requires at least one), so do a regular upload.
+        # Checking the part number rather than self.parts because parts are only added once a worker has uploaded them.
+        if self.part_number == 1:
+            self._stop_upload_threads()
+            self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.current_part))
+            if self.upload_id:
+                self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            logger.info("No parts were uploaded, so did a regular upload")
             return
 
-        # Upload final part if any data remains
-        if self.buffer.tell() > 0:
-            self.buffer.seek(0)
-            final_chunk = self.buffer.getvalue()
-            self.upload_queue.put((final_chunk, self.part_number))
+        # Upload final part if any data remains. It's the only part allowed to be smaller than the chunk size.
+        if len(self.current_part) > 0:
+            self._queue_current_part()
 
         # Wait for all uploads to complete
         self.upload_queue.join()
-        self.upload_queue.put((None, None))  # Stop the worker thread
-        self.upload_thread.join()
+        self._stop_upload_threads()
+
+        if self.spool_directory is not None:
+            self._upload_spooled_parts()
+
+        if self.failed_part_number is not None:
+            # Completing would produce a recording with a hole in it, so don't leave a broken upload behind
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            raise Exception(f"Streaming upload of {self.key} failed, part {self.failed_part_number} could not be uploaded: {self.failed_part_error}")
 
         # Complete multipart upload
         self.s3_client.complete_multipart_upload(
@@ -90,6 +218,8 @@ class StreamingUploader:
             UploadId=self.upload_id,
             MultipartUpload={"Parts": sorted(self.parts, key=lambda x: x["PartNumber"])},
         )
+        progress = self.progress()
+        logger.info(f"Completed upload of {self.key}: {progress['parts_uploaded']} parts, {progress['bytes_uploaded'] / 1e6:.0f} MB at {progress['megabytes_per_second']:.1f} MB/s")
 
     def start_upload(self):
         """Initialize the multipart upload and get the upload ID"""
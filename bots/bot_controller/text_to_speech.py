@@ -1,13 +1,17 @@
 import json
+import re
 
 from google.cloud import texttospeech
 
 from bots.models import Credentials
 
+# Splits text after the end of each sentence
+SENTENCE_BOUNDARY_REGEX = re.compile(r"(?<=[.!?])\s+")
 
-def generate_audio_from_text(bot, text, settings, sample_rate):
+
+def generate_audio_segments_from_text(bot, text, settings, sample_rate):
     """
-    Generate audio from text using text-to-speech settings.
+    Generate audio from text one sentence at a time, so the first sentence can be played while the rest are synthesized.
 
     Args:
         bot (Bot): The bot instance
@@ -17,10 +21,8 @@ def generate_audio_from_text(bot, text, settings, sample_rate):
                 voice_language_code (str): Language code (e.g., "en-US")
                 voice_name (str): Name of the voice to use
         sample_rate (int): The sample rate in Hz
-    Returns:
-        tuple: (bytes, int) containing:
-            - Audio data in LINEAR16 format
-            - Duration in milliseconds
+    Yields:
+        bytes: Audio data for each sentence in LINEAR16 format. The credentials are checked when the first sentence is requested.
     """
 
     # Additional providers will be added, for now we only support Google TTS
@@ -37,9 +39,6 @@ def generate_audio_from_text(bot, text, settings, sample_rate):
     except Exception as e:
         raise ValueError("Failed to initialize Google Text-to-Speech client: " + str(e)) from e
 
-    # Set up text input
-    synthesis_input = texttospeech.SynthesisInput(text=text)
-
     # Get Google settings
     google_settings = settings.get("google", {})
     language_code = google_settings.get("voice_language_code")
@@ -51,19 +50,15 @@ def generate_audio_from_text(bot, text, settings, sample_rate):
     # Configure audio output as PCM (LINEAR16)
     audio_config = texttospeech.AudioConfig(
         audio_encoding=texttospeech.AudioEncoding.LINEAR16,
-        sample_rate_hertz=sample_rate,  # Using 8kHz sample rate
+        sample_rate_hertz=sample_rate,
     )
 
-    # Perform the text-to-speech request
-    response = client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
-
-    # Skip the WAV header (first 44 bytes) to get raw PCM data
-    audio_content = response.audio_content[44:]
+    for sentence in SENTENCE_BOUNDARY_REGEX.split(text.strip()):
+        # Set up text input
+        synthesis_input = texttospeech.SynthesisInput(text=sentence)
 
-    # Calculate duration in milliseconds
-    # For LINEAR16: 2 bytes per sample, sample_rate samples per second
-    bytes_per_sample = 2
-    duration_ms = int((len(audio_content) / bytes_per_sample / sample_rate) * 1000)
+        # Perform the text-to-speech request
+        response = client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
 
-    # Return both audio content and duration
-    return audio_content, duration_ms
+        # Skip the WAV header (first 44 bytes) to get raw PCM data
+        yield response.audio_content[44:]
@@ -0,0 +1,44 @@
+import numpy as np
+
+
+class UtteranceAudioBuffer:
+    """
+    Holds the audio for one speaker's utterance in a buffer allocated up front, large enough for the longest utterance.
+
+    Growing a bytearray reallocates and copies it as it grows, and flushing it with bytes() copies it again. This buffer is
+    allocated once with np.empty, so the operating system only backs the pages audio is actually written to, and audio is
+    copied into it exactly once. When the utterance is flushed, the buffer is handed off as a memoryview without copying,
+    and the next utterance gets a new buffer.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = None
+        self.buffer_view = None
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, data):
+        if self.buffer is None:
+            self.buffer = np.empty(self.capacity, dtype=np.uint8)
+            self.buffer_view = memoryview(self.buffer)
+        end = self.length + len(data)
+        if end > len(self.buffer):
+            # Only happens if the caller goes over the capacity it asked for
+            self.buffer = np.concatenate([self.buffer[: self.length], np.empty(max(end, 2 * len(self.buffer)) - self.length, dtype=np.uint8)])
+            self.buffer_view = memoryview(self.buffer)
+        # Assigning to a memoryview slice is a plain memcpy, without the overhead of wrapping data in a numpy array
+        self.buffer_view[self.length : end] = data
+        self.length = end
+
+    def release(self):
+        """Returns the audio as a memoryview over the buffer, and leaves this empty. The buffer is never written to again."""
+        if self.buffer is None:
+            return memoryview(b"")
+        audio = self.buffer_view[: self.length]
+        self.buffer = None
+        self.buffer_view = None
+        self.length = 0
+        return audio
@@ -0,0 +1,214 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+METRIC_NAME_PREFIX = "attendee_bot_"
+
+# Buckets for histograms of durations in milliseconds
+LATENCY_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Buckets for histograms of item counts, like the number of utterances written in one flush
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # The last count is for values larger than every bucket
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = None
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket that contains the given percentile, or the max if it's past the last bucket"""
+        if self.count == 0:
+            return None
+        target = fraction * self.count
+        cumulative_count = 0
+        for bucket, bucket_count in zip(self.buckets, self.bucket_counts):
+            cumulative_count += bucket_count
+            if cumulative_count >= target:
+                return bucket
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 3) if self.count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "max": round(self.max, 3) if self.max is not None else None,
+        }
+
+
+class BotMetrics:
+    """
+    In-process counters, gauges and histograms for a single bot. Safe to update from any thread.
+    Rendered in the Prometheus text format for scraping and summarised into the bot's events when it shuts down.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    @staticmethod
+    def key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def increment(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS_MS, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes how long the block took, in milliseconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000, **labels)
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+
+    def render_prometheus(self):
+        lines = []
+        with self.lock:
+            for metric_type, values in (("counter", self.counters), ("gauge", self.gauges)):
+                names_written = set()
+                for (name, labels), value in sorted(values.items()):
+                    if name not in names_written:
+                        lines.append(f"# TYPE {METRIC_NAME_PREFIX}{name} {metric_type}")
+                        names_written.add(name)
+                    lines.append(f"{METRIC_NAME_PREFIX}{name}{format_labels(labels)} {value}")
+
+            names_written = set()
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                full_name = METRIC_NAME_PREFIX + name
+                if name not in names_written:
+                    lines.append(f"# TYPE {full_name} histogram")
+                    names_written.add(name)
+                cumulative_count = 0
+                for bucket, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+                    cumulative_count += bucket_count
+                    lines.append(f"{full_name}_bucket{format_labels(labels + (('le', bucket),))} {cumulative_count}")
+                lines.append(f"{full_name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{full_name}_sum{format_labels(labels)} {histogram.sum}")
+                lines.append(f"{full_name}_count{format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Compact dict of every metric, small enough to store in BotEvent metadata"""
+        with self.lock:
+            return {
+                "counters": {f"{name}{format_labels(labels)}": value for (name, labels), value in sorted(self.counters.items())},
+                "gauges": {f"{name}{format_labels(labels)}": value for (name, labels), value in sorted(self.gauges.items())},
+                "histograms": {f"{name}{format_labels(labels)}": histogram.summary() for (name, labels), histogram in sorted(self.histograms.items())},
+            }
+
+
+# Each bot runs in its own process, so one set of metrics per process
+bot_metrics = BotMetrics()
+
+
+class BotMetricsServer:
+    """Serves the bot's metrics in the Prometheus text format at /metrics"""
+
+    def __init__(self, *, metrics, host, port):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.server = None
+        self.server_thread = None
+
+    def start(self):
+        metrics = self.metrics
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes are frequent, don't fill the bot logs with them
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), MetricsRequestHandler)
+        except OSError as e:
+            logger.info(f"Could not start metrics server on {self.host}:{self.port}: {e}")
+            return
+
+        self.server.daemon_threads = True
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        logger.info(f"Metrics server listening on {self.host}:{self.port}")
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def orm_timing_execute_wrapper(execute, sql, params, many, context):
+    statement_type = sql.lstrip().split(None, 1)[0].upper() if sql else "UNKNOWN"
+    if statement_type not in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+        statement_type = "OTHER"
+    with bot_metrics.timer("orm_query_duration_ms", statement=statement_type):
+        return execute(sql, params, many, context)
+
+
+def add_orm_timing_to_connection(sender, connection, **kwargs):
+    if orm_timing_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(orm_timing_execute_wrapper)
+
+
+def install_orm_timing(connection):
+    """Times every query on the given connection and on every connection opened later, in any thread"""
+    connection_created.connect(add_orm_timing_to_connection, dispatch_uid="bot_metrics_orm_timing")
+    add_orm_timing_to_connection(sender=None, connection=connection)
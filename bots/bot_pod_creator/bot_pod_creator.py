@@ -1,6 +1,6 @@
 import os
 import uuid
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from kubernetes import client, config
 
@@ -46,18 +46,33 @@ class BotPodCreator:
         # python manage.py run_bot --botid
         command = ["python", "manage.py", "run_bot", "--botid", str(bot_id)]
 
+        return self.create_pod(pod_name=bot_name, command=command, app_label="bot-proc")
+
+    def create_warm_bot_pod(self, pod_name: Optional[str] = None) -> Dict:
+        """
+        Create a pod that starts a bot process ahead of time and waits in the warm pool
+        until a bot is assigned to it.
+        """
+        if pod_name is None:
+            pod_name = f"bot-pod-warm-{uuid.uuid4().hex[:12]}"
+
+        command = ["python", "manage.py", "run_warm_bot_worker"]
+
+        return self.create_pod(pod_name=pod_name, command=command, app_label="warm-bot-proc")
+
+    def create_pod(self, pod_name: str, command: List[str], app_label: str) -> Dict:
         # Metadata labels matching the deployment
         labels = {
             "app.kubernetes.io/name": self.app_name,
             "app.kubernetes.io/instance": self.app_instance,
             "app.kubernetes.io/version": self.app_version,
             "app.kubernetes.io/managed-by": "cuber",
-            "app": "bot-proc"
+            "app": app_label
         }
 
         pod = client.V1Pod(
             metadata=client.V1ObjectMeta(
-                name=bot_name,
+                name=pod_name,
                 namespace=self.namespace,
                 labels=labels
             ),
@@ -66,7 +81,8 @@ class BotPodCreator:
                     client.V1Container(
                         name="bot-proc",
                         image=self.image,
-                        image_pull_policy="Always",
+                        # The image tag is the release version, so a node that already has it doesn't need to pull it again
+                        image_pull_policy="IfNotPresent",
                         command=command,
                         resources=client.V1ResourceRequirements(
                             requests={
@@ -122,7 +138,7 @@ class BotPodCreator:
             
         except client.ApiException as e:
             return {
-                "name": bot_name,
+                "name": pod_name,
                 "status": "Error",
                 "created": False,
                 "error": str(e)
@@ -40,6 +40,7 @@ from .serializers import (
     TranscriptUtteranceSerializer,
 )
 from .tasks import run_bot
+from .warm_bot_pool import WarmBotPool, warm_bot_pool_enabled
 
 TokenHeaderParameter = [
     OpenApiParameter(
@@ -121,6 +122,11 @@ def send_sync_command(bot, command="sync"):
 
 
 def launch_bot(bot):
+    # If there's an idle bot process in the warm pool, hand the bot to it so it can join right away
+    if warm_bot_pool_enabled() and WarmBotPool.from_env().dispatch(bot.id):
+        logging.info(f"Dispatched bot {bot.object_id} to the warm bot pool")
+        return
+
     # If this instance is running in Kubernetes, use the Kubernetes pod creator
     # which spins up a new pod for the bot
     if os.getenv("LAUNCH_BOT_METHOD") == "kubernetes":
@@ -201,7 +207,7 @@ class BotCreateView(APIView):
         Recording.objects.create(
             bot=bot,
             recording_type=RecordingTypes.AUDIO_AND_VIDEO,
-            transcription_type=TranscriptionTypes.NON_REALTIME,
+            transcription_type=TranscriptionTypes.REALTIME if bot.deepgram_use_streaming() else TranscriptionTypes.NON_REALTIME,
             transcription_provider=TranscriptionProviders.DEEPGRAM,
             is_default_recording=True,
         )
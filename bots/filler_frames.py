@@ -0,0 +1,55 @@
+import threading
+from functools import lru_cache
+
+from .i420_scaler import i420_planes
+
+
+@lru_cache(maxsize=None)
+def black_i420_frame(frame_size):
+    """
+    Returns a black I420 frame of the given size. Rendered once per size, the returned bytes are shared.
+    """
+    width, height = frame_size
+    # Ensure dimensions are even for proper chroma subsampling
+    if width % 2 != 0 or height % 2 != 0:
+        raise ValueError("Width and height must be even numbers for I420 format")
+
+    frame = bytearray(width * height * 3 // 2)
+    y, u, v = i420_planes(frame, frame_size)
+    # For "dark" black: Y=0, U=128, V=128
+    u.fill(128)
+    v.fill(128)
+    return bytes(frame)
+
+
+class FillerFrameSender:
+    """
+    Sits in front of a video sink and keeps it fed while no real video is available.
+
+    The black filler frame comes from a per-resolution cache, so sending one never allocates. Once it has been sent, later
+    filler ticks only ask the sink to repeat the previous frame (if it supports that), which is the same black frame.
+    """
+
+    def __init__(self, *, frame_size, add_video_frame_callback, repeat_video_frame_callback=None):
+        self.frame_size = tuple(frame_size)
+        self.add_video_frame_callback = add_video_frame_callback
+        self.repeat_video_frame_callback = repeat_video_frame_callback
+
+        self.last_frame_was_filler = False
+        self.lock = threading.Lock()
+
+    def send_frame(self, frame, current_time_ns):
+        with self.lock:
+            self.last_frame_was_filler = False
+        self.add_video_frame_callback(frame, current_time_ns)
+
+    def send_filler_frame(self, current_time_ns):
+        with self.lock:
+            # The sink is already showing the filler, so it only needs to hold it
+            can_repeat = self.last_frame_was_filler
+            self.last_frame_was_filler = True
+
+        if can_repeat and self.repeat_video_frame_callback:
+            self.repeat_video_frame_callback(current_time_ns)
+        else:
+            self.add_video_frame_callback(black_i420_frame(self.frame_size), current_time_ns)
@@ -143,8 +143,8 @@ class FullCaptureManager {
             this.ssrcsOrder.push(...ssrcsInCurrentFrame.filter(ssrc => !ssrcsOrderSet.has(ssrc)));
 
             const numCols = Math.ceil(Math.sqrt(this.ssrcsOrder.length));
-            const cellWidth = 1920 / numCols;
-            const cellHeight = 1080 / numCols;
+            const cellWidth = window.initialData.recordingFrameWidth / numCols;
+            const cellHeight = window.initialData.recordingFrameHeight / numCols;
 
             const ssrcToVideoElement = new Map(videoElementsFiltered.map(video => [video.ssrc, video]));
                        
@@ -210,8 +210,8 @@ class FullCaptureManager {
             return layoutElements;
         }
 
-        const canvasWidth = 1920;
-        const canvasHeight = 1080;
+        const canvasWidth = window.initialData.recordingFrameWidth;
+        const canvasHeight = window.initialData.recordingFrameHeight;
         let minX = Infinity;
         let minY = Infinity;
         let maxX = 0;
@@ -277,17 +277,32 @@ class FullCaptureManager {
     }
 
     async start() {
+        // Audio only recordings don't need the canvas at all
+        if (window.initialData.recordVideo && !this.startCanvasCapture())
+            return;
+
+        this.startAudioMixing();
+
+        this.finalStream = new MediaStream(this.videoTrack ? [this.videoTrack, this.mixedAudioTrack] : [this.mixedAudioTrack]);
+
+        // Initialize MediaRecorder with the final stream
+        this.startRecording();
+
+        this.startSilenceDetection();
+    }
+
+    startCanvasCapture() {
         // Find the main element that contains all the video elements
         const mainElement = document.querySelector('main');
         if (!mainElement) {
             console.error('No <main> element found in the DOM');
-            return;
+            return false;
         }
 
         // Create a canvas element with dimensions of rendered frame
         const canvas = document.createElement('canvas');
-        canvas.width = 1920;
-        canvas.height = 1080;
+        canvas.width = window.initialData.recordingFrameWidth;
+        canvas.height = window.initialData.recordingFrameHeight;
         document.body.appendChild(canvas);
 
         const debugCanvas = false;
@@ -423,12 +438,15 @@ class FullCaptureManager {
         // Start the drawing loop
         drawFrameLayoutToCanvas();
 
-        // Capture the canvas stream at 30 fps
-        const canvasStream = canvas.captureStream(30);
+        // Capture the canvas stream at the recording's frame rate
+        const canvasStream = canvas.captureStream(window.initialData.recordingFrameRate);
         const [videoTrack] = canvasStream.getVideoTracks();
         this.videoTrack = videoTrack;
         this.canvas = canvas; // Store canvas reference for cleanup
+        return true;
+    }
 
+    startAudioMixing() {
         // Set up audio context and processing as before
         this.audioContext = new AudioContext();
 
@@ -456,16 +474,6 @@ class FullCaptureManager {
         mixedSource.connect(this.analyser);
 
         this.mixedAudioTrack = destination.stream.getAudioTracks()[0];
-
-        this.finalStream = new MediaStream([
-            this.videoTrack,
-            this.mixedAudioTrack
-        ]);
-
-        // Initialize MediaRecorder with the final stream
-        this.startRecording();
-
-        this.startSilenceDetection();
     }
 
     startSilenceDetection() {
@@ -504,7 +512,7 @@ class FullCaptureManager {
 
     startRecording() {
         // Options for better quality
-        const options = { mimeType: 'video/mp4' };
+        const options = { mimeType: window.initialData.recordVideo ? 'video/mp4' : 'audio/mp4' };
         this.mediaRecorder = new MediaRecorder(this.finalStream, options);
 
         this.mediaRecorder.ondataavailable = (event) => {
@@ -822,6 +830,10 @@ class WebSocketClient {
       ENCODED_MP4_CHUNK: 4
   };
 
+  // If more than this is waiting to go out over the websocket, the bot isn't keeping up, so drop video frames
+  // instead of letting them pile up in memory. Audio is small and is never dropped.
+  static MAX_BUFFERED_VIDEO_BYTES = 16 * 1024 * 1024;
+
   constructor() {
       const url = `ws://localhost:${window.initialData.websocketPort}`;
       console.log('WebSocketClient url', url);
@@ -845,6 +857,7 @@ class WebSocketClient {
       };
 
       this.mediaSendingEnabled = false;
+      this.droppedVideoFrames = 0;
       
       /*
       We no longer need this because we're not using MediaStreamTrackProcessor's
@@ -910,6 +923,16 @@ class WebSocketClient {
   }
   */
 
+  canSendVideo() {
+    if (this.ws.bufferedAmount <= WebSocketClient.MAX_BUFFERED_VIDEO_BYTES)
+        return true;
+
+    this.droppedVideoFrames++;
+    if (this.droppedVideoFrames % 100 === 1)
+        console.log('Websocket is backed up, dropped', this.droppedVideoFrames, 'video frames so far');
+    return false;
+  }
+
   enableMediaSending() {
     this.mediaSendingEnabled = true;
     window.fullCaptureManager.start();
@@ -1020,8 +1043,11 @@ class WebSocketClient {
       }
 
       try {
-          // Create final message: type (4 bytes) + timestamp (8 bytes) + audio data
-          const message = new Uint8Array(4 + 8 + 4 + audioData.buffer.byteLength);
+          // Convert streamId to UTF-8 bytes, the bot gives every stream its own source in the audio mixer
+          const streamIdBytes = new TextEncoder().encode(String(streamId));
+
+          // Create final message: type (4 bytes) + timestamp (8 bytes) + streamId length (4 bytes) + streamId bytes + audio data
+          const message = new Uint8Array(4 + 8 + 4 + streamIdBytes.length + audioData.buffer.byteLength);
           const dataView = new DataView(message.buffer);
           
           // Set message type (3 for AUDIO)
@@ -1031,10 +1057,11 @@ class WebSocketClient {
           dataView.setBigInt64(4, BigInt(timestamp), true);
 
           // Set streamId length and bytes
-          dataView.setInt32(12, streamId, true);
+          dataView.setInt32(12, streamIdBytes.length, true);
+          message.set(streamIdBytes, 16);
 
-          // Copy audio data after type and timestamp
-          message.set(new Uint8Array(audioData.buffer), 16);
+          // Copy audio data after the streamId
+          message.set(new Uint8Array(audioData.buffer), 16 + streamIdBytes.length);
           
           // Send the binary message
           this.ws.send(message.buffer);
@@ -1052,6 +1079,10 @@ class WebSocketClient {
       if (!this.mediaSendingEnabled) {
         return;
       }
+
+      if (!this.canSendVideo()) {
+        return;
+      }
       
       this.lastVideoFrameTime = performance.now();
       this.lastVideoFrame = {width, height, frameData: videoData};
@@ -1476,8 +1507,8 @@ const handleVideoTrack = async (event) => {
                 const currentTime = performance.now();
                 
                 if (firstStreamId && firstStreamId === videoTrackManager.getStreamIdToSendCached()) {
-                    // Check if enough time has passed since the last frame
-                    if (currentTime - lastFrameTime >= frameInterval) {
+                    // Check if enough time has passed since the last frame, and don't bother copying it if the websocket is backed up
+                    if (currentTime - lastFrameTime >= frameInterval && ws.canSendVideo()) {
                         // Copy the frame to get access to raw data
                         const rawFrame = new VideoFrame(frame, {
                             format: 'I420'
@@ -1632,7 +1663,7 @@ const handleAudioTrack = async (event) => {
 
                 // Send audio data through websocket
                 const currentTimeMicros = BigInt(Math.floor(performance.now() * 1000));
-                ws.sendAudio(currentTimeMicros, firstStreamId, audioData);
+                ws.sendAudio(currentTimeMicros, firstStreamId ?? event.track.id, audioData);
 
                 // Pass through the original frame
                 controller.enqueue(frame);
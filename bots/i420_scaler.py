@@ -0,0 +1,185 @@
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+
+def half_ceil(x):
+    return (x + 1) // 2
+
+
+def i420_frame_length(frame_size):
+    width, height = frame_size
+    return width * height + 2 * half_ceil(width) * half_ceil(height)
+
+
+@dataclass(frozen=True)
+class I420ResizePlan:
+    """
+    Everything about scaling from one frame size to another that doesn't depend on the pixels.
+    Computed once per (source size, destination size) pair.
+    """
+
+    src_size: tuple
+    dst_size: tuple
+    # Size of the scaled image inside the destination frame. Equal to dst_size when no letterboxing is needed.
+    scaled_size: tuple
+    scaled_chroma_size: tuple
+    # (x, y) offsets of the scaled image inside the destination luma and chroma planes
+    luma_offset: tuple
+    chroma_offset: tuple
+
+    @property
+    def passthrough(self):
+        return self.src_size == self.dst_size
+
+    @property
+    def letterboxed(self):
+        return self.scaled_size != self.dst_size
+
+
+@lru_cache(maxsize=256)
+def get_i420_resize_plan(src_size, dst_size):
+    orig_width, orig_height = src_size
+    new_width, new_height = dst_size
+
+    input_aspect = orig_width / orig_height
+    output_aspect = new_width / new_height
+
+    if abs(input_aspect - output_aspect) < 1e-6:
+        # Same aspect ratio; do a straightforward resize
+        scaled_width, scaled_height = new_width, new_height
+    elif input_aspect > output_aspect:
+        # The image is relatively wider => match width, shrink height
+        scaled_width = new_width
+        scaled_height = int(round(new_width / input_aspect))
+    else:
+        # The image is relatively taller => match height, shrink width
+        scaled_height = new_height
+        scaled_width = int(round(new_height * input_aspect))
+
+    offset_x = (new_width - scaled_width) // 2
+    offset_y = (new_height - scaled_height) // 2
+
+    return I420ResizePlan(
+        src_size=(orig_width, orig_height),
+        dst_size=(new_width, new_height),
+        scaled_size=(scaled_width, scaled_height),
+        scaled_chroma_size=(half_ceil(scaled_width), half_ceil(scaled_height)),
+        luma_offset=(offset_x, offset_y),
+        # Offsets for U and V planes are half of the Y offsets (integer floor)
+        chroma_offset=(offset_x // 2, offset_y // 2),
+    )
+
+
+def i420_planes(buffer, frame_size):
+    """
+    Returns (y, u, v) 2D numpy views into an I420 buffer without copying.
+    Handles odd frame widths/heights by using 'ceil' in the chroma planes.
+    """
+    width, height = frame_size
+    chroma_width, chroma_height = half_ceil(width), half_ceil(height)
+    y_plane_size = width * height
+    uv_plane_size = chroma_width * chroma_height
+
+    flat = np.frombuffer(buffer, dtype=np.uint8, count=y_plane_size + 2 * uv_plane_size)
+    y = flat[:y_plane_size].reshape(height, width)
+    u = flat[y_plane_size : y_plane_size + uv_plane_size].reshape(chroma_height, chroma_width)
+    v = flat[y_plane_size + uv_plane_size :].reshape(chroma_height, chroma_width)
+    return y, u, v
+
+
+class I420Scaler:
+    """
+    Scales I420 frames to a fixed output size, letterboxing/pillarboxing when the aspect ratios differ.
+
+    The output frame is written into a buffer that is preallocated once per source size and reused for every
+    frame, and the black bars are only painted when that buffer is created, since the scaled image always lands in
+    the same place. Each scaled frame is copied out of that buffer once, because callers hold on to frames.
+    Not thread safe, each producer of frames should have its own scaler.
+    """
+
+    def __init__(self, dst_size):
+        self.dst_size = tuple(dst_size)
+        self.output_frame_length = i420_frame_length(self.dst_size)
+        self.current_plan = None
+        self.output_buffer = None
+        self.letterbox_buffers = None
+
+    def prepare(self, src_size):
+        plan = get_i420_resize_plan(tuple(src_size), self.dst_size)
+        if plan == self.current_plan:
+            return plan
+
+        self.current_plan = plan
+        self.output_buffer = np.empty(self.output_frame_length, dtype=np.uint8)
+        y, u, v = i420_planes(self.output_buffer, self.dst_size)
+        # For "dark" black: Y=0, U=128, V=128
+        y.fill(0)
+        u.fill(128)
+        v.fill(128)
+
+        # cv2.resize can only write in place into contiguous arrays, so the letterboxed case scales into
+        # scratch planes and then copies them into the middle of the output planes
+        self.letterbox_buffers = None
+        if plan.letterboxed:
+            scaled_width, scaled_height = plan.scaled_size
+            chroma_width, chroma_height = plan.scaled_chroma_size
+            self.letterbox_buffers = (
+                np.empty((scaled_height, scaled_width), dtype=np.uint8),
+                np.empty((chroma_height, chroma_width), dtype=np.uint8),
+                np.empty((chroma_height, chroma_width), dtype=np.uint8),
+            )
+        return plan
+
+    def scale(self, frame, src_size):
+        """
+        Scales the I420 frame and returns the result as bytes. If the source size already matches the output size the
+        frame is returned as is.
+
+        :param frame:    A bytes-like object containing the raw I420 frame data.
+        :param src_size: (width, height) of the frame
+        :return:         A bytes-like object with the scaled I420 frame.
+        """
+        plan = self.prepare(src_size)
+        if plan.passthrough:
+            return frame if isinstance(frame, bytes) else bytes(frame)
+
+        self._resize_planes(plan, i420_planes(frame, plan.src_size), i420_planes(self.output_buffer, self.dst_size))
+        # Callers may hold on to the frame after the next one is scaled, so hand out a copy of the reused buffer
+        return self.output_buffer.tobytes()
+
+    def _resize_planes(self, plan, src_planes, dst_planes):
+        scaled_width, scaled_height = plan.scaled_size
+        chroma_width, chroma_height = plan.scaled_chroma_size
+        offset_x, offset_y = plan.luma_offset
+        chroma_offset_x, chroma_offset_y = plan.chroma_offset
+
+        for index, (src_plane, dst_plane) in enumerate(zip(src_planes, dst_planes)):
+            if index == 0:
+                width, height, x, y = scaled_width, scaled_height, offset_x, offset_y
+            else:
+                width, height, x, y = chroma_width, chroma_height, chroma_offset_x, chroma_offset_y
+
+            if not plan.letterboxed:
+                cv2.resize(src_plane, (width, height), dst=dst_plane, interpolation=cv2.INTER_LINEAR)
+                continue
+
+            scaled_plane = cv2.resize(src_plane, (width, height), dst=self.letterbox_buffers[index], interpolation=cv2.INTER_LINEAR)
+            dst_plane[y : y + height, x : x + width] = scaled_plane
+
+
+_thread_local_scalers = threading.local()
+
+
+def get_thread_local_i420_scaler(dst_size):
+    scalers = getattr(_thread_local_scalers, "scalers", None)
+    if scalers is None:
+        scalers = _thread_local_scalers.scalers = {}
+    dst_size = tuple(dst_size)
+    scaler = scalers.get(dst_size)
+    if scaler is None:
+        scaler = scalers[dst_size] = I420Scaler(dst_size)
+    return scaler
@@ -0,0 +1,59 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from bots.i420_scaler import I420Scaler, i420_frame_length
+
+# Frame sizes we commonly receive from each platform, scaled to the 1920x1080 frame the gstreamer pipeline expects
+SOURCE_FRAME_SIZES = {
+    "zoom 180p": (320, 180),
+    "zoom 360p": (640, 360),
+    "zoom 720p": (1280, 720),
+    "zoom 1080p": (1920, 1080),
+    "meet 640x360": (640, 360),
+    "meet 1280x720": (1280, 720),
+    "meet portrait 360x640": (360, 640),
+    "teams 1920x1080": (1920, 1080),
+    "teams 1280x720": (1280, 720),
+    "screenshare 1920x1200": (1920, 1200),
+    "screenshare 2560x1440": (2560, 1440),
+}
+
+
+class Command(BaseCommand):
+    help = "Benchmarks I420 frame scaling for common Zoom, Google Meet and Teams frame sizes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--frames", type=int, default=300, help="Number of frames to scale per source size")
+        parser.add_argument("--width", type=int, default=1920, help="Output frame width")
+        parser.add_argument("--height", type=int, default=1080, help="Output frame height")
+
+    def time_frames(self, scale_frame, frames):
+        start = time.perf_counter()
+        for frame in frames:
+            scale_frame(frame)
+        return (time.perf_counter() - start) / len(frames) * 1000
+
+    def handle(self, *args, **options):
+        output_size = (options["width"], options["height"])
+        num_frames = options["frames"]
+        rng = np.random.default_rng(0)
+
+        self.stdout.write(f"Scaling {num_frames} frames to {output_size[0]}x{output_size[1]}")
+        self.stdout.write(f"{'source':<24}{'size':>12}{'cold ms/frame':>16}{'warm ms/frame':>16}{'warm fps':>12}")
+
+        for name, source_size in SOURCE_FRAME_SIZES.items():
+            # A handful of distinct frames so we're not just measuring a cache-hot single buffer
+            frames = [rng.integers(0, 256, i420_frame_length(source_size), dtype=np.uint8).tobytes() for _ in range(4)]
+            frames = [frames[i % len(frames)] for i in range(num_frames)]
+
+            # Cold: a new scaler for every frame, so the output buffer and black bars are rebuilt each time
+            cold_ms = self.time_frames(lambda frame: I420Scaler(output_size).scale(frame, source_size), frames)
+
+            # Warm: one scaler reused across frames, which is how the adapters use it
+            scaler = I420Scaler(output_size)
+            warm_ms = self.time_frames(lambda frame: scaler.scale(frame, source_size), frames)
+
+            size = f"{source_size[0]}x{source_size[1]}"
+            self.stdout.write(f"{name:<24}{size:>12}{cold_ms:>16.3f}{warm_ms:>16.3f}{1000 / warm_ms:>12.0f}")
@@ -0,0 +1,103 @@
+import queue
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import webrtcvad
+from django.core.management.base import BaseCommand
+
+from bots.bot_controller.individual_audio_input_manager import IndividualAudioInputManager
+
+SAMPLE_RATE = 32000
+# Zoom sends each speaker's audio in 10ms chunks
+CHUNK_DURATION_MS = 10
+CHUNK_SAMPLES = SAMPLE_RATE * CHUNK_DURATION_MS // 1000
+# The bot controller processes queued chunks every 100ms
+PROCESS_INTERVAL_CHUNKS = 10
+
+
+def speaker_audio(rng, num_chunks):
+    """Alternating two seconds of speech-like noise and one second of near silence"""
+    samples = rng.normal(0, 3000, num_chunks * CHUNK_SAMPLES)
+    sample_times = np.arange(len(samples)) / SAMPLE_RATE
+    samples[sample_times % 3 >= 2] *= 0.01
+    return samples.astype(np.int16).tobytes()
+
+
+class PerChunkVad:
+    """How IndividualAudioInputManager used to process chunks, one at a time as they came off the queue, kept here to compare against"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.vad = webrtcvad.Vad()
+        self.last_nonsilent_audio_time = {}
+
+    def add_chunk(self, speaker_id, chunk_time, chunk_bytes):
+        self.queue.put((speaker_id, chunk_time, chunk_bytes))
+
+    def process_chunks(self):
+        while not self.queue.empty():
+            speaker_id, chunk_time, chunk_bytes = self.queue.get()
+            self.process_chunk(speaker_id, chunk_time, chunk_bytes)
+        for speaker_id in list(self.last_nonsilent_audio_time.keys()):
+            self.process_chunk(speaker_id, datetime.utcnow(), None)
+
+    def process_chunk(self, speaker_id, chunk_time, chunk_bytes):
+        if chunk_bytes:
+            samples = np.frombuffer(chunk_bytes, dtype=np.int16)
+            # Squaring the int16 samples overflows, which the old code didn't account for
+            with np.errstate(over="ignore"):
+                rms = np.sqrt(np.mean(np.square(samples))) / 32768
+            audio_is_silent = rms < IndividualAudioInputManager.SILENCE_RMS_THRESHOLD or not self.vad.is_speech(chunk_bytes, SAMPLE_RATE)
+        else:
+            audio_is_silent = True
+        if not audio_is_silent:
+            self.last_nonsilent_audio_time[speaker_id] = chunk_time
+        elif speaker_id in self.last_nonsilent_audio_time and (chunk_time - self.last_nonsilent_audio_time[speaker_id]).total_seconds() >= 3:
+            del self.last_nonsilent_audio_time[speaker_id]
+
+
+class Command(BaseCommand):
+    help = "Benchmarks voice activity detection in IndividualAudioInputManager for many concurrent Zoom speakers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=int, default=10, help="Seconds of audio to simulate for each speaker")
+        parser.add_argument("--speakers", type=int, nargs="+", default=[10, 50, 100], help="Numbers of concurrent speakers to simulate")
+
+    def run(self, manager, audio_by_speaker, num_chunks, chunk_time):
+        start = time.process_time()
+        for chunk_index in range(num_chunks):
+            chunk_start = chunk_index * CHUNK_SAMPLES * 2
+            for speaker_id, audio in enumerate(audio_by_speaker):
+                manager.add_chunk(speaker_id, chunk_time(chunk_index), audio[chunk_start : chunk_start + CHUNK_SAMPLES * 2])
+            if chunk_index % PROCESS_INTERVAL_CHUNKS == PROCESS_INTERVAL_CHUNKS - 1:
+                manager.process_chunks()
+        return time.process_time() - start
+
+    def run_per_chunk(self, audio_by_speaker, num_chunks):
+        start_time = datetime.utcnow()
+        return self.run(PerChunkVad(), audio_by_speaker, num_chunks, lambda chunk_index: start_time + timedelta(milliseconds=chunk_index * CHUNK_DURATION_MS))
+
+    def run_batched(self, audio_by_speaker, num_chunks):
+        manager = IndividualAudioInputManager(
+            save_utterance_callback=lambda utterance: None,
+            get_participant_callback=lambda speaker_id: {"participant_uuid": speaker_id},
+        )
+        start_time_ns = time.monotonic_ns()
+        return self.run(manager, audio_by_speaker, num_chunks, lambda chunk_index: start_time_ns + chunk_index * CHUNK_DURATION_MS * 1_000_000)
+
+    def handle(self, *args, **options):
+        seconds = options["seconds"]
+        num_chunks = seconds * 1000 // CHUNK_DURATION_MS
+        rng = np.random.default_rng(0)
+
+        self.stdout.write(f"Simulating {seconds}s of {CHUNK_DURATION_MS}ms chunks at {SAMPLE_RATE}Hz for each speaker")
+        self.stdout.write(f"{'speakers':>10}{'per chunk cpu ms/s':>22}{'batched cpu ms/s':>20}{'speedup':>10}")
+
+        for num_speakers in options["speakers"]:
+            audio_by_speaker = [speaker_audio(rng, num_chunks) for _ in range(num_speakers)]
+
+            per_chunk_ms = self.run_per_chunk(audio_by_speaker, num_chunks) / seconds * 1000
+            batched_ms = self.run_batched(audio_by_speaker, num_chunks) / seconds * 1000
+
+            self.stdout.write(f"{num_speakers:>10}{per_chunk_ms:>22.2f}{batched_ms:>20.2f}{per_chunk_ms / batched_ms:>9.1f}x")
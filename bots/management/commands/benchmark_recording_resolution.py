@@ -0,0 +1,78 @@
+import resource
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from bots.i420_scaler import I420Scaler, i420_frame_length
+from bots.models import RECORDING_RESOLUTION_FRAME_SIZES
+
+# 10ms of 32kHz mono S16LE silence, the audio format the Zoom adapter produces
+AUDIO_CHUNK = bytes(640)
+AUDIO_CHUNK_DURATION_NS = 10_000_000
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Command(BaseCommand):
+    help = "Benchmarks how much CPU a bot spends scaling and encoding video at each recording resolution and frame rate"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=int, default=20, help="Seconds of meeting video to record at each resolution")
+        parser.add_argument("--source-width", type=int, default=640, help="Width of the frames the platform sends")
+        parser.add_argument("--source-height", type=int, default=360, help="Height of the frames the platform sends")
+        parser.add_argument("--frame-rates", default="30,15", help="Comma separated frame rates to try")
+
+    def record(self, output_size, frame_rate, source_size, seconds):
+        """Scales and pushes seconds of video through the same gstreamer pipeline a bot uses, writing to /dev/null. Returns CPU seconds used."""
+        from bots.bot_controller.gstreamer_pipeline import GstreamerPipeline
+
+        rng = np.random.default_rng(0)
+        # A few distinct frames so the encoder has something to do, like a talking head that moves a bit
+        source_frames = [rng.integers(0, 256, i420_frame_length(source_size), dtype=np.uint8).tobytes() for _ in range(8)]
+
+        pipeline = GstreamerPipeline(
+            on_new_sample_callback=lambda data: None,
+            video_frame_size=output_size,
+            video_frame_rate=frame_rate,
+            audio_format=GstreamerPipeline.AUDIO_FORMAT_PCM,
+            output_format=GstreamerPipeline.OUTPUT_FORMAT_WEBM,
+            sink_type=GstreamerPipeline.SINK_TYPE_FILE,
+            file_location="/dev/null",
+        )
+        pipeline.setup()
+        scaler = I420Scaler(output_size)
+
+        start_cpu_seconds = cpu_seconds()
+        frame_duration_ns = 1_000_000_000 // frame_rate
+        audio_time_ns = 0
+        for frame_index in range(seconds * frame_rate):
+            frame_time_ns = frame_index * frame_duration_ns
+            while audio_time_ns <= frame_time_ns:
+                pipeline.on_mixed_audio_raw_data_received_callback(AUDIO_CHUNK, audio_time_ns)
+                audio_time_ns += AUDIO_CHUNK_DURATION_NS
+            scaled_frame = scaler.scale(source_frames[frame_index % len(source_frames)], source_size)
+            pipeline.on_new_video_frame(scaled_frame, frame_time_ns)
+        pipeline.cleanup()
+        return cpu_seconds() - start_cpu_seconds
+
+    def handle(self, *args, **options):
+        source_size = (options["source_width"], options["source_height"])
+        frame_rates = [int(frame_rate) for frame_rate in options["frame_rates"].split(",")]
+        output_sizes = {str(resolution): frame_size for resolution, frame_size in RECORDING_RESOLUTION_FRAME_SIZES.items()}
+        output_sizes["source"] = source_size
+
+        self.stdout.write(f"Recording {options['seconds']}s of {source_size[0]}x{source_size[1]} video at each resolution")
+        self.stdout.write(f"{'resolution':<12}{'size':>12}{'fps':>6}{'cpu s':>10}{'cpu % of a core':>18}")
+        for resolution, output_size in output_sizes.items():
+            for frame_rate in frame_rates:
+                start = time.perf_counter()
+                used_cpu_seconds = self.record(output_size, frame_rate, source_size, options["seconds"])
+                elapsed = time.perf_counter() - start
+                # Normalized to the length of the recording, this is the share of a core a bot needs to keep up in real time
+                cpu_percent = used_cpu_seconds / options["seconds"] * 100
+                size = f"{output_size[0]}x{output_size[1]}"
+                self.stdout.write(f"{resolution:<12}{size:>12}{frame_rate:>6}{used_cpu_seconds:>10.2f}{cpu_percent:>18.1f}  ({elapsed:.1f}s wall)")
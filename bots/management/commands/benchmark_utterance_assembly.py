@@ -0,0 +1,76 @@
+import ctypes
+import gc
+import os
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from bots.bot_controller.utterance_audio_buffer import UtteranceAudioBuffer
+
+SAMPLE_RATE = 32000
+# IndividualAudioInputManager adds audio to utterances in 30ms VAD frames
+FRAME_BYTES = SAMPLE_RATE * 30 // 1000 * 2
+UTTERANCE_SIZE_LIMIT = 19200000
+
+
+def resident_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class BytearrayUtterance:
+    """How IndividualAudioInputManager used to assemble utterances, kept here to compare against"""
+
+    def __init__(self):
+        self.audio = bytearray()
+
+    def append(self, frame):
+        self.audio.extend(frame)
+
+    def release(self):
+        audio = bytes(self.audio)
+        self.audio = bytearray()
+        return audio
+
+
+class Command(BaseCommand):
+    help = "Benchmarks assembling per-speaker utterance audio and handing it off when the utterance is flushed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--durations", type=int, nargs="+", default=[5, 60, 300], help="Utterance lengths to assemble, in seconds")
+        parser.add_argument("--utterances", type=int, default=3, help="Number of utterances to assemble for each length")
+
+    def assemble(self, utterance, frame, num_frames):
+        """Returns how long assembling and releasing the utterance took, and how much resident memory grew while the handed off audio was still alive"""
+        gc.collect()
+        # Give memory freed by earlier runs back to the operating system, so it isn't reused without showing up as growth
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+        resident_bytes_before = resident_bytes()
+        start = time.perf_counter()
+        for _ in range(num_frames):
+            utterance.append(frame)
+        audio = utterance.release()
+        elapsed = time.perf_counter() - start
+        resident_bytes_growth = resident_bytes() - resident_bytes_before
+        del audio
+        return elapsed, resident_bytes_growth
+
+    def handle(self, *args, **options):
+        frame = np.random.default_rng(0).integers(-3000, 3000, FRAME_BYTES // 2, dtype=np.int16).tobytes()
+
+        self.stdout.write(f"Assembling utterances from {len(frame)} byte frames, {options['utterances']} of each length")
+        self.stdout.write(f"{'seconds':>8}{'method':>14}{'ms/utterance':>14}{'rss growth MB':>15}{'MB copied at flush':>20}")
+
+        for duration in options["durations"]:
+            num_frames = duration * SAMPLE_RATE * 2 // len(frame)
+            utterance_bytes = num_frames * len(frame)
+            methods = {
+                "bytearray": (BytearrayUtterance, utterance_bytes),
+                "preallocated": (lambda: UtteranceAudioBuffer(UTTERANCE_SIZE_LIMIT + FRAME_BYTES), 0),
+            }
+            for method, (make_utterance, bytes_copied_at_flush) in methods.items():
+                results = [self.assemble(make_utterance(), frame, num_frames) for _ in range(options["utterances"])]
+                elapsed_ms = sum(elapsed for elapsed, _ in results) / len(results) * 1000
+                resident_mb = max(growth for _, growth in results) / 1_000_000
+                self.stdout.write(f"{duration:>8}{method:>14}{elapsed_ms:>14.2f}{resident_mb:>15.1f}{bytes_copied_at_flush / 1_000_000:>20.1f}")
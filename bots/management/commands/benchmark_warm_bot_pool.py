@@ -0,0 +1,76 @@
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from bots.warm_bot_pool import WarmBotPool
+
+
+class BenchmarkWarmBotPool(WarmBotPool):
+    # Separate keys so the benchmark can't hand out or claim real bots
+    PENDING_BOT_IDS_KEY = "warm_bot_pool_benchmark:pending_bot_ids"
+    IDLE_WORKERS_KEY = "warm_bot_pool_benchmark:idle_workers"
+    STARTING_WORKERS_KEY = "warm_bot_pool_benchmark:starting_workers"
+    CLAIMED_BOT_WORKER_KEY_PREFIX = "warm_bot_pool_benchmark:worker_for_bot:"
+    PROCESSING_BOT_IDS_KEY_PREFIX = "warm_bot_pool_benchmark:processing_bot_ids:"
+    CLAIMED_AT_KEY = "warm_bot_pool_benchmark:claimed_at"
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the startup work a launched bot waits on before it can start joining its meeting, with and without the warm bot pool. Joining itself takes the same time either way and isn't included."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=5, help="Number of bots to start each way")
+        parser.add_argument("--no-browser", action="store_true", help="Don't include starting Chrome, e.g. for Zoom bots")
+
+    def time_cold_start(self, no_browser):
+        # Everything a freshly launched bot process does before it can start joining: interpreter and Django startup,
+        # imports, GStreamer init and starting Chrome. The warm pool does all of this before the bot is assigned.
+        command = [sys.executable, "manage.py", "run_warm_bot_worker", "--prewarm-only"]
+        if no_browser:
+            command.append("--no-browser")
+
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return time.perf_counter() - start
+
+    def time_warm_start(self, warm_bot_pool, bot_id):
+        # With the pool, the only work before joining is handing the bot id to an idle worker
+        worker_name = f"benchmark-worker-{bot_id}"
+        warm_bot_pool.set_worker_idle(worker_name)
+        claimed_at = {}
+
+        def worker():
+            warm_bot_pool.claim_bot_id(worker_name, timeout_seconds=10)
+            claimed_at["time"] = time.perf_counter()
+
+        worker_thread = threading.Thread(target=worker)
+        worker_thread.start()
+
+        start = time.perf_counter()
+        if not warm_bot_pool.dispatch(bot_id):
+            raise Exception("Benchmark worker was not registered as idle")
+        worker_thread.join()
+
+        warm_bot_pool.remove_worker(worker_name)
+        warm_bot_pool.release_claimed_bots(worker_name)
+        warm_bot_pool.redis_client.delete(warm_bot_pool.PENDING_BOT_IDS_KEY)
+        return claimed_at["time"] - start
+
+    def report(self, name, seconds):
+        self.stdout.write(f"{name:<28}{statistics.mean(seconds):>10.3f}{min(seconds):>10.3f}{max(seconds):>10.3f}")
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        warm_bot_pool = BenchmarkWarmBotPool(WarmBotPool.from_env().redis_client)
+
+        cold_seconds = [self.time_cold_start(options["no_browser"]) for _ in range(iterations)]
+        warm_seconds = [self.time_warm_start(warm_bot_pool, bot_id) for bot_id in range(iterations)]
+
+        self.stdout.write(f"Seconds of startup work before a bot can start joining, over {iterations} bots")
+        self.stdout.write(f"{'':<28}{'mean':>10}{'min':>10}{'max':>10}")
+        self.report("cold: process startup", cold_seconds)
+        self.report("warm: dispatch to claim", warm_seconds)
@@ -0,0 +1,115 @@
+import struct
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from websockets.sync.client import connect
+from websockets.sync.server import serve
+
+from bots.bot_controller.automatic_leave_configuration import AutomaticLeaveConfiguration
+from bots.i420_scaler import i420_frame_length
+from bots.models import RecordingViews
+from bots.web_bot_adapter.web_bot_adapter import WebBotAdapter, read_captured_websocket_messages
+
+MESSAGE_TYPE_NAMES = {1: "json", 2: "video", 3: "audio", 4: "encoded_mp4_chunk"}
+
+
+def synthetic_video_message(timestamp_us, stream_id, frame_size, frame_data):
+    stream_id_bytes = stream_id.encode("utf-8")
+    return struct.pack("<iqi", 2, timestamp_us, len(stream_id_bytes)) + stream_id_bytes + struct.pack("<ii", *frame_size) + frame_data
+
+
+def synthetic_audio_message(timestamp_us, stream_id, audio_data):
+    stream_id_bytes = stream_id.encode("utf-8")
+    return struct.pack("<iqi", 3, timestamp_us, len(stream_id_bytes)) + stream_id_bytes + audio_data
+
+
+class Command(BaseCommand):
+    help = "Benchmarks how fast the web bot adapter can ingest websocket traffic from the chromedriver payload, replaying a capture made with WEBSOCKET_TRAFFIC_CAPTURE_PATH or synthetic traffic"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--capture", help="File written by a bot running with WEBSOCKET_TRAFFIC_CAPTURE_PATH set")
+        parser.add_argument("--seconds", type=int, default=10, help="Seconds of synthetic meeting traffic to generate if there's no capture")
+        parser.add_argument("--width", type=int, default=1280, help="Width of synthetic video frames")
+        parser.add_argument("--height", type=int, default=720, help="Height of synthetic video frames")
+        parser.add_argument("--over-websocket", action="store_true", help="Send the messages over a local websocket connection instead of handing them to the adapter directly")
+
+    def synthetic_messages(self, seconds, frame_size):
+        rng = np.random.default_rng(0)
+        frame_data = rng.integers(0, 256, i420_frame_length(frame_size), dtype=np.uint8).tobytes()
+        # Chrome delivers 48kHz float32 audio in chunks of 480 samples
+        audio_data = (rng.standard_normal(480) * 0.1).astype(np.float32).tobytes()
+
+        messages = []
+        for i in range(seconds * 100):
+            timestamp_us = i * 10000
+            messages.append(synthetic_audio_message(timestamp_us, "1", audio_data))
+            # 30 fps video
+            if i % 10 in (0, 3, 6):
+                messages.append(synthetic_video_message(timestamp_us, "1", frame_size, frame_data))
+        return messages
+
+    def create_adapter(self):
+        return WebBotAdapter(
+            display_name="Benchmark bot",
+            send_message_callback=lambda message: None,
+            meeting_url="https://meet.google.com/abc-defg-hij",
+            add_video_frame_callback=lambda frame, timestamp_ns: None,
+            wants_any_video_frames_callback=lambda: True,
+            add_mixed_audio_chunk_callback=lambda chunk, timestamp_ns, audio_source_id: None,
+            add_encoded_mp4_chunk_callback=lambda chunk: None,
+            upsert_caption_callback=lambda caption: None,
+            automatic_leave_configuration=AutomaticLeaveConfiguration(),
+            recording_view=RecordingViews.SPEAKER_VIEW,
+            should_create_debug_recording=False,
+        )
+
+    def ingest_over_websocket(self, adapter, messages):
+        handler_finished = threading.Event()
+
+        def handler(websocket):
+            adapter.handle_websocket(websocket)
+            handler_finished.set()
+
+        with serve(handler, "localhost", 0, compression=None, max_size=None) as server:
+            server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+            server_thread.start()
+            port = server.socket.getsockname()[1]
+
+            start = time.perf_counter()
+            with connect(f"ws://localhost:{port}", compression=None, max_size=None) as websocket:
+                for message in messages:
+                    websocket.send(message)
+            handler_finished.wait()
+            elapsed = time.perf_counter() - start
+
+            server.shutdown()
+        return elapsed
+
+    def handle(self, *args, **options):
+        if options["capture"]:
+            with open(options["capture"], "rb") as capture_file:
+                messages = list(read_captured_websocket_messages(capture_file))
+            source = options["capture"]
+        else:
+            frame_size = (options["width"], options["height"])
+            messages = self.synthetic_messages(options["seconds"], frame_size)
+            source = f"{options['seconds']}s of synthetic traffic with {frame_size[0]}x{frame_size[1]} video"
+
+        adapter = self.create_adapter()
+        if options["over_websocket"]:
+            elapsed = self.ingest_over_websocket(adapter, messages)
+        else:
+            # handle_websocket only iterates over the connection, so a list of messages stands in for it
+            start = time.perf_counter()
+            adapter.handle_websocket(messages)
+            elapsed = time.perf_counter() - start
+
+        total_bytes = sum(len(message) for message in messages)
+        message_type_counts = Counter(MESSAGE_TYPE_NAMES.get(int.from_bytes(message[:4], byteorder="little"), "unknown") for message in messages)
+
+        self.stdout.write(f"Replayed {len(messages)} messages ({total_bytes / 1e6:.1f} MB) from {source}")
+        self.stdout.write("Messages by type: " + ", ".join(f"{name} {count}" for name, count in sorted(message_type_counts.items())))
+        self.stdout.write(f"{elapsed:.3f}s, {len(messages) / elapsed:.0f} messages/s, {total_bytes / 1e6 / elapsed:.1f} MB/s")
@@ -0,0 +1,40 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from bots.models import Utterance
+from bots.utterance_audio_storage import get_utterance_audio_store
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Deletes stored utterance audio that is older than the utterance audio retention period"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--retention-days", type=int, default=settings.UTTERANCE_AUDIO_RETENTION_DAYS, help="Delete audio for transcribed utterances older than this many days")
+
+    def handle(self, *args, **options):
+        utterance_audio_store = get_utterance_audio_store()
+        if not utterance_audio_store:
+            logger.info("Utterance audio is stored in the database, nothing to delete")
+            return
+
+        cutoff = timezone.now() - timedelta(days=options["retention_days"])
+        expired_utterances = Utterance.objects.filter(audio_storage_key__isnull=False, transcription__isnull=False, created_at__lt=cutoff)
+        logger.info(f"Found {expired_utterances.count()} utterances with expired audio")
+
+        deleted_count = 0
+        for utterance in expired_utterances.iterator():
+            try:
+                utterance_audio_store.delete(utterance.audio_storage_key)
+                utterance.audio_storage_key = None
+                utterance.save(update_fields=["audio_storage_key", "updated_at"])
+                deleted_count += 1
+            except Exception as e:
+                logger.error(f"Failed to delete audio for utterance {utterance.id}: {str(e)}")
+
+        logger.info(f"Deleted audio for {deleted_count} utterances")
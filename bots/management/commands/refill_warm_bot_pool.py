@@ -0,0 +1,66 @@
+import logging
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from bots.models import Bot, BotEventManager
+from bots.warm_bot_pool import WarmBotPool, warm_bot_pool_size
+
+logger = logging.getLogger(__name__)
+
+
+def bot_has_started(bot_id):
+    """A bot no longer needs a warm worker once it has a heartbeat, or if it has already ended or been deleted"""
+    bot = Bot.objects.filter(id=bot_id).first()
+    return bot is None or bot.first_heartbeat_timestamp is not None or BotEventManager.is_terminal_state(bot.state)
+
+
+class Command(BaseCommand):
+    help = "Puts back bots lost with their warm bot worker, and starts warm bot workers until the pool has WARM_BOT_POOL_SIZE idle or starting workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=int, default=None, help="Keep running and refill the pool every this many seconds")
+
+    def refill(self, warm_bot_pool):
+        for bot_id in warm_bot_pool.recover_lost_bots(bot_has_started):
+            logger.info(f"Bot {bot_id} was claimed by a warm bot worker but never started, put it back in the queue")
+
+        num_idle_workers = warm_bot_pool.num_idle_workers()
+        num_starting_workers = warm_bot_pool.num_starting_workers()
+        num_pending_bots = warm_bot_pool.num_pending_bots()
+        # Bots waiting in the queue will take idle workers, including bots put back after their worker was lost
+        num_workers_needed = warm_bot_pool_size() + num_pending_bots - num_idle_workers - num_starting_workers
+        logger.info(f"Warm bot pool has {num_idle_workers} idle and {num_starting_workers} starting workers, {num_pending_bots} bots waiting. Starting {max(num_workers_needed, 0)} workers.")
+
+        if num_workers_needed <= 0:
+            return
+
+        if os.getenv("LAUNCH_BOT_METHOD") != "kubernetes":
+            # Outside of kubernetes, warm workers are run by whatever manages the other processes (e.g. as compose replicas)
+            logger.info("Not running in kubernetes, run more warm bot workers with 'python manage.py run_warm_bot_worker'")
+            return
+
+        from bots.bot_pod_creator import BotPodCreator
+
+        bot_pod_creator = BotPodCreator()
+        for _ in range(num_workers_needed):
+            result = bot_pod_creator.create_warm_bot_pod()
+            if result["created"]:
+                warm_bot_pool.mark_worker_starting(result["name"])
+                logger.info(f"Created warm bot pod {result['name']}")
+            else:
+                logger.info(f"Failed to create warm bot pod {result['name']}: {result.get('error')}")
+
+    def handle(self, *args, **options):
+        warm_bot_pool = WarmBotPool.from_env()
+
+        while True:
+            try:
+                self.refill(warm_bot_pool)
+            except Exception as e:
+                logger.info(f"Error refilling warm bot pool: {e}")
+
+            if options["interval"] is None:
+                return
+            time.sleep(options["interval"])
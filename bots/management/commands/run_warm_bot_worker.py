@@ -0,0 +1,106 @@
+import logging
+import os
+import signal
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from bots.models import Bot, MeetingTypes
+from bots.utils import meeting_type_from_url
+from bots.warm_bot_pool import WarmBotPool
+
+logger = logging.getLogger(__name__)
+
+
+def prewarm(*, with_browser):
+    """Does the per-process setup every bot needs, before the worker knows which bot it will run. Returns how long each step took."""
+    timings = {}
+
+    start = time.perf_counter()
+    import gi
+
+    gi.require_version("Gst", "1.0")
+    from gi.repository import Gst
+
+    from bots.bot_controller import BotController  # noqa: F401
+    from bots.google_meet_bot_adapter import GoogleMeetBotAdapter  # noqa: F401
+    from bots.teams_bot_adapter import TeamsBotAdapter  # noqa: F401
+    from bots.zoom_bot_adapter import ZoomBotAdapter  # noqa: F401
+
+    timings["imports"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    Gst.init(None)
+    timings["gstreamer_init"] = time.perf_counter() - start
+
+    if with_browser:
+        from bots.web_bot_adapter.chromedriver_payload import payload_libraries_code
+        from bots.web_bot_adapter.warm_browser import prewarm_browser
+
+        start = time.perf_counter()
+        payload_libraries_code()
+        timings["payload_libraries"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        prewarm_browser()
+        timings["browser"] = time.perf_counter() - start
+
+    return timings
+
+
+class Command(BaseCommand):
+    help = "Starts a bot process ahead of time, waits for a bot to be assigned to it and then runs it"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--no-browser", action="store_true", help="Don't start Chrome ahead of time")
+        parser.add_argument("--prewarm-only", action="store_true", help="Do the warm up, report how long it took and exit without claiming a bot")
+
+    def handle(self, *args, **options):
+        from bots.tasks import run_bot
+
+        worker_name = os.getenv("HOSTNAME") or f"warm-bot-{uuid.uuid4().hex[:8]}"
+
+        timings = prewarm(with_browser=not options["no_browser"])
+        logger.info(f"Warm bot worker {worker_name} ready in {sum(timings.values()):.2f}s: " + ", ".join(f"{step} {seconds:.2f}s" for step, seconds in timings.items()))
+
+        if options["prewarm_only"]:
+            self.discard_prewarmed_browser()
+            return
+
+        warm_bot_pool = WarmBotPool.from_env()
+
+        # Stop cleanly if we're told to shut down while idle. Once a bot is running, the bot controller handles signals.
+        def handle_signal_while_idle(signum, frame):
+            raise SystemExit(0)
+
+        signal.signal(signal.SIGTERM, handle_signal_while_idle)
+        bot_id = None
+        try:
+            while bot_id is None:
+                # Re-registering on every iteration doubles as the worker's heartbeat
+                warm_bot_pool.set_worker_idle(worker_name)
+                bot_id = warm_bot_pool.claim_bot_id(worker_name, timeout_seconds=15)
+        except SystemExit:
+            logger.info(f"Warm bot worker {worker_name} shutting down before claiming a bot")
+            self.discard_prewarmed_browser()
+            raise
+        finally:
+            warm_bot_pool.remove_worker(worker_name)
+            if bot_id is None:
+                # We may have been stopped after taking a bot off the pending list, so give it to another worker
+                for released_bot_id in warm_bot_pool.release_claimed_bots(worker_name):
+                    logger.info(f"Warm bot worker {worker_name} put bot {released_bot_id} back in the queue")
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        logger.info(f"Warm bot worker {worker_name} claimed bot {bot_id}")
+        if meeting_type_from_url(Bot.objects.get(id=bot_id).meeting_url) == MeetingTypes.ZOOM:
+            # Zoom bots use the SDK, not a browser
+            self.discard_prewarmed_browser()
+
+        run_bot.run(bot_id)
+
+    def discard_prewarmed_browser(self):
+        from bots.web_bot_adapter.warm_browser import discard_prewarmed_browser
+
+        discard_prewarmed_browser()
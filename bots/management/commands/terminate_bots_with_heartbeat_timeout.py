@@ -7,6 +7,7 @@ from django.utils import timezone
 from kubernetes import client, config
 
 from bots.models import Bot, BotEventManager, BotEventSubTypes, BotEventTypes
+from bots.warm_bot_pool import WarmBotPool, warm_bot_pool_enabled
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +44,9 @@ class Command(BaseCommand):
         # Try to delete the pod if it exists
         try:
             pod_name = bot.k8s_pod_name()
+            # Bots that were run by the warm pool live in the worker's pod instead
+            if warm_bot_pool_enabled():
+                pod_name = WarmBotPool.from_env().worker_for_bot(bot.id) or pod_name
             v1.delete_namespaced_pod(
                 name=pod_name,
                 namespace=self.namespace,
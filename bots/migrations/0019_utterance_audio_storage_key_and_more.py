@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0018_webhooksecret_webhooksubscription_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='utterance',
+            name='audio_storage_key',
+            field=models.CharField(blank=True, default=None, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='utterance',
+            name='audio_format',
+            field=models.IntegerField(choices=[(1, 'PCM'), (2, 'MP3'), (3, 'FLAC')], default=1, null=True),
+        ),
+    ]
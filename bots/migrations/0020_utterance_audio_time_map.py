@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bots', '0019_utterance_audio_storage_key_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='utterance',
+            name='audio_time_map',
+            field=models.JSONField(default=None, null=True),
+        ),
+    ]
@@ -118,6 +118,13 @@ class BotStates(models.IntegerChoices):
 class RecordingFormats(models.TextChoices):
     MP4 = "mp4"
     WEBM = "webm"
+    # Audio only
+    M4A = "m4a"
+    MP3 = "mp3"
+    OPUS = "opus"
+
+
+AUDIO_ONLY_RECORDING_FORMATS = (RecordingFormats.M4A, RecordingFormats.MP3, RecordingFormats.OPUS)
 
 
 class RecordingViews(models.TextChoices):
@@ -125,6 +132,23 @@ class RecordingViews(models.TextChoices):
     GALLERY_VIEW = "gallery_view"
 
 
+class RecordingResolutions(models.TextChoices):
+    HD_1080P = "1080p"
+    HD_720P = "720p"
+    SD_360P = "360p"
+    # The resolution the meeting platform sends video at, so frames aren't scaled up
+    SOURCE = "source"
+
+
+RECORDING_RESOLUTION_FRAME_SIZES = {
+    RecordingResolutions.HD_1080P: (1920, 1080),
+    RecordingResolutions.HD_720P: (1280, 720),
+    RecordingResolutions.SD_360P: (640, 360),
+}
+
+DEFAULT_RECORDING_FRAME_RATE = 30
+
+
 class Bot(models.Model):
     OBJECT_ID_PREFIX = "bot_"
 
@@ -186,6 +210,9 @@ class Bot(models.Model):
     def deepgram_detect_language(self):
         return self.settings.get("transcription_settings", {}).get("deepgram", {}).get("detect_language", None)
 
+    def deepgram_use_streaming(self):
+        return self.settings.get("transcription_settings", {}).get("deepgram", {}).get("use_streaming", False)
+
     def google_meet_closed_captions_language(self):
         return self.settings.get("transcription_settings", {}).get("meeting_closed_captions", {}).get("google_meet_language", None)
 
@@ -202,6 +229,12 @@ class Bot(models.Model):
 
         return f"{destination_url}/{stream_key}"
 
+    def rtmp_save_recording(self):
+        rtmp_settings = self.settings.get("rtmp_settings")
+        if not rtmp_settings:
+            return False
+        return rtmp_settings.get("save_recording", False)
+
     def recording_format(self):
         recording_settings = self.settings.get("recording_settings", {})
         if recording_settings is None:
@@ -214,6 +247,25 @@ class Bot(models.Model):
             recording_settings = {}
         return recording_settings.get("view", RecordingViews.SPEAKER_VIEW)
 
+    def recording_resolution(self):
+        recording_settings = self.settings.get("recording_settings", {})
+        if recording_settings is None:
+            recording_settings = {}
+        return recording_settings.get("resolution", RecordingResolutions.HD_1080P)
+
+    def recording_resolution_is_set(self):
+        recording_settings = self.settings.get("recording_settings", {})
+        if recording_settings is None:
+            recording_settings = {}
+        return recording_settings.get("resolution") is not None
+
+    def recording_frame_rate(self):
+        recording_settings = self.settings.get("recording_settings", {})
+        if recording_settings is None:
+            recording_settings = {}
+        # Bots created before whole numbers were enforced can have a frame rate like 30.0
+        return int(recording_settings.get("frame_rate", DEFAULT_RECORDING_FRAME_RATE))
+
     def create_debug_recording(self):
         debug_settings = self.settings.get("debug_settings", {})
         if debug_settings is None:
@@ -903,16 +955,21 @@ class Utterance(models.Model):
     class AudioFormat(models.IntegerChoices):
         PCM = 1, "PCM"
         MP3 = 2, "MP3"
+        FLAC = 3, "FLAC"
 
     recording = models.ForeignKey(Recording, on_delete=models.CASCADE, related_name="utterances")
     participant = models.ForeignKey(Participant, on_delete=models.PROTECT, related_name="utterances")
     audio_blob = models.BinaryField()
+    # Set when the audio lives in the utterance audio store instead of audio_blob
+    audio_storage_key = models.CharField(max_length=255, null=True, blank=True, default=None)
     audio_format = models.IntegerField(choices=AudioFormat.choices, default=AudioFormat.PCM, null=True)
     timestamp_ms = models.BigIntegerField()
     duration_ms = models.IntegerField()
     transcription = models.JSONField(null=True, default=None)
     source_uuid = models.CharField(max_length=255, null=True, unique=True)
     sample_rate = models.IntegerField(null=True, default=None)
+    # Set when the audio was compacted before it was stored, see utterance_audio_compaction.compact_speech
+    audio_time_map = models.JSONField(null=True, default=None)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -7,12 +7,15 @@ from drf_spectacular.utils import (
 from rest_framework import serializers
 
 from .models import (
+    AUDIO_ONLY_RECORDING_FORMATS,
     Bot,
     BotEventSubTypes,
     BotEventTypes,
     BotStates,
+    MeetingTypes,
     Recording,
     RecordingFormats,
+    RecordingResolutions,
     RecordingStates,
     RecordingTranscriptionStates,
     RecordingViews,
@@ -35,6 +38,10 @@ from .utils import meeting_type_from_url
                         "type": "boolean",
                         "description": "Whether to automatically detect the spoken language",
                     },
+                    "use_streaming": {
+                        "type": "boolean",
+                        "description": "Whether to transcribe participant audio in real time with a streaming connection instead of after each utterance. Only supported for Zoom.",
+                    },
                 },
             },
             "meeting_closed_captions": {
@@ -66,6 +73,10 @@ class TranscriptionSettingsJSONField(serializers.JSONField):
                 "type": "string",
                 "description": "The stream key to use for the RTMP server",
             },
+            "save_recording": {
+                "type": "boolean",
+                "description": "Whether to also save a recording of the meeting while streaming. The recording and the stream share one video encode. Defaults to false.",
+            },
         },
         "required": ["destination_url", "stream_key"],
     }
@@ -80,12 +91,20 @@ class RTMPSettingsJSONField(serializers.JSONField):
         "properties": {
             "format": {
                 "type": "string",
-                "description": "The format of the recording to save. The supported formats are 'webm' and 'mp4'.",
+                "description": "The format of the recording to save. The supported formats are 'webm' and 'mp4', and 'm4a', 'mp3' and 'opus' for audio only recordings. Google Meet bots only support 'm4a' for audio only recordings.",
             },
             "view": {
                 "type": "string",
                 "description": "The view to use for the recording. The supported views are 'speaker_view' and 'gallery_view'.",
             },
+            "resolution": {
+                "type": "string",
+                "description": "The resolution of the recording. The supported resolutions are '1080p', '720p', '360p' and 'source', which records at the resolution the meeting platform sends video at. Defaults to '1080p'.",
+            },
+            "frame_rate": {
+                "type": "integer",
+                "description": "The frame rate of the recording, between 1 and 30. Defaults to 30.",
+            },
         },
         "required": [],
     }
@@ -142,6 +161,7 @@ class CreateBotSerializer(serializers.Serializer):
                         "type": "string",
                     },
                     "detect_language": {"type": "boolean"},
+                    "use_streaming": {"type": "boolean"},
                 },
                 "oneOf": [
                     {"required": ["language"]},
@@ -181,7 +201,7 @@ class CreateBotSerializer(serializers.Serializer):
         return value
 
     rtmp_settings = RTMPSettingsJSONField(
-        help_text="RTMP server to stream to, e.g. {'destination_url': 'rtmp://global-live.mux.com:5222/app', 'stream_key': 'xxxx'}.",
+        help_text="RTMP server to stream to, e.g. {'destination_url': 'rtmp://global-live.mux.com:5222/app', 'stream_key': 'xxxx'}. Add 'save_recording': true to also save a recording of the meeting.",
         required=False,
         default=None,
     )
@@ -191,6 +211,7 @@ class CreateBotSerializer(serializers.Serializer):
         "properties": {
             "destination_url": {"type": "string"},
             "stream_key": {"type": "string"},
+            "save_recording": {"type": "boolean"},
         },
         "required": ["destination_url", "stream_key"],
     }
@@ -212,7 +233,7 @@ class CreateBotSerializer(serializers.Serializer):
         return value
 
     recording_settings = RecordingSettingsJSONField(
-        help_text="The settings for the bot's recording. Either {'format': 'webm'} or {'format': 'mp4'}, with optional 'view': 'speaker_view' or 'gallery_view'.",
+        help_text="The settings for the bot's recording. Either {'format': 'webm'} or {'format': 'mp4'}, or {'format': 'm4a'}, {'format': 'mp3'} or {'format': 'opus'} for audio only, with optional 'view': 'speaker_view' or 'gallery_view', 'resolution': '1080p', '720p', '360p' or 'source' and 'frame_rate' between 1 and 30.",
         required=False,
         default={"format": RecordingFormats.WEBM, "view": RecordingViews.SPEAKER_VIEW},
     )
@@ -222,6 +243,8 @@ class CreateBotSerializer(serializers.Serializer):
         "properties": {
             "format": {"type": "string"},
             "view": {"type": "string"},
+            "resolution": {"type": "string"},
+            "frame_rate": {"type": "integer"},
         },
         "required": [],
     }
@@ -237,14 +260,28 @@ class CreateBotSerializer(serializers.Serializer):
 
         # Validate format if provided
         format = value.get("format")
-        if format not in [RecordingFormats.MP4, RecordingFormats.WEBM, None]:
-            raise serializers.ValidationError({"format": "Format must be mp4 or webm"})
+        if format not in [*RecordingFormats.values, None]:
+            raise serializers.ValidationError({"format": "Format must be mp4, webm, m4a, mp3 or opus"})
 
         # Validate view if provided
         view = value.get("view")
         if view not in [RecordingViews.SPEAKER_VIEW, RecordingViews.GALLERY_VIEW, None]:
             raise serializers.ValidationError({"view": "View must be speaker_view or gallery_view"})
 
+        # Validate resolution if provided
+        resolution = value.get("resolution")
+        if resolution not in [*RecordingResolutions.values, None]:
+            raise serializers.ValidationError({"resolution": "Resolution must be 1080p, 720p, 360p or source"})
+
+        # Validate frame rate if provided
+        frame_rate = value.get("frame_rate")
+        if frame_rate is not None:
+            # JSON Schema counts 30.0 as an integer, but it would end up in the GStreamer caps as 30.0/1
+            if not isinstance(frame_rate, int) or isinstance(frame_rate, bool):
+                raise serializers.ValidationError({"frame_rate": "Frame rate must be a whole number"})
+            if not 1 <= frame_rate <= 30:
+                raise serializers.ValidationError({"frame_rate": "Frame rate must be between 1 and 30"})
+
         return value
 
     debug_settings = DebugSettingsJSONField(
@@ -273,6 +310,18 @@ class CreateBotSerializer(serializers.Serializer):
 
         return value
 
+    def validate(self, data):
+        # Google Meet recordings are made by the browser's MediaRecorder, which can only make an audio only recording as m4a
+        recording_format = (data.get("recording_settings") or {}).get("format")
+        if recording_format in [RecordingFormats.MP3, RecordingFormats.OPUS] and meeting_type_from_url(data.get("meeting_url")) == MeetingTypes.GOOGLE_MEET:
+            raise serializers.ValidationError({"recording_settings": "Google Meet bots only support m4a for audio only recordings"})
+
+        # The recording shares the stream's video encode, so it has to have video
+        if (data.get("rtmp_settings") or {}).get("save_recording") and recording_format in AUDIO_ONLY_RECORDING_FORMATS:
+            raise serializers.ValidationError({"rtmp_settings": "save_recording is not supported with audio only recording formats"})
+
+        return data
+
 
 class BotSerializer(serializers.ModelSerializer):
     id = serializers.CharField(source="object_id")
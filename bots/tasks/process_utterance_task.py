@@ -1,11 +1,14 @@
 import logging
 
 from celery import shared_task
+from django.conf import settings
 from django.db import DatabaseError
 
 logger = logging.getLogger(__name__)
 
 from bots.models import Credentials, RecordingManager, Utterance
+from bots.utterance_audio_compaction import compact_speech, restore_timestamps
+from bots.utterance_audio_storage import get_utterance_audio_store
 
 
 @shared_task(
@@ -31,23 +34,34 @@ def process_utterance(self, utterance_id):
     RecordingManager.set_recording_transcription_in_progress(recording)
 
     if utterance.transcription is None:
-        payload: FileSource = {
-            "buffer": utterance.audio_blob.tobytes(),
-        }
-
         # nova-3 does not have multilingual support yet, so we need to use nova-2 if we're transcribing with a non-default language
         if (recording.bot.deepgram_language() != "en" and recording.bot.deepgram_language()) or recording.bot.deepgram_detect_language():
             deepgram_model = "nova-2"
         else:
             deepgram_model = "nova-3"
 
+        # Stored audio was compacted before it was stored. Raw PCM in the database is compacted before it's sent.
+        pcm_data = None
+        time_map = utterance.audio_time_map
+        sample_rate = utterance.sample_rate
+        if settings.UTTERANCE_TRANSCRIPTION_AUDIO_COMPACTION and time_map is None and utterance.audio_format == Utterance.AudioFormat.PCM and utterance.sample_rate:
+            if utterance.audio_storage_key:
+                with get_utterance_audio_store().open(utterance.audio_storage_key) as audio_file:
+                    pcm_data = audio_file.read()
+            else:
+                pcm_data = utterance.audio_blob
+            original_size = len(pcm_data)
+            pcm_data, sample_rate, time_map = compact_speech(pcm_data, utterance.sample_rate, settings.UTTERANCE_TRANSCRIPTION_SAMPLE_RATE)
+            logger.info(f"Compacted utterance {utterance_id} audio from {original_size} bytes at {utterance.sample_rate}Hz to {len(pcm_data)} bytes at {sample_rate}Hz")
+
         options = PrerecordedOptions(
             model=deepgram_model,
             smart_format=True,
             language=recording.bot.deepgram_language(),
             detect_language=recording.bot.deepgram_detect_language(),
-            encoding="linear16",  # for 16-bit PCM
-            sample_rate=utterance.sample_rate,
+            # Compressed audio is self-describing, the encoding only needs to be specified for raw PCM
+            encoding="linear16" if utterance.audio_format == Utterance.AudioFormat.PCM else None,  # for 16-bit PCM
+            sample_rate=sample_rate if utterance.audio_format == Utterance.AudioFormat.PCM else None,
         )
 
         deepgram_credentials_record = recording.bot.project.credentials.filter(credential_type=Credentials.CredentialTypes.DEEPGRAM).first()
@@ -60,9 +74,38 @@ def process_utterance(self, utterance_id):
 
         deepgram = DeepgramClient(deepgram_credentials["api_key"])
 
-        response = deepgram.listen.rest.v("1").transcribe_file(payload, options)
+        if pcm_data is not None:
+            payload: FileSource = {
+                "buffer": pcm_data,
+            }
+            response = deepgram.listen.rest.v("1").transcribe_file(payload, options)
+        elif utterance.audio_storage_key:
+            utterance_audio_store = get_utterance_audio_store()
+            audio_url = utterance_audio_store.url(utterance.audio_storage_key)
+            if audio_url:
+                # Let deepgram fetch the audio straight from object storage
+                response = deepgram.listen.rest.v("1").transcribe_url({"url": audio_url}, options)
+            else:
+                with utterance_audio_store.open(utterance.audio_storage_key) as audio_file:
+                    payload: FileSource = {
+                        "stream": audio_file,
+                    }
+                    response = deepgram.listen.rest.v("1").transcribe_file(payload, options)
+        else:
+            payload: FileSource = {
+                "buffer": utterance.audio_blob.tobytes(),
+            }
+            response = deepgram.listen.rest.v("1").transcribe_file(payload, options)
+
         utterance.transcription = json.loads(response.results.channels[0].alternatives[0].to_json())
+        if time_map:
+            # Word timestamps are relative to the compacted audio, put them back on the utterance's timeline
+            restore_timestamps(utterance.transcription, time_map)
         utterance.audio_blob = b""  # set the binary field to empty byte string
+        # Stored audio is kept around for the retention period, otherwise it's no longer needed once transcribed
+        if utterance.audio_storage_key and settings.UTTERANCE_AUDIO_RETENTION_DAYS == 0:
+            get_utterance_audio_store().delete(utterance.audio_storage_key)
+            utterance.audio_storage_key = None
         utterance.save()
 
         logger.info(f"Transcription complete for utterance {utterance_id} with model {deepgram_model}")
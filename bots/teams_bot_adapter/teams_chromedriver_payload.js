@@ -566,6 +566,10 @@ class WebSocketClient {
         VIDEO: 2,  // Reserved for future use
         AUDIO: 3   // Reserved for future use
     };
+
+    // If more than this is waiting to go out over the websocket, the bot isn't keeping up, so drop video frames
+    // instead of letting them pile up in memory. Audio is small and is never dropped.
+    static MAX_BUFFERED_VIDEO_BYTES = 16 * 1024 * 1024;
   
     constructor() {
         const url = `ws://localhost:${window.initialData.websocketPort}`;
@@ -592,8 +596,38 @@ class WebSocketClient {
         this.mediaSendingEnabled = false;
         this.lastVideoFrameTime = performance.now();
         this.blackFrameInterval = null;
+        this.blackFrame = null;
+        this.lastVideoFrameWasBlack = false;
+        this.droppedVideoFrames = 0;
+    }
+
+    canSendVideo() {
+        if (this.ws.bufferedAmount <= WebSocketClient.MAX_BUFFERED_VIDEO_BYTES)
+            return true;
+
+        this.droppedVideoFrames++;
+        if (this.droppedVideoFrames % 100 === 1)
+            realConsole?.log('Websocket is backed up, dropped', this.droppedVideoFrames, 'video frames so far');
+        return false;
     }
   
+    getBlackFrame(width, height) {
+      // Render the black frame (I420 format) once and reuse it
+      if (!this.blackFrame || this.blackFrame.width !== width || this.blackFrame.height !== height) {
+          const yPlaneSize = width * height;
+          const uvPlaneSize = (width * height) / 4;
+
+          const frameData = new Uint8Array(yPlaneSize + 2 * uvPlaneSize);
+          // Y plane (black = 0)
+          frameData.fill(0, 0, yPlaneSize);
+          // U and V planes (black = 128)
+          frameData.fill(128, yPlaneSize);
+
+          this.blackFrame = { width, height, data: frameData };
+      }
+      return this.blackFrame.data;
+    }
+
     startBlackFrameTimer() {
       if (this.blackFrameInterval) return; // Don't start if already running
       
@@ -601,20 +635,25 @@ class WebSocketClient {
           try {
               const currentTime = performance.now();
               if (currentTime - this.lastVideoFrameTime >= 500 && this.mediaSendingEnabled) {
-                  // Create black frame data (I420 format)
-                  const width = 1920, height = 1080;
-                  const yPlaneSize = width * height;
-                  const uvPlaneSize = (width * height) / 4;
-                  
-                  const frameData = new Uint8Array(yPlaneSize + 2 * uvPlaneSize);
-                  // Y plane (black = 0)
-                  frameData.fill(0, 0, yPlaneSize);
-                  // U and V planes (black = 128)
-                  frameData.fill(128, yPlaneSize);
-                  
                   // Fix: Math.floor() the milliseconds before converting to BigInt
                   const currentTimeMicros = BigInt(Math.floor(currentTime) * 1000);
-                  this.sendVideo(currentTimeMicros, '0', width, height, frameData);
+
+                  // The black frame only needs to be sent once, after that the bot just holds the previous frame
+                  if (this.lastVideoFrameWasBlack) {
+                      this.sendJson({
+                          type: 'RepeatVideoFrame',
+                          timestamp: Number(currentTimeMicros)
+                      });
+                      return;
+                  }
+
+                  // Try again on the next tick rather than marking a black frame as sent when it was dropped
+                  if (!this.canSendVideo())
+                      return;
+
+                  const width = window.initialData.recordingFrameWidth, height = window.initialData.recordingFrameHeight;
+                  this.sendVideo(currentTimeMicros, '0', width, height, this.getBlackFrame(width, height));
+                  this.lastVideoFrameWasBlack = true;
               }
           } catch (error) {
               console.error('Error in black frame timer:', error);
@@ -631,7 +670,8 @@ class WebSocketClient {
   
     enableMediaSending() {
       this.mediaSendingEnabled = true;
-      this.startBlackFrameTimer();
+      if (window.initialData.recordVideo)
+        this.startBlackFrameTimer();
     }
   
     disableMediaSending() {
@@ -704,8 +744,11 @@ class WebSocketClient {
         }
   
         try {
-            // Create final message: type (4 bytes) + timestamp (8 bytes) + audio data
-            const message = new Uint8Array(4 + 8 + 4 + audioData.buffer.byteLength);
+            // Convert streamId to UTF-8 bytes, the bot gives every stream its own source in the audio mixer
+            const streamIdBytes = new TextEncoder().encode(String(streamId));
+
+            // Create final message: type (4 bytes) + timestamp (8 bytes) + streamId length (4 bytes) + streamId bytes + audio data
+            const message = new Uint8Array(4 + 8 + 4 + streamIdBytes.length + audioData.buffer.byteLength);
             const dataView = new DataView(message.buffer);
             
             // Set message type (3 for AUDIO)
@@ -715,10 +758,11 @@ class WebSocketClient {
             dataView.setBigInt64(4, BigInt(timestamp), true);
   
             // Set streamId length and bytes
-            dataView.setInt32(12, streamId, true);
+            dataView.setInt32(12, streamIdBytes.length, true);
+            message.set(streamIdBytes, 16);
   
-            // Copy audio data after type and timestamp
-            message.set(new Uint8Array(audioData.buffer), 16);
+            // Copy audio data after the streamId
+            message.set(new Uint8Array(audioData.buffer), 16 + streamIdBytes.length);
             
             // Send the binary message
             this.ws.send(message.buffer);
@@ -736,8 +780,13 @@ class WebSocketClient {
         if (!this.mediaSendingEnabled) {
           return;
         }
+
+        if (!this.canSendVideo()) {
+          return;
+        }
         
         this.lastVideoFrameTime = performance.now();
+        this.lastVideoFrameWasBlack = false;
   
         try {
             // Convert streamId to UTF-8 bytes
@@ -1157,8 +1206,8 @@ const handleVideoTrack = async (event) => {
                    //realConsole?.log('firstStreamId', firstStreamId, 'streamIdToSend', virtualStreamToPhysicalStreamMappingManager.getVideoStreamIdToSend());
                   
                   if (firstStreamId && firstStreamId === virtualStreamToPhysicalStreamMappingManager.getVideoStreamIdToSend()) {
-                      // Check if enough time has passed since the last frame
-                      if (currentTime - lastFrameTime >= frameInterval) {
+                      // Check if enough time has passed since the last frame, and don't bother copying it if the websocket is backed up
+                      if (currentTime - lastFrameTime >= frameInterval && ws.canSendVideo()) {
                           // Copy the frame to get access to raw data
                           const rawFrame = new VideoFrame(frame, {
                               format: 'I420'
@@ -1295,7 +1344,8 @@ const handleAudioTrack = async (event) => {
   
                   // Send audio data through websocket
                   const currentTimeMicros = BigInt(Math.floor(performance.now() * 1000));
-                  ws.sendAudio(currentTimeMicros, 0, audioData);
+                  // Each track gets its own source in the bot's audio mixer
+                  ws.sendAudio(currentTimeMicros, event.track.id, audioData);
   
                   // Pass through the original frame
                   controller.enqueue(frame);
@@ -1364,7 +1414,8 @@ new RTCInterceptor({
                     realConsole?.log('Error handling audio track:', e);
                 }
             }
-            if (event.track.kind === 'video') {
+            // Audio only recordings don't need the video frames, so don't pay for copying them out of the track
+            if (event.track.kind === 'video' && window.initialData.recordVideo) {
                 realConsole?.log('got video track');
                 realConsole?.log(event);
                 try {
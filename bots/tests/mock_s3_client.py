@@ -0,0 +1,70 @@
+import base64
+import hashlib
+import threading
+import uuid
+
+
+class MockS3Client:
+    """
+    In-memory stand-in for the parts of the boto3 S3 client that the uploaders use. Objects end up in self.objects,
+    keyed by (bucket, key), and multipart uploads are assembled the same way S3 does it.
+    """
+
+    MIN_PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.objects = {}
+        self.multipart_uploads = {}
+        self.aborted_upload_ids = []
+        self.upload_part_calls = 0
+        # Set to make the next this many upload_part calls fail
+        self.upload_part_failures_remaining = 0
+
+    def put_object(self, *, Bucket, Key, Body):
+        with self.lock:
+            self.objects[(Bucket, Key)] = bytes(Body)
+        return {"ETag": uuid.uuid4().hex}
+
+    def create_multipart_upload(self, *, Bucket, Key):
+        upload_id = uuid.uuid4().hex
+        with self.lock:
+            self.multipart_uploads[upload_id] = {"bucket": Bucket, "key": Key, "parts": {}}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, *, Bucket, Key, PartNumber, UploadId, Body, ContentMD5=None):
+        etag = uuid.uuid4().hex
+        with self.lock:
+            self.upload_part_calls += 1
+            if self.upload_part_failures_remaining > 0:
+                self.upload_part_failures_remaining -= 1
+                raise Exception("InternalError: We encountered an internal error. Please try again.")
+            if ContentMD5 is not None and ContentMD5 != base64.b64encode(hashlib.md5(Body).digest()).decode("ascii"):
+                raise Exception("BadDigest: The Content-MD5 you specified did not match what we received.")
+            self.multipart_uploads[UploadId]["parts"][PartNumber] = (etag, bytes(Body))
+        return {"ETag": etag}
+
+    def complete_multipart_upload(self, *, Bucket, Key, UploadId, MultipartUpload):
+        with self.lock:
+            upload = self.multipart_uploads.pop(UploadId)
+            parts = MultipartUpload["Parts"]
+            if not parts:
+                raise Exception("MalformedXML: a multipart upload needs at least one part")
+
+            data = bytearray()
+            for index, part in enumerate(parts):
+                etag, part_data = upload["parts"][part["PartNumber"]]
+                if etag != part["ETag"]:
+                    raise Exception(f"InvalidPart: ETag mismatch for part {part['PartNumber']}")
+                if index < len(parts) - 1 and len(part_data) < self.MIN_PART_SIZE:
+                    raise Exception(f"EntityTooSmall: part {part['PartNumber']} is {len(part_data)} bytes")
+                data.extend(part_data)
+
+            self.objects[(Bucket, Key)] = bytes(data)
+        return {}
+
+    def abort_multipart_upload(self, *, Bucket, Key, UploadId):
+        with self.lock:
+            self.multipart_uploads.pop(UploadId, None)
+            self.aborted_upload_ids.append(UploadId)
+        return {}
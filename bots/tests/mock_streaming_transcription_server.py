@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+from http import HTTPStatus
+
+from websockets.sync.server import serve
+
+
+class MockStreamingTranscriptionServer:
+    """
+    Local stand-in for the Deepgram live streaming API. For every segment_size_bytes of audio received it emits an
+    interim result followed by a final result, and it answers CloseStream by finalizing any partial segment and closing.
+    The first rejected_connections connection attempts are refused, like an overloaded or unreachable provider.
+    """
+
+    def __init__(self, *, sample_rate=32000, segment_size_bytes=64000, transcript="hello world", rejected_connections=0):
+        self.sample_rate = sample_rate
+        self.segment_size_bytes = segment_size_bytes
+        self.transcript = transcript
+        self.rejected_connections = rejected_connections
+
+        self.connection_attempt_times = []
+
+        self.received_audio_bytes = 0
+        self.received_keepalives = 0
+        self.request_paths = []
+        self.request_headers = []
+        self.server = None
+        self.server_thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.socket.getsockname()[:2]
+        return f"ws://{host}:{port}/v1/listen"
+
+    def start(self):
+        self.server = serve(self.handle_connection, "127.0.0.1", 0, process_request=self.process_request)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server_thread.join(timeout=5)
+
+    def process_request(self, connection, request):
+        self.connection_attempt_times.append(time.monotonic())
+        if len(self.connection_attempt_times) <= self.rejected_connections:
+            return connection.respond(HTTPStatus.SERVICE_UNAVAILABLE, "Try again later\n")
+        return None
+
+    def seconds_for_bytes(self, num_bytes):
+        # 16-bit mono PCM
+        return num_bytes / 2 / self.sample_rate
+
+    def results_message(self, *, start_bytes, end_bytes, is_final, transcript):
+        start = self.seconds_for_bytes(start_bytes)
+        duration = self.seconds_for_bytes(end_bytes - start_bytes)
+        words = []
+        if transcript:
+            word_list = transcript.split(" ")
+            word_duration = duration / len(word_list)
+            for i, word in enumerate(word_list):
+                words.append(
+                    {
+                        "word": word,
+                        "start": start + i * word_duration,
+                        "end": start + (i + 1) * word_duration,
+                        "confidence": 0.99,
+                        "punctuated_word": word,
+                    }
+                )
+
+        return json.dumps(
+            {
+                "type": "Results",
+                "start": start,
+                "duration": duration,
+                "is_final": is_final,
+                "channel": {"alternatives": [{"transcript": transcript, "confidence": 0.99, "words": words}]},
+            }
+        )
+
+    def handle_connection(self, websocket):
+        self.request_paths.append(websocket.request.path)
+        self.request_headers.append(websocket.request.headers)
+
+        segment_start_bytes = 0
+        connection_bytes = 0
+        for message in websocket:
+            if isinstance(message, str):
+                control_message = json.loads(message)
+                if control_message["type"] == "KeepAlive":
+                    self.received_keepalives += 1
+                elif control_message["type"] == "CloseStream":
+                    if connection_bytes > segment_start_bytes:
+                        websocket.send(self.results_message(start_bytes=segment_start_bytes, end_bytes=connection_bytes, is_final=True, transcript=self.transcript))
+                    websocket.close()
+                    return
+                continue
+
+            self.received_audio_bytes += len(message)
+            connection_bytes += len(message)
+            if connection_bytes - segment_start_bytes >= self.segment_size_bytes:
+                websocket.send(self.results_message(start_bytes=segment_start_bytes, end_bytes=connection_bytes, is_final=False, transcript=self.transcript.split(" ")[0]))
+                websocket.send(self.results_message(start_bytes=segment_start_bytes, end_bytes=connection_bytes, is_final=True, transcript=self.transcript))
+                segment_start_bytes = connection_bytes
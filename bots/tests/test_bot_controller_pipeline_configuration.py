@@ -0,0 +1,65 @@
+import os
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from bots.bot_controller import BotController
+from bots.bot_controller.gstreamer_pipeline import GstreamerPipeline
+from bots.bot_controller.pipeline_configuration import PipelineConfiguration
+from bots.models import Bot
+
+
+class TestBotControllerPipelineSelection(SimpleTestCase):
+    def create_controller(self, settings, meeting_url="https://zoom.us/j/123?pwd=456"):
+        bot = Bot(id=1, meeting_url=meeting_url, settings=settings)
+        with patch("bots.bot_controller.bot_controller.Bot.objects.get", return_value=bot):
+            return BotController(bot.id)
+
+    def test_audio_only_formats_use_the_audio_recorder_pipeline(self):
+        expected_output_formats = {
+            "m4a": GstreamerPipeline.OUTPUT_FORMAT_M4A,
+            "mp3": GstreamerPipeline.OUTPUT_FORMAT_MP3,
+            "opus": GstreamerPipeline.OUTPUT_FORMAT_OPUS,
+        }
+        for recording_format, output_format in expected_output_formats.items():
+            controller = self.create_controller({"recording_settings": {"format": recording_format}})
+
+            self.assertEqual(controller.pipeline_configuration, PipelineConfiguration.audio_recorder_bot())
+            self.assertFalse(controller.pipeline_configuration.record_video)
+            self.assertEqual(controller.get_gstreamer_output_format(), output_format)
+            self.assertIn(controller.get_gstreamer_output_format(), GstreamerPipeline.AUDIO_ONLY_OUTPUT_FORMATS)
+
+    def test_video_formats_use_the_recorder_pipeline(self):
+        for recording_format, output_format in (("mp4", GstreamerPipeline.OUTPUT_FORMAT_MP4), ("webm", GstreamerPipeline.OUTPUT_FORMAT_WEBM)):
+            controller = self.create_controller({"recording_settings": {"format": recording_format}})
+
+            self.assertEqual(controller.pipeline_configuration, PipelineConfiguration.recorder_bot())
+            self.assertEqual(controller.get_gstreamer_output_format(), output_format)
+
+    def test_default_format_records_video(self):
+        controller = self.create_controller({})
+
+        self.assertEqual(controller.pipeline_configuration, PipelineConfiguration.recorder_bot())
+        self.assertEqual(controller.get_gstreamer_output_format(), GstreamerPipeline.OUTPUT_FORMAT_WEBM)
+
+    @patch.dict(os.environ, {"RECORDING_UPLOAD_MODE": "file"})
+    def test_rtmp_with_save_recording_records_and_streams_from_one_pipeline(self):
+        rtmp_settings = {"destination_url": "rtmp://example.com/live", "stream_key": "key", "save_recording": True}
+        controller = self.create_controller({"recording_settings": {"format": "mp4"}, "rtmp_settings": rtmp_settings})
+
+        self.assertEqual(controller.pipeline_configuration, PipelineConfiguration.rtmp_streaming_and_recorder_bot())
+        self.assertFalse(controller.is_rtmp_streaming_only())
+        # The recording is the pipeline's main output, the stream is teed off it as FLV
+        self.assertEqual(controller.get_gstreamer_output_format(), GstreamerPipeline.OUTPUT_FORMAT_MP4)
+        self.assertEqual(controller.get_gstreamer_sink_type(), GstreamerPipeline.SINK_TYPE_FILE)
+
+    @patch.dict(os.environ, {"RTMP_EGRESS_MODE": "ffmpeg"})
+    def test_rtmp_without_save_recording_only_streams(self):
+        rtmp_settings = {"destination_url": "rtmp://example.com/live", "stream_key": "key"}
+        controller = self.create_controller({"recording_settings": {"format": "mp4"}, "rtmp_settings": rtmp_settings})
+
+        self.assertEqual(controller.pipeline_configuration, PipelineConfiguration.rtmp_streaming_bot())
+        self.assertTrue(controller.is_rtmp_streaming_only())
+        self.assertEqual(controller.get_gstreamer_output_format(), GstreamerPipeline.OUTPUT_FORMAT_FLV)
+        self.assertEqual(controller.get_gstreamer_sink_type(), GstreamerPipeline.SINK_TYPE_APPSINK)
+        self.assertIsNone(controller.get_recording_file_location())
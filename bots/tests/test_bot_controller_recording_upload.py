@@ -0,0 +1,59 @@
+from unittest.mock import MagicMock
+
+from django.test import TransactionTestCase
+
+from bots.bot_controller import BotController
+from bots.models import (
+    Bot,
+    BotEventManager,
+    BotEventTypes,
+    BotStates,
+    Organization,
+    Project,
+    Recording,
+    RecordingStates,
+    RecordingTypes,
+    TranscriptionProviders,
+    TranscriptionTypes,
+)
+
+
+class TestBotControllerStreamingUpload(TransactionTestCase):
+    def setUp(self):
+        organization = Organization.objects.create(name="Test Org")
+        project = Project.objects.create(name="Test Project", organization=organization)
+        self.bot = Bot.objects.create(project=project, name="Test Bot", meeting_url="https://zoom.us/j/123?pwd=456", state=BotStates.POST_PROCESSING)
+        self.recording = Recording.objects.create(
+            bot=self.bot,
+            recording_type=RecordingTypes.AUDIO_AND_VIDEO,
+            transcription_type=TranscriptionTypes.NON_REALTIME,
+            transcription_provider=TranscriptionProviders.DEEPGRAM,
+            is_default_recording=True,
+            state=RecordingStates.IN_PROGRESS,
+        )
+
+        self.controller = BotController.__new__(BotController)
+        self.controller.bot_in_db = self.bot
+        self.controller.streaming_uploader = MagicMock(key="recording.mp4")
+        self.controller.get_first_buffer_timestamp_ms = MagicMock(return_value=1000)
+
+    def test_completed_upload_is_saved_as_the_recording_file(self):
+        self.controller.complete_streaming_upload()
+        BotEventManager.create_event(bot=self.bot, event_type=BotEventTypes.POST_PROCESSING_COMPLETED)
+
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.file.name, "recording.mp4")
+        self.assertEqual(self.recording.state, RecordingStates.COMPLETE)
+
+    def test_failed_upload_fails_the_recording(self):
+        self.controller.streaming_uploader.complete_upload.side_effect = Exception("part 3 could not be uploaded")
+
+        self.controller.complete_streaming_upload()
+        # The bot still finishes post processing, but that mustn't mark the recording complete
+        BotEventManager.create_event(bot=self.bot, event_type=BotEventTypes.POST_PROCESSING_COMPLETED)
+
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.state, RecordingStates.FAILED)
+        self.assertFalse(self.recording.file)
+        self.bot.refresh_from_db()
+        self.assertEqual(self.bot.state, BotStates.ENDED)
@@ -0,0 +1,53 @@
+import urllib.request
+
+from django.test import SimpleTestCase
+
+from bots.bot_metrics import SIZE_BUCKETS, BotMetrics, BotMetricsServer
+
+
+class TestBotMetrics(SimpleTestCase):
+    def setUp(self):
+        self.metrics = BotMetrics()
+        self.metrics.increment("video_frames_received_total")
+        self.metrics.increment("video_frames_received_total", 2)
+        self.metrics.increment("pipeline_queue_dropped_buffers_total", queue="q1")
+        self.metrics.set_gauge("task_executor_queue_depth", 7)
+        for value in (1, 3, 30, 20000):
+            self.metrics.observe("main_loop_lag_ms", value)
+        self.metrics.observe("utterance_flush_size", 4, buckets=SIZE_BUCKETS, source="closed_caption")
+
+    def test_render_prometheus(self):
+        rendered = self.metrics.render_prometheus()
+
+        self.assertIn("# TYPE attendee_bot_video_frames_received_total counter", rendered)
+        self.assertIn("attendee_bot_video_frames_received_total 3", rendered)
+        self.assertIn('attendee_bot_pipeline_queue_dropped_buffers_total{queue="q1"} 1', rendered)
+        self.assertIn("attendee_bot_task_executor_queue_depth 7", rendered)
+        self.assertIn("# TYPE attendee_bot_main_loop_lag_ms histogram", rendered)
+        self.assertIn('attendee_bot_main_loop_lag_ms_bucket{le="5"} 2', rendered)
+        self.assertIn('attendee_bot_main_loop_lag_ms_bucket{le="+Inf"} 4', rendered)
+        self.assertIn("attendee_bot_main_loop_lag_ms_count 4", rendered)
+        self.assertIn('attendee_bot_utterance_flush_size_bucket{source="closed_caption",le="5"} 1', rendered)
+
+    def test_summary(self):
+        summary = self.metrics.summary()
+
+        self.assertEqual(summary["counters"]["video_frames_received_total"], 3)
+        self.assertEqual(summary["gauges"]["task_executor_queue_depth"], 7)
+        lag_summary = summary["histograms"]["main_loop_lag_ms"]
+        self.assertEqual(lag_summary["count"], 4)
+        self.assertEqual(lag_summary["p50"], 5)
+        # Past the last bucket, so the max is reported
+        self.assertEqual(lag_summary["p95"], 20000)
+        self.assertEqual(lag_summary["max"], 20000)
+
+    def test_metrics_server(self):
+        server = BotMetricsServer(metrics=self.metrics, host="127.0.0.1", port=0)
+        server.start()
+        try:
+            port = server.server.server_address[1]
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+                self.assertEqual(response.status, 200)
+                self.assertIn("attendee_bot_video_frames_received_total 3", response.read().decode("utf-8"))
+        finally:
+            server.stop()
@@ -0,0 +1,144 @@
+from unittest.mock import MagicMock, patch
+
+from django.test import TransactionTestCase
+
+from bots.bot_controller.closed_caption_utterance_writer import ClosedCaptionUtteranceWriter
+from bots.bot_metrics import bot_metrics
+from bots.models import (
+    Bot,
+    Organization,
+    Participant,
+    Project,
+    Recording,
+    RecordingStates,
+    RecordingTranscriptionStates,
+    RecordingTypes,
+    TranscriptionProviders,
+    TranscriptionTypes,
+    Utterance,
+)
+
+
+def caption(source_uuid_suffix, text, participant_uuid="participant-1"):
+    return {
+        "source_uuid_suffix": source_uuid_suffix,
+        "participant_uuid": participant_uuid,
+        "participant_user_uuid": f"user-{participant_uuid}",
+        "participant_full_name": f"Name of {participant_uuid}",
+        "text": text,
+        "timestamp_ms": 1000,
+        "duration_ms": 500,
+    }
+
+
+class TestClosedCaptionUtteranceWriter(TransactionTestCase):
+    def setUp(self):
+        organization = Organization.objects.create(name="Test Org")
+        project = Project.objects.create(name="Test Project", organization=organization)
+        self.bot = Bot.objects.create(project=project, name="Test Bot", meeting_url="https://meet.google.com/abc-defg-hij")
+        self.recording = Recording.objects.create(
+            bot=self.bot,
+            recording_type=RecordingTypes.AUDIO_AND_VIDEO,
+            transcription_type=TranscriptionTypes.REALTIME,
+            transcription_provider=TranscriptionProviders.DEEPGRAM,
+            is_default_recording=True,
+            state=RecordingStates.IN_PROGRESS,
+        )
+        self.get_recording_in_progress = MagicMock(return_value=self.recording)
+
+        # Long enough that only the test writes, not the background thread
+        flush_interval_patcher = patch.object(ClosedCaptionUtteranceWriter, "FLUSH_INTERVAL_SECONDS", 60)
+        flush_interval_patcher.start()
+        self.addCleanup(flush_interval_patcher.stop)
+        retry_delay_patcher = patch.object(ClosedCaptionUtteranceWriter, "FINAL_FLUSH_RETRY_DELAY_SECONDS", 0)
+        retry_delay_patcher.start()
+        self.addCleanup(retry_delay_patcher.stop)
+
+        self.writer = ClosedCaptionUtteranceWriter(bot=self.bot, get_recording_in_progress_callback=self.get_recording_in_progress)
+        bot_metrics.reset()
+
+    def transcripts(self):
+        return {utterance.source_uuid: utterance.transcription["transcript"] for utterance in Utterance.objects.filter(recording=self.recording)}
+
+    def test_updated_captions_are_upserted(self):
+        self.writer.enqueue(caption("caption-1", "Hel"))
+        self.writer.enqueue(caption("caption-1", "Hello"))
+        self.writer.enqueue(caption("caption-2", "Hi"))
+        self.writer.flush()
+
+        self.writer.enqueue(caption("caption-1", "Hello there"))
+        self.writer.flush()
+        self.writer.stop()
+
+        self.assertEqual(
+            self.transcripts(),
+            {f"{self.recording.object_id}-caption-1": "Hello there", f"{self.recording.object_id}-caption-2": "Hi"},
+        )
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.transcription_state, RecordingTranscriptionStates.IN_PROGRESS)
+
+    def test_participants_and_recording_are_looked_up_once(self):
+        with patch.object(Participant.objects, "get_or_create", wraps=Participant.objects.get_or_create) as get_or_create:
+            for index in range(3):
+                self.writer.enqueue(caption(f"caption-{index}", "Hello", participant_uuid="participant-1"))
+                self.writer.enqueue(caption(f"other-caption-{index}", "Hi", participant_uuid="participant-2"))
+                self.writer.flush()
+            self.writer.stop()
+
+        self.assertEqual(get_or_create.call_count, 2)
+        self.get_recording_in_progress.assert_called_once()
+        self.assertEqual(Participant.objects.filter(bot=self.bot).count(), 2)
+        self.assertEqual(len(self.transcripts()), 6)
+
+    def test_failed_flush_is_retried(self):
+        self.writer.enqueue(caption("caption-1", "Hello"))
+        with patch.object(Utterance.objects, "bulk_create", side_effect=Exception("database unavailable")):
+            self.writer.flush()
+        self.assertEqual(self.transcripts(), {})
+
+        self.writer.stop()
+
+        self.assertEqual(self.transcripts(), {f"{self.recording.object_id}-caption-1": "Hello"})
+
+    def test_stop_retries_the_final_flush(self):
+        bulk_create = Utterance.objects.bulk_create
+        attempts = []
+
+        def bulk_create_failing_twice(utterances, **kwargs):
+            attempts.append(len(utterances))
+            if len(attempts) <= 2:
+                raise Exception("database unavailable")
+            return bulk_create(utterances, **kwargs)
+
+        self.writer.enqueue(caption("caption-1", "Hello"))
+        self.writer.enqueue(caption("caption-2", "Hi"))
+        with patch.object(Utterance.objects, "bulk_create", side_effect=bulk_create_failing_twice):
+            self.writer.stop()
+
+        # Written together on the third attempt, not one at a time
+        self.assertEqual(attempts, [2, 2, 2])
+        self.assertEqual(len(self.transcripts()), 2)
+        self.assertNotIn(bot_metrics.key("closed_captions_dropped_total", {}), bot_metrics.counters)
+
+    def test_stop_writes_captions_one_at_a_time_and_drops_the_ones_that_fail(self):
+        bulk_create = Utterance.objects.bulk_create
+
+        def bulk_create_failing_on_bad_captions(utterances, **kwargs):
+            if any(utterance.transcription["transcript"] == "bad" for utterance in utterances):
+                raise Exception("value too long")
+            return bulk_create(utterances, **kwargs)
+
+        self.writer.enqueue(caption("caption-1", "Hello"))
+        self.writer.enqueue(caption("caption-2", "bad"))
+        self.writer.enqueue(caption("caption-3", "Hi"))
+        with patch.object(Utterance.objects, "bulk_create", side_effect=bulk_create_failing_on_bad_captions):
+            with self.assertLogs("bots.bot_controller.closed_caption_utterance_writer", level="ERROR") as logs:
+                self.writer.stop()
+
+        self.assertEqual(
+            self.transcripts(),
+            {f"{self.recording.object_id}-caption-1": "Hello", f"{self.recording.object_id}-caption-3": "Hi"},
+        )
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("caption-2", logs.output[0])
+        self.assertEqual(bot_metrics.counters[bot_metrics.key("closed_captions_dropped_total", {})], 1)
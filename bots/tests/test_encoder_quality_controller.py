@@ -0,0 +1,42 @@
+from django.test import SimpleTestCase
+
+from bots.bot_controller.encoder_quality_controller import EncoderQualityController
+
+
+class TestEncoderQualityController(SimpleTestCase):
+    def setUp(self):
+        self.controller = EncoderQualityController(cpu_budget_cores=3.4)
+
+    def update(self, cpu_cores_used, max_queue_fill=0, new_queue_drops=0):
+        return self.controller.update(cpu_cores_used=cpu_cores_used, max_queue_fill=max_queue_fill, new_queue_drops=new_queue_drops, recording_time_ms=1000)
+
+    def test_steps_down_one_level_at_a_time_under_pressure(self):
+        self.assertTrue(self.update(4.0))
+        self.assertEqual(self.controller.level, 1)
+        self.assertTrue(self.update(1.0, max_queue_fill=0.8))
+        self.assertTrue(self.update(1.0, new_queue_drops=3))
+        self.assertEqual((self.controller.bitrate_fraction, self.controller.frame_rate_divisor), EncoderQualityController.LEVELS[-1])
+
+        # Already at the lowest level
+        self.assertFalse(self.update(4.0))
+        self.assertEqual([change["reason"] for change in self.controller.changes], ["over_cpu_budget", "video_queue_filling", "video_queue_dropped_buffers"])
+
+    def test_steps_back_up_after_staying_well_under_budget(self):
+        self.update(4.0)
+        for _ in range(EncoderQualityController.SAMPLES_BEFORE_RECOVERY - 1):
+            self.assertFalse(self.update(1.0))
+        # Just under the budget isn't enough to recover, and it starts the count again
+        self.assertFalse(self.update(3.0))
+        for _ in range(EncoderQualityController.SAMPLES_BEFORE_RECOVERY - 1):
+            self.assertFalse(self.update(1.0))
+        self.assertTrue(self.update(1.0))
+        self.assertEqual(self.controller.level, 0)
+        self.assertEqual(self.controller.changes[-1]["reason"], "under_cpu_budget")
+
+    def test_lower_levels_encode_fewer_frames(self):
+        encoded_frames_per_level = []
+        for level in range(len(EncoderQualityController.LEVELS)):
+            self.controller.level = level
+            encoded_frames_per_level.append(sum(self.controller.should_encode_frame(frame_index) for frame_index in range(30)))
+
+        self.assertEqual(encoded_frames_per_level, [30, 30, 15, 10])
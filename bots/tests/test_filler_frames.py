@@ -0,0 +1,42 @@
+from unittest.mock import MagicMock
+
+from django.test import SimpleTestCase
+
+from bots.filler_frames import FillerFrameSender, black_i420_frame
+
+
+class TestFillerFrameSender(SimpleTestCase):
+    def setUp(self):
+        self.add_video_frame = MagicMock()
+        self.repeat_video_frame = MagicMock()
+        self.sender = FillerFrameSender(frame_size=(640, 360), add_video_frame_callback=self.add_video_frame, repeat_video_frame_callback=self.repeat_video_frame)
+
+    def test_black_frame_is_rendered_once(self):
+        frame = black_i420_frame((640, 360))
+        self.assertEqual(len(frame), 640 * 360 * 3 // 2)
+        self.assertEqual(frame[0], 0)
+        self.assertEqual(frame[-1], 128)
+        self.assertIs(black_i420_frame((640, 360)), frame)
+
+    def test_repeats_after_the_first_filler_frame(self):
+        self.sender.send_filler_frame(1)
+        self.sender.send_filler_frame(2)
+        self.sender.send_filler_frame(3)
+
+        self.add_video_frame.assert_called_once_with(black_i420_frame((640, 360)), 1)
+        self.assertEqual([call.args for call in self.repeat_video_frame.call_args_list], [(2,), (3,)])
+
+    def test_real_frame_ends_the_filler(self):
+        self.sender.send_filler_frame(1)
+        self.sender.send_frame(b"frame", 2)
+        self.sender.send_filler_frame(3)
+
+        self.assertEqual([call.args for call in self.add_video_frame.call_args_list], [(black_i420_frame((640, 360)), 1), (b"frame", 2), (black_i420_frame((640, 360)), 3)])
+        self.repeat_video_frame.assert_not_called()
+
+    def test_sends_the_filler_frame_again_without_a_repeat_callback(self):
+        sender = FillerFrameSender(frame_size=(640, 360), add_video_frame_callback=self.add_video_frame)
+        sender.send_filler_frame(1)
+        sender.send_filler_frame(2)
+
+        self.assertEqual(self.add_video_frame.call_count, 2)
@@ -0,0 +1,220 @@
+import threading
+import time
+from unittest.mock import patch
+
+import numpy as np
+from django.test import SimpleTestCase
+from gi.repository import GLib
+
+from bots.bot_controller.encoder_quality_controller import EncoderQualityController
+from bots.bot_controller.gstreamer_pipeline import GstreamerPipeline
+from bots.bot_metrics import bot_metrics
+
+# 10ms of 32kHz mono S16LE, the audio format the Zoom adapter produces
+SAMPLES_PER_CHUNK = 320
+CHUNK_DURATION_NS = 10_000_000
+
+
+def tone_chunk(source_id, chunk_index):
+    # A different frequency for each source, quiet enough that 24 of them mixed together don't clip
+    sample_times = (np.arange(SAMPLES_PER_CHUNK) + chunk_index * SAMPLES_PER_CHUNK) / 32000
+    return (np.sin(2 * np.pi * (200 + source_id * 50) * sample_times) * 1000).astype(np.int16).tobytes()
+
+
+class TestGstreamerPipelineAudioMixing(SimpleTestCase):
+    def test_mixes_many_audio_sources_and_releases_idle_ones(self):
+        output = []
+        pipeline = GstreamerPipeline(
+            on_new_sample_callback=output.append,
+            video_frame_size=(640, 360),
+            audio_format=GstreamerPipeline.AUDIO_FORMAT_PCM,
+            output_format=GstreamerPipeline.OUTPUT_FORMAT_M4A,
+            sink_type=GstreamerPipeline.SINK_TYPE_APPSINK,
+        )
+        pipeline.setup()
+
+        num_sources = 24
+        start_time_ns = time.time_ns()
+        # One second of audio from every source at once
+        for chunk_index in range(100):
+            for source_id in range(num_sources):
+                pipeline.on_mixed_audio_raw_data_received_callback(tone_chunk(source_id, chunk_index), start_time_ns + chunk_index * CHUNK_DURATION_NS, source_id)
+
+        self.assertEqual(len(pipeline.audio_sources), num_sources)
+        self.assertEqual(len(pipeline.audio_mixer.sinkpads), num_sources)
+
+        # Only the default source is kept once the others have gone quiet
+        with patch("bots.bot_controller.gstreamer_pipeline.time.monotonic", return_value=time.monotonic() + 60):
+            pipeline.release_idle_audio_sources()
+        self.assertEqual(list(pipeline.audio_sources), [GstreamerPipeline.DEFAULT_AUDIO_SOURCE_ID])
+
+        # The branches are removed from the main loop, once their queued audio has been mixed
+        context = GLib.MainContext.default()
+        deadline = time.monotonic() + 10
+        while len(pipeline.audio_mixer.sinkpads) > 1 and time.monotonic() < deadline:
+            context.iteration(False)
+            time.sleep(0.01)
+        self.assertEqual(len(pipeline.audio_mixer.sinkpads), 1)
+
+        # A source that starts sending again gets a new pad
+        pipeline.on_mixed_audio_raw_data_received_callback(tone_chunk(5, 100), start_time_ns + 100 * CHUNK_DURATION_NS, 5)
+        self.assertEqual(len(pipeline.audio_mixer.sinkpads), 2)
+
+        pipeline.cleanup()
+        self.assertGreater(sum(len(data) for data in output), 0)
+
+
+class TestGstreamerPipelineAudioOnlyFormats(SimpleTestCase):
+    def record_audio(self, output_format):
+        output = []
+        pipeline = GstreamerPipeline(
+            on_new_sample_callback=output.append,
+            video_frame_size=(640, 360),
+            audio_format=GstreamerPipeline.AUDIO_FORMAT_PCM,
+            output_format=output_format,
+            sink_type=GstreamerPipeline.SINK_TYPE_APPSINK,
+        )
+        pipeline.setup()
+
+        # There's no video branch at all
+        self.assertIsNone(pipeline.appsrc)
+        self.assertIsNone(pipeline.pipeline.get_by_name("video_source"))
+        self.assertFalse(pipeline.wants_any_video_frames())
+
+        start_time_ns = time.time_ns()
+        for chunk_index in range(100):
+            pipeline.on_mixed_audio_raw_data_received_callback(tone_chunk(0, chunk_index), start_time_ns + chunk_index * CHUNK_DURATION_NS, GstreamerPipeline.DEFAULT_AUDIO_SOURCE_ID)
+        pipeline.cleanup()
+        return b"".join(output)
+
+    def test_mp3(self):
+        recording = self.record_audio(GstreamerPipeline.OUTPUT_FORMAT_MP3)
+        # Starts with an MPEG audio frame sync
+        self.assertEqual(recording[0], 0xFF)
+        self.assertEqual(recording[1] & 0xE0, 0xE0)
+
+    def test_opus(self):
+        recording = self.record_audio(GstreamerPipeline.OUTPUT_FORMAT_OPUS)
+        self.assertTrue(recording.startswith(b"OggS"))
+        self.assertIn(b"OpusHead", recording[:100])
+
+    def test_m4a(self):
+        recording = self.record_audio(GstreamerPipeline.OUTPUT_FORMAT_M4A)
+        self.assertEqual(recording[4:8], b"ftyp")
+
+
+class TestGstreamerPipelineRtmpTee(SimpleTestCase):
+    def test_stalled_stream_does_not_hold_up_the_recording(self):
+        recording = []
+        stream = []
+        stream_unstalled = threading.Event()
+
+        def on_new_flv_sample(data):
+            # An RTMP endpoint that has stopped reading
+            stream_unstalled.wait(60)
+            stream.append(data)
+
+        pipeline = GstreamerPipeline(
+            on_new_sample_callback=recording.append,
+            video_frame_size=(320, 180),
+            audio_format=GstreamerPipeline.AUDIO_FORMAT_PCM,
+            output_format=GstreamerPipeline.OUTPUT_FORMAT_MP4,
+            sink_type=GstreamerPipeline.SINK_TYPE_APPSINK,
+            on_new_flv_sample_callback=on_new_flv_sample,
+        )
+        pipeline.setup()
+        # One encode, split between the recording and the stream
+        self.assertIsNotNone(pipeline.pipeline.get_by_name("video_tee"))
+        self.assertIsNotNone(pipeline.pipeline.get_by_name("audio_tee"))
+        self.assertIsNotNone(pipeline.pipeline.get_by_name("flv_muxer"))
+
+        bot_metrics.reset()
+        num_seconds = 8
+        frame = bytes(320 * 180 * 3 // 2)
+        start_time_ns = time.time_ns()
+
+        def push_media():
+            chunks_per_frame = 1_000_000_000 // pipeline.video_frame_rate // CHUNK_DURATION_NS
+            for frame_index in range(num_seconds * pipeline.video_frame_rate):
+                pipeline.on_new_video_frame(frame, start_time_ns + frame_index * 1_000_000_000 // pipeline.video_frame_rate)
+                for chunk_index in range(frame_index * chunks_per_frame, (frame_index + 1) * chunks_per_frame):
+                    pipeline.on_mixed_audio_raw_data_received_callback(tone_chunk(0, chunk_index), start_time_ns + chunk_index * CHUNK_DURATION_NS, GstreamerPipeline.DEFAULT_AUDIO_SOURCE_ID)
+
+        pusher = threading.Thread(target=push_media, daemon=True)
+        pusher.start()
+        pusher.join(timeout=60)
+        self.assertFalse(pusher.is_alive(), "The stalled stream held up the recording")
+
+        # The recording got every frame, while the stream's leaky queues dropped what it couldn't take
+        self.assertGreaterEqual(bot_metrics.counters.get(bot_metrics.key("video_frames_encoded_total", {}), 0), num_seconds * pipeline.video_frame_rate - 2)
+        stream_drops = sum(pipeline.queue_drops[queue_name] for queue_name in GstreamerPipeline.TIME_LIMITED_QUEUE_NAMES)
+        self.assertGreater(stream_drops, 0)
+
+        stream_unstalled.set()
+        pipeline.cleanup()
+        self.assertEqual(b"".join(recording)[4:8], b"ftyp")
+        self.assertTrue(b"".join(stream).startswith(b"FLV"))
+
+
+class TestGstreamerPipelineEncoderQuality(SimpleTestCase):
+    def encode_frames(self, quality_level, num_frames):
+        """Records num_frames frames at the given encoder quality level, and returns how many frames were encoded"""
+        pipeline = GstreamerPipeline(
+            on_new_sample_callback=lambda data: None,
+            video_frame_size=(320, 180),
+            audio_format=GstreamerPipeline.AUDIO_FORMAT_PCM,
+            output_format=GstreamerPipeline.OUTPUT_FORMAT_MP4,
+            sink_type=GstreamerPipeline.SINK_TYPE_APPSINK,
+        )
+        pipeline.setup()
+        pipeline.encoder_quality_controller.level = quality_level
+
+        bot_metrics.reset()
+        frame = bytes(320 * 180 * 3 // 2)
+        start_time_ns = time.time_ns()
+        for frame_index in range(num_frames):
+            pipeline.on_new_video_frame(frame, start_time_ns + frame_index * 1_000_000_000 // pipeline.video_frame_rate)
+        # Audio alongside the video, so the muxer gets both streams
+        for chunk_index in range(num_frames * 1_000_000_000 // pipeline.video_frame_rate // CHUNK_DURATION_NS):
+            pipeline.on_mixed_audio_raw_data_received_callback(tone_chunk(0, chunk_index), start_time_ns + chunk_index * CHUNK_DURATION_NS, GstreamerPipeline.DEFAULT_AUDIO_SOURCE_ID)
+        pipeline.cleanup()
+        return bot_metrics.counters.get(bot_metrics.key("video_frames_encoded_total", {}), 0)
+
+    def test_lowest_quality_level_encodes_fewer_frames(self):
+        num_frames = 90
+        full_rate_frames_encoded = self.encode_frames(0, num_frames)
+        lowest_quality_level = len(EncoderQualityController.LEVELS) - 1
+        lowest_quality_frames_encoded = self.encode_frames(lowest_quality_level, num_frames)
+
+        frame_rate_divisor = EncoderQualityController.LEVELS[lowest_quality_level][1]
+        self.assertGreaterEqual(full_rate_frames_encoded, num_frames - 2)
+        self.assertLessEqual(lowest_quality_frames_encoded, num_frames // frame_rate_divisor + 2)
+        self.assertGreater(lowest_quality_frames_encoded, 0)
+
+
+class TestGstreamerPipelineRepeatVideoFrame(SimpleTestCase):
+    def test_repeated_frames_are_encoded(self):
+        pipeline = GstreamerPipeline(
+            on_new_sample_callback=lambda data: None,
+            video_frame_size=(320, 180),
+            audio_format=GstreamerPipeline.AUDIO_FORMAT_PCM,
+            output_format=GstreamerPipeline.OUTPUT_FORMAT_MP4,
+            sink_type=GstreamerPipeline.SINK_TYPE_APPSINK,
+        )
+        pipeline.setup()
+
+        bot_metrics.reset()
+        start_time_ns = time.time_ns()
+        # Nothing to repeat yet
+        pipeline.on_repeat_video_frame(start_time_ns)
+        pipeline.on_new_video_frame(bytes(320 * 180 * 3 // 2), start_time_ns)
+        # A second of the adapter asking for the frame to be held, every 250ms like the Zoom filler timer
+        for repeat_index in range(1, 5):
+            pipeline.on_repeat_video_frame(start_time_ns + repeat_index * 250_000_000)
+        for chunk_index in range(100):
+            pipeline.on_mixed_audio_raw_data_received_callback(tone_chunk(0, chunk_index), start_time_ns + chunk_index * CHUNK_DURATION_NS, GstreamerPipeline.DEFAULT_AUDIO_SOURCE_ID)
+        pipeline.cleanup()
+
+        self.assertEqual(bot_metrics.counters.get(bot_metrics.key("video_frames_received_total", {})), 5)
+        # videorate fills in the frames between the repeats, so the recording has a full second of video
+        self.assertGreaterEqual(bot_metrics.counters.get(bot_metrics.key("video_frames_encoded_total", {}), 0), pipeline.video_frame_rate - 2)
@@ -0,0 +1,108 @@
+import cv2
+import numpy as np
+from django.test import SimpleTestCase
+
+from bots.i420_scaler import I420Scaler, get_i420_resize_plan, half_ceil, i420_frame_length, i420_planes
+
+
+def random_i420_frame(frame_size, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, i420_frame_length(frame_size), dtype=np.uint8).tobytes()
+
+
+def reference_scale_i420(frame, frame_size, new_size):
+    # How frames were scaled before I420Scaler, every plane resized and pasted onto a fresh black canvas
+    orig_width, orig_height = frame_size
+    new_width, new_height = new_size
+    y, u, v = (plane.copy() for plane in i420_planes(frame, frame_size))
+
+    input_aspect = orig_width / orig_height
+    output_aspect = new_width / new_height
+    if abs(input_aspect - output_aspect) < 1e-6:
+        scaled_width, scaled_height = new_width, new_height
+    elif input_aspect > output_aspect:
+        scaled_width, scaled_height = new_width, int(round(new_width / input_aspect))
+    else:
+        scaled_width, scaled_height = int(round(new_height * input_aspect)), new_height
+
+    final_y = np.zeros((new_height, new_width), dtype=np.uint8)
+    final_u = np.full((half_ceil(new_height), half_ceil(new_width)), 128, dtype=np.uint8)
+    final_v = np.full((half_ceil(new_height), half_ceil(new_width)), 128, dtype=np.uint8)
+    offset_x = (new_width - scaled_width) // 2
+    offset_y = (new_height - scaled_height) // 2
+    final_y[offset_y : offset_y + scaled_height, offset_x : offset_x + scaled_width] = cv2.resize(y, (scaled_width, scaled_height), interpolation=cv2.INTER_LINEAR)
+    chroma_width, chroma_height = half_ceil(scaled_width), half_ceil(scaled_height)
+    for plane, final_plane in ((u, final_u), (v, final_v)):
+        final_plane[offset_y // 2 : offset_y // 2 + chroma_height, offset_x // 2 : offset_x // 2 + chroma_width] = cv2.resize(plane, (chroma_width, chroma_height), interpolation=cv2.INTER_LINEAR)
+    return np.concatenate([final_y.ravel(), final_u.ravel(), final_v.ravel()]).tobytes()
+
+
+class TestI420Scaler(SimpleTestCase):
+    def assert_matches_reference(self, src_size, dst_size):
+        frame = random_i420_frame(src_size)
+        scaled = I420Scaler(dst_size).scale(frame, src_size)
+        self.assertEqual(len(scaled), i420_frame_length(dst_size))
+        self.assertEqual(scaled, reference_scale_i420(frame, src_size, dst_size))
+
+    def test_same_aspect_ratio_matches_reference(self):
+        self.assert_matches_reference((1280, 720), (1920, 1080))
+        self.assert_matches_reference((1920, 1080), (640, 360))
+
+    def test_odd_sizes_match_reference(self):
+        self.assert_matches_reference((641, 359), (1280, 720))
+        self.assert_matches_reference((1280, 720), (321, 181))
+        self.assert_matches_reference((333, 333), (101, 77))
+
+    def test_letterboxing_matches_reference(self):
+        # Wider than the output, so there are bars above and below
+        self.assert_matches_reference((1920, 800), (1280, 720))
+        plan = get_i420_resize_plan((1920, 800), (1280, 720))
+        self.assertEqual(plan.scaled_size, (1280, 533))
+        self.assertEqual(plan.luma_offset, (0, 93))
+
+    def test_pillarboxing_matches_reference(self):
+        # Taller than the output, so there are bars left and right
+        self.assert_matches_reference((480, 640), (1280, 720))
+        plan = get_i420_resize_plan((480, 640), (1280, 720))
+        self.assertEqual(plan.scaled_size, (540, 720))
+        self.assertEqual(plan.luma_offset, (370, 0))
+
+    def test_reused_buffer_keeps_the_bars_black(self):
+        scaler = I420Scaler((1280, 720))
+        for seed in range(3):
+            frame = random_i420_frame((480, 640), seed=seed)
+            self.assertEqual(scaler.scale(frame, (480, 640)), reference_scale_i420(frame, (480, 640), (1280, 720)))
+
+    def test_frames_handed_out_are_not_overwritten_by_the_next_one(self):
+        scaler = I420Scaler((640, 360))
+        first_frame = random_i420_frame((1280, 720), seed=1)
+        first_scaled = scaler.scale(first_frame, (1280, 720))
+
+        scaler.scale(random_i420_frame((1280, 720), seed=2), (1280, 720))
+
+        self.assertEqual(first_scaled, reference_scale_i420(first_frame, (1280, 720), (640, 360)))
+
+    def test_frames_of_the_output_size_are_passed_through(self):
+        scaler = I420Scaler((1280, 720))
+        frame = random_i420_frame((1280, 720))
+
+        self.assertIs(scaler.scale(frame, (1280, 720)), frame)
+        self.assertEqual(scaler.scale(bytearray(frame), (1280, 720)), frame)
+        self.assertTrue(get_i420_resize_plan((1280, 720), (1280, 720)).passthrough)
+
+    def test_plans_and_buffers_are_reused(self):
+        get_i420_resize_plan.cache_clear()
+        scaler = I420Scaler((1280, 720))
+
+        scaler.scale(random_i420_frame((640, 480)), (640, 480))
+        output_buffer = scaler.output_buffer
+        scaler.scale(random_i420_frame((640, 480), seed=1), (640, 480))
+        I420Scaler((1280, 720)).scale(random_i420_frame((640, 480)), (640, 480))
+
+        self.assertEqual(get_i420_resize_plan.cache_info().misses, 1)
+        self.assertEqual(get_i420_resize_plan.cache_info().hits, 2)
+        self.assertIs(scaler.output_buffer, output_buffer)
+
+        # A new source size gets a new plan and buffer
+        scaler.scale(random_i420_frame((1920, 1080)), (1920, 1080))
+        self.assertEqual(get_i420_resize_plan.cache_info().misses, 2)
+        self.assertIsNot(scaler.output_buffer, output_buffer)
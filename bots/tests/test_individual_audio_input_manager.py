@@ -0,0 +1,104 @@
+import os
+import time
+from unittest.mock import patch
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from bots.bot_controller.individual_audio_input_manager import IndividualAudioInputManager
+
+CHUNK_DURATION_NS = 25_000_000
+# 25ms at 32kHz, so chunks don't line up with the 30ms VAD frames
+CHUNK_SAMPLES = 800
+
+
+def loud_chunk(chunk_index):
+    sample_times = (np.arange(CHUNK_SAMPLES) + chunk_index * CHUNK_SAMPLES) / 32000
+    return (np.sin(2 * np.pi * 440 * sample_times) * 10000).astype(np.int16).tobytes()
+
+
+def silent_chunk():
+    return bytes(CHUNK_SAMPLES * 2)
+
+
+class TestIndividualAudioInputManager(SimpleTestCase):
+    def setUp(self):
+        self.utterances = []
+        self.manager = IndividualAudioInputManager(
+            save_utterance_callback=self.utterances.append,
+            get_participant_callback=lambda speaker_id: {"participant_uuid": speaker_id},
+        )
+
+    def test_utterances_are_split_by_silence(self):
+        start_time_ns = time.monotonic_ns()
+        with patch.object(self.manager.vad, "is_speech", return_value=True) as mock_is_speech:
+            # Two speakers, a second of speech each and then silence, processed in 100ms batches
+            for chunk_index in range(200):
+                chunk_time_ns = start_time_ns + chunk_index * CHUNK_DURATION_NS
+                for speaker_id in ("speaker_1", "speaker_2"):
+                    self.manager.add_chunk(speaker_id, chunk_time_ns, loud_chunk(chunk_index) if chunk_index < 40 else silent_chunk())
+                if chunk_index % 4 == 3:
+                    self.manager.process_chunks()
+
+        # Quiet frames are never passed to WebRTC VAD
+        for call in mock_is_speech.call_args_list:
+            self.assertEqual(len(call.args[0]), 1920)
+        # 34 frames of speech for each speaker, the last one is partly silent
+        self.assertEqual(mock_is_speech.call_count, 2 * 34)
+
+        self.assertEqual([utterance["participant_uuid"] for utterance in self.utterances], ["speaker_1", "speaker_2"])
+        for utterance in self.utterances:
+            self.assertEqual(utterance["flush_reason"], "silence_limit")
+            self.assertEqual(utterance["timestamp_ms"], (start_time_ns + self.manager.wall_clock_offset_ns) // 1_000_000)
+            # The speech, followed by the pause that ended it, in whole VAD frames. A short utterance needs a pause of close to 3 seconds.
+            speech = b"".join(loud_chunk(chunk_index) for chunk_index in range(40))
+            self.assertEqual(utterance["audio_data"][: len(speech)], speech)
+            self.assertEqual(len(utterance["audio_data"]) % 1920, 0)
+            self.assertGreaterEqual(len(utterance["audio_data"]) - len(speech), 2 * 32000 * 2)
+            self.assertLess(len(utterance["audio_data"]) - len(speech), 3 * 32000 * 2)
+
+    def test_flush_includes_audio_that_did_not_fill_a_vad_frame(self):
+        with patch.object(self.manager.vad, "is_speech", return_value=True):
+            # One whole VAD frame, and 20ms left over
+            self.manager.add_chunk("speaker_1", time.monotonic_ns(), loud_chunk(0))
+            self.manager.add_chunk("speaker_1", time.monotonic_ns(), loud_chunk(1))
+            self.manager.process_chunks()
+            self.manager.flush_utterances()
+
+        self.assertEqual(len(self.utterances), 1)
+        self.assertEqual(self.utterances[0]["audio_data"], loud_chunk(0) + loud_chunk(1))
+
+    def test_utterance_starts_with_the_audio_before_the_speech(self):
+        start_time_ns = time.monotonic_ns()
+        # Half a second of silence, then a second of speech
+        chunks = [silent_chunk()] * 20 + [loud_chunk(chunk_index) for chunk_index in range(20, 60)]
+        with patch.object(self.manager.vad, "is_speech", return_value=True):
+            for chunk_index, chunk in enumerate(chunks):
+                self.manager.add_chunk("speaker_1", start_time_ns + chunk_index * CHUNK_DURATION_NS, chunk)
+            self.manager.process_chunks()
+            self.manager.flush_utterances()
+
+        self.assertEqual(len(self.utterances), 1)
+        # 10 frames of silence, from the 6th frame on, which starts in the 7th chunk
+        pre_roll_start = 6 * 1920
+        self.assertEqual(self.utterances[0]["audio_data"], b"".join(chunks)[pre_roll_start:])
+        self.assertEqual(self.utterances[0]["timestamp_ms"], (start_time_ns + 7 * CHUNK_DURATION_NS + self.manager.wall_clock_offset_ns) // 1_000_000)
+
+    def test_long_monologues_are_split_at_pauses(self):
+        with patch.dict(os.environ, {"MAX_UTTERANCE_DURATION_MS": "5000"}):
+            manager = IndividualAudioInputManager(save_utterance_callback=self.utterances.append, get_participant_callback=lambda speaker_id: {"participant_uuid": speaker_id})
+
+        start_time_ns = time.monotonic_ns()
+        with patch.object(manager.vad, "is_speech", return_value=True):
+            # 20 seconds of a second and a half of speech followed by half a second pause
+            for chunk_index in range(800):
+                chunk = loud_chunk(chunk_index) if chunk_index % 80 < 60 else silent_chunk()
+                manager.add_chunk("speaker_1", start_time_ns + chunk_index * CHUNK_DURATION_NS, chunk)
+                if chunk_index % 4 == 3:
+                    manager.process_chunks()
+
+        self.assertGreater(len(self.utterances), 3)
+        for utterance in self.utterances:
+            self.assertLessEqual(len(utterance["audio_data"]), manager.max_utterance_bytes)
+        # Ended by a half second pause once they got long enough, rather than cut off mid speech
+        self.assertIn("silence_limit", [utterance["flush_reason"] for utterance in self.utterances])
@@ -0,0 +1,87 @@
+import os
+import struct
+import tempfile
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from bots.bot_controller.fragmented_mp4_index import SAMPLE_IS_NON_SYNC_SAMPLE, find_box, mp4_box, mp4_full_box
+from bots.bot_controller.media_recorder_receiver import MediaRecorderReceiver
+
+
+def fragment(track_id, decode_time, first_sample_flags, media_data):
+    tfhd = mp4_full_box(b"tfhd", 0, 0x20000, struct.pack(">I", track_id))
+    tfdt = mp4_full_box(b"tfdt", 1, 0, struct.pack(">Q", decode_time))
+    # data offset and first sample flags present, one sample
+    trun = mp4_full_box(b"trun", 0, 0x1 | 0x4, struct.pack(">IiI", 1, 0, first_sample_flags))
+    moof = mp4_box(b"moof", mp4_full_box(b"mfhd", 0, 0, struct.pack(">I", 1)) + mp4_box(b"traf", tfhd + tfdt + trun))
+    return moof + mp4_box(b"mdat", media_data)
+
+
+def fragmented_mp4():
+    ftyp = mp4_box(b"ftyp", b"isom" + struct.pack(">I", 0) + b"isomiso6mp41")
+    trex = mp4_full_box(b"trex", 0, 0, struct.pack(">IIIII", 1, 1, 0, 0, 0))
+    moov = mp4_box(b"moov", mp4_box(b"mvex", trex))
+    fragments = [
+        fragment(1, 0, 0, os.urandom(5000)),
+        fragment(1, 30000, SAMPLE_IS_NON_SYNC_SAMPLE, os.urandom(3000)),
+        fragment(1, 60000, 0, os.urandom(7000)),
+    ]
+    return ftyp + moov + b"".join(fragments)
+
+
+class TestMediaRecorderReceiver(SimpleTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.file_location = os.path.join(self.temp_dir.name, "recording.mp4")
+
+    @patch("bots.bot_controller.media_recorder_receiver.subprocess.run")
+    def test_fragmented_mp4_is_indexed_without_remuxing(self, mock_run):
+        recording = fragmented_mp4()
+        receiver = MediaRecorderReceiver(file_location=self.file_location)
+        # MediaRecorder chunks don't line up with box boundaries
+        for offset in range(0, len(recording), 777):
+            receiver.on_encoded_mp4_chunk(recording[offset : offset + 777])
+        receiver.cleanup()
+
+        mock_run.assert_not_called()
+        with open(self.file_location, "rb") as f:
+            written = f.read()
+        self.assertEqual(written[: len(recording)], recording)
+
+        mfra = find_box(written[len(recording) :], b"mfra")
+        tfra = find_box(mfra, b"tfra")
+        track_id, _, num_entries = struct.unpack_from(">III", tfra, 4)
+        self.assertEqual((track_id, num_entries), (1, 2))
+        # The fragment that starts with a non-sync sample is not a seek point
+        times_and_offsets = [struct.unpack_from(">QQ", tfra, 16 + i * 19) for i in range(num_entries)]
+        self.assertEqual([time for time, _ in times_and_offsets], [0, 60000])
+        for _, moof_offset in times_and_offsets:
+            self.assertEqual(recording[moof_offset + 4 : moof_offset + 8], b"moof")
+
+        mfro = find_box(mfra, b"mfro")
+        self.assertEqual(struct.unpack_from(">I", mfro, 4)[0], len(written) - len(recording))
+
+    def test_chunks_can_be_passed_to_a_callback_instead_of_a_file(self):
+        recording = fragmented_mp4()
+        chunks = []
+        receiver = MediaRecorderReceiver(write_chunk_callback=chunks.append)
+        receiver.on_encoded_mp4_chunk(recording)
+        receiver.cleanup()
+
+        self.assertEqual(chunks[0], recording)
+        self.assertEqual(chunks[1][4:8], b"mfra")
+        self.assertFalse(os.path.exists(self.file_location))
+
+    @patch("bots.bot_controller.media_recorder_receiver.subprocess.run")
+    def test_other_recordings_fall_back_to_remuxing(self, mock_run):
+        mock_run.return_value.returncode = 0
+        receiver = MediaRecorderReceiver(file_location=self.file_location)
+        receiver.on_encoded_mp4_chunk(b"\x1a\x45\xdf\xa3" + os.urandom(1000))
+
+        with patch("bots.bot_controller.media_recorder_receiver.os.replace"):
+            receiver.cleanup()
+
+        mock_run.assert_called_once()
+        self.assertEqual(mock_run.call_args.args[0][0], "ffmpeg")
@@ -0,0 +1,171 @@
+import random
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+
+from bots.bot_controller import BotController
+from bots.bot_controller.ordered_task_executor import OrderedTaskExecutor
+from bots.bot_metrics import bot_metrics
+
+
+class TestOrderedTaskExecutor(SimpleTestCase):
+    def setUp(self):
+        bot_metrics.reset()
+        self.addCleanup(bot_metrics.reset)
+
+    def create_executor(self, **kwargs):
+        executor = OrderedTaskExecutor(**kwargs)
+        self.addCleanup(executor.shutdown, timeout=5)
+        return executor
+
+    def counter(self, name, **labels):
+        return bot_metrics.counters.get(bot_metrics.key(name, labels), 0)
+
+    def test_tasks_with_the_same_key_run_in_order(self):
+        executor = self.create_executor(num_workers=4)
+        results = {"a": [], "b": []}
+
+        def append(key, index):
+            time.sleep(random.random() / 1000)
+            results[key].append(index)
+
+        for index in range(50):
+            executor.submit("a", append, "a", index)
+            executor.submit("b", append, "b", index)
+
+        self.assertTrue(executor.wait_until_idle(timeout=10))
+        self.assertEqual(results, {"a": list(range(50)), "b": list(range(50))})
+        self.assertEqual(executor.queue_depth(), 0)
+
+    def test_tasks_with_different_keys_run_in_parallel(self):
+        executor = self.create_executor(num_workers=2)
+        # Each task waits for the other, so they only finish if they run at the same time
+        barrier = threading.Barrier(2, timeout=5)
+        finished = []
+
+        def meet(key):
+            barrier.wait()
+            finished.append(key)
+
+        executor.submit("a", meet, "a")
+        executor.submit("b", meet, "b")
+
+        self.assertTrue(executor.wait_until_idle(timeout=10))
+        self.assertCountEqual(finished, ["a", "b"])
+
+    def test_submit_does_not_block_past_the_bound(self):
+        executor = self.create_executor(num_workers=1, max_pending_tasks=2)
+        release_worker = threading.Event()
+        ran = []
+        executor.submit("slow", release_worker.wait, 10)
+
+        start = time.monotonic()
+        for index in range(5):
+            executor.submit("utterances", ran.append, index)
+        self.assertLess(time.monotonic() - start, 1)
+
+        # Everything past the bound is still queued, just counted
+        self.assertEqual(executor.queue_depth(), 6)
+        self.assertEqual(self.counter("task_executor_overflow_total", task="append"), 4)
+        self.assertEqual(executor.max_pending_task_count, 6)
+
+        release_worker.set()
+        self.assertTrue(executor.wait_until_idle(timeout=10))
+        self.assertEqual(ran, [0, 1, 2, 3, 4])
+
+    def test_coalesced_tasks_are_dropped_past_the_bound(self):
+        executor = self.create_executor(num_workers=1, max_pending_tasks=2)
+        release_worker = threading.Event()
+        heartbeats = []
+        executor.submit("slow", release_worker.wait, 10)
+        executor.submit("utterances", time.sleep, 0)
+
+        self.assertFalse(executor.submit_coalesced("heartbeat", heartbeats.append, 1))
+
+        self.assertEqual(self.counter("task_executor_dropped_total", task="append"), 1)
+        release_worker.set()
+        self.assertTrue(executor.wait_until_idle(timeout=10))
+        self.assertEqual(heartbeats, [])
+
+    def test_coalesced_task_is_skipped_while_one_is_waiting(self):
+        executor = self.create_executor(num_workers=1)
+        release_worker = threading.Event()
+        heartbeats = []
+        executor.submit("slow", release_worker.wait, 10)
+
+        self.assertTrue(executor.submit_coalesced("heartbeat", heartbeats.append, 1))
+        self.assertFalse(executor.submit_coalesced("heartbeat", heartbeats.append, 2))
+
+        self.assertEqual(self.counter("task_executor_coalesced_total", task="append"), 1)
+        release_worker.set()
+        self.assertTrue(executor.wait_until_idle(timeout=10))
+        self.assertEqual(heartbeats, [1])
+
+    def test_coalesced_task_is_queued_behind_a_running_one(self):
+        executor = self.create_executor(num_workers=1)
+        heartbeat_started = threading.Event()
+        release_heartbeat = threading.Event()
+        heartbeats = []
+
+        def write_heartbeat(index):
+            heartbeat_started.set()
+            release_heartbeat.wait(10)
+            heartbeats.append(index)
+
+        executor.submit_coalesced("heartbeat", write_heartbeat, 1)
+        self.assertTrue(heartbeat_started.wait(5))
+
+        # The running heartbeat may already have read stale state, so a new one is still needed
+        self.assertTrue(executor.submit_coalesced("heartbeat", write_heartbeat, 2))
+
+        release_heartbeat.set()
+        self.assertTrue(executor.wait_until_idle(timeout=10))
+        self.assertEqual(heartbeats, [1, 2])
+
+    def test_wait_until_idle_times_out(self):
+        executor = self.create_executor(num_workers=1)
+        release_worker = threading.Event()
+        self.addCleanup(release_worker.set)
+        executor.submit("slow", release_worker.wait, 10)
+
+        self.assertFalse(executor.wait_until_idle(timeout=0.1))
+
+    def test_queue_wait_is_observed_per_task(self):
+        executor = self.create_executor(num_workers=1)
+
+        def save_utterance():
+            pass
+
+        executor.submit("utterances", save_utterance)
+        self.assertTrue(executor.wait_until_idle(timeout=10))
+
+        self.assertEqual(bot_metrics.histograms[bot_metrics.key("task_queue_wait_ms", {"task": "save_utterance"})].count, 1)
+        self.assertEqual(bot_metrics.histograms[bot_metrics.key("task_duration_ms", {"task": "save_utterance"})].count, 1)
+
+
+class TestMainLoopLagMetrics(SimpleTestCase):
+    def setUp(self):
+        bot_metrics.reset()
+        self.addCleanup(bot_metrics.reset)
+
+        self.controller = BotController.__new__(BotController)
+        self.controller.task_executor = MagicMock()
+        self.controller.task_executor.queue_depth.return_value = 2
+        self.controller.last_main_loop_timeout_at = None
+        self.controller.max_main_loop_lag_ms = 0
+        self.controller.last_main_loop_stats_logged_at = 1000
+
+    def test_lag_and_queue_depth_are_recorded_every_tick(self):
+        # The second tick ran 250ms later than scheduled
+        tick_times = [1000, 1000 + (BotController.MAIN_LOOP_TIMEOUT_INTERVAL_MS + 250) / 1000]
+        with patch("bots.bot_controller.bot_controller.time.monotonic", side_effect=tick_times):
+            self.controller.record_main_loop_lag()
+            self.controller.record_main_loop_lag()
+
+        lag_histogram = bot_metrics.histograms[bot_metrics.key("main_loop_lag_ms", {})]
+        self.assertEqual(lag_histogram.count, 1)
+        self.assertAlmostEqual(lag_histogram.sum, 250, places=3)
+        self.assertAlmostEqual(self.controller.max_main_loop_lag_ms, 250, places=3)
+        self.assertEqual(bot_metrics.gauges[bot_metrics.key("task_executor_queue_depth", {})], 2)
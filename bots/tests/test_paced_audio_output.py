@@ -0,0 +1,172 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+
+from bots.bot_controller.audio_output_manager import AudioOutputManager
+from bots.bot_controller.paced_audio_output import PacedAudioOutput
+
+SAMPLE_RATE = 8000
+BYTES_PER_SECOND = SAMPLE_RATE * 2
+
+
+class TestPacedAudioOutput(SimpleTestCase):
+    def setUp(self):
+        self.sent_frames = []
+
+    def play_raw_audio(self, bytes, sample_rate):
+        self.sent_frames.append((time.monotonic(), bytes))
+
+    def play(self, segments):
+        output = PacedAudioOutput(sample_rate=SAMPLE_RATE, segments=segments, play_raw_audio_callback=self.play_raw_audio)
+        output.start()
+        return output
+
+    def test_sends_frames_in_real_time(self):
+        audio = bytes(range(256)) * (BYTES_PER_SECOND // 2 // 256)
+        start = time.monotonic()
+        output = self.play(iter([audio[:1000], audio[1000:]]))
+        self.assertTrue(output.finished.wait(2))
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(b"".join(frame for _, frame in self.sent_frames), audio)
+        self.assertTrue(all(len(frame) == 320 for _, frame in self.sent_frames[:-1]))
+        # Half a second of audio, the last frame sent a little ahead of when it plays
+        last_frame_sent_at = self.sent_frames[-1][0] - start
+        self.assertGreater(last_frame_sent_at, 0.35)
+        self.assertLess(last_frame_sent_at, 0.5)
+        self.assertGreaterEqual(elapsed, 0.49)
+
+    def test_starts_before_later_segments_are_ready(self):
+        def segments():
+            yield bytes(BYTES_PER_SECOND // 10)
+            time.sleep(0.3)
+            yield bytes(BYTES_PER_SECOND // 10)
+
+        start = time.monotonic()
+        output = self.play(segments())
+        self.assertTrue(output.finished.wait(2))
+
+        self.assertLess(self.sent_frames[0][0] - start, 0.05)
+        self.assertEqual(sum(len(frame) for _, frame in self.sent_frames), BYTES_PER_SECOND // 5)
+
+    def test_cancel_stops_playback_immediately(self):
+        output = self.play(iter([bytes(BYTES_PER_SECOND * 10)]))
+        time.sleep(0.2)
+
+        cancel_start = time.monotonic()
+        output.cancel()
+        self.assertLess(time.monotonic() - cancel_start, 0.05)
+        self.assertTrue(output.finished.is_set())
+
+        sent_bytes = sum(len(frame) for _, frame in self.sent_frames)
+        # What has played, plus no more than the lead
+        self.assertLess(sent_bytes, BYTES_PER_SECOND * (0.2 + PacedAudioOutput.LEAD_MS / 1000 + 0.05))
+        time.sleep(0.1)
+        self.assertEqual(sum(len(frame) for _, frame in self.sent_frames), sent_bytes)
+
+    def test_error_getting_a_later_segment_stops_playback(self):
+        def segments():
+            yield bytes(BYTES_PER_SECOND // 10)
+            raise RuntimeError("Text-to-speech request failed")
+
+        output = self.play(segments())
+        self.assertTrue(output.finished.wait(2))
+
+        self.assertIsInstance(output.error, RuntimeError)
+        self.assertLessEqual(sum(len(frame) for _, frame in self.sent_frames), BYTES_PER_SECOND // 10)
+
+    def test_finishing_without_error(self):
+        output = self.play(iter([bytes(BYTES_PER_SECOND // 10)]))
+        self.assertTrue(output.finished.wait(2))
+
+        self.assertIsNone(output.error)
+
+
+class TestAudioOutputManager(SimpleTestCase):
+    def setUp(self):
+        self.finished_callback = MagicMock()
+        self.failed_callback = MagicMock()
+        self.play_raw_audio = MagicMock()
+        self.audio_output_manager = AudioOutputManager(
+            currently_playing_audio_media_request_finished_callback=self.finished_callback,
+            currently_playing_audio_media_request_failed_callback=self.failed_callback,
+            play_raw_audio_callback=self.play_raw_audio,
+        )
+
+    def text_to_speech_request(self):
+        audio_media_request = MagicMock()
+        audio_media_request.media_blob = None
+        return audio_media_request
+
+    def wait_until_done(self):
+        self.assertTrue(self.audio_output_manager.paced_audio_output.finished.wait(2))
+        self.audio_output_manager.monitor_currently_playing_audio_media_request()
+
+    def test_audio_that_cant_be_decoded_fails_the_request(self):
+        audio_media_request = MagicMock()
+        audio_media_request.media_blob.blob = b"ID3 this is not an mp3" + bytes(1000)
+
+        self.audio_output_manager.start_playing_audio_media_request(audio_media_request)
+        self.wait_until_done()
+
+        self.failed_callback.assert_called_once_with(audio_media_request)
+        self.finished_callback.assert_not_called()
+        self.play_raw_audio.assert_not_called()
+
+    @patch("bots.bot_controller.audio_output_manager.mp3_to_pcm")
+    def test_audio_is_decoded_on_the_playback_thread(self, mock_mp3_to_pcm):
+        decoded_on = []
+
+        def mp3_to_pcm(mp3_data, sample_rate):
+            decoded_on.append(threading.current_thread())
+            return bytes(sample_rate // 10)
+
+        mock_mp3_to_pcm.side_effect = mp3_to_pcm
+        audio_media_request = MagicMock()
+
+        self.audio_output_manager.start_playing_audio_media_request(audio_media_request)
+        self.wait_until_done()
+
+        self.assertEqual(len(decoded_on), 1)
+        self.assertIsNot(decoded_on[0], threading.current_thread())
+        self.finished_callback.assert_called_once_with(audio_media_request)
+
+    @patch("bots.bot_controller.audio_output_manager.generate_audio_segments_from_text")
+    def test_text_to_speech_error_on_a_later_sentence_fails_the_request(self, mock_generate_audio_segments_from_text):
+        def segments():
+            yield bytes(AudioOutputManager.SAMPLE_RATE // 10)
+            raise RuntimeError("Text-to-speech request failed")
+
+        mock_generate_audio_segments_from_text.return_value = segments()
+        audio_media_request = self.text_to_speech_request()
+
+        self.audio_output_manager.start_playing_audio_media_request(audio_media_request)
+        self.wait_until_done()
+
+        self.failed_callback.assert_called_once_with(audio_media_request)
+        self.finished_callback.assert_not_called()
+
+    @patch("bots.bot_controller.audio_output_manager.generate_audio_segments_from_text")
+    def test_error_sending_audio_fails_the_request(self, mock_generate_audio_segments_from_text):
+        mock_generate_audio_segments_from_text.return_value = iter([bytes(AudioOutputManager.SAMPLE_RATE // 10)])
+        self.play_raw_audio.side_effect = Exception("Send failed")
+        audio_media_request = self.text_to_speech_request()
+
+        self.audio_output_manager.start_playing_audio_media_request(audio_media_request)
+        self.wait_until_done()
+
+        self.failed_callback.assert_called_once_with(audio_media_request)
+        self.finished_callback.assert_not_called()
+
+    @patch("bots.bot_controller.audio_output_manager.generate_audio_segments_from_text")
+    def test_request_finishes_when_all_audio_has_played(self, mock_generate_audio_segments_from_text):
+        mock_generate_audio_segments_from_text.return_value = iter([bytes(AudioOutputManager.SAMPLE_RATE // 10)])
+        audio_media_request = self.text_to_speech_request()
+
+        self.audio_output_manager.start_playing_audio_media_request(audio_media_request)
+        self.wait_until_done()
+
+        self.finished_callback.assert_called_once_with(audio_media_request)
+        self.failed_callback.assert_not_called()
@@ -0,0 +1,25 @@
+from django.test import SimpleTestCase
+
+from bots.bot_controller.pipeline_memory_budget import PipelineMemoryBudget
+
+
+class TestPipelineMemoryBudget(SimpleTestCase):
+    def test_queue_limits_add_up_to_the_budget(self):
+        video_budget = PipelineMemoryBudget(total_bytes=1_000_000_000, queue_names=["q1", "q2", "q3", "q4", "q5", "mixer_q1", "q6", "q7"])
+        self.assertLessEqual(sum(video_budget.queue_limits.values()), 1_000_000_000)
+        self.assertGreater(video_budget.limit_for_queue("q2"), video_budget.limit_for_queue("q5"))
+
+        # Without the video queues, the audio queues get their share
+        audio_only_budget = PipelineMemoryBudget(total_bytes=1_000_000_000, queue_names=["q4", "q5", "mixer_q1", "q6", "q7"])
+        self.assertGreater(audio_only_budget.limit_for_queue("q5"), video_budget.limit_for_queue("q5"))
+        self.assertEqual(audio_only_budget.limit_for_queue("some_added_audio_source_queue"), 5_000_000)
+
+    def test_sheds_video_until_the_queues_drain(self):
+        budget = PipelineMemoryBudget(total_bytes=1000, queue_names=["q1", "q5"])
+        self.assertFalse(budget.update(700))
+        self.assertTrue(budget.update(850))
+        self.assertTrue(budget.shedding_video)
+        # Still over the lower threshold
+        self.assertFalse(budget.update(700))
+        self.assertTrue(budget.update(500))
+        self.assertFalse(budget.shedding_video)
@@ -0,0 +1,159 @@
+import io
+import struct
+import subprocess
+import sys
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+
+from bots.bot_controller.rtmp_client import FLV_TAG_TYPE_AUDIO, FLV_TAG_TYPE_SCRIPT, FLV_TAG_TYPE_VIDEO, FlvTagReader, RTMPClient
+
+FLV_FILE_HEADER = b"FLV\x01\x05" + struct.pack(">I", 9) + struct.pack(">I", 0)
+
+
+def flv_tag(tag_type, timestamp_ms, payload):
+    header = bytes([tag_type]) + len(payload).to_bytes(3, "big") + (timestamp_ms & 0xFFFFFF).to_bytes(3, "big") + bytes([timestamp_ms >> 24]) + bytes(3)
+    return header + payload + struct.pack(">I", 11 + len(payload))
+
+
+def video_tag(timestamp_ms, keyframe):
+    # Frame type in the high nibble, AVC codec in the low nibble, then a NALU packet type
+    return flv_tag(FLV_TAG_TYPE_VIDEO, timestamp_ms, bytes([(1 if keyframe else 2) << 4 | 7, 1]) + bytes(100))
+
+
+def stream_headers():
+    return FLV_FILE_HEADER + flv_tag(FLV_TAG_TYPE_SCRIPT, 0, b"metadata") + flv_tag(FLV_TAG_TYPE_VIDEO, 0, bytes([0x17, 0]) + b"avcc") + flv_tag(FLV_TAG_TYPE_AUDIO, 0, bytes([0xAF, 0]) + b"asc")
+
+
+def mock_ffmpeg_process(write):
+    process = MagicMock()
+    process.poll.return_value = None
+    process.stderr = io.BytesIO()
+    process.stdin.write.side_effect = write
+    return process
+
+
+class TestRTMPClient(SimpleTestCase):
+    def test_tag_reader_splits_chunks_at_tag_boundaries(self):
+        stream = stream_headers() + video_tag(0, True) + video_tag(33, False)
+        reader = FlvTagReader()
+        tags = []
+        for offset in range(0, len(stream), 7):
+            tags.extend(reader.add_chunk(stream[offset : offset + 7]))
+
+        self.assertEqual(reader.file_header, FLV_FILE_HEADER)
+        self.assertEqual([tag.header_kind for tag in tags], ["metadata", "video_sequence_header", "audio_sequence_header", None, None])
+        self.assertEqual([tag.is_keyframe for tag in tags[3:]], [True, False])
+        self.assertEqual(tags[4].timestamp_ms, 33)
+
+    @patch("bots.bot_controller.rtmp_client.subprocess.Popen")
+    def test_stalled_connection_drops_to_keyframe_without_blocking(self, mock_popen):
+        release_write = threading.Event()
+        written = []
+
+        def stalled_write(data):
+            release_write.wait()
+            written.append(data)
+
+        mock_popen.return_value = mock_ffmpeg_process(stalled_write)
+        client = RTMPClient("rtmp://example.com/live", max_buffered_ms=1000)
+        client.start()
+
+        start = time.monotonic()
+        self.assertTrue(client.write_data(stream_headers()))
+        # 5 seconds of 30fps video with a keyframe every second
+        for frame_number in range(150):
+            self.assertTrue(client.write_data(video_tag(frame_number * 33, frame_number % 30 == 0)))
+        self.assertLess(time.monotonic() - start, 1)
+
+        media_tags = [tag for tag in client.queue if not tag.header_kind]
+        self.assertTrue(media_tags[0].is_keyframe)
+        self.assertLessEqual(media_tags[-1].timestamp_ms - media_tags[0].timestamp_ms, 1000)
+
+        release_write.set()
+        client.stop()
+
+    @patch("bots.bot_controller.rtmp_client.subprocess.Popen")
+    def test_reconnects_and_resends_stream_headers(self, mock_popen):
+        first_connection_writes = []
+        second_connection_writes = []
+
+        def broken_write(data):
+            first_connection_writes.append(data)
+            if len(first_connection_writes) > 1:
+                raise BrokenPipeError()
+
+        mock_popen.side_effect = [mock_ffmpeg_process(broken_write), mock_ffmpeg_process(second_connection_writes.append)]
+        client = RTMPClient("rtmp://example.com/live", reconnect_base_delay_seconds=0)
+        client.start()
+
+        client.write_data(stream_headers())
+        client.write_data(video_tag(0, True))
+        client.write_data(video_tag(33, False))
+        client.write_data(video_tag(1000, True))
+
+        deadline = time.monotonic() + 5
+        while len(second_connection_writes) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        client.stop()
+
+        self.assertEqual(mock_popen.call_count, 2)
+        self.assertFalse(client.failed)
+        # The new connection starts with the stream headers, then the keyframe that failed to write
+        self.assertEqual(second_connection_writes, [stream_headers() + video_tag(0, True), video_tag(33, False), video_tag(1000, True)])
+
+    @patch("bots.bot_controller.rtmp_client.subprocess.Popen")
+    def test_stream_headers_that_fail_to_write_are_resent(self, mock_popen):
+        second_connection_writes = []
+
+        def broken_write(data):
+            raise BrokenPipeError()
+
+        mock_popen.side_effect = [mock_ffmpeg_process(broken_write), mock_ffmpeg_process(second_connection_writes.append)]
+        client = RTMPClient("rtmp://example.com/live", reconnect_base_delay_seconds=0)
+        client.start()
+
+        client.write_data(stream_headers() + video_tag(0, True))
+
+        deadline = time.monotonic() + 5
+        while len(second_connection_writes) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        client.stop()
+
+        self.assertEqual(mock_popen.call_count, 2)
+        # Sent once, in their original order, and the sequence headers that were still queued aren't sent again
+        self.assertEqual(second_connection_writes, [stream_headers(), video_tag(0, True)])
+
+    def test_tags_too_short_for_a_codec_header_are_media(self):
+        reader = FlvTagReader()
+        tags = reader.add_chunk(FLV_FILE_HEADER + flv_tag(FLV_TAG_TYPE_VIDEO, 0, bytes([0x17])) + flv_tag(FLV_TAG_TYPE_AUDIO, 0, b"") + flv_tag(FLV_TAG_TYPE_VIDEO, 33, b""))
+
+        # The byte after a one byte payload belongs to the PreviousTagSize, and happens to look like a sequence header
+        self.assertEqual([tag.header_kind for tag in tags], [None, None, None])
+        self.assertEqual([tag.is_keyframe for tag in tags], [True, False, False])
+
+    def test_stop_does_not_hang_when_the_writer_is_blocked(self):
+        # A real process that never reads its stdin, like ffmpeg when the RTMP endpoint stalls
+        stalled_process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self.addCleanup(stalled_process.kill)
+        client = RTMPClient("rtmp://example.com/live")
+        with patch("bots.bot_controller.rtmp_client.subprocess.Popen", return_value=stalled_process):
+            client.start()
+
+        # Much bigger than the pipe's buffer, so the writer thread blocks writing it
+        client.write_data(stream_headers() + flv_tag(FLV_TAG_TYPE_VIDEO, 0, bytes([0x17, 1]) + bytes(4_000_000)))
+        deadline = time.monotonic() + 5
+        while client.queue and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(client.queue), 0)
+
+        # On a thread, so the test fails rather than hangs if stop() does
+        stop_thread = threading.Thread(target=client.stop, daemon=True)
+        stop_thread.start()
+        stop_thread.join(timeout=3)
+
+        self.assertFalse(stop_thread.is_alive())
+        self.assertFalse(client.writer_thread.is_alive())
+        self.assertIsNotNone(stalled_process.poll())
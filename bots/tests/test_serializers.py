@@ -0,0 +1,94 @@
+from django.test import SimpleTestCase
+
+from bots.models import AUDIO_ONLY_RECORDING_FORMATS, Bot, RecordingFormats, RecordingResolutions
+from bots.serializers import CreateBotSerializer
+
+
+class TestCreateBotSerializerRecordingSettings(SimpleTestCase):
+    def serializer(self, recording_settings, meeting_url="https://zoom.us/j/123?pwd=456"):
+        return CreateBotSerializer(data={"meeting_url": meeting_url, "bot_name": "Test Bot", "recording_settings": recording_settings})
+
+    def test_accepts_resolution_and_frame_rate(self):
+        for resolution in RecordingResolutions.values:
+            serializer = self.serializer({"format": "mp4", "resolution": resolution, "frame_rate": 15})
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            self.assertEqual(serializer.validated_data["recording_settings"]["resolution"], resolution)
+
+    def test_rejects_unknown_resolution(self):
+        serializer = self.serializer({"format": "mp4", "resolution": "4k"})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("recording_settings", serializer.errors)
+
+    def test_rejects_frame_rate_out_of_range(self):
+        for frame_rate in (0, 31):
+            serializer = self.serializer({"format": "mp4", "frame_rate": frame_rate})
+            self.assertFalse(serializer.is_valid())
+            self.assertIn("recording_settings", serializer.errors)
+
+    def test_rejects_frame_rate_that_is_not_a_whole_number(self):
+        # JSON Schema accepts 30.0 as an integer
+        for frame_rate in (30.0, 15.5, True):
+            serializer = self.serializer({"format": "mp4", "frame_rate": frame_rate})
+            self.assertFalse(serializer.is_valid())
+            self.assertIn("recording_settings", serializer.errors)
+
+
+class TestCreateBotSerializerAudioOnlyFormats(SimpleTestCase):
+    ZOOM_URL = "https://zoom.us/j/123?pwd=456"
+    TEAMS_URL = "https://teams.microsoft.com/l/meetup-join/19%3ameeting_abc%40thread.v2/0"
+    GOOGLE_MEET_URL = "https://meet.google.com/abc-defg-hij"
+
+    def serializer(self, meeting_url, recording_format, rtmp_settings=None):
+        data = {"meeting_url": meeting_url, "bot_name": "Test Bot", "recording_settings": {"format": recording_format}}
+        if rtmp_settings:
+            data["rtmp_settings"] = rtmp_settings
+        return CreateBotSerializer(data=data)
+
+    def test_accepts_every_audio_only_format_on_zoom_and_teams(self):
+        for meeting_url in (self.ZOOM_URL, self.TEAMS_URL):
+            for recording_format in AUDIO_ONLY_RECORDING_FORMATS:
+                serializer = self.serializer(meeting_url, recording_format)
+                self.assertTrue(serializer.is_valid(), serializer.errors)
+                self.assertEqual(serializer.validated_data["recording_settings"]["format"], recording_format)
+
+    def test_google_meet_only_accepts_m4a(self):
+        serializer = self.serializer(self.GOOGLE_MEET_URL, RecordingFormats.M4A)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+        for recording_format in (RecordingFormats.MP3, RecordingFormats.OPUS):
+            serializer = self.serializer(self.GOOGLE_MEET_URL, recording_format)
+            self.assertFalse(serializer.is_valid())
+            self.assertEqual(serializer.errors["recording_settings"], ["Google Meet bots only support m4a for audio only recordings"])
+
+    def test_rejects_unknown_format(self):
+        serializer = self.serializer(self.ZOOM_URL, "wav")
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("recording_settings", serializer.errors)
+
+    def test_rejects_saving_an_audio_only_recording_of_an_rtmp_stream(self):
+        rtmp_settings = {"destination_url": "rtmp://example.com/live", "stream_key": "key", "save_recording": True}
+        serializer = self.serializer(self.ZOOM_URL, RecordingFormats.MP3, rtmp_settings=rtmp_settings)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("rtmp_settings", serializer.errors)
+
+        serializer = self.serializer(self.ZOOM_URL, RecordingFormats.MP4, rtmp_settings=rtmp_settings)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+
+class TestBotRecordingResolution(SimpleTestCase):
+    def test_defaults_when_not_set(self):
+        bot = Bot(settings={"recording_settings": {"format": "mp4"}})
+        self.assertEqual(bot.recording_resolution(), RecordingResolutions.HD_1080P)
+        self.assertFalse(bot.recording_resolution_is_set())
+        self.assertEqual(bot.recording_frame_rate(), 30)
+
+    def test_set_resolution(self):
+        bot = Bot(settings={"recording_settings": {"format": "mp4", "resolution": "720p", "frame_rate": 10}})
+        self.assertEqual(bot.recording_resolution(), RecordingResolutions.HD_720P)
+        self.assertTrue(bot.recording_resolution_is_set())
+        self.assertEqual(bot.recording_frame_rate(), 10)
+
+    def test_stored_float_frame_rate_is_a_whole_number(self):
+        bot = Bot(settings={"recording_settings": {"format": "mp4", "frame_rate": 30.0}})
+        self.assertEqual(bot.recording_frame_rate(), 30)
+        self.assertIsInstance(bot.recording_frame_rate(), int)
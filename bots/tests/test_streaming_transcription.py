@@ -0,0 +1,124 @@
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from bots.bot_controller.streaming_transcription_manager import StreamingTranscriptionManager, StreamingTranscriptionSession, deepgram_streaming_url
+from bots.tests.mock_streaming_transcription_server import MockStreamingTranscriptionServer
+
+
+class TestStreamingTranscriptionManager(SimpleTestCase):
+    def setUp(self):
+        self.start_server()
+
+    def start_server(self, **kwargs):
+        self.server = MockStreamingTranscriptionServer(segment_size_bytes=64000, **kwargs)
+        self.server.start()
+
+        self.saved_results = []
+        self.manager = StreamingTranscriptionManager(
+            url=deepgram_streaming_url(model="nova-3", language="en", sample_rate=32000, base_url=self.server.url),
+            api_key="test_api_key",
+            save_result_callback=self.saved_results.append,
+            get_participant_callback=lambda speaker_id: {
+                "participant_uuid": speaker_id,
+                "participant_user_uuid": None,
+                "participant_full_name": f"Speaker {speaker_id}",
+            },
+        )
+
+    def tearDown(self):
+        self.server.stop()
+
+    def wait_for_results(self, count, timeout=5):
+        deadline = time.time() + timeout
+        while len(self.saved_results) < count and time.time() < deadline:
+            self.manager.process_results()
+            time.sleep(0.01)
+
+    def test_streams_audio_and_saves_final_results(self):
+        # So the interim result is never due to be saved on a slow machine
+        self.manager.INTERIM_RESULTS_SAVE_INTERVAL_SECONDS = 60
+        # One second of audio from a single speaker in 10ms chunks
+        for _ in range(100):
+            self.manager.add_chunk(1, datetime.utcnow(), b"\x00" * 640)
+
+        self.wait_for_results(1)
+
+        self.assertEqual(self.server.request_headers[0]["Authorization"], "Token test_api_key")
+        self.assertIn("encoding=linear16", self.server.request_paths[0])
+        self.assertIn("sample_rate=32000", self.server.request_paths[0])
+
+        # The interim result was replaced by the final result for the same segment before it was due to be saved
+        [final_result] = self.saved_results
+        self.assertTrue(final_result["is_final"])
+        self.assertEqual(final_result["transcription"]["transcript"], "hello world")
+        self.assertEqual(final_result["participant_uuid"], 1)
+        self.assertEqual(final_result["duration_ms"], 1000)
+        self.assertEqual(final_result["transcription"]["words"][0]["start"], 0.0)
+
+    def interim_result(self, segment_key, transcript):
+        return {"speaker_id": 1, "segment_key": segment_key, "discard": False, "is_final": False, "transcription": {"transcript": transcript}}
+
+    def test_saves_only_the_latest_interim_result_for_each_segment(self):
+        self.manager.results_queue.put(self.interim_result("0-0", "hello"))
+        self.manager.results_queue.put(self.interim_result("0-0", "hello wor"))
+        self.manager.results_queue.put(self.interim_result("0-2000", "how"))
+        self.manager.results_queue.put({**self.interim_result("0-2000", "how are you"), "is_final": True})
+        self.manager.results_queue.put(self.interim_result("0-4000", "good"))
+        self.manager.results_queue.put({"speaker_id": 1, "segment_key": "0-4000", "discard": True})
+
+        # Final results and discards are saved straight away, the interim result isn't due to be saved yet
+        self.manager.process_results()
+        self.assertEqual([(result["segment_key"], result["discard"]) for result in self.saved_results], [("0-2000", False), ("0-4000", True)])
+
+        self.manager.interim_results_saved_at -= StreamingTranscriptionManager.INTERIM_RESULTS_SAVE_INTERVAL_SECONDS
+        self.manager.process_results()
+        self.assertEqual(len(self.saved_results), 3)
+        self.assertEqual(self.saved_results[-1]["segment_key"], "0-0")
+        self.assertEqual(self.saved_results[-1]["transcription"]["transcript"], "hello wor")
+
+    @patch.object(StreamingTranscriptionSession, "INITIAL_RECONNECT_DELAY_SECONDS", 0.05)
+    def test_reconnects_with_backoff_and_keeps_queued_audio(self):
+        self.server.stop()
+        self.start_server(rejected_connections=3)
+
+        for _ in range(25):
+            self.manager.add_chunk(1, datetime.utcnow(), b"\x00" * 640)
+            time.sleep(0.01)
+        # The session keeps trying to connect instead of a new session being made for every chunk
+        self.assertEqual(len(self.manager.sessions), 1)
+        self.assertLessEqual(len(self.server.connection_attempt_times), 3)
+
+        self.wait_for_connection_attempts(4)
+        self.manager.flush_results()
+
+        # Every chunk queued while the provider was refusing connections was sent once it accepted one
+        self.assertEqual(self.server.received_audio_bytes, 25 * 640)
+        self.assertEqual(len(self.saved_results), 1)
+        self.assertTrue(self.saved_results[0]["is_final"])
+        self.assertEqual(self.saved_results[0]["duration_ms"], 250)
+
+        retry_delays = [later - earlier for earlier, later in zip(self.server.connection_attempt_times, self.server.connection_attempt_times[1:])]
+        self.assertGreater(retry_delays[1], retry_delays[0] * 1.5)
+        self.assertGreater(retry_delays[2], retry_delays[1] * 1.5)
+
+    def wait_for_connection_attempts(self, count, timeout=5):
+        deadline = time.time() + timeout
+        while len(self.server.connection_attempt_times) < count and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_flush_finalizes_partial_segments_for_each_speaker(self):
+        for _ in range(25):
+            self.manager.add_chunk(1, datetime.utcnow(), b"\x00" * 640)
+            self.manager.add_chunk(2, datetime.utcnow(), b"\x00" * 640)
+
+        self.manager.flush_results()
+
+        self.assertEqual(self.server.received_audio_bytes, 2 * 25 * 640)
+        self.assertEqual(sorted(result["participant_uuid"] for result in self.saved_results), [1, 2])
+        for result in self.saved_results:
+            self.assertTrue(result["is_final"])
+            self.assertEqual(result["duration_ms"], 250)
+        self.assertEqual(self.manager.sessions, {})
@@ -0,0 +1,101 @@
+import os
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from bots.bot_controller.streaming_uploader import StreamingUploader
+from bots.bot_metrics import bot_metrics
+from bots.tests.mock_s3_client import MockS3Client
+
+
+class TestStreamingUploader(SimpleTestCase):
+    def setUp(self):
+        self.s3_client = MockS3Client()
+        boto3_client_patcher = patch("bots.bot_controller.streaming_uploader.boto3.client", return_value=self.s3_client)
+        boto3_client_patcher.start()
+        self.addCleanup(boto3_client_patcher.stop)
+        bot_metrics.reset()
+        self.addCleanup(bot_metrics.reset)
+
+    def test_uploads_parts_while_recording_and_completes_at_the_end(self):
+        uploader = StreamingUploader("test-bucket", "recording.mp4")
+        uploader.start_upload()
+
+        # About 12MB of muxer output, arriving in uneven chunks like appsink samples do
+        recording = os.urandom(12 * 1024 * 1024 + 12345)
+        offset = 0
+        chunk_sizes = [1000, 65536, 300000, 7]
+        while offset < len(recording):
+            chunk_size = chunk_sizes[offset % len(chunk_sizes)]
+            uploader.upload_part(recording[offset : offset + chunk_size])
+            offset += chunk_size
+
+        # The full parts were uploaded before the recording ended
+        uploader.upload_queue.join()
+        self.assertEqual(self.s3_client.upload_part_calls, 2)
+        self.assertEqual(uploader.progress()["bytes_uploaded"], 2 * uploader.chunk_size)
+
+        uploader.complete_upload()
+
+        self.assertEqual(self.s3_client.upload_part_calls, 3)
+        self.assertEqual(self.s3_client.objects[("test-bucket", "recording.mp4")], recording)
+        self.assertEqual(self.s3_client.multipart_uploads, {})
+
+    def test_small_recording_is_uploaded_in_one_request(self):
+        uploader = StreamingUploader("test-bucket", "recording.webm")
+        uploader.start_upload()
+
+        recording = os.urandom(100000)
+        uploader.upload_part(recording)
+        uploader.complete_upload()
+
+        self.assertEqual(self.s3_client.upload_part_calls, 0)
+        self.assertEqual(self.s3_client.objects[("test-bucket", "recording.webm")], recording)
+        # The multipart upload that was started is aborted so it doesn't linger in the bucket
+        self.assertEqual(len(self.s3_client.aborted_upload_ids), 1)
+        self.assertEqual(self.s3_client.multipart_uploads, {})
+
+    def test_failed_parts_are_retried(self):
+        uploader = StreamingUploader("test-bucket", "recording.mp4", retry_base_delay_seconds=0)
+        uploader.start_upload()
+        self.s3_client.upload_part_failures_remaining = 3
+
+        recording = os.urandom(3 * uploader.chunk_size + 100)
+        uploader.upload_part(recording)
+        uploader.complete_upload()
+
+        self.assertEqual(self.s3_client.upload_part_calls, 4 + 3)
+        self.assertEqual(self.s3_client.objects[("test-bucket", "recording.mp4")], recording)
+
+    def test_parts_are_spooled_to_disk_once_a_part_keeps_failing(self):
+        uploader = StreamingUploader("test-bucket", "recording.mp4", max_concurrent_uploads=1, max_attempts=2, retry_base_delay_seconds=0)
+        uploader.start_upload()
+        self.s3_client.upload_part_failures_remaining = 2
+
+        recording = os.urandom(3 * uploader.chunk_size + 100)
+        with self.assertLogs("bots.bot_controller.streaming_uploader", level="ERROR"):
+            uploader.upload_part(recording)
+            uploader.upload_queue.join()
+
+        # Reported as soon as it happens, and the parts after it go straight to disk instead of retrying S3
+        self.assertEqual(self.s3_client.upload_part_calls, 2)
+        self.assertEqual(sorted(uploader.spooled_part_paths), [1, 2, 3])
+        self.assertEqual(bot_metrics.counters[bot_metrics.key("recording_upload_parts_spooled_total", {})], 3)
+
+        uploader.complete_upload()
+
+        self.assertEqual(self.s3_client.objects[("test-bucket", "recording.mp4")], recording)
+        self.assertFalse(os.path.exists(uploader.spool_directory))
+
+    def test_upload_is_aborted_if_a_part_keeps_failing(self):
+        uploader = StreamingUploader("test-bucket", "recording.mp4", max_concurrent_uploads=1, max_attempts=2, retry_base_delay_seconds=0)
+        uploader.start_upload()
+        self.s3_client.upload_part_failures_remaining = 100
+
+        uploader.upload_part(os.urandom(2 * uploader.chunk_size))
+        with self.assertRaises(Exception):
+            uploader.complete_upload()
+
+        self.assertNotIn(("test-bucket", "recording.mp4"), self.s3_client.objects)
+        self.assertEqual(self.s3_client.aborted_upload_ids, [uploader.upload_id])
+        self.assertFalse(os.path.exists(uploader.spool_directory))
@@ -0,0 +1,28 @@
+from django.test import SimpleTestCase
+
+from bots.bot_controller.utterance_audio_buffer import UtteranceAudioBuffer
+
+
+class TestUtteranceAudioBuffer(SimpleTestCase):
+    def test_release_hands_off_the_audio_without_copying(self):
+        buffer = UtteranceAudioBuffer(8)
+        buffer.append(b"abc")
+        buffer.append(memoryview(b"defg"))
+        self.assertEqual(len(buffer), 7)
+
+        audio = buffer.release()
+        self.assertIsInstance(audio, memoryview)
+        self.assertEqual(audio, b"abcdefg")
+        self.assertEqual(len(buffer), 0)
+
+        # The next utterance doesn't overwrite the audio that was handed off
+        buffer.append(b"xyz")
+        self.assertEqual(audio, b"abcdefg")
+        self.assertEqual(buffer.release(), b"xyz")
+
+    def test_grows_past_its_capacity(self):
+        buffer = UtteranceAudioBuffer(4)
+        buffer.append(b"abc")
+        buffer.append(b"defgh")
+        self.assertEqual(buffer.release(), b"abcdefgh")
+        self.assertEqual(buffer.release(), b"")
@@ -0,0 +1,46 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from bots.utterance_audio_compaction import compact_speech, downsample, restore_timestamps
+
+SAMPLE_RATE = 32000
+
+
+def tone(seconds, frequency=300):
+    sample_times = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (np.sin(2 * np.pi * frequency * sample_times) * 8000).astype(np.int16)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.int16)
+
+
+class TestUtteranceAudioCompaction(SimpleTestCase):
+    def test_trims_silence_and_shortens_long_pauses(self):
+        audio = np.concatenate([silence(2), tone(1), silence(0.5), tone(1), silence(5), tone(1), silence(3)])
+        pcm_data, sample_rate, time_map = compact_speech(audio.tobytes(), SAMPLE_RATE, 16000)
+
+        self.assertEqual(sample_rate, 16000)
+        # 3.5 seconds of speech and the short pause, 1 second left of the long pause, and padding at either end
+        self.assertAlmostEqual(len(pcm_data) / 2 / sample_rate, 5.1, delta=0.1)
+        self.assertEqual(len(time_map), 2)
+
+        # The last second of speech starts half a second into the second segment, after what's left of the long pause
+        compacted_last_speech_start = time_map[1][0] + 0.5
+        transcription = {"words": [{"word": "test", "start": compacted_last_speech_start, "end": compacted_last_speech_start + 0.4}]}
+        restore_timestamps(transcription, time_map)
+        self.assertAlmostEqual(transcription["words"][0]["start"], 9.5, delta=0.05)
+        self.assertAlmostEqual(transcription["words"][0]["end"], 9.9, delta=0.05)
+
+    def test_keeps_audio_without_speech(self):
+        audio = silence(2)
+        pcm_data, sample_rate, time_map = compact_speech(audio.tobytes(), SAMPLE_RATE, SAMPLE_RATE)
+        self.assertEqual(pcm_data, audio.tobytes())
+        self.assertEqual(time_map, [(0.0, 0.0)])
+
+    def test_downsampling_filters_out_frequencies_above_the_new_nyquist_frequency(self):
+        high_frequency, _ = downsample(tone(1, frequency=12000), SAMPLE_RATE, 16000)
+        low_frequency, _ = downsample(tone(1, frequency=1000), SAMPLE_RATE, 16000)
+        self.assertEqual(len(low_frequency), 16000)
+        self.assertLess(np.sqrt(np.mean(high_frequency.astype(np.float64) ** 2)), 100)
+        self.assertGreater(np.sqrt(np.mean(low_frequency.astype(np.float64) ** 2)), 5000)
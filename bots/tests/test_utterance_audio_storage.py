@@ -0,0 +1,266 @@
+import io
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from django.core.files.storage import InMemoryStorage
+from django.core.management import call_command
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from pydub import AudioSegment
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from bots.bot_controller import BotController
+from bots.models import (
+    Bot,
+    Credentials,
+    Organization,
+    Participant,
+    Project,
+    Recording,
+    RecordingStates,
+    RecordingTypes,
+    TranscriptionProviders,
+    TranscriptionTypes,
+    Utterance,
+)
+from bots.tasks.process_utterance_task import process_utterance
+from bots.utils import pcm_to_flac
+from bots.utterance_audio_storage import UtteranceAudioStore, get_utterance_audio_store
+
+SAMPLE_RATE = 16000
+
+
+def speech_pcm(duration_seconds=1):
+    samples = np.arange(SAMPLE_RATE * duration_seconds)
+    return (np.sin(2 * np.pi * 440 * samples / SAMPLE_RATE) * 8000).astype(np.int16).tobytes()
+
+
+class TestUtteranceAudioStore(SimpleTestCase):
+    def test_flac_round_trip_is_lossless(self):
+        pcm_data = speech_pcm()
+
+        flac_data = pcm_to_flac(pcm_data, sample_rate=SAMPLE_RATE)
+
+        self.assertLess(len(flac_data), len(pcm_data))
+        decoded = AudioSegment.from_file(io.BytesIO(flac_data), format="flac")
+        self.assertEqual(decoded.frame_rate, SAMPLE_RATE)
+        self.assertEqual(decoded.raw_data, pcm_data)
+
+    def test_save_compresses_to_flac(self):
+        store = UtteranceAudioStore(InMemoryStorage(), compression="flac")
+        pcm_data = speech_pcm()
+
+        key, audio_format = store.save("recording/utterance", pcm_data, SAMPLE_RATE)
+
+        self.assertEqual(key, "recording/utterance.flac")
+        self.assertEqual(audio_format, Utterance.AudioFormat.FLAC)
+        with store.open(key) as audio_file:
+            self.assertEqual(AudioSegment.from_file(audio_file, format="flac").raw_data, pcm_data)
+
+    def test_save_without_compression_keeps_pcm(self):
+        store = UtteranceAudioStore(InMemoryStorage(), compression="none")
+        pcm_data = speech_pcm()
+
+        key, audio_format = store.save("recording/utterance", pcm_data, SAMPLE_RATE)
+
+        self.assertEqual(key, "recording/utterance.pcm")
+        self.assertEqual(audio_format, Utterance.AudioFormat.PCM)
+        with store.open(key) as audio_file:
+            self.assertEqual(audio_file.read(), pcm_data)
+
+        store.delete(key)
+        self.assertFalse(store.storage.exists(key))
+
+    def test_url_is_only_available_from_object_storage(self):
+        self.assertIsNone(UtteranceAudioStore(InMemoryStorage()).url("utterance.flac"))
+
+        s3_storage = MagicMock(spec=S3Boto3Storage)
+        s3_storage.url.return_value = "https://bucket.s3.amazonaws.com/utterance_audio/utterance.flac?signature=abc"
+        store = UtteranceAudioStore(s3_storage)
+
+        self.assertEqual(store.url("utterance.flac"), s3_storage.url.return_value)
+        s3_storage.url.assert_called_once_with("utterance.flac", expire=UtteranceAudioStore.PRESIGNED_URL_EXPIRATION_SECONDS)
+
+    def test_backends_the_celery_worker_cant_read_are_rejected(self):
+        get_utterance_audio_store.cache_clear()
+        self.addCleanup(get_utterance_audio_store.cache_clear)
+
+        with override_settings(UTTERANCE_AUDIO_STORAGE_BACKEND="memory"):
+            with self.assertRaises(ValueError):
+                get_utterance_audio_store()
+
+        get_utterance_audio_store.cache_clear()
+        with override_settings(UTTERANCE_AUDIO_STORAGE_BACKEND="database"):
+            self.assertIsNone(get_utterance_audio_store())
+
+
+class StoredUtteranceAudioTestCase(TransactionTestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Test Org")
+        self.project = Project.objects.create(name="Test Project", organization=self.organization)
+        deepgram_credentials = Credentials.objects.create(project=self.project, credential_type=Credentials.CredentialTypes.DEEPGRAM)
+        deepgram_credentials.set_credentials({"api_key": "test_api_key"})
+        self.bot = Bot.objects.create(project=self.project, name="Test Bot", meeting_url="https://zoom.us/j/123456789?pwd=password123")
+        self.recording = Recording.objects.create(
+            bot=self.bot,
+            recording_type=RecordingTypes.AUDIO_AND_VIDEO,
+            transcription_type=TranscriptionTypes.NON_REALTIME,
+            transcription_provider=TranscriptionProviders.DEEPGRAM,
+            is_default_recording=True,
+            state=RecordingStates.IN_PROGRESS,
+        )
+        self.participant = Participant.objects.create(bot=self.bot, uuid="participant-1", user_uuid="user-1", full_name="Test Participant")
+
+        self.store = UtteranceAudioStore(InMemoryStorage())
+        store_patcher = patch("bots.tasks.process_utterance_task.get_utterance_audio_store", return_value=self.store)
+        store_patcher.start()
+        self.addCleanup(store_patcher.stop)
+
+        self.deepgram_client = MagicMock()
+        deepgram_patcher = patch("deepgram.DeepgramClient", return_value=self.deepgram_client)
+        deepgram_patcher.start()
+        self.addCleanup(deepgram_patcher.stop)
+
+    def create_stored_utterance(self, **kwargs):
+        key, audio_format = self.store.save(f"{self.bot.object_id}/utterance", speech_pcm(), SAMPLE_RATE)
+        return Utterance.objects.create(
+            recording=self.recording,
+            participant=self.participant,
+            audio_blob=b"",
+            audio_storage_key=key,
+            audio_format=audio_format,
+            timestamp_ms=1000,
+            duration_ms=1000,
+            sample_rate=SAMPLE_RATE,
+            **kwargs,
+        )
+
+    def deepgram_response(self, transcript):
+        response = MagicMock()
+        response.results.channels[0].alternatives[0].to_json.return_value = f'{{"transcript": "{transcript}", "words": []}}'
+        return response
+
+
+@override_settings(UTTERANCE_TRANSCRIPTION_AUDIO_COMPACTION=False)
+class TestStoredUtteranceAudio(StoredUtteranceAudioTestCase):
+    @override_settings(UTTERANCE_AUDIO_RETENTION_DAYS=0)
+    def test_process_utterance_streams_audio_by_key_and_deletes_it(self):
+        utterance = self.create_stored_utterance()
+        key = utterance.audio_storage_key
+        transcribe_file = self.deepgram_client.listen.rest.v.return_value.transcribe_file
+        streams = []
+        transcribed_audio = []
+
+        def transcribe(payload, options):
+            streams.append(payload["stream"])
+            transcribed_audio.append(payload["stream"].read())
+            return self.deepgram_response("hello")
+
+        transcribe_file.side_effect = transcribe
+
+        process_utterance.apply(args=[utterance.id])
+
+        utterance.refresh_from_db()
+        self.assertEqual(utterance.transcription["transcript"], "hello")
+        self.assertEqual(AudioSegment.from_file(io.BytesIO(transcribed_audio[0]), format="flac").raw_data, speech_pcm())
+        # The audio isn't kept once it's transcribed
+        self.assertIsNone(utterance.audio_storage_key)
+        self.assertFalse(self.store.storage.exists(key))
+        self.assertTrue(streams[0].closed)
+
+    @override_settings(UTTERANCE_AUDIO_RETENTION_DAYS=7)
+    def test_process_utterance_sends_object_storage_url(self):
+        utterance = self.create_stored_utterance()
+        transcribe_url = self.deepgram_client.listen.rest.v.return_value.transcribe_url
+        transcribe_url.return_value = self.deepgram_response("hello")
+
+        with patch.object(self.store, "url", return_value="https://bucket.s3.amazonaws.com/utterance.flac?signature=abc"):
+            process_utterance.apply(args=[utterance.id])
+
+        transcribe_url.assert_called_once()
+        self.assertEqual(transcribe_url.call_args.args[0], {"url": "https://bucket.s3.amazonaws.com/utterance.flac?signature=abc"})
+        self.deepgram_client.listen.rest.v.return_value.transcribe_file.assert_not_called()
+        utterance.refresh_from_db()
+        self.assertEqual(utterance.transcription["transcript"], "hello")
+        # Kept until the retention period is up
+        self.assertTrue(self.store.storage.exists(utterance.audio_storage_key))
+
+    def test_expired_audio_of_transcribed_utterances_is_deleted(self):
+        expired_utterance = self.create_stored_utterance(transcription={"transcript": "hello"}, source_uuid="expired")
+        recent_utterance = self.create_stored_utterance(transcription={"transcript": "hello"}, source_uuid="recent")
+        untranscribed_utterance = self.create_stored_utterance(source_uuid="untranscribed")
+        expired_key = expired_utterance.audio_storage_key
+        Utterance.objects.filter(id__in=[expired_utterance.id, untranscribed_utterance.id]).update(created_at=timezone.now() - timedelta(days=8))
+
+        with patch("bots.management.commands.delete_expired_utterance_audio.get_utterance_audio_store", return_value=self.store):
+            call_command("delete_expired_utterance_audio", retention_days=7)
+
+        for utterance in (expired_utterance, recent_utterance, untranscribed_utterance):
+            utterance.refresh_from_db()
+        self.assertIsNone(expired_utterance.audio_storage_key)
+        self.assertFalse(self.store.storage.exists(expired_key))
+        self.assertTrue(self.store.storage.exists(recent_utterance.audio_storage_key))
+        # Audio that hasn't been transcribed yet is kept no matter how old it is
+        self.assertTrue(self.store.storage.exists(untranscribed_utterance.audio_storage_key))
+
+
+@override_settings(UTTERANCE_TRANSCRIPTION_AUDIO_COMPACTION=True, UTTERANCE_TRANSCRIPTION_SAMPLE_RATE=16000, UTTERANCE_AUDIO_RETENTION_DAYS=7)
+class TestCompactedStoredUtteranceAudio(StoredUtteranceAudioTestCase):
+    BOT_SAMPLE_RATE = 32000
+
+    def utterance_pcm(self):
+        # 2s of silence, 1s of speech, 3s of silence and another 1s of speech
+        samples = np.arange(self.BOT_SAMPLE_RATE)
+        speech = (np.sin(2 * np.pi * 440 * samples / self.BOT_SAMPLE_RATE) * 8000).astype(np.int16)
+        silence = np.zeros(self.BOT_SAMPLE_RATE, dtype=np.int16)
+        return np.concatenate([silence, silence, speech, silence, silence, silence, speech]).tobytes()
+
+    def save_utterance_from_bot(self, pcm_data):
+        controller = BotController.__new__(BotController)
+        controller.bot_in_db = self.bot
+        message = {
+            "participant_uuid": self.participant.uuid,
+            "participant_user_uuid": self.participant.user_uuid,
+            "participant_full_name": self.participant.full_name,
+            "audio_data": memoryview(pcm_data),
+            "timestamp_ms": 1000,
+            "sample_rate": self.BOT_SAMPLE_RATE,
+        }
+        with patch("bots.bot_controller.bot_controller.get_utterance_audio_store", return_value=self.store), patch("bots.tasks.process_utterance_task.process_utterance.delay"):
+            controller.save_individual_audio_utterance(message)
+        return Utterance.objects.get(recording=self.recording)
+
+    def test_stored_audio_is_compacted_before_it_is_compressed(self):
+        pcm_data = self.utterance_pcm()
+
+        utterance = self.save_utterance_from_bot(pcm_data)
+
+        self.assertEqual(utterance.audio_format, Utterance.AudioFormat.FLAC)
+        self.assertEqual(utterance.sample_rate, 16000)
+        self.assertEqual(utterance.duration_ms, 7000)
+        with self.store.open(utterance.audio_storage_key) as audio_file:
+            stored_audio = AudioSegment.from_file(audio_file, format="flac")
+        self.assertEqual(stored_audio.frame_rate, 16000)
+        # The leading silence is gone and the long pause is shortened
+        self.assertLess(len(stored_audio), 4500)
+        self.assertEqual(utterance.audio_time_map[0][0], 0)
+        # Kept from just before the first speech
+        self.assertAlmostEqual(utterance.audio_time_map[0][1], 1.7, delta=0.05)
+
+    def test_word_timestamps_are_restored_from_the_stored_time_map(self):
+        utterance = self.save_utterance_from_bot(self.utterance_pcm())
+        transcribe_file = self.deepgram_client.listen.rest.v.return_value.transcribe_file
+        response = MagicMock()
+        # Said 0.3s into the compacted audio, which starts with the first speech
+        response.results.channels[0].alternatives[0].to_json.return_value = '{"transcript": "hello", "words": [{"word": "hello", "start": 0.3, "end": 0.8}]}'
+        transcribe_file.return_value = response
+
+        process_utterance.apply(args=[utterance.id])
+
+        utterance.refresh_from_db()
+        first_speech_start = utterance.audio_time_map[0][1]
+        self.assertAlmostEqual(utterance.transcription["words"][0]["start"], first_speech_start + 0.3, places=3)
+        self.assertAlmostEqual(utterance.transcription["words"][0]["end"], first_speech_start + 0.8, places=3)
+        # Sent as stored, not decoded and compacted again
+        self.assertIn("stream", transcribe_file.call_args.args[0])
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+
+import redis
+from django.test import SimpleTestCase
+
+from bots.warm_bot_pool import WarmBotPool
+
+
+class WarmBotPoolForTests(WarmBotPool):
+    # Separate keys so the tests can't hand out or claim bots from a real pool
+    PENDING_BOT_IDS_KEY = "warm_bot_pool_test:pending_bot_ids"
+    IDLE_WORKERS_KEY = "warm_bot_pool_test:idle_workers"
+    STARTING_WORKERS_KEY = "warm_bot_pool_test:starting_workers"
+    CLAIMED_BOT_WORKER_KEY_PREFIX = "warm_bot_pool_test:worker_for_bot:"
+    PROCESSING_BOT_IDS_KEY_PREFIX = "warm_bot_pool_test:processing_bot_ids:"
+    CLAIMED_AT_KEY = "warm_bot_pool_test:claimed_at"
+
+
+class WarmBotPoolTest(SimpleTestCase):
+    def setUp(self):
+        self.redis_client = redis.from_url(os.getenv("REDIS_URL"))
+        self.delete_test_keys()
+        self.addCleanup(self.delete_test_keys)
+        self.warm_bot_pool = WarmBotPoolForTests(self.redis_client)
+
+    def delete_test_keys(self):
+        for key in self.redis_client.scan_iter(match="warm_bot_pool_test:*"):
+            self.redis_client.delete(key)
+
+    def test_dispatch_only_queues_bots_for_idle_workers(self):
+        self.assertFalse(self.warm_bot_pool.dispatch(1))
+
+        self.warm_bot_pool.set_worker_idle("worker-1")
+        self.assertTrue(self.warm_bot_pool.dispatch(1))
+        # The only idle worker is already spoken for
+        self.assertFalse(self.warm_bot_pool.dispatch(2))
+        self.assertEqual(self.warm_bot_pool.num_pending_bots(), 1)
+
+    def test_dispatch_ignores_stale_workers(self):
+        self.redis_client.zadd(self.warm_bot_pool.IDLE_WORKERS_KEY, {"worker-1": time.time() - WarmBotPool.WORKER_HEARTBEAT_TIMEOUT_SECONDS - 1})
+
+        self.assertFalse(self.warm_bot_pool.dispatch(1))
+        self.assertEqual(self.warm_bot_pool.num_idle_workers(), 0)
+
+    def test_concurrent_dispatches_dont_queue_more_bots_than_idle_workers(self):
+        for worker_index in range(3):
+            self.warm_bot_pool.set_worker_idle(f"worker-{worker_index}")
+
+        results = []
+        barrier = threading.Barrier(20)
+
+        def launch(bot_id):
+            barrier.wait()
+            results.append(self.warm_bot_pool.dispatch(bot_id))
+
+        threads = [threading.Thread(target=launch, args=(bot_id,)) for bot_id in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 3)
+        self.assertEqual(self.warm_bot_pool.num_pending_bots(), 3)
+
+    def test_claim_moves_bot_to_the_workers_processing_list(self):
+        self.warm_bot_pool.set_worker_idle("worker-1")
+        self.warm_bot_pool.dispatch(7)
+
+        self.assertEqual(self.warm_bot_pool.claim_bot_id("worker-1", timeout_seconds=1), 7)
+
+        self.assertEqual(self.warm_bot_pool.num_pending_bots(), 0)
+        self.assertEqual(self.warm_bot_pool.num_idle_workers(), 0)
+        self.assertEqual(self.redis_client.lrange(self.warm_bot_pool.processing_bot_ids_key("worker-1"), 0, -1), [b"7"])
+        self.assertEqual(self.warm_bot_pool.worker_for_bot(7), "worker-1")
+
+    def test_release_puts_claimed_bot_back_at_the_front(self):
+        for worker_name in ("worker-1", "worker-2"):
+            self.warm_bot_pool.set_worker_idle(worker_name)
+        self.warm_bot_pool.dispatch(7)
+        self.warm_bot_pool.dispatch(8)
+        self.warm_bot_pool.claim_bot_id("worker-1", timeout_seconds=1)
+
+        self.assertEqual(self.warm_bot_pool.release_claimed_bots("worker-1"), [7])
+
+        self.assertEqual(self.warm_bot_pool.worker_for_bot(7), None)
+        self.assertEqual(self.warm_bot_pool.claim_bot_id("worker-2", timeout_seconds=1), 7)
+
+    def test_recover_acknowledges_started_bots(self):
+        self.warm_bot_pool.set_worker_idle("worker-1")
+        self.warm_bot_pool.dispatch(7)
+        self.warm_bot_pool.claim_bot_id("worker-1", timeout_seconds=1)
+
+        self.assertEqual(self.warm_bot_pool.recover_lost_bots(lambda bot_id: True), [])
+
+        self.assertFalse(self.redis_client.exists(self.warm_bot_pool.processing_bot_ids_key("worker-1")))
+        self.assertIsNone(self.redis_client.zscore(self.warm_bot_pool.CLAIMED_AT_KEY, "worker-1"))
+        self.assertEqual(self.warm_bot_pool.num_pending_bots(), 0)
+        self.assertEqual(self.warm_bot_pool.worker_for_bot(7), "worker-1")
+
+    def test_recover_requeues_bots_that_never_started(self):
+        self.warm_bot_pool.set_worker_idle("worker-1")
+        self.warm_bot_pool.dispatch(7)
+        self.warm_bot_pool.claim_bot_id("worker-1", timeout_seconds=1)
+
+        # Not timed out yet, the worker may still be starting the bot
+        self.assertEqual(self.warm_bot_pool.recover_lost_bots(lambda bot_id: False), [])
+        self.assertEqual(self.warm_bot_pool.num_pending_bots(), 0)
+
+        self.redis_client.zadd(self.warm_bot_pool.CLAIMED_AT_KEY, {"worker-1": time.time() - WarmBotPool.CLAIM_TIMEOUT_SECONDS - 1})
+        self.assertEqual(self.warm_bot_pool.recover_lost_bots(lambda bot_id: False), [7])
+
+        self.warm_bot_pool.set_worker_idle("worker-2")
+        self.assertEqual(self.warm_bot_pool.claim_bot_id("worker-2", timeout_seconds=1), 7)
+
+    def test_recover_times_out_claims_that_were_never_recorded(self):
+        # A worker that died right after taking the bot off the pending list
+        self.redis_client.rpush(self.warm_bot_pool.processing_bot_ids_key("worker-1"), 7)
+
+        self.assertEqual(self.warm_bot_pool.recover_lost_bots(lambda bot_id: False), [])
+        self.assertIsNotNone(self.redis_client.zscore(self.warm_bot_pool.CLAIMED_AT_KEY, "worker-1"))
+
+        self.redis_client.zadd(self.warm_bot_pool.CLAIMED_AT_KEY, {"worker-1": time.time() - WarmBotPool.CLAIM_TIMEOUT_SECONDS - 1})
+        self.assertEqual(self.warm_bot_pool.recover_lost_bots(lambda bot_id: False), [7])
+        self.assertEqual(self.warm_bot_pool.num_pending_bots(), 1)
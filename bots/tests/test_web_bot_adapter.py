@@ -0,0 +1,59 @@
+import struct
+from unittest.mock import MagicMock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from bots.bot_controller.automatic_leave_configuration import AutomaticLeaveConfiguration
+from bots.models import RecordingViews
+from bots.web_bot_adapter import WebBotAdapter
+
+
+def audio_message(timestamp_us, stream_id, audio_data):
+    # Laid out the way the chromedriver payloads' sendAudio lays it out
+    stream_id_bytes = stream_id.encode("utf-8")
+    return struct.pack("<iqi", 3, timestamp_us, len(stream_id_bytes)) + stream_id_bytes + audio_data
+
+
+class TestWebBotAdapterAudioSources(SimpleTestCase):
+    def setUp(self):
+        self.add_mixed_audio_chunk_callback = MagicMock()
+        self.adapter = WebBotAdapter(
+            display_name="Test bot",
+            send_message_callback=MagicMock(),
+            meeting_url="https://meet.google.com/abc-defg-hij",
+            add_video_frame_callback=MagicMock(),
+            wants_any_video_frames_callback=lambda: True,
+            add_mixed_audio_chunk_callback=self.add_mixed_audio_chunk_callback,
+            add_encoded_mp4_chunk_callback=MagicMock(),
+            upsert_caption_callback=MagicMock(),
+            automatic_leave_configuration=AutomaticLeaveConfiguration(),
+            recording_view=RecordingViews.SPEAKER_VIEW,
+            should_create_debug_recording=False,
+        )
+
+    def test_each_stream_gets_its_own_audio_source(self):
+        # Google Meet stream ids and Teams track ids are strings, none of them numeric
+        stream_ids = ["{6b1d2c3e-8f0a-4b5c-9d7e-1f2a3b4c5d6e}", "a1b2c3d4-e5f6-7890-abcd-ef0123456789", "mixed"]
+        sent_audio = {}
+        for timestamp_index in range(3):
+            for stream_index, stream_id in enumerate(stream_ids):
+                audio_data = np.full(480, (stream_index + 1) / 10, dtype=np.float32).tobytes()
+                sent_audio[(stream_id, timestamp_index)] = audio_data
+                self.adapter.process_audio_frame(audio_message(timestamp_index * 10_000, stream_id, audio_data))
+
+        calls = [call.args for call in self.add_mixed_audio_chunk_callback.call_args_list]
+        self.assertEqual(len(calls), 9)
+        # Numbered in the order they first sent audio, and each stream keeps its number
+        self.assertEqual([audio_source_id for _, _, audio_source_id in calls], [0, 1, 2] * 3)
+        for call_index, (chunk, timestamp_ns, audio_source_id) in enumerate(calls):
+            timestamp_index = call_index // 3
+            self.assertEqual(chunk, sent_audio[(stream_ids[audio_source_id], timestamp_index)])
+            self.assertEqual(timestamp_ns, timestamp_index * 10_000 * 1000)
+
+    def test_stream_that_comes_back_keeps_its_audio_source(self):
+        audio_data = np.zeros(480, dtype=np.float32).tobytes()
+        for stream_id in ["first", "second", "first", "third", "second"]:
+            self.adapter.process_audio_frame(audio_message(0, stream_id, audio_data))
+
+        self.assertEqual([call.args[2] for call in self.add_mixed_audio_chunk_callback.call_args_list], [0, 1, 0, 2, 1])
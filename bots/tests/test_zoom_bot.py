@@ -959,24 +959,15 @@ class TestZoomBot(TransactionTestCase):
         self.assertIsNotNone(utterance.transcription)
         print("utterance.transcription = ", utterance.transcription)
 
-        # Verify the bot adapter received the media
-        controller.adapter.audio_raw_data_sender.send.assert_has_calls(
-            [
-                # First call from audio request
-                call(
-                    mp3_to_pcm(self.test_mp3_bytes, sample_rate=44100),
-                    44100,
-                    mock_zoom_sdk_adapter.ZoomSDKAudioChannel_Mono,
-                ),
-                # Second call from text-to-speech
-                call(
-                    pcm_speech_data,
-                    44100,
-                    mock_zoom_sdk_adapter.ZoomSDKAudioChannel_Mono,
-                ),
-            ],
-            any_order=True,
+        # Verify the bot adapter received the media, the audio request and then the text-to-speech, sent in 20ms frames
+        audio_send_calls = controller.adapter.audio_raw_data_sender.send.call_args_list
+        self.assertEqual(
+            b"".join(audio_send_call.args[0] for audio_send_call in audio_send_calls),
+            mp3_to_pcm(self.test_mp3_bytes, sample_rate=44100) + pcm_speech_data,
         )
+        for audio_send_call in audio_send_calls:
+            self.assertLessEqual(len(audio_send_call.args[0]), 44100 * 20 // 1000 * 2)
+            self.assertEqual(audio_send_call.args[1:], (44100, mock_zoom_sdk_adapter.ZoomSDKAudioChannel_Mono))
 
         yuv_image, yuv_image_width, yuv_image_height = png_to_yuv420_frame(self.test_png_bytes)
         controller.adapter.video_sender.sendVideoFrame.assert_has_calls(
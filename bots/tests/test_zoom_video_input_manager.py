@@ -0,0 +1,15 @@
+import zoom_meeting_sdk as zoom
+from django.test import SimpleTestCase
+
+from bots.zoom_bot_adapter.video_input_manager import zoom_sdk_resolution_for_frame_size
+
+
+class TestZoomSDKResolutionForFrameSize(SimpleTestCase):
+    def test_subscribes_at_180p_without_a_frame_size(self):
+        self.assertEqual(zoom_sdk_resolution_for_frame_size(None), zoom.ZoomSDKResolution_180P)
+
+    def test_subscribes_at_the_smallest_resolution_covering_the_frame_size(self):
+        self.assertEqual(zoom_sdk_resolution_for_frame_size((320, 180)), zoom.ZoomSDKResolution_180P)
+        self.assertEqual(zoom_sdk_resolution_for_frame_size((640, 360)), zoom.ZoomSDKResolution_360P)
+        self.assertEqual(zoom_sdk_resolution_for_frame_size((1280, 720)), zoom.ZoomSDKResolution_720P)
+        self.assertEqual(zoom_sdk_resolution_for_frame_size((1920, 1080)), zoom.ZoomSDKResolution_1080P)
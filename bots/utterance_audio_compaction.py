@@ -0,0 +1,108 @@
+import numpy as np
+
+FRAME_DURATION_MS = 30
+# Frames quieter than this are silence, the same threshold IndividualAudioInputManager uses
+SILENCE_RMS_THRESHOLD = 0.01
+# Kept around speech, so quiet starts and ends of words aren't cut off
+SPEECH_PADDING_MS = 300
+# Pauses longer than this, between speech, are shortened to this
+MAX_PAUSE_MS = 1000
+DOWNSAMPLING_FILTER_TAPS_PER_FACTOR = 16
+
+
+def speech_segments(samples, sample_rate):
+    """
+    Finds the parts of the audio to keep for transcription.
+
+    Returns a list of (start sample, end sample) pairs. Silence before the first speech and after the last is dropped, and
+    pauses longer than MAX_PAUSE_MS are shortened, keeping half of MAX_PAUSE_MS at each end. If there's no speech at all the
+    whole audio is kept, so the transcription provider still gets to decide.
+    """
+    frame_length = sample_rate * FRAME_DURATION_MS // 1000
+    num_frames = len(samples) // frame_length
+    if num_frames == 0:
+        return [(0, len(samples))]
+
+    frames = samples[: num_frames * frame_length].reshape(num_frames, frame_length).astype(np.float32)
+    frame_rms = np.sqrt(np.einsum("ij,ij->i", frames, frames) / frame_length) / 32768
+    speech_frame_indices = np.flatnonzero(frame_rms >= SILENCE_RMS_THRESHOLD)
+    if len(speech_frame_indices) == 0:
+        return [(0, len(samples))]
+
+    padding_frames = SPEECH_PADDING_MS // FRAME_DURATION_MS
+    # What's kept at each end of a pause that's shortened
+    pause_padding_frames = max(padding_frames, MAX_PAUSE_MS // FRAME_DURATION_MS // 2)
+    # Runs of speech frames, split wherever the pause between them is too long to keep whole
+    long_pause_indices = np.flatnonzero(np.diff(speech_frame_indices) - 1 > 2 * pause_padding_frames)
+    run_starts = speech_frame_indices[np.concatenate([[0], long_pause_indices + 1])]
+    run_ends = speech_frame_indices[np.concatenate([long_pause_indices, [len(speech_frame_indices) - 1]])] + 1
+
+    segments = []
+    for run_index, (run_start, run_end) in enumerate(zip(run_starts, run_ends)):
+        start_frame = max(run_start - (padding_frames if run_index == 0 else pause_padding_frames), 0)
+        end_frame = min(run_end + (padding_frames if run_index == len(run_starts) - 1 else pause_padding_frames), num_frames)
+        segments.append((int(start_frame) * frame_length, int(end_frame) * frame_length))
+    # Samples after the last whole frame go with it
+    if segments[-1][1] == num_frames * frame_length:
+        segments[-1] = (segments[-1][0], len(samples))
+    return segments
+
+
+def downsample(samples, sample_rate, target_sample_rate):
+    """Low pass filters and decimates int16 samples. Only whole number ratios are supported, otherwise the samples are returned as is."""
+    if target_sample_rate >= sample_rate or sample_rate % target_sample_rate != 0:
+        return samples, sample_rate
+    factor = sample_rate // target_sample_rate
+    # Windowed sinc low pass filter at the new Nyquist frequency
+    num_taps = DOWNSAMPLING_FILTER_TAPS_PER_FACTOR * factor + 1
+    tap_positions = np.arange(num_taps) - (num_taps - 1) / 2
+    taps = np.sinc(tap_positions / factor) * np.hamming(num_taps)
+    taps /= taps.sum()
+    filtered = np.convolve(samples.astype(np.float32), taps.astype(np.float32), mode="same")[::factor]
+    return np.clip(np.round(filtered), -32768, 32767).astype(np.int16), target_sample_rate
+
+
+def compact_speech(pcm_data, sample_rate, target_sample_rate):
+    """
+    Prepares raw 16-bit mono PCM utterance audio for transcription, by cutting out silence and downsampling it.
+
+    Returns (pcm data, sample rate, time map). The time map is a list of (compacted seconds, original seconds) pairs, one
+    for the start of each kept segment. restore_timestamps uses it to put word timestamps back on the original audio's
+    timeline.
+    """
+    samples = np.frombuffer(pcm_data, dtype=np.int16)
+    segments = speech_segments(samples, sample_rate)
+
+    time_map = []
+    compacted_samples = 0
+    for start, end in segments:
+        time_map.append((compacted_samples / sample_rate, start / sample_rate))
+        compacted_samples += end - start
+    if len(segments) == 1 and segments[0] == (0, len(samples)):
+        compacted = samples
+    else:
+        compacted = np.concatenate([samples[start:end] for start, end in segments])
+
+    compacted, compacted_sample_rate = downsample(compacted, sample_rate, target_sample_rate)
+    return compacted.tobytes(), compacted_sample_rate, time_map
+
+
+def original_time(compacted_time, time_map):
+    compacted_starts = [compacted_start for compacted_start, _ in time_map]
+    segment_index = max(np.searchsorted(compacted_starts, compacted_time, side="right") - 1, 0)
+    compacted_start, original_start = time_map[segment_index]
+    return round(original_start + compacted_time - compacted_start, 3)
+
+
+def restore_timestamps(transcription, time_map):
+    """Maps every start and end time in a transcription, the words and anything else that has them, back to the original audio's timeline"""
+    if isinstance(transcription, list):
+        for item in transcription:
+            restore_timestamps(item, time_map)
+    elif isinstance(transcription, dict):
+        for key, value in transcription.items():
+            if key in ("start", "end") and isinstance(value, (int, float)):
+                transcription[key] = original_time(value, time_map)
+            else:
+                restore_timestamps(value, time_map)
+    return transcription
@@ -0,0 +1,85 @@
+import logging
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from .models import Utterance
+from .utils import pcm_to_flac
+
+logger = logging.getLogger(__name__)
+
+
+class UtteranceAudioS3Storage(S3Boto3Storage):
+    bucket_name = settings.AWS_UTTERANCE_AUDIO_STORAGE_BUCKET_NAME
+    location = "utterance_audio"
+
+
+class UtteranceAudioStore:
+    """
+    Keeps utterance audio in object storage so that the utterance row only holds a key.
+    Wraps a django storage backend (S3 or the local filesystem).
+    """
+
+    PRESIGNED_URL_EXPIRATION_SECONDS = 3600
+
+    def __init__(self, storage, compression="flac"):
+        self.storage = storage
+        self.compression = compression
+
+    def save(self, key, pcm_data, sample_rate):
+        """
+        Save raw PCM audio under the given key, compressing it if configured.
+
+        Args:
+            key (str): Key to store the audio under, without an extension
+            pcm_data (bytes): Raw 16-bit mono PCM audio data
+            sample_rate (int): Sample rate of the PCM audio in Hz
+
+        Returns:
+            tuple: (storage key, Utterance.AudioFormat of the stored audio)
+        """
+        if self.compression == "flac":
+            audio_data = pcm_to_flac(pcm_data, sample_rate=sample_rate)
+            audio_format = Utterance.AudioFormat.FLAC
+            key = f"{key}.flac"
+        else:
+            audio_data = pcm_data
+            audio_format = Utterance.AudioFormat.PCM
+            key = f"{key}.pcm"
+
+        saved_key = self.storage.save(key, ContentFile(audio_data))
+        logger.info(f"Saved utterance audio to {saved_key} ({len(pcm_data)} bytes of pcm stored as {len(audio_data)} bytes)")
+        return saved_key, audio_format
+
+    def open(self, key):
+        return self.storage.open(key, "rb")
+
+    def url(self, key):
+        # Only object storage can hand the transcription provider a url to fetch the audio from directly
+        if not isinstance(self.storage, S3Boto3Storage):
+            return None
+        return self.storage.url(key, expire=self.PRESIGNED_URL_EXPIRATION_SECONDS)
+
+    def delete(self, key):
+        self.storage.delete(key)
+
+
+@lru_cache(maxsize=None)
+def get_utterance_audio_store():
+    """
+    Returns the configured UtteranceAudioStore, or None if utterance audio should be kept in the database.
+    """
+    backend = settings.UTTERANCE_AUDIO_STORAGE_BACKEND
+    if backend == "database":
+        return None
+    if backend == "s3":
+        storage = UtteranceAudioS3Storage()
+    elif backend == "local":
+        storage = FileSystemStorage(location=settings.UTTERANCE_AUDIO_LOCAL_PATH)
+    else:
+        raise ValueError(f"Invalid utterance audio storage backend: {backend}")
+
+    return UtteranceAudioStore(storage, compression=settings.UTTERANCE_AUDIO_COMPRESSION)
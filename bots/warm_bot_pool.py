@@ -0,0 +1,156 @@
+import logging
+import os
+import time
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+def warm_bot_pool_size():
+    return int(os.getenv("WARM_BOT_POOL_SIZE", "0"))
+
+
+def warm_bot_pool_enabled():
+    return warm_bot_pool_size() > 0
+
+
+class WarmBotPool:
+    """
+    Bookkeeping for pre-started bot processes, kept in Redis.
+
+    Launching a bot pushes its id onto a list, and idle workers block on that list. A BLMOVE hands each id to exactly one
+    worker, moving it onto that worker's own processing list, so a bot can't be claimed twice and isn't lost if the worker
+    dies before the bot starts. Once the bot has a heartbeat its claim is acknowledged, and claims that go unacknowledged
+    for CLAIM_TIMEOUT_SECONDS are put back on the pending list. Idle workers keep a heartbeat in a sorted set so the
+    scheduler knows how many are ready, and workers that have been requested but haven't registered yet are tracked
+    separately so the scheduler doesn't overshoot while pods are starting.
+    """
+
+    PENDING_BOT_IDS_KEY = "warm_bot_pool:pending_bot_ids"
+    IDLE_WORKERS_KEY = "warm_bot_pool:idle_workers"
+    STARTING_WORKERS_KEY = "warm_bot_pool:starting_workers"
+    CLAIMED_BOT_WORKER_KEY_PREFIX = "warm_bot_pool:worker_for_bot:"
+    PROCESSING_BOT_IDS_KEY_PREFIX = "warm_bot_pool:processing_bot_ids:"
+    CLAIMED_AT_KEY = "warm_bot_pool:claimed_at"
+
+    # An idle worker that hasn't refreshed its heartbeat in this long is assumed dead
+    WORKER_HEARTBEAT_TIMEOUT_SECONDS = 60
+    # A requested worker that hasn't registered in this long is assumed to have failed to start
+    WORKER_STARTUP_TIMEOUT_SECONDS = 600
+    # A claimed bot that hasn't started in this long is assumed lost with its worker, and is handed to another one
+    CLAIM_TIMEOUT_SECONDS = 120
+
+    # Counts the idle workers and the bots already waiting for one in the same step as pushing the bot, so concurrent
+    # launches can't queue more bots than there are workers to take them
+    DISPATCH_SCRIPT = """
+    redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", ARGV[1])
+    if redis.call("ZCARD", KEYS[1]) <= redis.call("LLEN", KEYS[2]) then
+        return 0
+    end
+    redis.call("RPUSH", KEYS[2], ARGV[2])
+    return 1
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.dispatch_script = redis_client.register_script(self.DISPATCH_SCRIPT)
+
+    @classmethod
+    def from_env(cls):
+        redis_url = os.getenv("REDIS_URL") + ("?ssl_cert_reqs=none" if os.getenv("DISABLE_REDIS_SSL") else "")
+        return cls(redis.from_url(redis_url))
+
+    def remove_stale_workers(self):
+        now = time.time()
+        self.redis_client.zremrangebyscore(self.IDLE_WORKERS_KEY, "-inf", now - self.WORKER_HEARTBEAT_TIMEOUT_SECONDS)
+        self.redis_client.zremrangebyscore(self.STARTING_WORKERS_KEY, "-inf", now - self.WORKER_STARTUP_TIMEOUT_SECONDS)
+
+    def num_idle_workers(self):
+        self.remove_stale_workers()
+        return self.redis_client.zcard(self.IDLE_WORKERS_KEY)
+
+    def num_starting_workers(self):
+        self.remove_stale_workers()
+        return self.redis_client.zcard(self.STARTING_WORKERS_KEY)
+
+    def num_pending_bots(self):
+        return self.redis_client.llen(self.PENDING_BOT_IDS_KEY)
+
+    def dispatch(self, bot_id):
+        """Hands the bot to an idle worker. Returns False if there aren't enough idle workers, so the caller can cold start it instead."""
+        stale_before = time.time() - self.WORKER_HEARTBEAT_TIMEOUT_SECONDS
+        return bool(self.dispatch_script(keys=[self.IDLE_WORKERS_KEY, self.PENDING_BOT_IDS_KEY], args=[stale_before, bot_id]))
+
+    def mark_worker_starting(self, worker_name):
+        self.redis_client.zadd(self.STARTING_WORKERS_KEY, {worker_name: time.time()})
+
+    def set_worker_idle(self, worker_name):
+        pipeline = self.redis_client.pipeline()
+        pipeline.zrem(self.STARTING_WORKERS_KEY, worker_name)
+        pipeline.zadd(self.IDLE_WORKERS_KEY, {worker_name: time.time()})
+        pipeline.execute()
+
+    def remove_worker(self, worker_name):
+        pipeline = self.redis_client.pipeline()
+        pipeline.zrem(self.STARTING_WORKERS_KEY, worker_name)
+        pipeline.zrem(self.IDLE_WORKERS_KEY, worker_name)
+        pipeline.execute()
+
+    def processing_bot_ids_key(self, worker_name):
+        return f"{self.PROCESSING_BOT_IDS_KEY_PREFIX}{worker_name}"
+
+    def claim_bot_id(self, worker_name, timeout_seconds):
+        """Blocks until a bot is dispatched to this worker or the timeout passes, in which case it returns None"""
+        result = self.redis_client.blmove(self.PENDING_BOT_IDS_KEY, self.processing_bot_ids_key(worker_name), timeout_seconds, "LEFT", "RIGHT")
+        if result is None:
+            return None
+
+        bot_id = int(result)
+        pipeline = self.redis_client.pipeline()
+        pipeline.zrem(self.IDLE_WORKERS_KEY, worker_name)
+        pipeline.zadd(self.CLAIMED_AT_KEY, {worker_name: time.time()})
+        # Lets the heartbeat timeout job find the pod that's running the bot
+        pipeline.set(f"{self.CLAIMED_BOT_WORKER_KEY_PREFIX}{bot_id}", worker_name, ex=60 * 60 * 24)
+        pipeline.execute()
+        return bot_id
+
+    def release_claimed_bots(self, worker_name):
+        """Puts any bots this worker claimed back at the front of the pending list, for a worker that's stopping before running them"""
+        released_bot_ids = []
+        while True:
+            bot_id = self.redis_client.lmove(self.processing_bot_ids_key(worker_name), self.PENDING_BOT_IDS_KEY, "RIGHT", "LEFT")
+            if bot_id is None:
+                break
+            released_bot_ids.append(int(bot_id))
+            self.redis_client.delete(f"{self.CLAIMED_BOT_WORKER_KEY_PREFIX}{int(bot_id)}")
+        self.redis_client.zrem(self.CLAIMED_AT_KEY, worker_name)
+        return released_bot_ids
+
+    def recover_lost_bots(self, bot_has_started):
+        """
+        Acknowledges claims whose bot has started, and puts bots back on the pending list if they were claimed more than
+        CLAIM_TIMEOUT_SECONDS ago and still haven't started. bot_has_started(bot_id) says whether the bot got far enough
+        that it no longer needs a worker. Returns the ids of the bots put back.
+        """
+        now = time.time()
+        requeued_bot_ids = []
+        for processing_bot_ids_key in self.redis_client.scan_iter(match=f"{self.PROCESSING_BOT_IDS_KEY_PREFIX}*"):
+            worker_name = processing_bot_ids_key.decode("utf-8").removeprefix(self.PROCESSING_BOT_IDS_KEY_PREFIX)
+            for bot_id in self.redis_client.lrange(processing_bot_ids_key, 0, -1):
+                if bot_has_started(int(bot_id)):
+                    self.redis_client.lrem(processing_bot_ids_key, 0, bot_id)
+            if self.redis_client.llen(processing_bot_ids_key) == 0:
+                self.redis_client.zrem(self.CLAIMED_AT_KEY, worker_name)
+                continue
+
+            # A worker that died between claiming the bot and recording the claim has no claim time, so its timeout starts now
+            self.redis_client.zadd(self.CLAIMED_AT_KEY, {worker_name: now}, nx=True)
+            if self.redis_client.zscore(self.CLAIMED_AT_KEY, worker_name) > now - self.CLAIM_TIMEOUT_SECONDS:
+                continue
+            requeued_bot_ids.extend(self.release_claimed_bots(worker_name))
+        return requeued_bot_ids
+
+    def worker_for_bot(self, bot_id):
+        worker_name = self.redis_client.get(f"{self.CLAIMED_BOT_WORKER_KEY_PREFIX}{bot_id}")
+        return worker_name.decode("utf-8") if worker_name else None
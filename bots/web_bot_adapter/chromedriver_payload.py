@@ -0,0 +1,54 @@
+import logging
+import os
+from functools import lru_cache
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Libraries the chromedriver payloads depend on, loaded before the payload. The image vendors them at build time (see the Dockerfile).
+PAYLOAD_LIBRARIES = {
+    "protobuf.min.js": "https://cdnjs.cloudflare.com/ajax/libs/protobufjs/7.4.0/protobuf.min.js",
+    "pako.min.js": "https://cdnjs.cloudflare.com/ajax/libs/pako/2.1.0/pako.min.js",
+}
+
+BOTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def payload_libraries_dir():
+    return os.getenv("CHROMEDRIVER_PAYLOAD_LIBRARIES_DIR", "/opt/chromedriver_payload_libraries")
+
+
+def read_payload_library(file_name, url):
+    vendored_path = os.path.join(payload_libraries_dir(), file_name)
+    if os.path.exists(vendored_path):
+        with open(vendored_path, "r") as file:
+            return file.read()
+
+    # Not vendored, e.g. when running outside the docker image
+    logger.info(f"{file_name} is not vendored at {vendored_path}, downloading it from {url}")
+    response = requests.get(url, timeout=30)
+    if response.status_code != 200:
+        raise Exception(f"Failed to download library from {url}")
+    return response.text
+
+
+@lru_cache(maxsize=None)
+def payload_libraries_code():
+    """Code for all the payload libraries, read once per process"""
+    return "".join(read_payload_library(file_name, url) + "\n" for file_name, url in PAYLOAD_LIBRARIES.items())
+
+
+@lru_cache(maxsize=None)
+def payload_code(payload_file_name):
+    """Libraries followed by the payload, read once per process. payload_file_name is relative to the bots directory."""
+    with open(os.path.join(BOTS_DIR, payload_file_name), "r") as file:
+        return payload_libraries_code() + file.read()
+
+
+def chromedriver_init_script(initial_data_code, payload_file_name):
+    # Initial data goes first so the payload can read it, the rest is the same for every bot
+    return f"""
+            {initial_data_code}
+            {payload_code(payload_file_name)}
+        """
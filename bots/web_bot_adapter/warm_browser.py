@@ -0,0 +1,66 @@
+import logging
+import os
+
+from pyvirtualdisplay import Display
+from selenium import webdriver
+
+logger = logging.getLogger(__name__)
+
+# Display and Chrome started ahead of time by a warm bot worker, waiting to be handed to the adapter
+prewarmed_display = None
+prewarmed_driver = None
+
+
+def chrome_options():
+    options = webdriver.ChromeOptions()
+
+    options.add_argument("--use-fake-ui-for-media-stream")
+    options.add_argument("--start-maximized")
+    options.add_argument("--no-sandbox")
+    # options.add_argument('--headless=new')
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-application-cache")
+    options.add_argument("--disable-setuid-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+
+    return options
+
+
+def prewarm_browser():
+    """Starts the virtual display and Chrome before the worker knows which bot it will run"""
+    global prewarmed_display, prewarmed_driver
+
+    if os.environ.get("DISPLAY") is None:
+        # Starting the display sets DISPLAY, so the adapter will reuse it instead of starting its own
+        prewarmed_display = Display(visible=0, size=(1920, 1080))
+        prewarmed_display.start()
+
+    prewarmed_driver = webdriver.Chrome(options=chrome_options())
+    logger.info(f"Prewarmed web driver server initialized at port {prewarmed_driver.service.port}")
+
+
+def take_prewarmed_driver():
+    """Returns the prewarmed driver, if there is one. It can only be taken once."""
+    global prewarmed_driver
+
+    driver = prewarmed_driver
+    prewarmed_driver = None
+    return driver
+
+
+def discard_prewarmed_browser():
+    """Shuts down a prewarmed browser that turned out not to be needed, e.g. because the bot is joining a Zoom meeting"""
+    global prewarmed_display
+
+    driver = take_prewarmed_driver()
+    if driver:
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.info(f"Error quitting prewarmed driver: {e}")
+
+    if prewarmed_display:
+        prewarmed_display.stop()
+        prewarmed_display = None
@@ -3,26 +3,49 @@ import datetime
 import json
 import logging
 import os
+import struct
 import threading
 import time
 from time import sleep
 
 import numpy as np
-import requests
 from pyvirtualdisplay import Display
 from selenium import webdriver
 from websockets.sync.server import serve
 
 from bots.bot_adapter import BotAdapter
 from bots.bot_controller.automatic_leave_configuration import AutomaticLeaveConfiguration
+from bots.bot_metrics import bot_metrics
+from bots.i420_scaler import I420Scaler, i420_frame_length
 from bots.models import RecordingViews
-from bots.utils import half_ceil, scale_i420
 
+from .chromedriver_payload import chromedriver_init_script
 from .debug_screen_recorder import DebugScreenRecorder
 from .ui_methods import UiRequestToJoinDeniedException, UiRetryableException, UiRetryableExpectedException
+from .warm_browser import chrome_options, take_prewarmed_driver
 
 logger = logging.getLogger(__name__)
 
+# Little-endian headers of the binary messages sent by the chromedriver payloads, after the 4 byte message type
+VIDEO_MESSAGE_HEADER = struct.Struct("<qi")  # timestamp, stream ID length
+VIDEO_MESSAGE_DIMENSIONS = struct.Struct("<ii")  # width, height, after the stream ID
+AUDIO_MESSAGE_HEADER = struct.Struct("<qi")  # timestamp, stream ID length
+CAPTURED_MESSAGE_LENGTH = struct.Struct("<I")
+
+
+def write_captured_websocket_message(capture_file, message):
+    capture_file.write(CAPTURED_MESSAGE_LENGTH.pack(len(message)))
+    capture_file.write(message)
+
+
+def read_captured_websocket_messages(capture_file):
+    while True:
+        length_bytes = capture_file.read(CAPTURED_MESSAGE_LENGTH.size)
+        if len(length_bytes) < CAPTURED_MESSAGE_LENGTH.size:
+            return
+        (length,) = CAPTURED_MESSAGE_LENGTH.unpack(length_bytes)
+        yield capture_file.read(length)
+
 
 class WebBotAdapter(BotAdapter):
     def __init__(
@@ -39,19 +62,28 @@ class WebBotAdapter(BotAdapter):
         automatic_leave_configuration: AutomaticLeaveConfiguration,
         recording_view: RecordingViews,
         should_create_debug_recording: bool,
+        repeat_video_frame_callback=None,
+        video_frame_size=(1920, 1080),
+        video_frame_rate=30,
+        record_video=True,
     ):
         self.display_name = display_name
         self.send_message_callback = send_message_callback
         self.add_mixed_audio_chunk_callback = add_mixed_audio_chunk_callback
         self.add_video_frame_callback = add_video_frame_callback
         self.wants_any_video_frames_callback = wants_any_video_frames_callback
+        self.repeat_video_frame_callback = repeat_video_frame_callback
         self.add_encoded_mp4_chunk_callback = add_encoded_mp4_chunk_callback
         self.upsert_caption_callback = upsert_caption_callback
         self.recording_view = recording_view
 
         self.meeting_url = meeting_url
 
-        self.video_frame_size = (1920, 1080)
+        self.video_frame_size = video_frame_size
+        self.video_frame_rate = video_frame_rate
+        # When false, the payload doesn't capture any video, so there are no frames to copy, send or scale
+        self.record_video = record_video
+        self.video_frame_scaler = I420Scaler(self.video_frame_size)
 
         self.driver = None
 
@@ -73,6 +105,8 @@ class WebBotAdapter(BotAdapter):
         self.participants_info = {}
         self.only_one_participant_in_meeting_at = None
         self.video_frame_ticker = 0
+        # The pipeline's audio mixer identifies sources by number, the browser identifies streams by a string id
+        self.audio_source_ids_by_stream_id = {}
 
         self.automatic_leave_configuration = automatic_leave_configuration
 
@@ -99,54 +133,61 @@ class WebBotAdapter(BotAdapter):
     def process_video_frame(self, message):
         self.last_media_message_processed_time = time.time()
         if len(message) > 24:  # Minimum length check
-            # Bytes 4-12 contain the timestamp
-            timestamp = int.from_bytes(message[4:12], byteorder="little")
-
-            # Get stream ID length and string
-            stream_id_length = int.from_bytes(message[12:16], byteorder="little")
-            message[16 : 16 + stream_id_length].decode("utf-8")
+            # Header is type (4 bytes), timestamp (8 bytes), stream ID length (4 bytes), stream ID, width (4 bytes), height (4 bytes).
+            # Parsed in place so the frame data isn't copied.
+            timestamp, stream_id_length = VIDEO_MESSAGE_HEADER.unpack_from(message, 4)
 
             # Get width and height after stream ID
             offset = 16 + stream_id_length
-            width = int.from_bytes(message[offset : offset + 4], byteorder="little")
-            height = int.from_bytes(message[offset + 4 : offset + 8], byteorder="little")
+            width, height = VIDEO_MESSAGE_DIMENSIONS.unpack_from(message, offset)
 
             # Keep track of the video frame dimensions
             if self.video_frame_ticker % 300 == 0:
                 logger.info(f"video dimensions {width} {height} message length {len(message) - offset - 8}")
             self.video_frame_ticker += 1
 
-            # Scale frame to 1920x1080
-            expected_video_data_length = width * height + 2 * half_ceil(width) * half_ceil(height)
-            video_data = np.frombuffer(message[offset + 8 :], dtype=np.uint8)
+            # Scale frame to the recording's frame size
+            expected_video_data_length = i420_frame_length((width, height))
+            video_data = memoryview(message)[offset + 8 :]
 
             # Check if len(video_data) does not agree with width and height
             if len(video_data) == expected_video_data_length:  # I420 format uses 1.5 bytes per pixel
-                scaled_i420_frame = scale_i420(video_data, (width, height), (1920, 1080))
+                with bot_metrics.timer("frame_scaling_duration_ms", source="web"):
+                    scaled_i420_frame = self.video_frame_scaler.scale(video_data, (width, height))
                 if self.wants_any_video_frames_callback() and self.send_frames:
                     self.add_video_frame_callback(scaled_i420_frame, timestamp * 1000)
 
             else:
                 logger.info(f"video data length does not agree with width and height {len(video_data)} {width} {height}")
 
+    def audio_source_id(self, stream_id):
+        """Numbers streams in the order their audio first arrives, so each one keeps its own pad on the mixer"""
+        audio_source_id = self.audio_source_ids_by_stream_id.get(stream_id)
+        if audio_source_id is None:
+            audio_source_id = self.audio_source_ids_by_stream_id[stream_id] = len(self.audio_source_ids_by_stream_id)
+            logger.info(f"Audio stream {stream_id} is audio source {audio_source_id}")
+        return audio_source_id
+
     def process_audio_frame(self, message):
         self.last_media_message_processed_time = time.time()
-        if len(message) > 12:
-            # Bytes 4-12 contain the timestamp
-            timestamp = int.from_bytes(message[4:12], byteorder="little")
-
-            # Bytes 12-16 contain the stream ID
-            stream_id = int.from_bytes(message[12:16], byteorder="little")
+        if len(message) > 16:
+            # Bytes 4-12 contain the timestamp, bytes 12-16 contain the stream ID length, followed by the stream ID
+            timestamp, stream_id_length = AUDIO_MESSAGE_HEADER.unpack_from(message, 4)
+            offset = 16 + stream_id_length
+            stream_id = message[16:offset].decode("utf-8")
 
-            # Convert the float32 audio data to numpy array
-            audio_data = np.frombuffer(message[16:], dtype=np.float32)
+            # View the float32 audio data in place, without copying it
+            audio_data = np.frombuffer(message, dtype=np.float32, offset=offset)
 
             # Only mark last_audio_message_processed_time if the audio data has at least one non-zero value
             if np.any(audio_data):
                 self.last_audio_message_processed_time = time.time()
 
-            if self.wants_any_video_frames_callback() and self.send_frames:
-                self.add_mixed_audio_chunk_callback(audio_data.tobytes(), timestamp * 1000, stream_id % 3)
+            # Not gated on wants_any_video_frames_callback, because audio only recordings never want video frames
+            if self.send_frames:
+                # The pipeline needs its own bytes object, this is the only copy of the audio data
+                # Each stream gets its own pad on the pipeline's audio mixer
+                self.add_mixed_audio_chunk_callback(message[offset:], timestamp * 1000, self.audio_source_id(stream_id))
 
     def handle_websocket(self, websocket):
         audio_format = None
@@ -155,10 +196,20 @@ class WebBotAdapter(BotAdapter):
         # Create frames directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
 
+        # Set WEBSOCKET_TRAFFIC_CAPTURE_PATH to record the raw messages, which benchmark_websocket_ingest can replay
+        capture_file = None
+        if os.getenv("WEBSOCKET_TRAFFIC_CAPTURE_PATH"):
+            capture_file = open(os.getenv("WEBSOCKET_TRAFFIC_CAPTURE_PATH"), "ab")
+
         try:
             for message in websocket:
+                if capture_file:
+                    write_captured_websocket_message(capture_file, message)
+
                 # Get first 4 bytes as message type
                 message_type = int.from_bytes(message[:4], byteorder="little")
+                bot_metrics.increment("websocket_messages_received_total", message_type=message_type)
+                bot_metrics.increment("websocket_bytes_received_total", len(message), message_type=message_type)
 
                 if message_type == 1:  # JSON
                     json_data = json.loads(message[4:].decode("utf-8"))
@@ -173,6 +224,11 @@ class WebBotAdapter(BotAdapter):
                         elif json_data.get("type") == "CaptionUpdate":
                             self.upsert_caption_callback(json_data["caption"])
 
+                        elif json_data.get("type") == "RepeatVideoFrame":
+                            # The page has no new video and wants the previous (filler) frame held, timestamp is in microseconds
+                            if self.repeat_video_frame_callback and self.wants_any_video_frames_callback() and self.send_frames:
+                                self.repeat_video_frame_callback(json_data["timestamp"] * 1000)
+
                         elif json_data.get("type") == "UsersUpdate":
                             for user in json_data["newUsers"]:
                                 user["active"] = user["humanized_status"] == "in_meeting"
@@ -211,6 +267,9 @@ class WebBotAdapter(BotAdapter):
                 self.last_websocket_message_processed_time = time.time()
         except Exception as e:
             logger.info(f"Websocket error: {e}")
+        finally:
+            if capture_file:
+                capture_file.close()
 
     def run_websocket_server(self):
         loop = asyncio.new_event_loop()
@@ -279,19 +338,6 @@ class WebBotAdapter(BotAdapter):
         )
 
     def init_driver(self):
-        options = webdriver.ChromeOptions()
-
-        options.add_argument("--use-fake-ui-for-media-stream")
-        options.add_argument("--start-maximized")
-        options.add_argument("--no-sandbox")
-        # options.add_argument('--headless=new')
-        options.add_argument("--disable-gpu")
-        options.add_argument("--disable-extensions")
-        options.add_argument("--disable-application-cache")
-        options.add_argument("--disable-setuid-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-blink-features=AutomationControlled")
-
         if self.driver:
             # Simulate closing browser window
             try:
@@ -305,35 +351,18 @@ class WebBotAdapter(BotAdapter):
                 logger.info(f"Error closing existing driver: {e}")
             self.driver = None
 
-        self.driver = webdriver.Chrome(options=options)
-        logger.info(f"web driver server initialized at port {self.driver.service.port}")
-
-        initial_data_code = f"window.initialData = {{websocketPort: {self.websocket_port}, addClickRipple: {'true' if self.should_create_debug_recording else 'false'}, recordingView: '{self.recording_view}'}}"
+        # A warm bot worker may have started Chrome before this bot was assigned to it, only the first attempt can use it
+        self.driver = take_prewarmed_driver()
+        if self.driver:
+            logger.info(f"using prewarmed web driver server at port {self.driver.service.port}")
+        else:
+            self.driver = webdriver.Chrome(options=chrome_options())
+            logger.info(f"web driver server initialized at port {self.driver.service.port}")
 
-        # Define the CDN libraries needed
-        CDN_LIBRARIES = ["https://cdnjs.cloudflare.com/ajax/libs/protobufjs/7.4.0/protobuf.min.js", "https://cdnjs.cloudflare.com/ajax/libs/pako/2.1.0/pako.min.js"]
+        initial_data_code = f"window.initialData = {{websocketPort: {self.websocket_port}, addClickRipple: {'true' if self.should_create_debug_recording else 'false'}, recordingView: '{self.recording_view}', recordingFrameWidth: {self.video_frame_size[0]}, recordingFrameHeight: {self.video_frame_size[1]}, recordingFrameRate: {self.video_frame_rate}, recordVideo: {'true' if self.record_video else 'false'}}}"
 
-        # Download all library code
-        libraries_code = ""
-        for url in CDN_LIBRARIES:
-            response = requests.get(url)
-            if response.status_code == 200:
-                libraries_code += response.text + "\n"
-            else:
-                raise Exception(f"Failed to download library from {url}")
-
-        # Get directory of current file
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        # Read your payload using path relative to current file
-        with open(os.path.join(current_dir, "..", self.get_chromedriver_payload_file_name()), "r") as file:
-            payload_code = file.read()
-
-        # Combine them ensuring libraries load first
-        combined_code = f"""
-            {initial_data_code}
-            {libraries_code}
-            {payload_code}
-        """
+        # Libraries and payload are read once per process and cached, so retries don't hit the disk or network again
+        combined_code = chromedriver_init_script(initial_data_code, self.get_chromedriver_payload_file_name())
 
         # Add the combined script to execute on new document
         self.driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": combined_code})
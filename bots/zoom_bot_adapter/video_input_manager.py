@@ -1,123 +1,29 @@
 import logging
 import time
 
-import cv2
-import numpy as np
 import zoom_meeting_sdk as zoom
 from gi.repository import GLib
 
+from bots.bot_metrics import bot_metrics
+from bots.filler_frames import FillerFrameSender
+from bots.i420_scaler import I420Scaler
+
 logger = logging.getLogger(__name__)
 
 
-def create_black_i420_frame(video_frame_size):
-    width, height = video_frame_size
-    # Ensure dimensions are even for proper chroma subsampling
-    if width % 2 != 0 or height % 2 != 0:
-        raise ValueError("Width and height must be even numbers for I420 format")
-
-    # Y plane (black = 0 in Y plane)
-    y_plane = np.zeros((height, width), dtype=np.uint8)
-
-    # U and V planes (black = 128 in UV planes)
-    # Both are quarter size of original due to 4:2:0 subsampling
-    u_plane = np.full((height // 2, width // 2), 128, dtype=np.uint8)
-    v_plane = np.full((height // 2, width // 2), 128, dtype=np.uint8)
-
-    # Concatenate all planes
-    yuv_frame = np.concatenate([y_plane.flatten(), u_plane.flatten(), v_plane.flatten()])
-
-    return yuv_frame.astype(np.uint8).tobytes()
-
-
-def scale_i420(frame, new_size):
-    new_width, new_height = new_size
-    """
-    Scales the given frame in I420 format to new_width x new_height while
-    preserving aspect ratio. If the aspect ratios do not match, letterboxes/pillarboxes
-    the scaled image on a black background.
-    
-    :param frame: Frame object with methods:
-        - GetStreamWidth()
-        - GetStreamHeight()
-        - GetYBuffer()
-        - GetUBuffer()
-        - GetVBuffer()
-    :param new_width: Desired width.
-    :param new_height: Desired height.
-    :return: Scaled (and possibly letter/pillarboxed) I420 frame bytes.
-    """
-    orig_width = frame.GetStreamWidth()
-    orig_height = frame.GetStreamHeight()
-
-    # 1) Convert buffers to NumPy arrays without extra copies if possible.
-    y = np.frombuffer(frame.GetYBuffer(), dtype=np.uint8, count=orig_width * orig_height)
-    u = np.frombuffer(frame.GetUBuffer(), dtype=np.uint8, count=(orig_width // 2) * (orig_height // 2))
-    v = np.frombuffer(frame.GetVBuffer(), dtype=np.uint8, count=(orig_width // 2) * (orig_height // 2))
-
-    # Reshape planes
-    y = y.reshape(orig_height, orig_width)
-    u = u.reshape(orig_height // 2, orig_width // 2)
-    v = v.reshape(orig_height // 2, orig_width // 2)
-
-    # 2) Determine scale preserving aspect ratio
-    input_aspect = orig_width / orig_height
-    output_aspect = new_width / new_height
-
-    if abs(input_aspect - output_aspect) < 1e-6:
-        # Aspect ratios match (or extremely close). Just do a simple stretch to (new_width, new_height).
-        scaled_y = cv2.resize(y, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
-        scaled_u = cv2.resize(u, (new_width // 2, new_height // 2), interpolation=cv2.INTER_LINEAR)
-        scaled_v = cv2.resize(v, (new_width // 2, new_height // 2), interpolation=cv2.INTER_LINEAR)
-
-        # Flatten and return
-        return np.concatenate([scaled_y.flatten(), scaled_u.flatten(), scaled_v.flatten()]).astype(np.uint8).tobytes()
-
-    # Otherwise, the aspect ratios differ => letterbox or pillarbox
-    # 3) Compute scaled dimensions that fit entirely within (new_width, new_height)
-    if input_aspect > output_aspect:
-        # The image is relatively wider => match width, shrink height
-        scaled_width = new_width
-        scaled_height = int(round(new_width / input_aspect))
-    else:
-        # The image is relatively taller => match height, shrink width
-        scaled_height = new_height
-        scaled_width = int(round(new_height * input_aspect))
-
-    # 4) Resize Y, U, and V to the scaled dimensions
-    scaled_y = cv2.resize(y, (scaled_width, scaled_height), interpolation=cv2.INTER_LINEAR)
-    scaled_u = cv2.resize(u, (scaled_width // 2, scaled_height // 2), interpolation=cv2.INTER_LINEAR)
-    scaled_v = cv2.resize(v, (scaled_width // 2, scaled_height // 2), interpolation=cv2.INTER_LINEAR)
-
-    # 5) Create the black background only if needed
-    # For I420, black is typically (Y=0, U=128, V=128) or (Y=16, U=128, V=128).
-    # We'll use Y=0, U=128, V=128 for "dark" black.
-    final_y = np.zeros((new_height, new_width), dtype=np.uint8)
-    final_u = np.full((new_height // 2, new_width // 2), 128, dtype=np.uint8)
-    final_v = np.full((new_height // 2, new_width // 2), 128, dtype=np.uint8)
-
-    # 6) Compute centering offsets for each plane
-    # For Y-plane
-    offset_y = (new_height - scaled_height) // 2
-    offset_x = (new_width - scaled_width) // 2
-
-    # Insert Y
-    final_y[offset_y : offset_y + scaled_height, offset_x : offset_x + scaled_width] = scaled_y
-
-    # For U, V planes (subsampled by 2 in each dimension)
-    offset_y_uv = offset_y // 2
-    offset_x_uv = offset_x // 2
-
-    final_u[
-        offset_y_uv : offset_y_uv + (scaled_height // 2),
-        offset_x_uv : offset_x_uv + (scaled_width // 2),
-    ] = scaled_u
-    final_v[
-        offset_y_uv : offset_y_uv + (scaled_height // 2),
-        offset_x_uv : offset_x_uv + (scaled_width // 2),
-    ] = scaled_v
-
-    # 7) Flatten back to I420 layout and return bytes
-    return np.concatenate([final_y.flatten(), final_u.flatten(), final_v.flatten()]).astype(np.uint8).tobytes()
+def zoom_sdk_resolution_for_frame_size(frame_size):
+    # Without a size, subscribe at 180p, which is what bots that don't set a recording resolution have always used
+    if frame_size is None:
+        return zoom.ZoomSDKResolution_180P
+    # Otherwise subscribe at the smallest resolution that covers the recording, so frames are scaled down rather than up
+    height = frame_size[1]
+    if height <= 180:
+        return zoom.ZoomSDKResolution_180P
+    if height <= 360:
+        return zoom.ZoomSDKResolution_360P
+    if height <= 720:
+        return zoom.ZoomSDKResolution_720P
+    return zoom.ZoomSDKResolution_1080P
 
 
 class VideoInputStream:
@@ -128,6 +34,7 @@ class VideoInputStream:
         self.share_source_id = share_source_id
         self.renderer_destroyed = False
         self.last_debug_frame_time = None
+        self.video_frame_scaler = I420Scaler(video_input_manager.video_frame_size)
         self.renderer_delegate = zoom.ZoomSDKRendererDelegateCallbacks(
             onRawDataFrameReceivedCallback=self.on_raw_video_frame_received_callback,
             onRendererBeDestroyedCallback=self.on_renderer_destroyed_callback,
@@ -135,7 +42,7 @@ class VideoInputStream:
         )
 
         self.renderer = zoom.createRenderer(self.renderer_delegate)
-        set_resolution_result = self.renderer.setRawDataResolution(zoom.ZoomSDKResolution_180P)
+        set_resolution_result = self.renderer.setRawDataResolution(zoom_sdk_resolution_for_frame_size(video_input_manager.video_subscription_frame_size))
         raw_data_type = {
             VideoInputManager.StreamType.SCREENSHARE: zoom.ZoomSDKRawDataType.RAW_DATA_TYPE_SHARE,
             VideoInputManager.StreamType.VIDEO: zoom.ZoomSDKRawDataType.RAW_DATA_TYPE_VIDEO,
@@ -165,9 +72,8 @@ class VideoInputStream:
 
         current_time = time.time()
         if current_time - self.last_frame_time >= 0.25 and self.raw_data_status == zoom.RawData_Off:
-            # Create a black frame of the same dimensions
-            black_frame = create_black_i420_frame(self.video_input_manager.video_frame_size)
-            self.video_input_manager.new_frame_callback(black_frame, time.time_ns())
+            # The black frame is pre-rendered, and after the first one the pipeline is just told to hold it
+            self.video_input_manager.filler_frame_sender.send_filler_frame(time.time_ns())
             logger.info(f"In VideoInputStream.send_black_frame for user {self.user_id} sent black frame")
 
         return not self.renderer_destroyed  # Continue timer if not cleaned up
@@ -209,8 +115,9 @@ class VideoInputStream:
             logger.debug(f"In VideoInputStream.on_raw_video_frame_received_callback for user {self.user_id} received frame")
             self.last_debug_frame_time = time.time()
 
-        scaled_i420_frame = scale_i420(data, self.video_input_manager.video_frame_size)
-        self.video_input_manager.new_frame_callback(scaled_i420_frame, current_time_ns)
+        with bot_metrics.timer("frame_scaling_duration_ms", source="zoom"):
+            scaled_i420_frame = self.video_frame_scaler.scale(i420_frame, (data.GetStreamWidth(), data.GetStreamHeight()))
+        self.video_input_manager.filler_frame_sender.send_frame(scaled_i420_frame, current_time_ns)
 
 
 class VideoInputManager:
@@ -222,10 +129,18 @@ class VideoInputManager:
         ACTIVE_SPEAKER = 1
         ACTIVE_SHARER = 2
 
-    def __init__(self, *, new_frame_callback, wants_any_frames_callback, video_frame_size):
+    def __init__(self, *, new_frame_callback, wants_any_frames_callback, video_frame_size, video_subscription_frame_size=None, repeat_frame_callback=None):
         self.new_frame_callback = new_frame_callback
         self.wants_any_frames_callback = wants_any_frames_callback
         self.video_frame_size = video_frame_size
+        # The size the Zoom video is subscribed at, None for the default
+        self.video_subscription_frame_size = video_subscription_frame_size
+        # Only one stream feeds the pipeline at a time, so they share a filler frame sender
+        self.filler_frame_sender = FillerFrameSender(
+            frame_size=video_frame_size,
+            add_video_frame_callback=new_frame_callback,
+            repeat_video_frame_callback=repeat_frame_callback,
+        )
         self.mode = None
         self.input_streams = []
 
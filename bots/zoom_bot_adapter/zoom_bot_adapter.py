@@ -83,6 +83,9 @@ class ZoomBotAdapter(BotAdapter):
         wants_any_video_frames_callback,
         add_mixed_audio_chunk_callback,
         automatic_leave_configuration: AutomaticLeaveConfiguration,
+        repeat_video_frame_callback=None,
+        video_frame_size=(1920, 1080),
+        video_subscription_frame_size=None,
     ):
         self.use_one_way_audio = use_one_way_audio
         self.use_mixed_audio = use_mixed_audio
@@ -93,6 +96,7 @@ class ZoomBotAdapter(BotAdapter):
         self.add_mixed_audio_chunk_callback = add_mixed_audio_chunk_callback
         self.add_video_frame_callback = add_video_frame_callback
         self.wants_any_video_frames_callback = wants_any_video_frames_callback
+        self.repeat_video_frame_callback = repeat_video_frame_callback
 
         self._jwt_token = generate_jwt(zoom_client_id, zoom_client_secret)
         self.meeting_id, self.meeting_password = parse_join_url(meeting_url)
@@ -130,7 +134,8 @@ class ZoomBotAdapter(BotAdapter):
         self.video_sender = None
         self.virtual_camera_video_source = None
         self.video_source_helper = None
-        self.video_frame_size = (1920, 1080)
+        self.video_frame_size = video_frame_size
+        self.video_subscription_frame_size = video_subscription_frame_size
         self.send_image_timeout_id = None
 
         self.automatic_leave_configuration = automatic_leave_configuration
@@ -145,6 +150,8 @@ class ZoomBotAdapter(BotAdapter):
                 new_frame_callback=self.add_video_frame_callback,
                 wants_any_frames_callback=self.wants_any_video_frames_callback,
                 video_frame_size=self.video_frame_size,
+                video_subscription_frame_size=self.video_subscription_frame_size,
+                repeat_frame_callback=self.repeat_video_frame_callback,
             )
         else:
             self.video_input_manager = None
@@ -475,9 +482,8 @@ class ZoomBotAdapter(BotAdapter):
         if node_id == self.my_participant_id:
             return
 
-        current_time = datetime.utcnow()
         self.last_audio_received_at = time.time()
-        self.add_audio_chunk_callback(node_id, current_time, data.GetBuffer())
+        self.add_audio_chunk_callback(node_id, time.monotonic_ns(), data.GetBuffer())
 
     def add_mixed_audio_chunk_convert_to_bytes(self, data):
         self.add_mixed_audio_chunk_callback(data.GetBuffer())